@@ -0,0 +1,46 @@
+"""
+Compare JSON and MessagePack list responses by payload size and encode/decode time.
+
+    python -m benchmarks.bench_msgpack --items 1000
+
+Uses the page of ORM images from benchmarks.bench_serialization and encodes it as the
+list endpoints do (src.utils.serialization), for the ImageResponse and ImageSearch schemas.
+Decoding is timed with orjson and msgpack, as a client would parse the body.
+"""
+import argparse
+import gzip
+
+import msgpack
+import orjson
+
+from benchmarks.bench_serialization import build_page, timed
+from src.schemas.image import ImageResponse, ImageSearch
+from src.utils.serialization import dump_list, pack_list
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    page = build_page(args.items)
+    for image in page:
+        image.average_rating = 4.25
+
+    print(f"{'schema':<14} {'format':<8} {'KiB':>8} {'gzip KiB':>9} {'encode ms':>10} {'decode ms':>10}")
+    for schema in (ImageResponse, ImageSearch):
+        encodings = (
+            ("json", lambda: dump_list(schema, page), orjson.loads),
+            ("msgpack", lambda: pack_list(schema, page), lambda body: msgpack.unpackb(body, timestamp=3)),
+        )
+        for name, encode, decode in encodings:
+            body = encode()
+            print(
+                f"{schema.__name__:<14} {name:<8} {len(body) / 1024:>8.1f} {len(gzip.compress(body)) / 1024:>9.1f} "
+                f"{timed(encode, args.repeat):>10.2f} {timed(lambda: decode(body), args.repeat):>10.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Compare OFFSET and keyset (cursor) page latency of the image listing.
+
+    python -m benchmarks.bench_pagination --rows 1100000
+
+Seeds a throwaway SQLite database and times one page of the admin image list
+at growing depths, using the same queries as src.repository.images.get_images.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from src.models.base import Base
+from src.models.image import Image
+from src.models.rating import Rating  # noqa: F401  registers the mapper used by Image.ratings
+from src.models.user import User
+
+DEPTHS = (1_000, 100_000, 1_000_000)
+
+
+def seed(db, rows: int, batch_size: int = 50_000):
+    """
+    The seed function inserts one admin user and the given number of images with bulk executemany statements.
+
+    :param db: Session: The database session
+    :param rows: int: Number of images to create
+    :param batch_size: int: Number of rows per executemany call
+    :return: The admin user
+    """
+    user = User(username="admin", email="admin@example.com", password="password", avatar="avatar", role="admin")
+    db.add(user)
+    db.commit()
+    for start in range(0, rows, batch_size):
+        db.execute(
+            insert(Image),
+            [
+                {"image_url": f"http://bench/{i}.jpg", "content": "content", "user_id": user.id}
+                for i in range(start, min(start + batch_size, rows))
+            ],
+        )
+    db.commit()
+    return user
+
+
+def timed(fn, repeat: int):
+    """
+    The timed function returns the best wall time of fn in milliseconds.
+
+    :param fn: Callable: The function to time
+    :param repeat: int: Number of runs
+    :return: The fastest run in milliseconds
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_100_000)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "bench_pagination.db")
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    seed(db, args.rows)
+
+    newest = db.query(Image.id).order_by(Image.id.desc()).first()[0]
+    print(f"{'depth':>10} {'offset ms':>10} {'keyset ms':>10}")
+    for depth in DEPTHS:
+        if depth >= args.rows:
+            continue
+        # The keyset query receives the id of the last row of the previous page, as a cursor would hold
+        after_id = newest - depth + 1
+
+        def offset_page():
+            db.query(Image).order_by(Image.id.desc()).offset(depth).limit(args.limit).all()
+
+        def keyset_page():
+            db.query(Image).filter(Image.id < after_id).order_by(Image.id.desc()).limit(args.limit).all()
+
+        print(f"{depth:>10} {timed(offset_page, args.repeat):>10.2f} {timed(keyset_page, args.repeat):>10.2f}")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Compare the rating filtered searches before and after the average rating moved into the search statement.
+
+    python -m benchmarks.bench_search_rating --images 10000
+
+Seeds a throwaway SQLite database with one user owning every image, each rated by a few voters,
+and times a search returning all of them: the user search (src.repository.search_filter.get_images_by_user)
+against its former correlated filter plus one average query per row, and the id query of the image search
+filtered on the average rating (filter_by_average_rating) against the former any() filters.
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+
+from sqlalchemy import create_engine, func, insert, select
+from sqlalchemy.orm import sessionmaker
+
+from benchmarks.bench_pagination import timed
+from src.models.base import Base
+from src.models.image import Image
+from src.models.rating import Rating
+from src.models.user import User
+from src.repository.search_filter import filter_by_average_rating, get_images_by_user
+from src.schemas.user import UserSearchResponse
+
+
+def seed(db, images: int, voters: int):
+    """
+    The seed function inserts the owner, the voters, the images and one rating per voter and image
+    with bulk executemany statements.
+
+    :param db: Session: The database session
+    :param images: int: Number of images to create
+    :param voters: int: Number of ratings per image
+    :return: The id of the owner
+    """
+    users = [
+        User(username=f"user{i}", email=f"user{i}@example.com", password="password", avatar="avatar")
+        for i in range(voters + 1)
+    ]
+    db.add_all(users)
+    db.commit()
+    owner, voter_ids = users[0].id, [user.id for user in users[1:]]
+    db.execute(
+        insert(Image),
+        [{"image_url": f"http://bench/{i}.jpg", "content": "content", "user_id": owner} for i in range(images)],
+    )
+    rng = random.Random(0)
+    db.execute(
+        insert(Rating),
+        [
+            # Scores from 3 to 5 keep every image within the searched range
+            {"user_id": voter_id, "image_id": image_id, "rating_score": rng.randint(3, 5)}
+            for image_id in db.scalars(select(Image.id))
+            for voter_id in voter_ids
+        ],
+    )
+    db.commit()
+    return owner
+
+
+def user_search_before(db, user_id: int, min_rating: int, max_rating: int):
+    """
+    The user_search_before function reproduces the former get_images_by_user:
+    a correlated average in WHERE, then one average query per returned image.
+    """
+    average = (
+        select(func.coalesce(func.avg(Rating.rating_score), 0))
+        .where(Rating.image_id == Image.id)
+        .scalar_subquery()
+    )
+    images = db.query(Image).filter(Image.user_id == user_id, average >= min_rating, average <= max_rating).all()
+    result = []
+    for image in images:
+        rating = db.query(func.avg(Rating.rating_score)).filter(Rating.image_id == image.id).scalar()
+        result.append(
+            UserSearchResponse(
+                id=image.id,
+                image_url=image.image_url,
+                username=image.user.username,
+                created_at=image.created_at,
+                updated_at=image.updated_at,
+                user_id=image.user_id,
+                content=image.content,
+                average_rating=round(rating, 1) if rating is not None else None,
+            )
+        )
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--images", type=int, default=10_000)
+    parser.add_argument("--voters", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "bench_search_rating.db")
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    owner = seed(db, args.images, args.voters)
+    min_rating, max_rating = 3, 5
+
+    def user_before():
+        db.expire_all()
+        return user_search_before(db, owner, min_rating, max_rating)
+
+    def user_after():
+        db.expire_all()
+        return asyncio.run(get_images_by_user(db, owner, min_rating, max_rating))
+
+    def search_before():
+        return (
+            db.query(Image.id)
+            .filter(Image.ratings.any(Rating.rating_score >= min_rating))
+            .filter(Image.ratings.any(Rating.rating_score <= max_rating))
+            .order_by(Image.id)
+            .all()
+        )
+
+    def search_after():
+        return filter_by_average_rating(db.query(Image.id), min_rating, max_rating).order_by(Image.id).all()
+
+    print(f"{'search':<14} {'results':>8} {'before ms':>10} {'after ms':>10}")
+    for name, before, after in (("user", user_before, user_after), ("image ids", search_before, search_after)):
+        results = len(after())
+        print(f"{name:<14} {results:>8} {timed(before, args.repeat):>10.2f} {timed(after, args.repeat):>10.2f}")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Compare the cost of turning a page of images into a JSON response body.
+
+    python -m benchmarks.bench_serialization --items 1000
+
+Builds a page of ORM images with tags in memory and times the serialization paths
+a list endpoint can take:
+
+- jsonable_encoder: no response model (GET /images/ used to declare response_model=list()),
+  FastAPI walks the ORM objects itself
+- response_model + json: FastAPI validates and dumps List[ImageResponse], JSONResponse encodes with json
+- response_model + orjson: the same, encoded by ORJSONResponse
+- TypeAdapter.dump_json: src.utils.serialization.dump_list, as served by SerializedListRoute
+"""
+import argparse
+import asyncio
+import gc
+import json
+import time
+from datetime import datetime
+from typing import List
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from src.models.image import Image, Tag
+from src.models.rating import Rating  # noqa: F401  registers the mapper used by Image.ratings
+from src.schemas.image import ImageResponse
+from src.utils.serialization import dump_list
+
+
+def build_page(items: int) -> List[Image]:
+    """
+    The build_page function creates transient images with every response column and three tags each.
+
+    :param items: int: Number of images
+    :return: A list of images
+    """
+    tags = [Tag(id=i, name=f"tag{i}") for i in range(3)]
+    now = datetime.now()
+    page = []
+    for i in range(items):
+        image = Image(
+            id=i,
+            image_url=f"https://res.cloudinary.com/demo/image/upload/SnapShare-API/{i:064x}",
+            content="A picture of something",
+            user_id=1,
+            created_at=now,
+            updated_at=now,
+            width=4000,
+            height=3000,
+            orientation="landscape",
+            mime_type="image/jpeg",
+            byte_size=2_500_000,
+            dominant_color="#336699",
+            blurhash="LEHV6nWB2yk8pyo0adR*.7kCMdnj",
+        )
+        image.tags = tags
+        page.append(image)
+    return page
+
+
+def timed(fn, repeat: int):
+    """
+    The timed function returns the best wall time of fn in milliseconds.
+    The garbage collector is paused while timing, so garbage left by one path does not slow down the next.
+
+    :param fn: Callable: The function to time
+    :param repeat: int: Number of runs
+    :return: The fastest run in milliseconds
+    """
+    best = float("inf")
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - start)
+    finally:
+        gc.enable()
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    page = build_page(args.items)
+    field = create_response_field(name="Response", type_=List[ImageResponse])
+    loop = asyncio.new_event_loop()
+
+    def response_model():
+        return loop.run_until_complete(serialize_response(field=field, response_content=page))
+
+    paths = {
+        "jsonable_encoder": lambda: json.dumps(jsonable_encoder(page)),
+        "response_model + json": lambda: json.dumps(response_model()),
+        "response_model + orjson": lambda: orjson.dumps(response_model()),
+        "TypeAdapter.dump_json": lambda: dump_list(ImageResponse, page),
+    }
+    size = len(dump_list(ImageResponse, page))
+    print(f"{args.items} images, {size / 1024:.0f} KiB of JSON")
+    print(f"{'path':<26} {'ms':>8}")
+    for name, fn in paths.items():
+        try:
+            print(f"{name:<26} {timed(fn, args.repeat):>8.2f}")
+        except (TypeError, ValueError, RecursionError) as e:
+            # The ORM objects are walked through their relationships and back
+            print(f"{name:<26} {'failed':>8} ({e.__class__.__name__})")
+    loop.close()
+
+
+if __name__ == "__main__":
+    main()
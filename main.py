@@ -3,14 +3,18 @@ from sqlalchemy import text
 
 import uvicorn
 from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi.responses import ORJSONResponse
 
 from src.database.db import get_db
 from src.routes import images, auth, users, tags, comments, search_filter
-from src.routes import ratings
+from src.routes import ratings, uploads
+from src.utils.image_metadata import shutdown_metadata_pool
+from src.services.search_index import start_search_index, stop_search_index
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
 app.include_router(auth.router, prefix='/api')
+app.include_router(uploads.router, prefix="/api")
 app.include_router(images.router, prefix="/api")
 app.include_router(comments.router, prefix='/api')
 app.include_router(tags.router, prefix='/api')
@@ -19,6 +23,29 @@ app.include_router(users.router, prefix='/api')
 
 app.include_router(search_filter.router, prefix='/api')
 
+
+@app.on_event("startup")
+async def load_search_index():
+    """
+    The load_search_index function loads the in-process keyword search index.
+
+    :return: None
+    """
+    await start_search_index()
+
+
+@app.on_event("shutdown")
+def shutdown_workers():
+    """
+    The shutdown_workers function stops the worker processes started by the application
+    and writes the search index snapshot.
+
+    :return: None
+    """
+    shutdown_metadata_pool()
+    stop_search_index()
+
+
 @app.get("/", name="Корінь проекту")
 def read_root():
     """
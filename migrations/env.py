@@ -7,11 +7,17 @@ from alembic import context
 
 from src.database.db import SQLALCHEMY_DATABASE_URL
 from src.models.base import Base
-from src.models.image import Image, Tag, image_m2m_tags
+from src.models.image import FTS_TABLE, SEARCH_VECTOR_COLUMN, Image, Tag, image_m2m_tags
 from src.models.user import User, UserRole
-from src.models.rating import Rating
+from src.models.rating import ImageRatingStats, Rating
 from src.models.comment import Comment
 from src.models.blacklist import Blacklist
+from src.models.upload import UploadSession
+from src.models.outbox import SearchIndexChange, StorageCleanup
+from src.models.follow import Follow
+from src.models.version import CollectionVersion
+from src.models.document import ImageDocument
+from src.models.view import ImageViews, ViewFlush
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -29,6 +35,14 @@ if config.config_file_name is not None:
 target_metadata = Base.metadata
 config.set_main_option("sqlalchemy.url", SQLALCHEMY_DATABASE_URL)
 
+
+def include_object(object, name, type_, reflected, compare_to):
+    # The full-text search objects are created by DDL events of src/models/image.py and are not mapped
+    if reflected and compare_to is None and name is not None:
+        return not (name.startswith(FTS_TABLE) or SEARCH_VECTOR_COLUMN in name)
+    return True
+
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -51,6 +65,7 @@ def run_migrations_offline() -> None:
     context.configure(
         url=url,
         target_metadata=target_metadata,
+        include_object=include_object,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
     )
@@ -74,7 +89,7 @@ def run_migrations_online() -> None:
 
     with connectable.connect() as connection:
         context.configure(
-            connection=connection, target_metadata=target_metadata
+            connection=connection, target_metadata=target_metadata, include_object=include_object
         )
 
         with context.begin_transaction():
@@ -0,0 +1,39 @@
+"""Added trigram indexes
+
+Revision ID: 0c6e2a9f4d81
+Revises: f5b3d9e2c147
+Create Date: 2026-10-19 21:48:37.604125
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0c6e2a9f4d81'
+down_revision: Union[str, None] = 'f5b3d9e2c147'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.create_index(
+        'ix_images_content_trgm', 'images', ['content'], unique=False,
+        postgresql_using='gin', postgresql_ops={'content': 'gin_trgm_ops'},
+    )
+    op.create_index(
+        'ix_tags_name_trgm', 'tags', ['name'], unique=False,
+        postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'},
+    )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.drop_index('ix_tags_name_trgm', table_name='tags', postgresql_using='gin')
+    op.drop_index('ix_images_content_trgm', table_name='images', postgresql_using='gin')
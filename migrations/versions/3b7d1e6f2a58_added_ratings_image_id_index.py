@@ -0,0 +1,26 @@
+"""Added ratings image_id index
+
+Revision ID: 3b7d1e6f2a58
+Revises: 0c6e2a9f4d81
+Create Date: 2026-10-19 23:12:05.318264
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b7d1e6f2a58'
+down_revision: Union[str, None] = '0c6e2a9f4d81'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(op.f('ix_ratings_image_id'), 'ratings', ['image_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_ratings_image_id'), table_name='ratings')
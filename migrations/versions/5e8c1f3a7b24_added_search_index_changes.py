@@ -0,0 +1,37 @@
+"""Added search index changes
+
+Revision ID: 5e8c1f3a7b24
+Revises: 9d4f7a2c6e13
+Create Date: 2026-10-19 09:12:44.603118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e8c1f3a7b24'
+down_revision: Union[str, None] = '9d4f7a2c6e13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('search_index_changes',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.Column('image_id', sa.Integer(), nullable=False),
+    sa.Column('content', sa.String(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_search_index_changes_id'), 'search_index_changes', ['id'], unique=False)
+    op.create_index('ix_search_index_changes_created_at', 'search_index_changes', ['created_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_search_index_changes_created_at', table_name='search_index_changes')
+    op.drop_index(op.f('ix_search_index_changes_id'), table_name='search_index_changes')
+    op.drop_table('search_index_changes')
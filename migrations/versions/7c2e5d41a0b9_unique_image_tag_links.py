@@ -0,0 +1,35 @@
+"""Unique image tag links
+
+Revision ID: 7c2e5d41a0b9
+Revises: 3f9a1c2d7b4e
+Create Date: 2026-10-19 11:02:17.604431
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c2e5d41a0b9'
+down_revision: Union[str, None] = '3f9a1c2d7b4e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Keep the oldest link of every (image_id, tag_id) pair before adding the constraint
+    op.execute(
+        """
+        DELETE FROM image_m2m_tags
+        WHERE id NOT IN (
+            SELECT MIN(id) FROM image_m2m_tags GROUP BY image_id, tag_id
+        )
+        """
+    )
+    op.create_unique_constraint('uq_image_m2m_tags_image_id_tag_id', 'image_m2m_tags', ['image_id', 'tag_id'])
+
+
+def downgrade() -> None:
+    op.drop_constraint('uq_image_m2m_tags_image_id_tag_id', 'image_m2m_tags', type_='unique')
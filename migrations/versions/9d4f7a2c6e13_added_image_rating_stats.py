@@ -0,0 +1,91 @@
+"""Added image rating stats
+
+Revision ID: 9d4f7a2c6e13
+Revises: 3b7d1e6f2a58
+Create Date: 2026-10-19 23:41:27.902517
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d4f7a2c6e13'
+down_revision: Union[str, None] = '3b7d1e6f2a58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SCORES = range(1, 6)
+STATS_COLUMNS = ['rating_sum', 'rating_count'] + [f'score_{score}' for score in SCORES]
+
+
+def _stats_values(row: str, sign: str = '') -> str:
+    scores = [f"CASE WHEN {row}.rating_score = {score} THEN {sign}1 ELSE 0 END" for score in SCORES]
+    return ", ".join([f"{sign}{row}.rating_score", f"{sign}1"] + scores)
+
+
+def _stats_upsert(row: str, sign: str = '') -> str:
+    columns = ", ".join(STATS_COLUMNS)
+    updates = ", ".join(f"{column} = image_rating_stats.{column} + excluded.{column}" for column in STATS_COLUMNS)
+    return (
+        f"INSERT INTO image_rating_stats (image_id, {columns}) VALUES ({row}.image_id, {_stats_values(row, sign)}) "
+        f"ON CONFLICT (image_id) DO UPDATE SET {updates}"
+    )
+
+
+def upgrade() -> None:
+    op.create_table('image_rating_stats',
+    sa.Column('image_id', sa.Integer(), nullable=False),
+    sa.Column('rating_sum', sa.Integer(), nullable=False),
+    sa.Column('rating_count', sa.Integer(), nullable=False),
+    *[sa.Column(f'score_{score}', sa.Integer(), nullable=False) for score in SCORES],
+    sa.Column(
+        'rating_average', sa.Float(),
+        sa.Computed('CAST(rating_sum AS FLOAT) / NULLIF(rating_count, 0)', persisted=True), nullable=True,
+    ),
+    sa.ForeignKeyConstraint(['image_id'], ['images.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('image_id')
+    )
+    op.create_index(
+        'ix_image_rating_stats_rating_average', 'image_rating_stats', ['rating_average', 'image_id'], unique=False
+    )
+    scores = ", ".join(f"SUM(CASE WHEN rating_score = {score} THEN 1 ELSE 0 END)" for score in SCORES)
+    op.execute(
+        f"INSERT INTO image_rating_stats (image_id, {', '.join(STATS_COLUMNS)}) "
+        f"SELECT image_id, SUM(rating_score), COUNT(*), {scores} FROM ratings GROUP BY image_id"
+    )
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute(
+            "CREATE OR REPLACE FUNCTION image_rating_stats_sync() RETURNS trigger AS $$ BEGIN "
+            f"IF TG_OP IN ('DELETE', 'UPDATE') THEN {_stats_upsert('OLD', '-')}; END IF; "
+            f"IF TG_OP IN ('INSERT', 'UPDATE') THEN {_stats_upsert('NEW')}; END IF; "
+            "RETURN NULL; END $$ LANGUAGE plpgsql"
+        )
+        op.execute(
+            "CREATE TRIGGER ratings_stats_sync AFTER INSERT OR DELETE OR UPDATE OF image_id, rating_score ON ratings "
+            "FOR EACH ROW EXECUTE FUNCTION image_rating_stats_sync()"
+        )
+        return
+    op.execute(f"CREATE TRIGGER ratings_stats_insert AFTER INSERT ON ratings BEGIN {_stats_upsert('new')}; END")
+    op.execute(f"CREATE TRIGGER ratings_stats_delete AFTER DELETE ON ratings BEGIN {_stats_upsert('old', '-')}; END")
+    op.execute(
+        "CREATE TRIGGER ratings_stats_update AFTER UPDATE OF image_id, rating_score ON ratings BEGIN "
+        f"{_stats_upsert('old', '-')}; {_stats_upsert('new')}; END"
+    )
+    op.execute(
+        "CREATE TRIGGER images_rating_stats_delete AFTER DELETE ON images BEGIN "
+        "DELETE FROM image_rating_stats WHERE image_id = old.id; END"
+    )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("DROP TRIGGER IF EXISTS ratings_stats_sync ON ratings")
+        op.execute("DROP FUNCTION IF EXISTS image_rating_stats_sync()")
+    else:
+        for trigger in ('ratings_stats_insert', 'ratings_stats_delete', 'ratings_stats_update', 'images_rating_stats_delete'):
+            op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    op.drop_index('ix_image_rating_stats_rating_average', table_name='image_rating_stats')
+    op.drop_table('image_rating_stats')
@@ -0,0 +1,42 @@
+"""Added follows
+
+Revision ID: a7c1e4f2d859
+Revises: f4b7d2a91e60
+Create Date: 2026-10-19 18:11:52.604517
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7c1e4f2d859'
+down_revision: Union[str, None] = 'f4b7d2a91e60'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('follows',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.Column('follower_id', sa.Integer(), nullable=False),
+    sa.Column('followed_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['follower_id'], ['users.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['followed_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('follower_id', 'followed_id', name='uq_follows_follower_followed')
+    )
+    op.create_index(op.f('ix_follows_id'), 'follows', ['id'], unique=False)
+    op.create_index('ix_follows_followed_id_follower_id', 'follows', ['followed_id', 'follower_id'], unique=False)
+    op.add_column('users', sa.Column('followers_count', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'followers_count')
+    op.drop_index('ix_follows_followed_id_follower_id', table_name='follows')
+    op.drop_index(op.f('ix_follows_id'), table_name='follows')
+    op.drop_table('follows')
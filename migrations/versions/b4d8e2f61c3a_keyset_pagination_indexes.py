@@ -0,0 +1,28 @@
+"""Keyset pagination indexes
+
+Revision ID: b4d8e2f61c3a
+Revises: 7c2e5d41a0b9
+Create Date: 2026-10-19 14:21:40.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b4d8e2f61c3a'
+down_revision: Union[str, None] = '7c2e5d41a0b9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_images_user_id_id', 'images', ['user_id', 'id'], unique=False)
+    op.create_index('ix_comments_image_id_id', 'comments', ['image_id', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_comments_image_id_id', table_name='comments')
+    op.drop_index('ix_images_user_id_id', table_name='images')
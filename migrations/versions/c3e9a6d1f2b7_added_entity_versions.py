@@ -0,0 +1,34 @@
+"""Added entity versions
+
+Revision ID: c3e9a6d1f2b7
+Revises: a7c1e4f2d859
+Create Date: 2026-10-19 19:02:37.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3e9a6d1f2b7'
+down_revision: Union[str, None] = 'a7c1e4f2d859'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('images', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('comments', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+    op.create_table('collection_versions',
+    sa.Column('name', sa.String(length=64), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('collection_versions')
+    op.drop_column('comments', 'version')
+    op.drop_column('images', 'version')
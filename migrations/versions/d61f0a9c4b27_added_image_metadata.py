@@ -0,0 +1,38 @@
+"""Added image metadata
+
+Revision ID: d61f0a9c4b27
+Revises: b4d8e2f61c3a
+Create Date: 2026-10-19 15:02:53.472913
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd61f0a9c4b27'
+down_revision: Union[str, None] = 'b4d8e2f61c3a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('images', sa.Column('width', sa.Integer(), nullable=True))
+    op.add_column('images', sa.Column('height', sa.Integer(), nullable=True))
+    op.add_column('images', sa.Column('orientation', sa.String(length=16), nullable=True))
+    op.add_column('images', sa.Column('mime_type', sa.String(length=64), nullable=True))
+    op.add_column('images', sa.Column('byte_size', sa.BigInteger(), nullable=True))
+    op.add_column('images', sa.Column('dominant_color', sa.String(length=7), nullable=True))
+    op.add_column('images', sa.Column('blurhash', sa.String(length=64), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('images', 'blurhash')
+    op.drop_column('images', 'dominant_color')
+    op.drop_column('images', 'byte_size')
+    op.drop_column('images', 'mime_type')
+    op.drop_column('images', 'orientation')
+    op.drop_column('images', 'height')
+    op.drop_column('images', 'width')
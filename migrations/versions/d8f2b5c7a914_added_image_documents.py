@@ -0,0 +1,38 @@
+"""Added image documents
+
+Revision ID: d8f2b5c7a914
+Revises: c3e9a6d1f2b7
+Create Date: 2026-10-19 19:48:05.530982
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd8f2b5c7a914'
+down_revision: Union[str, None] = 'c3e9a6d1f2b7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('image_documents',
+    sa.Column('image_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('document', sa.JSON().with_variant(postgresql.JSONB(astext_type=sa.Text()), 'postgresql'), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['image_id'], ['images.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('image_id')
+    )
+    op.create_index(op.f('ix_image_documents_user_id'), 'image_documents', ['user_id'], unique=False)
+    # Documents of existing images are built on every read until they are stored with
+    # rebuild_image_documents from src/repository/image_documents.py
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_image_documents_user_id'), table_name='image_documents')
+    op.drop_table('image_documents')
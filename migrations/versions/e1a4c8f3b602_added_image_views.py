@@ -0,0 +1,40 @@
+"""Added image views
+
+Revision ID: e1a4c8f3b602
+Revises: d8f2b5c7a914
+Create Date: 2026-10-19 20:21:44.907316
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e1a4c8f3b602'
+down_revision: Union[str, None] = 'd8f2b5c7a914'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('image_views',
+    sa.Column('image_id', sa.Integer(), nullable=False),
+    sa.Column('views', sa.BigInteger(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['image_id'], ['images.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('image_id')
+    )
+    op.create_table('view_flushes',
+    sa.Column('batch_id', sa.String(length=32), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('batch_id')
+    )
+    op.create_index(op.f('ix_view_flushes_created_at'), 'view_flushes', ['created_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_view_flushes_created_at'), table_name='view_flushes')
+    op.drop_table('view_flushes')
+    op.drop_table('image_views')
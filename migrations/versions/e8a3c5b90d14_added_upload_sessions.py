@@ -0,0 +1,43 @@
+"""Added upload sessions
+
+Revision ID: e8a3c5b90d14
+Revises: d61f0a9c4b27
+Create Date: 2026-10-19 15:48:11.206734
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e8a3c5b90d14'
+down_revision: Union[str, None] = 'd61f0a9c4b27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('upload_sessions',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.Column('upload_id', sa.String(length=32), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('filename', sa.String(), nullable=True),
+    sa.Column('content', sa.String(), nullable=False),
+    sa.Column('tags', sa.String(), nullable=False),
+    sa.Column('size', sa.BigInteger(), nullable=False),
+    sa.Column('offset', sa.BigInteger(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_upload_sessions_id'), 'upload_sessions', ['id'], unique=False)
+    op.create_index(op.f('ix_upload_sessions_upload_id'), 'upload_sessions', ['upload_id'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_upload_sessions_upload_id'), table_name='upload_sessions')
+    op.drop_index(op.f('ix_upload_sessions_id'), table_name='upload_sessions')
+    op.drop_table('upload_sessions')
@@ -0,0 +1,42 @@
+"""Added storage cleanup outbox
+
+Revision ID: f4b7d2a91e60
+Revises: e8a3c5b90d14
+Create Date: 2026-10-19 17:02:37.418265
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f4b7d2a91e60'
+down_revision: Union[str, None] = 'e8a3c5b90d14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('storage_cleanup_outbox',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.Column('public_id', sa.String(), nullable=False),
+    sa.Column('content_hash', sa.String(length=64), nullable=True),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('available_at', sa.DateTime(), nullable=False),
+    sa.Column('last_error', sa.String(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_storage_cleanup_outbox_id'), 'storage_cleanup_outbox', ['id'], unique=False)
+    op.create_index(op.f('ix_storage_cleanup_outbox_content_hash'), 'storage_cleanup_outbox', ['content_hash'], unique=False)
+    op.create_index(op.f('ix_storage_cleanup_outbox_available_at'), 'storage_cleanup_outbox', ['available_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_storage_cleanup_outbox_available_at'), table_name='storage_cleanup_outbox')
+    op.drop_index(op.f('ix_storage_cleanup_outbox_content_hash'), table_name='storage_cleanup_outbox')
+    op.drop_index(op.f('ix_storage_cleanup_outbox_id'), table_name='storage_cleanup_outbox')
+    op.drop_table('storage_cleanup_outbox')
@@ -0,0 +1,56 @@
+"""Added image full text search
+
+Revision ID: f5b3d9e2c147
+Revises: e1a4c8f3b602
+Create Date: 2026-10-19 21:12:05.318442
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f5b3d9e2c147'
+down_revision: Union[str, None] = 'e1a4c8f3b602'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute(
+            "ALTER TABLE images ADD COLUMN search_vector tsvector "
+            "GENERATED ALWAYS AS (to_tsvector('english', content)) STORED"
+        )
+        op.create_index('ix_images_search_vector', 'images', ['search_vector'], unique=False, postgresql_using='gin')
+        return
+    op.execute(
+        "CREATE VIRTUAL TABLE images_fts "
+        "USING fts5(content, content='images', content_rowid='id', tokenize='porter unicode61')"
+    )
+    op.execute(
+        "CREATE TRIGGER images_fts_insert AFTER INSERT ON images BEGIN "
+        "INSERT INTO images_fts(rowid, content) VALUES (new.id, new.content); END"
+    )
+    op.execute(
+        "CREATE TRIGGER images_fts_delete AFTER DELETE ON images BEGIN "
+        "INSERT INTO images_fts(images_fts, rowid, content) VALUES ('delete', old.id, old.content); END"
+    )
+    op.execute(
+        "CREATE TRIGGER images_fts_update AFTER UPDATE OF content ON images BEGIN "
+        "INSERT INTO images_fts(images_fts, rowid, content) VALUES ('delete', old.id, old.content); "
+        "INSERT INTO images_fts(rowid, content) VALUES (new.id, new.content); END"
+    )
+    op.execute("INSERT INTO images_fts(images_fts) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_index('ix_images_search_vector', table_name='images', postgresql_using='gin')
+        op.drop_column('images', 'search_vector')
+        return
+    for trigger in ('images_fts_insert', 'images_fts_delete', 'images_fts_update'):
+        op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    op.execute("DROP TABLE IF EXISTS images_fts")
@@ -1,3 +1,6 @@
+import os
+import tempfile
+
 from dotenv import load_dotenv
 from pydantic_settings import BaseSettings
 from src.schemas.user import EmailStr
@@ -23,10 +26,49 @@ class Settings(BaseSettings):
     redis_port: int = 6379
     redis_password: str = '321312'
     redis_blacklist_db: int = 0
+    redis_cache_db: int = 1
     token_expire_time: int = 900
     cloudinary_name: str = "CLOUDINARY_NAME"
     cloudinary_api_key: int = 0
     cloudinary_api_secret: str = "CLOUDINARY_API_SECRET"
+    upload_concurrency: int = 8
+    batch_upload_max_files: int = 50
+    metadata_workers: int = 2
+    upload_staging_dir: str = os.path.join(tempfile.gettempdir(), "snapshare-uploads")
+    upload_max_size: int = 64 * 1024 * 1024
+    upload_session_ttl: int = 24 * 60 * 60
+    user_storage_quota: int = 1024 * 1024 * 1024
+    storage_cleanup_batch_size: int = 100
+    storage_cleanup_concurrency: int = 4
+    storage_cleanup_max_attempts: int = 8
+    storage_cleanup_backoff: int = 60
+    storage_cleanup_orphan_delay: int = 60 * 60
+    feed_size: int = 1000
+    timeline_size: int = 800
+    timeline_fanout_limit: int = 10000
+    response_cache_ttl: int = 30
+    response_cache_stale: int = 300
+    view_flush_interval: int = 10
+    view_unique_viewers: bool = True
+    # Unique viewer estimates of images not viewed for this many seconds expire
+    view_unique_ttl: int = 30 * 24 * 60 * 60
+    trending_half_life: int = 6 * 60 * 60
+    trending_size: int = 1000
+    trending_decay_interval: int = 300
+    rating_reconcile_interval: int = 60 * 60
+    # pg_trgm thresholds of the fuzzy search: word_similarity for the content, similarity for tag names
+    search_word_similarity_threshold: float = 0.4
+    search_similarity_threshold: float = 0.3
+    search_index_enabled: bool = True
+    search_index_path: str = os.path.join(tempfile.gettempdir(), "snapshare-search-index.msgpack")
+    search_index_sync_interval: float = 1.0
+    search_index_retention: int = 24 * 60 * 60
+    # Keyword searches with more candidates in the index are matched by the database alone
+    search_index_max_candidates: int = 500
+    # Tag combinations matching more images are filtered by the database instead of the tag bitmaps
+    tag_bitmap_max_ids: int = 500
+    # Loader strategy of the Image relationships; the test suite sets "raise" to catch undeclared lazy loads
+    relationship_lazy: str = "select"
 
 
 # Load .env file before initializing Settings
@@ -0,0 +1,20 @@
+from redis import StrictRedis
+
+from src.conf.config import settings
+
+redis_cache = StrictRedis(
+    host=settings.redis_host,
+    port=settings.redis_port,
+    password=settings.redis_password,
+    db=settings.redis_cache_db,
+)
+
+
+def get_cache() -> StrictRedis:
+    """
+    The get_cache function returns the Redis client of the read caches (feeds, timelines, counters).
+    The data kept there can always be rebuilt from the database.
+
+    :return: A Redis client
+    """
+    return redis_cache
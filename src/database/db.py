@@ -1,7 +1,13 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+import sqlite3
+from datetime import datetime
+
+from sqlalchemy import create_engine, event, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, sessionmaker
 
 from src.conf.config import settings
+from src.utils.trigram import similarity, word_similarity
 
 SQLALCHEMY_DATABASE_URL = f"postgresql://{settings.postgres_user}:{settings.postgres_password}@{settings.postgres_host}:{settings.postgres_port}/{settings.postgres_db}"
 
@@ -21,3 +27,37 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def dialect_insert(db: Session, table):
+    """
+    The dialect_insert function returns an INSERT construct of the session's database dialect.
+    Unlike the generic insert, it supports ON CONFLICT clauses on both PostgreSQL and SQLite.
+
+    :param db: Session: The database session the statement will be executed with
+    :param table: The mapped class or table to insert into
+    :return: A dialect specific insert statement
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        return postgresql.insert(table)
+    return sqlite.insert(table)
+
+
+def database_now(db: Session) -> datetime:
+    """
+    The database_now function returns the current time of the database, the clock that fills the created_at
+    columns (func.now()), naive like those columns. Ages of rows are computed against it, not the clock
+    of the application server.
+
+    :param db: Session: The database session
+    :return: The current time of the database
+    """
+    return db.scalar(select(func.now())).replace(tzinfo=None)
+
+
+@event.listens_for(Engine, "connect")
+def _register_sqlite_functions(dbapi_connection, connection_record):
+    # pg_trgm's similarity functions for SQLite databases (tests, single node deployments), without an index
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.create_function("similarity", 2, similarity, deterministic=True)
+        dbapi_connection.create_function("word_similarity", 2, word_similarity, deterministic=True)
@@ -0,0 +1,68 @@
+from typing import Iterable, List, Optional, Type
+
+from pydantic import BaseModel
+from sqlalchemy import inspect
+from sqlalchemy.orm import joinedload, selectinload
+
+
+def relationship_names(mapper, schema: Optional[Type[BaseModel]], extra: Iterable[str] = ()) -> List[str]:
+    """
+    The relationship_names function lists the relationships of a mapper that the given response model reads.
+
+    :param mapper: Mapper: The mapper of the queried class
+    :param schema: Optional[Type[BaseModel]]: The response model the rows will be serialized with
+    :param extra: Iterable[str]: Additional relationship names to load
+    :return: A list of unique relationship names
+    """
+    names = list(extra)
+    if schema is not None:
+        names += [name for name in schema.model_fields if name in mapper.relationships]
+        names += list(getattr(schema, "eager_load", ()))
+    return list(dict.fromkeys(names))
+
+
+def loader_options(model, schema: Optional[Type[BaseModel]], extra: Iterable[str] = ()) -> List:
+    """
+    The loader_options function returns the eager loading options a query needs to serialize its rows
+    with the given response model, so serialization never falls back to one lazy load per row.
+    Collections are loaded with selectinload (one extra query per page), many-to-one relationships
+    with joinedload (in the same query).
+
+    Schema fields named after a relationship of the model are loaded, as well as the relationships
+    listed in the schema's eager_load class variable and in extra, for flattened fields such as a username.
+
+    :param model: The mapped class being queried
+    :param schema: Optional[Type[BaseModel]]: The response model the rows will be serialized with
+    :param extra: Iterable[str]: Additional relationship names to load
+    :return: A list of loader options for Query.options
+    """
+    mapper = inspect(model)
+    relationships = mapper.relationships
+    options = []
+    for name in relationship_names(mapper, schema, extra):
+        attribute = getattr(model, name)
+        if relationships[name].uselist:
+            options.append(selectinload(attribute))
+        else:
+            options.append(joinedload(attribute))
+    return options
+
+
+def refresh_loaded(db, instance, schema: Optional[Type[BaseModel]]) -> None:
+    """
+    The refresh_loaded function reloads an instance after a commit together with the relationships
+    its response model serializes. A plain refresh leaves relationships unloaded, so the first
+    access afterwards would lazy load them.
+
+    :param db: Session: The database session the instance belongs to
+    :param instance: The persistent instance to reload
+    :param schema: Optional[Type[BaseModel]]: The response model the instance will be serialized with
+    :return: None
+    """
+    if schema is None:
+        db.refresh(instance)
+        return
+    mapper = inspect(type(instance))
+    names = relationship_names(mapper, schema)
+    # Column attributes are listed too, otherwise refresh would only load the named relationships
+    db.refresh(instance, [attribute.key for attribute in mapper.column_attrs] + names)
@@ -1,5 +1,5 @@
 from sqlalchemy.orm import declarative_base
-from sqlalchemy import Column, Integer, DateTime, func
+from sqlalchemy import Column, Integer, DateTime, event, func
 
 Base = declarative_base()
 
@@ -9,3 +9,13 @@ class BaseModel(Base):
     id = Column(Integer, primary_key=True, index=True)
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+
+class VersionMixin:
+    # Incremented on every update, ETags built from it change even when updated_at keeps its second
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+
+
+@event.listens_for(VersionMixin, "before_update", propagate=True)
+def bump_version(mapper, connection, target):
+    target.version = mapper.class_.version + 1
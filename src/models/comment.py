@@ -1,11 +1,12 @@
-from sqlalchemy import Column, Integer, String, func, ForeignKey
+from sqlalchemy import Column, Integer, String, func, ForeignKey, Index
 from sqlalchemy.sql.sqltypes import DateTime
 from sqlalchemy.orm import relationship
 
-from src.models.base import BaseModel
+from src.models.base import BaseModel, VersionMixin
 
-class Comment(BaseModel):
+class Comment(VersionMixin, BaseModel):
     __tablename__ = "comments"
+    __table_args__ = (Index("ix_comments_image_id_id", "image_id", "id"),)
 
     content = Column(String, nullable=False)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -0,0 +1,14 @@
+from sqlalchemy import Column, Integer, ForeignKey, JSON, DateTime, func
+from sqlalchemy.dialects.postgresql import JSONB
+
+from src.models.base import Base
+
+
+class ImageDocument(Base):
+    __tablename__ = "image_documents"
+
+    # One denormalized document per image: the image row, its tags, owner and rating and comment aggregates
+    image_id = Column(Integer, ForeignKey("images.id", ondelete="CASCADE"), primary_key=True)
+    user_id = Column(Integer, nullable=False, index=True)
+    document = Column(JSON().with_variant(JSONB(), "postgresql"), nullable=False)
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
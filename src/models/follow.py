@@ -0,0 +1,14 @@
+from sqlalchemy import Column, Integer, ForeignKey, Index, UniqueConstraint
+
+from src.models.base import BaseModel
+
+
+class Follow(BaseModel):
+    __tablename__ = "follows"
+    __table_args__ = (
+        UniqueConstraint("follower_id", "followed_id", name="uq_follows_follower_followed"),
+        Index("ix_follows_followed_id_follower_id", "followed_id", "follower_id"),
+    )
+
+    follower_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    followed_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
@@ -1,7 +1,8 @@
-from sqlalchemy import Table, Column, String, ForeignKey, Integer, DateTime, func
+from sqlalchemy import DDL, Table, Column, String, ForeignKey, Integer, BigInteger, DateTime, event, func, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 
-from src.models.base import BaseModel, Base
+from src.conf.config import settings
+from src.models.base import BaseModel, Base, VersionMixin
 
 image_m2m_tags = Table(
     "image_m2m_tags",
@@ -9,24 +10,79 @@ image_m2m_tags = Table(
     Column("id", Integer, primary_key=True),
     Column("image_id", Integer, ForeignKey("images.id", ondelete="CASCADE")),
     Column("tag_id", Integer, ForeignKey("tags.id", ondelete="CASCADE")),
+    UniqueConstraint("image_id", "tag_id", name="uq_image_m2m_tags_image_id_tag_id"),
 )
 
 
-class Image(BaseModel):
+class Image(VersionMixin, BaseModel):
     __tablename__ = "images"
+    __table_args__ = (
+        Index("ix_images_user_id_id", "user_id", "id"),
+        # Trigram index of the fuzzy search, PostgreSQL only
+        Index(
+            "ix_images_content_trgm", "content", postgresql_using="gin", postgresql_ops={"content": "gin_trgm_ops"}
+        ).ddl_if(dialect="postgresql"),
+    )
 
     image_url = Column(String, nullable=False)
     image_transformed_url = Column(String, nullable=True)
     content = Column(String, nullable=False)
+    content_hash = Column(String(64), nullable=True, index=True)
+    width = Column(Integer, nullable=True)
+    height = Column(Integer, nullable=True)
+    orientation = Column(String(16), nullable=True)
+    mime_type = Column(String(64), nullable=True)
+    byte_size = Column(BigInteger, nullable=True)
+    dominant_color = Column(String(7), nullable=True)
+    blurhash = Column(String(64), nullable=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    ratings = relationship("Rating", back_populates="image")
-    comments = relationship("Comment", back_populates="image")
-    user = relationship("User", back_populates="images")
-    tags = relationship("Tag", secondary=image_m2m_tags, back_populates="images")
+    ratings = relationship("Rating", back_populates="image", lazy=settings.relationship_lazy)
+    comments = relationship("Comment", back_populates="image", lazy=settings.relationship_lazy)
+    user = relationship("User", back_populates="images", lazy=settings.relationship_lazy)
+    tags = relationship("Tag", secondary=image_m2m_tags, back_populates="images", lazy=settings.relationship_lazy)
 
 
 class Tag(BaseModel):
     __tablename__ = "tags"
+    __table_args__ = (
+        Index(
+            "ix_tags_name_trgm", "name", postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"}
+        ).ddl_if(dialect="postgresql"),
+    )
 
     name = Column(String, unique=True)
-    images = relationship("Image", secondary=image_m2m_tags, back_populates="tags")
+    images = relationship("Image", secondary=image_m2m_tags, back_populates="tags", lazy=settings.relationship_lazy)
+
+
+# Full-text search on Image.content, used by the search queries only and therefore not mapped:
+# PostgreSQL keeps a generated tsvector column with a GIN index, SQLite an FTS5 index synced by triggers.
+# Both stem English words, so both match "sunsets" for "sunset".
+SEARCH_LANGUAGE = "english"
+SEARCH_VECTOR_COLUMN = "search_vector"
+FTS_TABLE = "images_fts"
+
+POSTGRESQL_FULL_TEXT_DDL = (
+    f"ALTER TABLE images ADD COLUMN {SEARCH_VECTOR_COLUMN} tsvector "
+    f"GENERATED ALWAYS AS (to_tsvector('{SEARCH_LANGUAGE}', content)) STORED",
+    f"CREATE INDEX ix_images_{SEARCH_VECTOR_COLUMN} ON images USING gin ({SEARCH_VECTOR_COLUMN})",
+)
+SQLITE_FULL_TEXT_DDL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+    "USING fts5(content, content='images', content_rowid='id', tokenize='porter unicode61')",
+    f"CREATE TRIGGER {FTS_TABLE}_insert AFTER INSERT ON images BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, content) VALUES (new.id, new.content); END",
+    f"CREATE TRIGGER {FTS_TABLE}_delete AFTER DELETE ON images BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content) VALUES ('delete', old.id, old.content); END",
+    f"CREATE TRIGGER {FTS_TABLE}_update AFTER UPDATE OF content ON images BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content) VALUES ('delete', old.id, old.content); "
+    f"INSERT INTO {FTS_TABLE}(rowid, content) VALUES (new.id, new.content); END",
+)
+
+event.listen(
+    Base.metadata, "before_create", DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql")
+)
+for statement in POSTGRESQL_FULL_TEXT_DDL:
+    event.listen(Image.__table__, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+for statement in SQLITE_FULL_TEXT_DDL:
+    event.listen(Image.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+event.listen(Image.__table__, "before_drop", DDL(f"DROP TABLE IF EXISTS {FTS_TABLE}").execute_if(dialect="sqlite"))
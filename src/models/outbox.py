@@ -0,0 +1,22 @@
+from sqlalchemy import Column, String, Integer, DateTime, Index, func
+
+from src.models.base import BaseModel
+
+
+class StorageCleanup(BaseModel):
+    __tablename__ = "storage_cleanup_outbox"
+
+    public_id = Column(String, nullable=False)
+    content_hash = Column(String(64), nullable=True, index=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    available_at = Column(DateTime, nullable=False, default=func.now(), index=True)
+    last_error = Column(String, nullable=True)
+
+
+class SearchIndexChange(BaseModel):
+    __tablename__ = "search_index_changes"
+    __table_args__ = (Index("ix_search_index_changes_created_at", "created_at"),)
+
+    image_id = Column(Integer, nullable=False)
+    # None when the image was deleted
+    content = Column(String, nullable=True)
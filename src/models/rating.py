@@ -1,8 +1,8 @@
-from sqlalchemy import Integer, ForeignKey, Column
+from sqlalchemy import DDL, Column, Computed, Float, ForeignKey, Index, Integer, event
 from sqlalchemy.orm import relationship
 
 from src.database.db import engine
-from src.models.base import BaseModel
+from src.models.base import Base, BaseModel
 from src.models.user import User
 from src.models.image import Image
 
@@ -11,8 +11,87 @@ class Rating(BaseModel):
     __tablename__ = "ratings"
 
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    image_id = Column(Integer, ForeignKey("images.id"), nullable=False)
+    image_id = Column(Integer, ForeignKey("images.id"), nullable=False, index=True)
     rating_score = Column(Integer, nullable=False)
 
     user = relationship("User", back_populates="ratings")
     image = relationship("Image", back_populates="ratings")
+
+
+# Scores a rating can have, with one counter column each in ImageRatingStats
+RATING_SCORES = range(1, 6)
+SCORE_COLUMNS = tuple(f"score_{score}" for score in RATING_SCORES)
+STATS_COLUMNS = ("rating_sum", "rating_count") + SCORE_COLUMNS
+
+
+class ImageRatingStats(Base):
+    __tablename__ = "image_rating_stats"
+    __table_args__ = (
+        # Serves the top rated images and the rating range filters with index scans
+        Index("ix_image_rating_stats_rating_average", "rating_average", "image_id"),
+    )
+
+    # Kept apart from images so rating writes neither lock nor touch the image rows.
+    # Maintained by the triggers below, in the same statement as the rating insert, update or delete.
+    image_id = Column(Integer, ForeignKey("images.id", ondelete="CASCADE"), primary_key=True)
+    rating_sum = Column(Integer, nullable=False, default=0)
+    rating_count = Column(Integer, nullable=False, default=0)
+    score_1 = Column(Integer, nullable=False, default=0)
+    score_2 = Column(Integer, nullable=False, default=0)
+    score_3 = Column(Integer, nullable=False, default=0)
+    score_4 = Column(Integer, nullable=False, default=0)
+    score_5 = Column(Integer, nullable=False, default=0)
+    # NULL once the last rating of the image is removed
+    rating_average = Column(Float, Computed("CAST(rating_sum AS FLOAT) / NULLIF(rating_count, 0)", persisted=True))
+
+
+def _stats_values(row: str, sign: str = "") -> str:
+    """
+    The _stats_values function returns the SQL values a rating row adds to the columns of STATS_COLUMNS,
+    negated with sign="-" for a removed rating.
+
+    :param row: str: The trigger row, new or old
+    :param sign: str: "" or "-"
+    :return: The comma separated values
+    """
+    scores = [f"CASE WHEN {row}.rating_score = {score} THEN {sign}1 ELSE 0 END" for score in RATING_SCORES]
+    return ", ".join([f"{sign}{row}.rating_score", f"{sign}1"] + scores)
+
+
+def _stats_upsert(row: str, sign: str = "") -> str:
+    columns = ", ".join(STATS_COLUMNS)
+    updates = ", ".join(f"{column} = image_rating_stats.{column} + excluded.{column}" for column in STATS_COLUMNS)
+    return (
+        f"INSERT INTO image_rating_stats (image_id, {columns}) VALUES ({row}.image_id, {_stats_values(row, sign)}) "
+        f"ON CONFLICT (image_id) DO UPDATE SET {updates}"
+    )
+
+
+POSTGRESQL_RATING_STATS_DDL = (
+    "CREATE OR REPLACE FUNCTION image_rating_stats_sync() RETURNS trigger AS $$ BEGIN "
+    f"IF TG_OP IN ('DELETE', 'UPDATE') THEN {_stats_upsert('OLD', '-')}; END IF; "
+    f"IF TG_OP IN ('INSERT', 'UPDATE') THEN {_stats_upsert('NEW')}; END IF; "
+    "RETURN NULL; END $$ LANGUAGE plpgsql",
+    "CREATE TRIGGER ratings_stats_sync AFTER INSERT OR DELETE OR UPDATE OF image_id, rating_score ON ratings "
+    "FOR EACH ROW EXECUTE FUNCTION image_rating_stats_sync()",
+)
+SQLITE_RATING_STATS_DDL = (
+    f"CREATE TRIGGER ratings_stats_insert AFTER INSERT ON ratings BEGIN {_stats_upsert('new')}; END",
+    f"CREATE TRIGGER ratings_stats_delete AFTER DELETE ON ratings BEGIN {_stats_upsert('old', '-')}; END",
+    f"CREATE TRIGGER ratings_stats_update AFTER UPDATE OF image_id, rating_score ON ratings BEGIN "
+    f"{_stats_upsert('old', '-')}; {_stats_upsert('new')}; END",
+    # SQLite does not enforce the ON DELETE CASCADE of image_id unless foreign keys are enabled
+    "CREATE TRIGGER images_rating_stats_delete AFTER DELETE ON images BEGIN "
+    "DELETE FROM image_rating_stats WHERE image_id = old.id; END",
+)
+
+# Created after all tables, the triggers reference ratings, images and image_rating_stats
+for statement in POSTGRESQL_RATING_STATS_DDL:
+    event.listen(Base.metadata, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+for statement in SQLITE_RATING_STATS_DDL:
+    event.listen(Base.metadata, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+event.listen(
+    Base.metadata,
+    "after_drop",
+    DDL("DROP FUNCTION IF EXISTS image_rating_stats_sync()").execute_if(dialect="postgresql"),
+)
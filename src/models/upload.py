@@ -0,0 +1,15 @@
+from sqlalchemy import Column, String, Integer, BigInteger, ForeignKey
+
+from src.models.base import BaseModel
+
+
+class UploadSession(BaseModel):
+    __tablename__ = "upload_sessions"
+
+    upload_id = Column(String(32), nullable=False, unique=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    filename = Column(String, nullable=True)
+    content = Column(String, nullable=False)
+    tags = Column(String, nullable=False, default="")
+    size = Column(BigInteger, nullable=False)
+    offset = Column(BigInteger, nullable=False, default=0)
@@ -28,3 +28,5 @@ class User(BaseModel):
     reset_password_token = Column(String(255), nullable=True)
     confirmed = Column(Boolean, default=False)
     ban_status = Column(Boolean, default=False)
+    # Kept in step with the follows table, decides whether new images are fanned out on write
+    followers_count = Column(Integer, nullable=False, default=0, server_default="0")
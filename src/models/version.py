@@ -0,0 +1,10 @@
+from sqlalchemy import Column, String, Integer
+
+from src.models.base import Base
+
+
+class CollectionVersion(Base):
+    __tablename__ = "collection_versions"
+
+    name = Column(String(64), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
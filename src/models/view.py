@@ -0,0 +1,20 @@
+from sqlalchemy import Column, Integer, BigInteger, String, ForeignKey, DateTime, func
+
+from src.models.base import Base
+
+
+class ImageViews(Base):
+    __tablename__ = "image_views"
+
+    # Kept apart from images so flushing the counters neither locks nor touches the image rows
+    image_id = Column(Integer, ForeignKey("images.id", ondelete="CASCADE"), primary_key=True)
+    views = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+
+class ViewFlush(Base):
+    __tablename__ = "view_flushes"
+
+    # Batches already added to image_views, so a batch retried after a crash is not counted twice
+    batch_id = Column(String(32), primary_key=True)
+    created_at = Column(DateTime, default=func.now(), index=True)
@@ -1,4 +1,5 @@
-from typing import List
+from datetime import datetime
+from typing import List, Optional, Tuple
 from fastapi import HTTPException
 from sqlalchemy.orm import Session
 from sqlalchemy import and_
@@ -27,21 +28,30 @@ async def get_comment(
 
 async def get_comments(
     image_id: int, 
-    db: Session
+    db: Session,
+    limit: Optional[int] = None,
+    after_id: Optional[int] = None
     ) -> List[Comment]:
     """
-    The get_comments function returns a list of comments for the image with the given id.
+    The get_comments function returns a list of comments for the image with the given id, oldest first.
         Args:
             image_id (int): The id of an image in the database.
             db (Session): A database session object to query from.
+            limit (Optional[int]): The page size, None returns every comment.
+            after_id (Optional[int]): Id of the last comment of the previous page.
         Returns:
             List[Comment]: A list of Comment objects that are associated with the given image_id.
     
     :param image_id: int: Filter the comments by image_id
     :param db: Session: Pass the database session to the function
+    :param limit: Optional[int]: Limit the number of comments returned
+    :param after_id: Optional[int]: Id of the last comment of the previous page
     :return: A list of comments
     """
-    return db.query(Comment).filter(Comment.image_id==image_id).limit(None).all()
+    query = db.query(Comment).filter(Comment.image_id==image_id)
+    if after_id is not None:
+        query = query.filter(Comment.id > after_id)
+    return query.order_by(Comment.id).limit(limit).all()
 
 async def create_comment(
                          body: CommentRequest, 
@@ -112,3 +122,14 @@ async def delete_comment(
         db.delete(comment)
         db.commit()
     return comment
+
+
+async def get_comment_times(since: datetime, db: Session) -> List[Tuple[int, datetime]]:
+    """
+    The get_comment_times function returns the image ids and creation times of the comments created since a point in time.
+
+    :param since: datetime: The oldest creation time returned
+    :param db: Session: Pass the database session to the function
+    :return: A list of (image_id, created_at) tuples
+    """
+    return db.query(Comment.image_id, Comment.created_at).filter(Comment.created_at >= since).all()
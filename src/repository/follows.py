@@ -0,0 +1,93 @@
+from typing import List, Tuple
+
+from sqlalchemy import and_, delete, update
+from sqlalchemy.orm import Session
+
+from src.database.db import dialect_insert
+from src.models.follow import Follow
+from src.models.user import User
+
+
+async def follow_user(follower: User, followed: User, db: Session) -> bool:
+    """
+    The follow_user function makes follower follow followed.
+    Following twice is a no-op; followers_count is only incremented when a follow was created.
+
+    :param follower: User: The user who follows
+    :param followed: User: The user being followed
+    :param db: Session: Pass the database session to the function
+    :return: True if the follow was created
+    """
+    stmt = (
+        dialect_insert(db, Follow)
+        .values(follower_id=follower.id, followed_id=followed.id)
+        .on_conflict_do_nothing(index_elements=["follower_id", "followed_id"])
+    )
+    created = db.execute(stmt).rowcount == 1
+    if created:
+        db.execute(
+            update(User).where(User.id == followed.id).values(followers_count=User.followers_count + 1)
+        )
+    db.commit()
+    return created
+
+
+async def unfollow_user(follower: User, followed: User, db: Session) -> bool:
+    """
+    The unfollow_user function makes follower stop following followed.
+
+    :param follower: User: The user who follows
+    :param followed: User: The user being followed
+    :param db: Session: Pass the database session to the function
+    :return: True if a follow was removed
+    """
+    removed = (
+        db.execute(
+            delete(Follow).where(and_(Follow.follower_id == follower.id, Follow.followed_id == followed.id))
+        ).rowcount
+        == 1
+    )
+    if removed:
+        db.execute(
+            update(User).where(User.id == followed.id).values(followers_count=User.followers_count - 1)
+        )
+    db.commit()
+    return removed
+
+
+async def get_followers_count(user_id: int, db: Session) -> int:
+    """
+    The get_followers_count function returns how many users follow a user.
+
+    :param user_id: int: The id of the followed user
+    :param db: Session: Pass the database session to the function
+    :return: The number of followers
+    """
+    return db.query(User.followers_count).filter(User.id == user_id).scalar() or 0
+
+
+async def get_follower_ids(user_id: int, db: Session) -> List[int]:
+    """
+    The get_follower_ids function returns the ids of the users following a user.
+
+    :param user_id: int: The id of the followed user
+    :param db: Session: Pass the database session to the function
+    :return: A list of user ids
+    """
+    return [follower_id for follower_id, in db.query(Follow.follower_id).filter(Follow.followed_id == user_id)]
+
+
+async def get_followed_users(user_id: int, db: Session) -> List[Tuple[int, int]]:
+    """
+    The get_followed_users function returns the users a user follows, with their number of followers.
+
+    :param user_id: int: The id of the following user
+    :param db: Session: Pass the database session to the function
+    :return: A list of (user id, followers_count) tuples
+    """
+    return (
+        db.query(User.id, User.followers_count)
+        .join(Follow, Follow.followed_id == User.id)
+        .filter(Follow.follower_id == user_id)
+        .all()
+    )
@@ -0,0 +1,201 @@
+from typing import Dict, Iterable, List, Set
+
+from sqlalchemy import delete, event, func, inspect, select
+from sqlalchemy.orm import Session
+
+from src.database.db import dialect_insert
+from src.models.comment import Comment
+from src.models.document import ImageDocument
+from src.models.image import Image, Tag, image_m2m_tags
+from src.models.rating import ImageRatingStats, Rating
+from src.models.user import User
+from src.schemas.image import ImageCardResponse
+
+# Ids of the images whose documents are rebuilt before the session commits, kept in Session.info
+PENDING_IMAGES = "image_documents_images"
+PENDING_USERS = "image_documents_users"
+# Ids of the images whose documents were rebuilt, kept in Session.info for after_commit hooks (the response cache)
+CHANGED_IMAGES = "image_documents_changed"
+IMAGE_COLUMNS = (
+    "id", "image_url", "content", "user_id", "width", "height", "orientation",
+    "mime_type", "byte_size", "dominant_color", "blurhash",
+)
+
+
+def build_image_documents(image_ids: Iterable[int], db: Session) -> Dict[int, dict]:
+    """
+    The build_image_documents function assembles the documents of the given images from the normalized tables:
+    the image row with its owner's username, its tags, its materialized rating aggregates and its comment count.
+    The cost is four queries whatever the number of images.
+
+    :param image_ids: Iterable[int]: The ids of the images
+    :param db: Session: Pass the database session to the function
+    :return: The documents by image id; images that do not exist are missing
+    """
+    image_ids = list(image_ids)
+    if not image_ids:
+        return {}
+    rows = db.execute(
+        select(Image, User.username).join(User, User.id == Image.user_id).where(Image.id.in_(image_ids))
+    ).all()
+    tags: Dict[int, List[dict]] = {}
+    for image_id, name in db.execute(
+        select(image_m2m_tags.c.image_id, Tag.name)
+        .join(Tag, Tag.id == image_m2m_tags.c.tag_id)
+        .where(image_m2m_tags.c.image_id.in_(image_ids))
+        .order_by(image_m2m_tags.c.id)
+    ):
+        tags.setdefault(image_id, []).append({"name": name})
+    ratings = {
+        image_id: (average, count)
+        for image_id, average, count in db.execute(
+            select(ImageRatingStats.image_id, ImageRatingStats.rating_average, ImageRatingStats.rating_count)
+            .where(ImageRatingStats.image_id.in_(image_ids))
+        )
+    }
+    comments = dict(
+        db.execute(
+            select(Comment.image_id, func.count()).where(Comment.image_id.in_(image_ids)).group_by(Comment.image_id)
+        ).all()
+    )
+
+    documents = {}
+    for image, username in rows:
+        document = {column: getattr(image, column) for column in IMAGE_COLUMNS}
+        average, ratings_count = ratings.get(image.id, (None, 0))
+        document.update(
+            created_at=image.created_at.isoformat() if image.created_at else None,
+            updated_at=image.updated_at.isoformat() if image.updated_at else None,
+            username=username,
+            tags=tags.get(image.id, []),
+            average_rating=round(float(average), 1) if average is not None else None,
+            ratings_count=ratings_count,
+            comments_count=comments.get(image.id, 0),
+        )
+        documents[image.id] = document
+    return documents
+
+
+def refresh_image_documents(image_ids: Iterable[int], db: Session) -> None:
+    """
+    The refresh_image_documents function rebuilds the stored documents of the given images with one upsert
+    and drops the documents of images that no longer exist. The image rows are locked first, so transactions
+    changing the same image (two ratings, a comment and a rating) rebuild its document one after the other,
+    each reading what the previous one committed. The caller is responsible for committing.
+
+    :param image_ids: Iterable[int]: The ids of the changed images
+    :param db: Session: Pass the database session to the function
+    :return: None
+    """
+    image_ids = set(image_ids)
+    if not image_ids:
+        return
+    # FOR NO KEY UPDATE does not wait for the key share locks taken by inserting ratings and comments,
+    # so two transactions that both inserted one do not deadlock
+    db.execute(select(Image.id).where(Image.id.in_(image_ids)).order_by(Image.id).with_for_update(key_share=True))
+    documents = build_image_documents(image_ids, db)
+    if documents:
+        stmt = dialect_insert(db, ImageDocument).values(
+            [
+                {"image_id": image_id, "user_id": document["user_id"], "document": document}
+                for image_id, document in documents.items()
+            ]
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["image_id"],
+            set_={"user_id": stmt.excluded.user_id, "document": stmt.excluded.document, "updated_at": func.now()},
+        )
+        db.execute(stmt)
+    removed = image_ids - documents.keys()
+    if removed:
+        db.execute(delete(ImageDocument).where(ImageDocument.image_id.in_(removed)))
+
+
+def mark_image_documents(db: Session, *image_ids: int) -> None:
+    """
+    The mark_image_documents function schedules the documents of images changed without the ORM
+    (bulk statements) for a rebuild when the session commits. Changes made through ORM objects
+    are picked up on flush without it.
+
+    :param db: Session: The session of the write
+    :param image_ids: int: The ids of the changed images
+    :return: None
+    """
+    db.info.setdefault(PENDING_IMAGES, set()).update(image_ids)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changed_images(session: Session, flush_context):
+    images: Set[int] = session.info.setdefault(PENDING_IMAGES, set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Image):
+            images.add(obj.id)
+        elif isinstance(obj, (Rating, Comment)) and obj.image_id is not None:
+            images.add(obj.image_id)
+        elif isinstance(obj, User) and obj in session.dirty and inspect(obj).attrs.username.history.has_changes():
+            session.info.setdefault(PENDING_USERS, set()).add(obj.id)
+
+
+@event.listens_for(Session, "before_commit")
+def _refresh_pending_documents(session: Session):
+    session.flush()
+    images = session.info.pop(PENDING_IMAGES, set())
+    users = session.info.pop(PENDING_USERS, set())
+    if users:
+        images.update(session.scalars(select(Image.id).where(Image.user_id.in_(users))))
+    images.discard(None)
+    if images:
+        refresh_image_documents(images, session)
+        session.info.setdefault(CHANGED_IMAGES, set()).update(images)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending_documents(session: Session):
+    session.info.pop(PENDING_IMAGES, None)
+    session.info.pop(PENDING_USERS, None)
+    session.info.pop(CHANGED_IMAGES, None)
+
+
+async def get_image_documents(image_ids: List[int], db: Session) -> List[ImageCardResponse]:
+    """
+    The get_image_documents function returns the image cards of the given images with a single primary key
+    lookup, in the order of the ids. Documents of images created before the read model existed are built
+    on read without being stored, reads never write; rebuild_image_documents stores them.
+    Ids of images that no longer exist are skipped.
+
+    :param image_ids: List[int]: The ids of the images
+    :param db: Session: Pass the database session to the function
+    :return: A list of image cards
+    """
+    if not image_ids:
+        return []
+    documents = dict(
+        db.execute(
+            select(ImageDocument.image_id, ImageDocument.document).where(ImageDocument.image_id.in_(image_ids))
+        ).all()
+    )
+    missing = [image_id for image_id in image_ids if image_id not in documents]
+    if missing:
+        documents.update(build_image_documents(missing, db))
+    return [ImageCardResponse.model_validate(documents[image_id]) for image_id in image_ids if image_id in documents]
+
+
+async def rebuild_image_documents(db: Session, batch_size: int = 500) -> int:
+    """
+    The rebuild_image_documents function rebuilds the documents of every image, batch by batch.
+
+    :param db: Session: Pass the database session to the function
+    :param batch_size: int: Number of images rebuilt per transaction
+    :return: The number of documents written
+    """
+    written, after_id = 0, 0
+    while True:
+        image_ids = db.scalars(
+            select(Image.id).where(Image.id > after_id).order_by(Image.id).limit(batch_size)
+        ).all()
+        if not image_ids:
+            return written
+        refresh_image_documents(image_ids, db)
+        db.commit()
+        written += len(image_ids)
+        after_id = image_ids[-1]
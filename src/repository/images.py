@@ -1,14 +1,28 @@
-from sqlalchemy import and_, or_
+from datetime import datetime
+from typing import List, Optional, Tuple, Type
+
+from pydantic import BaseModel
+from sqlalchemy import and_, or_, func, select, update
 from sqlalchemy.orm import Session
 
+from src.database.loaders import loader_options, refresh_loaded
 from src.models.image import Image, Tag
 from src.models.user import User
-from src.schemas.image import ImageCreate, ImageUpdate
-from src.repository.ratings import get_ratings
+from src.schemas.image import ImageCreate, ImageUpdate, ImageResponse
+from src.repository.rating_stats import get_rating_stats
+from src.repository.image_documents import mark_image_documents
+from src.repository.storage_cleanup import enqueue_storage_cleanup
+from src.repository.tags import resolve_tags, normalize_tag_names, link_image_tags
 
 
 async def create_image(
-    image_url: str, image_data: ImageCreate, current_user: User, db: Session
+    image_url: str,
+    image_data: ImageCreate,
+    current_user: User,
+    db: Session,
+    content_hash: Optional[str] = None,
+    schema: Optional[Type[BaseModel]] = None,
+    image_metadata: Optional[dict] = None,
 ):
     """
     The create_image function creates a new image in the database.
@@ -22,24 +36,208 @@ async def create_image(
     :param image_data: ImageCreate: Create an imagecreate object from the request body
     :param current_user: User: Get the current user's id
     :param db: Session: Create a connection to the database
+    :param content_hash: Optional[str]: SHA-256 of the uploaded bytes, used for deduplication
+    :param schema: Optional[Type[BaseModel]]: The response model the image is serialized with
+    :param image_metadata: Optional[dict]: Dimensions, MIME type, size, dominant color and blurhash of the file
     :return: A new image object
     """
     image_dump = image_data.model_dump()
-    list_tags = db.query(Tag).filter(Tag.name.in_(image_dump["tags"])).all()
-    if len(list_tags) == 0:
-        list_tags = [Tag(name=i) for i in image_dump["tags"]]
+    list_tags = await resolve_tags(image_dump["tags"], db)
     new_image = Image(
         image_url=image_url,
         content=image_dump["content"],
+        content_hash=content_hash,
         user_id=current_user.id,
+        **(image_metadata or {}),
     )
     new_image.tags = list_tags
     db.add(new_image)
     db.commit()
-    db.refresh(new_image)
+    refresh_loaded(db, new_image, schema)
     return new_image
 
 
+async def create_images(
+    images_data: List[Tuple[str, ImageCreate, Optional[str], Optional[dict]]],
+    current_user: User,
+    db: Session,
+) -> List[Image]:
+    """
+    The create_images function creates many images in a single transaction.
+    The tags of all images are resolved at once and the images with their tag links
+    are inserted together on commit.
+
+    :param images_data: List of (image_url, ImageCreate, content_hash, image_metadata) tuples
+    :param current_user: User: Get the current user's id
+    :param db: Session: Create a connection to the database
+    :return: A list of new image objects in the order of images_data
+    """
+    names = [name for _, image_data, _, _ in images_data for name in image_data.tags]
+    tags = {tag.name: tag for tag in await resolve_tags(names, db)}
+    new_images = []
+    for image_url, image_data, content_hash, image_metadata in images_data:
+        new_image = Image(
+            image_url=image_url,
+            content=image_data.content,
+            content_hash=content_hash,
+            user_id=current_user.id,
+            **(image_metadata or {}),
+        )
+        new_image.tags = [
+            tags[name] for name in normalize_tag_names(image_data.tags) if name in tags
+        ]
+        new_images.append(new_image)
+    db.add_all(new_images)
+    db.flush()
+    image_ids = [image.id for image in new_images]
+    db.commit()
+    # Reload every new image with its tags in two queries instead of one refresh per image
+    _ = (
+        db.query(Image)
+        .options(*loader_options(Image, ImageResponse))
+        .filter(Image.id.in_(image_ids))
+        .all()
+    )
+    return new_images
+
+
+async def add_image_tags(image: Image, tags: List[Tag], db: Session) -> Image:
+    """
+    The add_image_tags function links resolved tags to an existing image with one bulk insert
+    and commits the change. Tags that are already linked are skipped.
+
+    :param image: Image: The image to tag
+    :param tags: List[Tag]: Tags returned by resolve_tags
+    :param db: Session: Pass the database session to the function
+    :return: The image with its reloaded tags
+    """
+    await link_image_tags([(image.id, tag.id) for tag in tags], db)
+    # The links are inserted without the ORM, so the version the ETag of the image is built from is bumped here
+    db.execute(
+        update(Image)
+        .where(Image.id == image.id)
+        .values(version=Image.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    mark_image_documents(db, image.id)
+    db.commit()
+    refresh_loaded(db, image, ImageResponse)
+    return image
+
+
+async def get_images_by_hashes(content_hashes: List[str], db: Session) -> dict:
+    """
+    The get_images_by_hashes function maps every given content hash that is already stored to its asset url.
+
+    :param content_hashes: List[str]: SHA-256 digests of uploaded files
+    :param db: Session: Pass the database session to the function
+    :return: A dict of content_hash to image_url
+    """
+    if not content_hashes:
+        return {}
+    rows = (
+        db.query(Image.content_hash, Image.image_url)
+        .filter(Image.content_hash.in_(content_hashes))
+        .all()
+    )
+    return {content_hash: image_url for content_hash, image_url in rows}
+
+
+async def get_image_by_hash(content_hash: str, db: Session) -> Optional[Image]:
+    """
+    The get_image_by_hash function returns any image whose stored asset has the given content hash.
+    It is used to skip the storage upload when identical bytes were already uploaded, so the new
+    Image row can reuse the stored asset url.
+
+    :param content_hash: str: SHA-256 of the uploaded bytes
+    :param db: Session: Pass the database session to the function
+    :return: An image object or None
+    """
+    return db.query(Image).filter(Image.content_hash == content_hash).first()
+
+
+async def get_image_by_url(image_url: str, current_user: User, db: Session) -> Optional[Image]:
+    """
+    The get_image_by_url function returns the image stored under the given url if it is owned by the current user
+    (admins can access every image).
+
+    :param image_url: str: The stored image url
+    :param current_user: User: Get the current user
+    :param db: Session: Pass the database session to the function
+    :return: An image object or None
+    """
+    # Images stored before content addressing derive their asset id from the owner
+    return (
+        db.query(Image)
+        .options(*loader_options(Image, None, extra=("user",)))
+        .filter(
+            and_(
+                Image.image_url == image_url,
+                or_(Image.user_id == current_user.id, current_user.role == "admin"),
+            )
+        )
+        .first()
+    )
+
+
+async def get_user_storage_usage(current_user: User, db: Session, lock: bool = False) -> int:
+    """
+    The get_user_storage_usage function returns the number of bytes the user has uploaded,
+    as recorded when the images were created.
+    With lock, the user row is locked until the transaction ends first, so uploads of the same user that
+    check their quota with the lock are serialized and each one counts the images the others committed.
+    The lock does not conflict with the key share lock the image inserts take on the user row.
+
+    :param current_user: User: The user whose images are counted
+    :param db: Session: Pass the database session to the function
+    :param lock: bool: Lock the user row before counting
+    :return: The total byte size of the user's images
+    """
+    if lock:
+        db.execute(select(User.id).where(User.id == current_user.id).with_for_update(key_share=True))
+    return (
+        db.query(func.coalesce(func.sum(Image.byte_size), 0))
+        .filter(Image.user_id == current_user.id)
+        .scalar()
+    )
+
+
+async def get_duplicate_report(current_user: User, db: Session) -> List[dict]:
+    """
+    The get_duplicate_report function groups the current user's images by content hash and
+    returns every group that holds more than one image.
+
+    :param current_user: User: Get the current user's id
+    :param db: Session: Pass the database session to the function
+    :return: A list of dicts with content_hash, count and image_ids keys
+    """
+    duplicates = (
+        db.query(Image.content_hash, func.count(Image.id))
+        .filter(Image.user_id == current_user.id, Image.content_hash.isnot(None))
+        .group_by(Image.content_hash)
+        .having(func.count(Image.id) > 1)
+        .all()
+    )
+    if not duplicates:
+        return []
+    image_ids = {content_hash: [] for content_hash, _ in duplicates}
+    rows = (
+        db.query(Image.id, Image.content_hash)
+        .filter(
+            Image.user_id == current_user.id,
+            Image.content_hash.in_(list(image_ids.keys())),
+        )
+        .order_by(Image.id)
+        .all()
+    )
+    for image_id, content_hash in rows:
+        image_ids[content_hash].append(image_id)
+    return [
+        {"content_hash": content_hash, "count": count, "image_ids": image_ids[content_hash]}
+        for content_hash, count in duplicates
+    ]
+
+
 async def add_transform_url_image(
     image_url: str, transform_url: ImageCreate, current_user: User, db: Session
 ):
@@ -73,7 +271,11 @@ async def add_transform_url_image(
 
 
 async def update_image(
-    image_id, image_data: ImageUpdate, current_user: User, db: Session
+    image_id,
+    image_data: ImageUpdate,
+    current_user: User,
+    db: Session,
+    schema: Optional[Type[BaseModel]] = None,
 ):
     """
     The update_image function updates an image in the database.
@@ -86,11 +288,13 @@ async def update_image(
     :param image_data: ImageUpdate: Pass in the data that will be used to update the image
     :param current_user: User: Compare the user_id with the current_user
     :param db: Session: Create a database session
+    :param schema: Optional[Type[BaseModel]]: The response model the image is serialized with
     :return: An image
     """
     # Compare user_id with current_user.id
     image = (
         db.query(Image)
+        .options(*loader_options(Image, schema))
         .filter(
             and_(
                 Image.id == image_id,
@@ -104,7 +308,7 @@ async def update_image(
             setattr(image, var, value) if value else None
         db.add(image)
         db.commit()
-        db.refresh(image)
+        refresh_loaded(db, image, schema)
     return image
 
 
@@ -132,12 +336,14 @@ async def delete_image(image_id: int, current_user: User, db: Session):
         .first()
     )
     if db_image:
+        # The stored asset is removed later by the storage cleanup worker, see src/services/storage_cleanup.py
+        await enqueue_storage_cleanup(db_image, db)
         db.delete(db_image)
         db.commit()
     return db_image
 
 
-async def get_image(image_id: int, db: Session):
+async def get_image(image_id: int, db: Session, schema: Optional[Type[BaseModel]] = None):
     """
     The get_image function returns an image object from the database.
         Args:
@@ -148,33 +354,158 @@ async def get_image(image_id: int, db: Session):
 
     :param image_id: int: Filter the image by id
     :param db: Session: Pass the database session to the function
+    :param schema: Optional[Type[BaseModel]]: The response model the image is serialized with
     :return: An image object
     """
-    return db.query(Image).filter(and_(Image.id == image_id)).first()
+    return (
+        db.query(Image)
+        .options(*loader_options(Image, schema))
+        .filter(and_(Image.id == image_id))
+        .first()
+    )
 
 
-async def get_images(skip: int, limit: int, current_user: User, db: Session):
+async def get_image_validators(image_id: int, db: Session):
+    """
+    The get_image_validators function returns only the columns the ETag and Last-Modified headers of an image
+    are built from, so conditional requests are answered without loading the image and its tags.
+
+    :param image_id: int: Filter the image by id
+    :param db: Session: Pass the database session to the function
+    :return: A row with id, version and updated_at or None if the image does not exist
     """
-    The get_images function returns a list of images for the current user.
+    return db.execute(
+        select(Image.id, Image.version, Image.updated_at).where(Image.id == image_id)
+    ).first()
 
-    :param skip: int: Skip the first n images
+
+async def get_images(
+    skip: int,
+    limit: int,
+    current_user: User,
+    db: Session,
+    after_id: Optional[int] = None,
+    schema: Optional[Type[BaseModel]] = None,
+):
+    """
+    The get_images function returns a list of images for the current user, newest first.
+    Pages are addressed by keyset (the id of the last image of the previous page), which
+    costs the same at any depth; skip is only used when no keyset is given.
+
+    :param skip: int: Skip the first n images (deprecated, use after_id)
     :param limit: int: Limit the number of images returned
     :param current_user: User: Get the current user's id
     :param db: Session: Pass the database session to the function
+    :param after_id: Optional[int]: Id of the last image of the previous page
+    :param schema: Optional[Type[BaseModel]]: The response model the images are serialized with
     :return: A list of image objects
     """
-    return (
-        db.query(Image)
-        .filter(
-            or_(Image.user_id == current_user.id, current_user.role == "admin"),
+    query = _user_images_page(
+        db.query(Image).options(*loader_options(Image, schema)), skip, limit, current_user, after_id
+    )
+    return query.all()
+
+
+async def get_image_ids(
+    skip: int, limit: int, current_user: User, db: Session, after_id: Optional[int] = None
+) -> List[int]:
+    """
+    The get_image_ids function returns the ids of the page get_images would return, read from the
+    user_id, id index alone; the cards are then read from their documents.
+
+    :param skip: int: Skip the first n images (deprecated, use after_id)
+    :param limit: int: Limit the number of images returned
+    :param current_user: User: Get the current user's id
+    :param db: Session: Pass the database session to the function
+    :param after_id: Optional[int]: Id of the last image of the previous page
+    :return: A list of image ids, newest first
+    """
+    return [image_id for image_id, in _user_images_page(db.query(Image.id), skip, limit, current_user, after_id)]
+
+
+def _user_images_page(query, skip: int, limit: int, current_user: User, after_id: Optional[int]):
+    query = query.filter(
+        or_(Image.user_id == current_user.id, current_user.role == "admin"),
+    ).order_by(Image.id.desc())
+    if after_id is not None:
+        query = query.filter(Image.id < after_id)
+    else:
+        query = query.offset(skip)
+    return query.limit(limit)
+
+
+async def get_recent_image_ids_by_users(
+    user_ids: List[int], limit: int, db: Session, after_id: Optional[int] = None
+) -> List[int]:
+    """
+    The get_recent_image_ids_by_users function returns the ids of the newest images of the given users.
+
+    :param user_ids: List[int]: The ids of the owners
+    :param limit: int: Number of ids returned
+    :param db: Session: Pass the database session to the function
+    :param after_id: Optional[int]: Only return ids lower than this one
+    :return: A list of image ids, newest first
+    """
+    if not user_ids:
+        return []
+    query = db.query(Image.id).filter(Image.user_id.in_(user_ids))
+    if after_id is not None:
+        query = query.filter(Image.id < after_id)
+    return [image_id for image_id, in query.order_by(Image.id.desc()).limit(limit)]
+
+
+async def get_recent_image_keys(limit: int, db: Session) -> List[Tuple[int, datetime]]:
+    """
+    The get_recent_image_keys function returns the ids and creation times of the newest images of the site.
+
+    :param limit: int: Number of images returned
+    :param db: Session: Pass the database session to the function
+    :return: A list of (id, created_at) tuples, newest first
+    """
+    return db.query(Image.id, Image.created_at).order_by(Image.id.desc()).limit(limit).all()
+
+
+async def get_recent_image_page(
+    limit: int, before: Optional[Tuple[datetime, int]], db: Session
+) -> List[Tuple[int, datetime]]:
+    """
+    The get_recent_image_page function returns a page of the newest images of the site, ordered like the
+    recent images feed: by creation time, then by id. It serves the feed when Redis is unavailable.
+
+    :param limit: int: Number of images returned
+    :param before: Optional[Tuple[datetime, int]]: Creation time and id of the last image of the previous page
+    :param db: Session: Pass the database session to the function
+    :return: A list of (id, created_at) tuples, newest first
+    """
+    query = db.query(Image.id, Image.created_at)
+    if before is not None:
+        created_at, image_id = before
+        query = query.filter(
+            or_(Image.created_at < created_at, and_(Image.created_at == created_at, Image.id < image_id))
         )
-        .offset(skip)
-        .limit(limit)
-        .all()
+    return query.order_by(Image.created_at.desc(), Image.id.desc()).limit(limit).all()
+
+
+async def get_image_contents(after_id: int, limit: int, db: Session) -> List[Tuple[int, str]]:
+    """
+    The get_image_contents function returns the ids and contents of a batch of images, in id order.
+
+    :param after_id: int: Only images with a greater id are returned
+    :param limit: int: Number of images returned
+    :param db: Session: Pass the database session to the function
+    :return: A list of (id, content) tuples
+    """
+    return (
+        db.query(Image.id, Image.content).filter(Image.id > after_id).order_by(Image.id).limit(limit).all()
     )
 
 
-async def get_image_user(image_id: int, db: Session, current_user: User):
+async def get_image_user(
+    image_id: int,
+    db: Session,
+    current_user: User,
+    schema: Optional[Type[BaseModel]] = None,
+):
     """
     The get_image_user function returns the image with the given id if it exists and is owned by the current user.
         Args:
@@ -185,10 +516,12 @@ async def get_image_user(image_id: int, db: Session, current_user: User):
     :param image_id: int: Get the image id from the url
     :param db: Session: Pass the database session to the function
     :param current_user: User: Get the current user
+    :param schema: Optional[Type[BaseModel]]: The response model the image is serialized with
     :return: An image object
     """
     return (
         db.query(Image)
+        .options(*loader_options(Image, schema))
         .filter(
             and_(
                 Image.id == image_id,
@@ -199,25 +532,14 @@ async def get_image_user(image_id: int, db: Session, current_user: User):
     )
 
 
-async def average_rating(image_id: int, db: Session):
+async def average_rating(image_id: int, db: Session) -> float:
     """
-    The average_rating function takes an image_id and a database session as arguments.
-    It then queries the database for the image with that id, and if it exists, it gets all of its ratings.
-    If there are any ratings, it calculates their average score and sets that as the rating attribute of 
-    the Image object in question. It then commits this change to the database.
-    
+    The average_rating function returns the average rating of an image from its materialized rating aggregates,
+    which the database keeps up to date with every rating insert and delete.
+
     :param image_id: int: Specify the image id for which we want to get the average rating
     :param db: Session: Pass the database session to the function
-    :return: The average rating of an image
+    :return: The average rating of an image, 0 if it has no ratings
     """
-    image = db.query(Image).filter(Image.id == image_id).first()
-    if image:
-        ratings = await get_ratings(db, image_id=image_id)
-        rating_avg = 0
-        if len(ratings):
-            n_ratings = [r.rating_score for r in ratings]
-            rating_avg = float(sum(n_ratings)) / len(n_ratings)
-        image.rating = rating_avg
-        db.commit()
-        db.refresh(image)
-    return rating_avg
\ No newline at end of file
+    stats = await get_rating_stats(image_id, db)
+    return stats.rating_average if stats is not None and stats.rating_average is not None else 0
@@ -0,0 +1,120 @@
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import case, delete, exists, func, select
+from sqlalchemy.orm import Session
+
+from src.database.db import dialect_insert
+from src.models.image import Image
+from src.models.rating import RATING_SCORES, STATS_COLUMNS, ImageRatingStats, Rating
+from src.repository.image_documents import mark_image_documents
+
+EMPTY_STATS = (0,) * len(STATS_COLUMNS)
+
+
+async def get_rating_stats(image_id: int, db: Session) -> Optional[ImageRatingStats]:
+    """
+    The get_rating_stats function returns the rating aggregates of an image: sum, count, average and
+    the number of ratings of every score.
+
+    :param image_id: int: The id of the image
+    :param db: Session: Pass the database session to the function
+    :return: The aggregates, or None if the image was never rated
+    """
+    return db.get(ImageRatingStats, image_id)
+
+
+async def get_top_rated_ids(skip: int, limit: int, db: Session) -> List[int]:
+    """
+    The get_top_rated_ids function returns the ids of the images with the best average rating, best first,
+    read from the index on image_rating_stats.rating_average.
+
+    :param skip: int: Number of images skipped
+    :param limit: int: Number of images returned
+    :param db: Session: Pass the database session to the function
+    :return: A list of image ids
+    """
+    return db.scalars(
+        select(ImageRatingStats.image_id)
+        .where(ImageRatingStats.rating_average.is_not(None))
+        .order_by(ImageRatingStats.rating_average.desc(), ImageRatingStats.image_id.desc())
+        .offset(skip)
+        .limit(limit)
+    ).all()
+
+
+def _aggregate_ratings(image_ids: List[int], db: Session) -> Dict[int, Tuple[int, ...]]:
+    columns = [func.sum(Rating.rating_score), func.count()] + [
+        func.sum(case((Rating.rating_score == score, 1), else_=0)) for score in RATING_SCORES
+    ]
+    return {
+        image_id: tuple(int(value) for value in values)
+        for image_id, *values in db.execute(
+            select(Rating.image_id, *columns).where(Rating.image_id.in_(image_ids)).group_by(Rating.image_id)
+        )
+    }
+
+
+def _stored_stats(image_ids: List[int], db: Session, lock: bool = False) -> Dict[int, Tuple[int, ...]]:
+    query = select(ImageRatingStats.image_id, *[getattr(ImageRatingStats, column) for column in STATS_COLUMNS])
+    query = query.where(ImageRatingStats.image_id.in_(image_ids))
+    if lock:
+        query = query.with_for_update()
+    return {image_id: tuple(values) for image_id, *values in db.execute(query)}
+
+
+def _drifted(image_ids: List[int], stored: Dict, actual: Dict) -> List[int]:
+    return [
+        image_id for image_id in image_ids
+        if stored.get(image_id, EMPTY_STATS) != actual.get(image_id, EMPTY_STATS)
+    ]
+
+
+async def reconcile_rating_stats(db: Session, batch_size: int = 500) -> int:
+    """
+    The reconcile_rating_stats function repairs the rating aggregates that drifted from the ratings, for example
+    after ratings were loaded or edited with the triggers disabled. Images are compared batch by batch;
+    the aggregates of the drifted images are locked, computed again from the ratings and overwritten,
+    so a rating written meanwhile is either counted in the new values or applied on top of them by its trigger.
+    Aggregates of images that no longer exist are deleted.
+
+    :param db: Session: Pass the database session to the function
+    :param batch_size: int: Number of images compared per transaction
+    :return: The number of aggregates repaired or deleted
+    """
+    repaired, after_id = 0, 0
+    while True:
+        image_ids = db.scalars(
+            select(Image.id).where(Image.id > after_id).order_by(Image.id).limit(batch_size)
+        ).all()
+        if not image_ids:
+            break
+        after_id = image_ids[-1]
+        drifted = _drifted(image_ids, _stored_stats(image_ids, db), _aggregate_ratings(image_ids, db))
+        if drifted:
+            stored = _stored_stats(drifted, db, lock=True)
+            actual = _aggregate_ratings(drifted, db)
+            drifted = _drifted(drifted, stored, actual)
+        if drifted:
+            stmt = dialect_insert(db, ImageRatingStats).values(
+                [
+                    {"image_id": image_id, **dict(zip(STATS_COLUMNS, actual.get(image_id, EMPTY_STATS)))}
+                    for image_id in drifted
+                ]
+            )
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["image_id"],
+                set_={column: getattr(stmt.excluded, column) for column in STATS_COLUMNS},
+            )
+            db.execute(stmt)
+            # The image cards hold the average rating
+            mark_image_documents(db, *drifted)
+            logging.warning(f"Repaired the rating aggregates of images {drifted}")
+            repaired += len(drifted)
+        db.commit()
+
+    orphans = db.execute(
+        delete(ImageRatingStats).where(~exists().where(Image.id == ImageRatingStats.image_id))
+    ).rowcount
+    db.commit()
+    return repaired + orphans
@@ -1,4 +1,5 @@
-from typing import List
+from datetime import datetime
+from typing import List, Optional, Tuple
 
 from sqlalchemy import select
 from sqlalchemy.orm import Session
@@ -30,16 +31,23 @@ async def get_ratings(db: Session, image_id: int = 0, user_id: int = 0) -> List[
     return ratings
 
 
-async def get_all_ratings(offset: int, limit: int, db: Session) -> Rating:
+async def get_all_ratings(offset: int, limit: int, db: Session, after_id: Optional[int] = None) -> List[Rating]:
     """
-    The get_all_ratings function returns all ratings in the database.
-        
+    The get_all_ratings function returns all ratings in the database, ordered by id.
+        Pages are addressed by keyset when after_id is given, offset is the deprecated fallback.
     
-    :param rating_id: int: Filter the query by id
+    :param offset: int: Skip the first n ratings
+    :param limit: int: Limit the number of ratings returned
     :param db: Session: Pass in the database session
+    :param after_id: Optional[int]: Id of the last rating of the previous page
     :return: A list of rating objects
     """
-    sq = select(Rating).offset(offset).limit(limit)
+    sq = select(Rating).order_by(Rating.id)
+    if after_id is not None:
+        sq = sq.where(Rating.id > after_id)
+    else:
+        sq = sq.offset(offset)
+    sq = sq.limit(limit)
     ratings = db.execute(sq)
     return ratings.scalars().all()
 
@@ -86,4 +94,15 @@ async def remove_rating(rating_id: int, db: Session) -> Rating:
     if rating_to_remove:
         db.delete(rating_to_remove)
         db.commit()
-    return rating_to_remove
\ No newline at end of file
+    return rating_to_remove
+
+
+async def get_rating_times(since: datetime, db: Session) -> List[Tuple[int, datetime]]:
+    """
+    The get_rating_times function returns the image ids and creation times of the ratings created since a point in time.
+
+    :param since: datetime: The oldest creation time returned
+    :param db: Session: Pass the database session to the function
+    :return: A list of (image_id, created_at) tuples
+    """
+    return db.execute(select(Rating.image_id, Rating.created_at).where(Rating.created_at >= since)).all()
@@ -1,30 +1,148 @@
 from typing import List, Optional
 
-from sqlalchemy.orm import Session
-from sqlalchemy import or_, and_, func
+from sqlalchemy.orm import Query, Session
+from sqlalchemy import or_, and_, column, false, func, literal, literal_column, not_, select, table
 
+from src.conf.config import settings
 from src.models.base import Base
 from src.models.user import User
-from src.models.image import Image
-from src.models.rating import Rating
+from src.models.image import FTS_TABLE, SEARCH_LANGUAGE, SEARCH_VECTOR_COLUMN, Image, Tag, image_m2m_tags
+from src.models.rating import ImageRatingStats
+from src.repository.image_documents import get_image_documents
+from src.schemas.image import ImageCardResponse
 from src.schemas.user import UserSearchResponse
+from src.services.search_index import search_ids
+from src.services.tag_bitmaps import get_tagged_image_ids
+from src.utils.full_text import websearch_to_fts5
 
-async def get_rating_score(image_id: int, db: Session) -> Optional[float]:
+def filter_by_average_rating(images_query: Query, min_rating: Optional[int], max_rating: Optional[int]) -> Query:
     """
-    The get_rating_score function takes in an image_id and a database session,
-    and returns the average rating score for that image. If there are no ratings
-    for the given image, it returns None.
-    
-    :param image_id: int: Specify the image id of the image to be rated
-    :param db: Session: Pass in the database session to the function
-    :return: A float or none
+    The filter_by_average_rating function restricts a query on images to the images whose average rating
+    lies between min_rating and max_rating, with a range scan of the index on the materialized averages
+    (image_rating_stats.rating_average). Images without ratings count as an average of 0, as in get_images_by_user.
+
+    :param images_query: Query: The query on images
+    :param min_rating: Optional[int]: The lowest average kept, None for no lower bound
+    :param max_rating: Optional[int]: The highest average kept, None for no upper bound
+    :return: The filtered query
     """
-    rating = (
-        db.query(func.avg(Rating.rating_score))
-        .filter(Rating.image_id == image_id)
-        .scalar()
-    )
-    return round(rating, 1) if rating is not None else None
+    average = ImageRatingStats.rating_average
+    bounds = []
+    if min_rating is not None:
+        bounds.append(average >= min_rating)
+    if max_rating is not None:
+        bounds.append(average <= max_rating)
+    if not bounds:
+        return images_query
+    rated = select(ImageRatingStats.image_id).where(*bounds)
+    if min_rating is not None and min_rating > 0:
+        # Unrated images are below the range, only rated images can match
+        return images_query.filter(Image.id.in_(rated))
+    if max_rating is not None and max_rating < 0:
+        return images_query.filter(false())
+    # Unrated images are in the range, so exclude the rated images whose average is outside of it
+    outside = select(ImageRatingStats.image_id).where(average.is_not(None), not_(and_(*bounds)))
+    return images_query.filter(Image.id.notin_(outside))
+
+
+def filter_by_tags(images_query: Query, names: List[str], mode: str) -> Query:
+    """
+    The filter_by_tags function combines several tags in the database, for the combinations the tag bitmaps
+    leave to it (see get_tagged_image_ids): mode "all" keeps the images having every tag, "any" the images
+    having at least one of them and "none" the images having none of them.
+
+    :param images_query: Query: The query on images
+    :param names: List[str]: The tag names
+    :param mode: str: One of "all", "any" and "none"
+    :return: The filtered query
+    """
+    if mode == "all":
+        return images_query.filter(and_(*(Image.tags.any(Tag.name == name) for name in set(names))))
+    tagged = Image.tags.any(Tag.name.in_(names))
+    return images_query.filter(tagged if mode == "any" else not_(tagged))
+
+
+def filter_by_content(images_query: Query, keyword: str, db: Session):
+    """
+    The filter_by_content function restricts a query on images to the images whose content matches a
+    full-text search, written in the syntax of websearch_to_tsquery (words, "phrases", OR, -word).
+    PostgreSQL matches the generated tsvector column through its GIN index and ranks with ts_rank,
+    SQLite matches its FTS5 index and ranks with bm25.
+
+    :param images_query: Query: The query on images
+    :param keyword: str: The search typed by the user
+    :param db: Session: Pass the database session to the function
+    :return: The filtered query and the ORDER BY expression of the ranking (None when nothing ranks the matches)
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        ts_query = func.websearch_to_tsquery(SEARCH_LANGUAGE, keyword)
+        search_vector = literal_column(f"images.{SEARCH_VECTOR_COLUMN}")
+        return images_query.filter(search_vector.op("@@")(ts_query)), func.ts_rank(search_vector, ts_query).desc()
+
+    required, excluded = websearch_to_fts5(keyword)
+    if required is None and excluded is None:
+        return images_query.filter(false()), None
+    fts = table(FTS_TABLE, column("rowid"))
+    match = literal_column(FTS_TABLE).op("MATCH")
+    if required is None:
+        return images_query.filter(Image.id.notin_(select(fts.c.rowid).where(match(excluded)))), None
+    if excluded is not None:
+        required = f"({required}) NOT ({excluded})"
+    images_query = images_query.join(fts, fts.c.rowid == Image.id).filter(match(required))
+    # bm25 is lower for better matches
+    return images_query, func.bm25(literal_column(FTS_TABLE))
+
+
+def _escape_like(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def filter_by_similarity(images_query: Query, tag: Optional[str], keyword: Optional[str], db: Session):
+    """
+    The filter_by_similarity function restricts a query on images to fuzzy matches: images with a tag similar
+    to tag, and images whose content contains keyword or a word close to it (misspellings, word beginnings).
+    On PostgreSQL the matches are found with the pg_trgm operators % and <%, which use the trigram GIN indexes
+    of tags.name and images.content; the thresholds are set for the current transaction from the settings.
+    Other databases compute the same similarity functions row by row.
+
+    :param images_query: Query: The query on images
+    :param tag: Optional[str]: The tag name searched
+    :param keyword: Optional[str]: The word or fragment searched in the content
+    :param db: Session: Pass the database session to the function
+    :return: The filtered query and the ORDER BY expression of the ranking, most similar first
+    """
+    postgresql = db.get_bind().dialect.name == "postgresql"
+    if postgresql:
+        db.execute(
+            select(
+                func.set_config("pg_trgm.similarity_threshold", str(settings.search_similarity_threshold), True),
+                func.set_config(
+                    "pg_trgm.word_similarity_threshold", str(settings.search_word_similarity_threshold), True
+                ),
+            )
+        )
+    rank = None
+    if tag:
+        if postgresql:
+            tag_match = Tag.name.op("%")(tag)
+        else:
+            tag_match = func.similarity(Tag.name, tag) >= settings.search_similarity_threshold
+        images_query = images_query.filter(Image.tags.any(tag_match))
+        rank = (
+            select(func.max(func.similarity(Tag.name, tag)))
+            .join(image_m2m_tags, image_m2m_tags.c.tag_id == Tag.id)
+            .where(image_m2m_tags.c.image_id == Image.id)
+            .scalar_subquery()
+        )
+    if keyword:
+        if postgresql:
+            content_match = literal(keyword).op("<%")(Image.content)
+        else:
+            content_match = func.word_similarity(keyword, Image.content) >= settings.search_word_similarity_threshold
+        substring_match = Image.content.ilike(f"%{_escape_like(keyword)}%", escape="\\")
+        images_query = images_query.filter(or_(content_match, substring_match))
+        rank = func.word_similarity(keyword, Image.content)
+    return images_query, rank.desc() if rank is not None else None
 
 
 async def get_images_by_search(
@@ -35,46 +153,72 @@ async def get_images_by_search(
     max_rating: int,
     start_date: Optional[str],
     end_date: Optional[str],
-) -> List[Image]:
+    fuzzy: bool = False,
+    tags: Optional[List[str]] = None,
+    mode: str = "all",
+) -> List[ImageCardResponse]:
     """
     The get_images_by_search function takes in a database session, tag, keyword, min_rating, max_rating and start/end dates.
-    It then queries the database for images that match the search criteria. It returns a list of Image objects.
+    It then queries the database for the ids of the images that match the search criteria and reads the
+    matching image cards, with their tags and average rating, from their documents.
+    The keyword is matched by a full-text search in the database (see filter_by_content), whose matches are returned
+    best first. When the in-process search index is loaded (see src/services/search_index.py), the search is
+    restricted to its candidates, unless there are more than settings.search_index_max_candidates of them.
+    In fuzzy mode the tag and keyword are matched by trigram similarity instead (see filter_by_similarity).
+    Several tags are combined with the tag bitmaps (see src/services/tag_bitmaps.py) according to mode,
+    or in the database (see filter_by_tags) when they match more than settings.tag_bitmap_max_ids images.
     
     :param db: Session: Pass in the database session
     :param tag: str: Filter the images by tag
-    :param keyword: str: Search for a keyword in the image content
+    :param keyword: str: Full-text search in the image content
     :param min_rating: int: Filter images by the minimum rating score
     :param max_rating: int: Filter the images by their rating score
     :param start_date: Optional[str]: Filter images by the date they were created
     :param end_date: Optional[str]: Filter images based on the date they were created
+    :param fuzzy: bool: Match similar tags and keywords, for misspelled or partial terms
+    :param tags: Optional[List[str]]: Tag names combined according to mode
+    :param mode: str: "all" (images with every tag), "any" (with one of them) or "none" (with none of them)
     :param : Filter the images by tag
     :return: A list of images that match the search criteria
     """
-    images_query = db.query(Image)
+    images_query = db.query(Image.id)
+    rank = None
 
     # Apply search based on the query
-    if tag:
-        images_query = images_query.filter(Image.tags.any(name=tag))
-    if keyword:
-        images_query = images_query.filter(Image.content.ilike(f"%{keyword}%"))
+    if fuzzy:
+        images_query, rank = filter_by_similarity(images_query, tag, keyword, db)
+    else:
+        if tag:
+            images_query = images_query.filter(Image.tags.any(name=tag))
+        if keyword:
+            candidates = await search_ids(keyword, db)
+            if candidates is not None and not candidates:
+                return []
+            if candidates is not None and len(candidates) <= settings.search_index_max_candidates:
+                images_query = images_query.filter(Image.id.in_(candidates))
+            images_query, rank = filter_by_content(images_query, keyword, db)
+
+    if tags:
+        tagged_ids = await get_tagged_image_ids(tags, mode, db)
+        if tagged_ids is None:
+            images_query = filter_by_tags(images_query, tags, mode)
+        elif not tagged_ids:
+            return []
+        else:
+            images_query = images_query.filter(Image.id.in_(tagged_ids))
 
     # Apply filters
-    if min_rating is not None:
-        images_query = images_query.filter(Image.ratings.any(Rating.rating_score >= min_rating))
+    images_query = filter_by_average_rating(images_query, min_rating, max_rating)
 
-    if max_rating is not None:
-        images_query = images_query.filter(Image.ratings.any(Rating.rating_score <= max_rating))
-        
     if start_date is not None:
         images_query = images_query.filter(Image.created_at >= start_date)
 
     if end_date is not None:
         images_query = images_query.filter(Image.created_at <= end_date)
 
-    images = images_query.all()
-    for image in images:
-        image.average_rating = await get_rating_score(image.id, db)
-    return images
+    order = (Image.id,) if rank is None else (rank, Image.id)
+    image_ids = [image_id for image_id, in images_query.order_by(*order).all()]
+    return await get_image_documents(image_ids, db)
 
 
 async def get_images_by_user(
@@ -84,7 +228,7 @@ async def get_images_by_user(
     max_rating: int = 5,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None
-) -> List[Image]:
+) -> List[UserSearchResponse]:
     """
     The get_images_by_user function returns a list of images that are associated with the user_id passed in.
         The function also takes optional parameters to filter the results by rating and date range.
@@ -97,13 +241,18 @@ async def get_images_by_user(
     :param end_date: Optional[str]: Filter the images by their created_at date
     :return: A list of usersearchresponse objects
     """
-    query = db.query(Image).filter(Image.user_id == user_id)
-    if min_rating is not None or max_rating is not None:
-        query = query.join(Rating, isouter=True).group_by(Image.id)
-        if min_rating is not None:
-            query = query.having(func.coalesce(func.avg(Rating.rating_score), 0) >= min_rating)
-        if max_rating is not None:
-            query = query.having(func.coalesce(func.avg(Rating.rating_score), 0) <= max_rating)
+    # The average is read from the materialized aggregates of the image, in the same statement
+    average = ImageRatingStats.rating_average
+    query = (
+        db.query(Image, User.username, average)
+        .join(User, User.id == Image.user_id)
+        .outerjoin(ImageRatingStats, ImageRatingStats.image_id == Image.id)
+        .filter(Image.user_id == user_id)
+    )
+    if min_rating is not None:
+        query = query.filter(func.coalesce(average, 0) >= min_rating)
+    if max_rating is not None:
+        query = query.filter(func.coalesce(average, 0) <= max_rating)
 
     if start_date is not None:
         query = query.filter(Image.created_at >= start_date)
@@ -111,19 +260,16 @@ async def get_images_by_user(
     if end_date is not None:
         query = query.filter(Image.created_at <= end_date)
 
-    images = query.all()
-    result_list = []
-    for image in images:
-        result = UserSearchResponse(
+    return [
+        UserSearchResponse(
             id=image.id,
             image_url=image.image_url,
-            username=image.user.username,
+            username=username,
             created_at=image.created_at,
             updated_at=image.updated_at,
             user_id=image.user_id,
             content=image.content,
-            average_rating=await get_rating_score(image.id, db)
+            average_rating=round(float(rating), 1) if rating is not None else None,
         )
-        result_list.append(result)
-
-    return result_list
+        for image, username, rating in query.order_by(Image.id).all()
+    ]
@@ -0,0 +1,82 @@
+from datetime import datetime
+from typing import Iterable, List, Tuple
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+
+from src.models.outbox import SearchIndexChange
+
+ID_BATCH_SIZE = 500
+
+
+async def get_search_index_changes(after_id: int, limit: int, db: Session) -> List[Tuple[int, int, str]]:
+    """
+    The get_search_index_changes function returns a batch of content changes recorded for the search index,
+    in id order.
+
+    :param after_id: int: Only changes with a greater id are returned
+    :param limit: int: Number of changes returned
+    :param db: Session: Pass the database session to the function
+    :return: A list of (id, image id, content) tuples, the content is None for deleted images
+    """
+    return db.execute(
+        select(SearchIndexChange.id, SearchIndexChange.image_id, SearchIndexChange.content)
+        .where(SearchIndexChange.id > after_id)
+        .order_by(SearchIndexChange.id)
+        .limit(limit)
+    ).all()
+
+
+async def get_search_index_changes_by_id(change_ids: Iterable[int], db: Session) -> List[Tuple[int, int, str]]:
+    """
+    The get_search_index_changes_by_id function returns the content changes with the given ids that are
+    committed, in id order. The ids are looked up ID_BATCH_SIZE at a time.
+
+    :param change_ids: Iterable[int]: The ids of the changes
+    :param db: Session: Pass the database session to the function
+    :return: A list of (id, image id, content) tuples, the content is None for deleted images
+    """
+    change_ids = sorted(change_ids)
+    changes = []
+    for start in range(0, len(change_ids), ID_BATCH_SIZE):
+        changes += db.execute(
+            select(SearchIndexChange.id, SearchIndexChange.image_id, SearchIndexChange.content)
+            .where(SearchIndexChange.id.in_(change_ids[start:start + ID_BATCH_SIZE]))
+            .order_by(SearchIndexChange.id)
+        ).all()
+    return changes
+
+
+async def get_search_index_change_ids(after_id: int, db: Session) -> List[int]:
+    """
+    The get_search_index_change_ids function returns the ids of the committed content changes after an id.
+
+    :param after_id: int: Only changes with a greater id are returned
+    :param db: Session: Pass the database session to the function
+    :return: A list of ids
+    """
+    return db.scalars(select(SearchIndexChange.id).where(SearchIndexChange.id > after_id)).all()
+
+
+async def get_last_search_index_change_id(db: Session) -> int:
+    """
+    The get_last_search_index_change_id function returns the id of the last committed content change.
+
+    :param db: Session: Pass the database session to the function
+    :return: The id, 0 when no change is recorded
+    """
+    return db.scalar(select(func.coalesce(func.max(SearchIndexChange.id), 0)))
+
+
+async def delete_search_index_changes(before: datetime, db: Session) -> int:
+    """
+    The delete_search_index_changes function deletes the content changes recorded before a date.
+    The deletion is committed.
+
+    :param before: datetime: Changes created before this date are deleted
+    :param db: Session: Pass the database session to the function
+    :return: The number of deleted changes
+    """
+    deleted = db.execute(delete(SearchIndexChange).where(SearchIndexChange.created_at < before)).rowcount
+    db.commit()
+    return deleted
@@ -0,0 +1,165 @@
+from datetime import datetime, timedelta
+from typing import Iterable, List, Set
+
+from sqlalchemy import and_, func, select
+from sqlalchemy.orm import Session
+
+from src.models.image import Image
+from src.models.outbox import StorageCleanup
+from src.utils.image_utils import get_content_public_id
+
+
+async def enqueue_storage_cleanup(image: Image, db: Session) -> None:
+    """
+    The enqueue_storage_cleanup function records that the stored asset of an image may have to be deleted.
+    It does not commit: the entry is written in the same transaction as the deletion of the image,
+    so either both happen or neither does.
+    Legacy images without a content hash share one per-user public id with the other legacy uploads
+    of their owner and are never cleaned up.
+
+    :param image: Image: The image being deleted
+    :param db: Session: Pass the database session to the function
+    :return: None
+    """
+    if not image.content_hash:
+        return
+    await enqueue_asset_cleanup(image.content_hash, db)
+
+
+async def enqueue_asset_cleanup(content_hash: str, db: Session, delay: int = 0) -> None:
+    """
+    The enqueue_asset_cleanup function records that the content-addressed asset of a content hash may have to
+    be deleted, once delay seconds have passed. Like every entry, it is only deleted if no image uses it by then.
+    It does not commit.
+
+    :param content_hash: str: SHA-256 of the asset bytes
+    :param db: Session: Pass the database session to the function
+    :param delay: int: Seconds before the entry is due
+    :return: None
+    """
+    db.add(
+        StorageCleanup(
+            public_id=get_content_public_id(content_hash),
+            content_hash=content_hash,
+            attempts=0,
+            available_at=datetime.now() + timedelta(seconds=delay),
+        )
+    )
+
+
+async def get_pending_cleanup_hashes(content_hashes: Iterable[str], db: Session) -> Set[str]:
+    """
+    The get_pending_cleanup_hashes function returns the content hashes among the given ones whose asset
+    has an entry in the outbox that was not handled yet.
+
+    :param content_hashes: Iterable[str]: SHA-256 digests of the assets
+    :param db: Session: Pass the database session to the function
+    :return: A set of content hashes
+    """
+    content_hashes = set(content_hashes)
+    if not content_hashes:
+        return set()
+    return set(
+        db.scalars(select(StorageCleanup.content_hash).where(StorageCleanup.content_hash.in_(content_hashes))).all()
+    )
+
+
+async def claim_storage_cleanups(batch_size: int, max_attempts: int, db: Session) -> List[StorageCleanup]:
+    """
+    The claim_storage_cleanups function returns the next entries of the outbox that are due, oldest first.
+    On PostgreSQL the rows stay locked until the batch is committed and locked rows are skipped,
+    so several workers can drain the outbox side by side.
+
+    :param batch_size: int: Maximum number of entries returned
+    :param max_attempts: int: Entries that failed this many times are left for inspection
+    :param db: Session: Pass the database session to the function
+    :return: A list of outbox entries
+    """
+    return (
+        db.query(StorageCleanup)
+        .filter(
+            and_(
+                StorageCleanup.available_at <= datetime.now(),
+                StorageCleanup.attempts < max_attempts,
+            )
+        )
+        .order_by(StorageCleanup.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+
+
+def lock_assets(content_hashes: Iterable[str], db: Session) -> None:
+    """
+    The lock_assets function takes the lock of the assets of the given content hashes until the transaction ends.
+    Uploads take it before reusing or uploading an asset and keep it until their image is committed, the storage
+    cleanup takes it before checking that an asset is unused and keeps it until the asset is deleted, so an upload
+    never links an image to an asset that is being deleted. On PostgreSQL it is a transaction level advisory lock;
+    the locks are taken in a fixed order, so two transactions never wait for each other.
+
+    :param content_hashes: Iterable[str]: SHA-256 digests of the assets
+    :param db: Session: Pass the database session to the function
+    :return: None
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        return
+    for content_hash in sorted(set(content_hashes)):
+        # The first 60 bits of the digest fit the signed 64 bit key of the lock
+        db.execute(select(func.pg_advisory_xact_lock(int(content_hash[:15], 16))))
+
+
+async def is_asset_referenced(content_hash: str, db: Session) -> bool:
+    """
+    The is_asset_referenced function checks whether an image still points at the asset of a content hash.
+    Identical uploads share one asset, so it may only be deleted once no image uses it anymore.
+
+    :param content_hash: str: SHA-256 of the asset bytes
+    :param db: Session: Pass the database session to the function
+    :return: True if an image still uses the asset
+    """
+    return db.query(Image.id).filter(Image.content_hash == content_hash).first() is not None
+
+
+async def get_referenced_hashes(content_hashes: Iterable[str], db: Session) -> Set[str]:
+    """
+    The get_referenced_hashes function returns the content hashes among the given ones whose asset
+    an image still points at (see is_asset_referenced).
+
+    :param content_hashes: Iterable[str]: SHA-256 digests of the assets
+    :param db: Session: Pass the database session to the function
+    :return: A set of content hashes
+    """
+    content_hashes = set(content_hashes)
+    if not content_hashes:
+        return set()
+    return set(db.scalars(select(Image.content_hash).where(Image.content_hash.in_(content_hashes))).all())
+
+
+async def complete_storage_cleanup(public_id: str, db: Session) -> None:
+    """
+    The complete_storage_cleanup function removes every outbox entry of an asset once it is handled,
+    including entries of other deleted images that shared it.
+    The change is committed with the rest of the batch.
+
+    :param public_id: str: Public id of the handled asset
+    :param db: Session: Pass the database session to the function
+    :return: None
+    """
+    db.query(StorageCleanup).filter(StorageCleanup.public_id == public_id).delete(synchronize_session=False)
+
+
+async def retry_storage_cleanup(entry: StorageCleanup, error: str, backoff: int, db: Session) -> None:
+    """
+    The retry_storage_cleanup function reschedules a failed entry with an exponential backoff.
+    The change is committed with the rest of the batch.
+
+    :param entry: StorageCleanup: The failed entry
+    :param error: str: Why the cleanup failed
+    :param backoff: int: Delay before the first retry in seconds, doubled on every further attempt
+    :param db: Session: Pass the database session to the function
+    :return: None
+    """
+    entry.attempts += 1
+    entry.last_error = error[:500]
+    entry.available_at = datetime.now() + timedelta(seconds=backoff * 2 ** (entry.attempts - 1))
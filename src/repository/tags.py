@@ -1,20 +1,120 @@
-from sqlalchemy import select
+from typing import Iterable, List, Optional, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
-from src.models.image import Tag
+from src.database.db import dialect_insert
+from src.models.image import Image, Tag, image_m2m_tags
+from src.repository.image_documents import mark_image_documents
+from src.repository.versions import TAGS_COLLECTION, bump_collection_version
+from src.services.tag_bitmaps import mark_tag_links
 from src.schemas.tag import TagRequest
 
-async def get_tags(offset: int, limit: int, db: Session):
+
+def normalize_tag_names(names: Iterable[str]) -> List[str]:
     """
-    The get_tags function returns a list of tags from the database.
-        
+    The normalize_tag_names function strips and collapses the whitespace of every tag name,
+    drops empty names and removes duplicates while keeping the original order.
+
+    :param names: Iterable[str]: Raw tag names
+    :return: A list of normalized, unique tag names
+    """
+    normalized = (" ".join(name.split()) for name in names)
+    return list(dict.fromkeys(name for name in normalized if name))
+
+
+async def resolve_tags(names: Iterable[str], db: Session) -> List[Tag]:
+    """
+    The resolve_tags function returns the Tag objects for the given names, creating the missing ones.
+    Every tag write path goes through it: missing tags are created with a single
+    INSERT ... ON CONFLICT DO NOTHING RETURNING statement and the tags that already existed
+    are loaded with one select, so the cost does not grow with the number of tags.
+    The caller is responsible for committing.
+
+    :param names: Iterable[str]: Raw tag names
+    :param db: Session: Pass the database session to the function
+    :return: A list of tags in the order of the normalized names
+    """
+    names = normalize_tag_names(names)
+    if not names:
+        return []
+    stmt = (
+        dialect_insert(db, Tag)
+        .values([{"name": name} for name in names])
+        .on_conflict_do_nothing(index_elements=["name"])
+        .returning(Tag)
+    )
+    tags = {tag.name: tag for tag in db.scalars(stmt).all()}
+    if tags:
+        await bump_collection_version(TAGS_COLLECTION, db)
+    existing = [name for name in names if name not in tags]
+    if existing:
+        tags.update(
+            {tag.name: tag for tag in db.scalars(select(Tag).where(Tag.name.in_(existing))).all()}
+        )
+    return [tags[name] for name in names if name in tags]
+
+
+async def link_image_tags(links: List[Tuple[int, int]], db: Session):
+    """
+    The link_image_tags function links images to tags with one bulk insert into image_m2m_tags.
+    Links that already exist are skipped. The caller is responsible for committing.
+
+    :param links: List[Tuple[int, int]]: (image_id, tag_id) pairs
+    :param db: Session: Pass the database session to the function
+    :return: None
+    """
+    if not links:
+        return
+    stmt = (
+        dialect_insert(db, image_m2m_tags)
+        .values([{"image_id": image_id, "tag_id": tag_id} for image_id, tag_id in links])
+        .on_conflict_do_nothing(index_elements=["image_id", "tag_id"])
+    )
+    db.execute(stmt)
+    mark_tag_links(db, links)
+
+
+async def touch_tagged_images(tag_id: int, db: Session):
+    """
+    The touch_tagged_images function bumps the version of every image linked to a tag,
+    so their ETags, cached responses and documents follow when the tag is renamed or removed.
+    The caller is responsible for committing.
+
+    :param tag_id: int: The id of the changed tag
+    :param db: Session: Pass the database session to the function
+    :return: None
+    """
+    tagged = select(image_m2m_tags.c.image_id).where(image_m2m_tags.c.tag_id == tag_id)
+    image_ids = db.scalars(
+        update(Image)
+        .where(Image.id.in_(tagged))
+        .values(version=Image.version + 1)
+        .returning(Image.id)
+        .execution_options(synchronize_session=False)
+    ).all()
+    mark_image_documents(db, *image_ids)
+
+
+async def get_tags(offset: int, limit: int, db: Session, after_id: Optional[int] = None):
+    """
+    The get_tags function returns a list of tags from the database, ordered by id.
+        Pages are addressed by keyset when after_id is given, offset is the deprecated fallback.
     
     :param offset: int: Specify the starting point of the query
     :param limit: int: Limit the number of tags returned
     :param db: Session: Pass the database session to the function
+    :param after_id: Optional[int]: Id of the last tag of the previous page
     :return: A list of strings, so the return type is list[str]
     """
-    sq = select(Tag).offset(offset).limit(limit)
+    sq = select(Tag).order_by(Tag.id)
+    if after_id is not None:
+        sq = sq.where(Tag.id > after_id)
+    else:
+        sq = sq.offset(offset)
+    sq = sq.limit(limit)
     tags = db.execute(sq)
     return tags.scalars().all()
 
@@ -37,30 +137,41 @@ async def create_tag(body: TagRequest, db: Session):
     
     :param body: TagRequest: Get the name of the tag from the request body
     :param db: Session: Pass the database session to the function
-    :return: A tag, so the return type of create_tag_handler should be tag
+    :return: A tag, or None if the normalized name is empty
     """
-    tag = db.query(Tag).filter_by(name=body.name).first()
-    if tag is None:
-        tag = Tag(name=body.name)
-        db.add(tag)
-        db.commit()
-        db.refresh(tag)
-    return tag
+    tags = await resolve_tags([body.name], db)
+    if not tags:
+        return None
+    db.commit()
+    return tags[0]
 
 async def update_tag(tag_id: int, body: TagRequest, db: Session):
     """
     The update_tag function updates a tag in the database.
-        
+        The new name is normalized like the names resolve_tags creates, so a renamed tag is matched by later upserts.
     
     :param tag_id: int: Identify the tag to be updated
     :param body: TagRequest: Pass the data to be updated
     :param db: Session: Access the database
     :return: The updated tag
+    :raises HTTPException: 400 if the normalized name is empty, 409 if another tag has the name
     """
     tag = db.query(Tag).filter(Tag.id == tag_id).first()
     if tag:
-        tag .name = body.name
-        db.commit()
+        names = normalize_tag_names([body.name])
+        if not names:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Tag name is required")
+        if db.scalar(select(Tag.id).where(Tag.name == names[0], Tag.id != tag_id)) is not None:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Tag already exists")
+        tag.name = names[0]
+        await touch_tagged_images(tag_id, db)
+        await bump_collection_version(TAGS_COLLECTION, db)
+        try:
+            db.commit()
+        except IntegrityError:
+            # Another request created or renamed a tag to the same name meanwhile
+            db.rollback()
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Tag already exists")
     return tag
 
 
@@ -75,6 +186,8 @@ async def remove_tag(tag_id: int, db: Session):
     """
     tag = db.query(Tag).filter(Tag.id == tag_id).first()
     if tag:
+        await touch_tagged_images(tag_id, db)
+        await bump_collection_version(TAGS_COLLECTION, db)
         db.delete(tag)
         db.commit()
     return tag
\ No newline at end of file
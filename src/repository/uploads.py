@@ -0,0 +1,131 @@
+import uuid
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy import and_, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from src.models.upload import UploadSession
+from src.models.user import User
+from src.schemas.upload import UploadCreate
+
+
+async def create_upload_session(body: UploadCreate, tags: List[str], current_user: User, db: Session) -> UploadSession:
+    """
+    The create_upload_session function starts a resumable upload for the current user.
+
+    :param body: UploadCreate: The announced file name, size and image details
+    :param tags: List[str]: The normalized tags of the image
+    :param current_user: User: The user who uploads the image
+    :param db: Session: Pass the database session to the function
+    :return: The new upload session
+    """
+    upload = UploadSession(
+        upload_id=uuid.uuid4().hex,
+        user_id=current_user.id,
+        filename=body.filename,
+        content=body.content,
+        tags=",".join(tags),
+        size=body.size,
+        offset=0,
+    )
+    db.add(upload)
+    db.commit()
+    db.refresh(upload)
+    return upload
+
+
+async def get_upload_session(upload_id: str, current_user: User, db: Session) -> Optional[UploadSession]:
+    """
+    The get_upload_session function returns an upload session of the current user.
+
+    :param upload_id: str: The id returned when the upload was created
+    :param current_user: User: The user who uploads the image
+    :param db: Session: Pass the database session to the function
+    :return: The upload session or None
+    """
+    return (
+        db.query(UploadSession)
+        .filter(and_(UploadSession.upload_id == upload_id, UploadSession.user_id == current_user.id))
+        .first()
+    )
+
+
+async def lock_upload_session(upload: UploadSession, db: Session) -> bool:
+    """
+    The lock_upload_session function locks the row of an upload session until the transaction ends and reloads it,
+    so the requests of one upload run one at a time across all workers. The lock is not waited for:
+    a request that finds it taken gives up instead of holding a connection while the other request appends its chunk.
+
+    :param upload: UploadSession: The upload session
+    :param db: Session: Pass the database session to the function
+    :return: True if the row is locked, False if another request holds the lock
+    """
+    try:
+        db.refresh(upload, with_for_update={"nowait": True})
+    except OperationalError:
+        db.rollback()
+        return False
+    return True
+
+
+async def advance_upload_offset(upload: UploadSession, expected_offset: int, new_offset: int, db: Session) -> bool:
+    """
+    The advance_upload_offset function acknowledges received bytes by moving the offset of an upload forward.
+    The update only applies while the stored offset still equals expected_offset, so two requests
+    appending to the same upload cannot both be acknowledged.
+
+    :param upload: UploadSession: The upload session
+    :param expected_offset: int: The offset the appended chunk started at
+    :param new_offset: int: The offset after the chunk
+    :param db: Session: Pass the database session to the function
+    :return: True if the offset was moved
+    """
+    result = db.execute(
+        update(UploadSession)
+        .where(and_(UploadSession.id == upload.id, UploadSession.offset == expected_offset))
+        .values(offset=new_offset)
+    )
+    db.commit()
+    db.refresh(upload)
+    return result.rowcount == 1
+
+
+async def delete_upload_session(upload: UploadSession, db: Session) -> None:
+    """
+    The delete_upload_session function removes a finished or aborted upload session.
+
+    :param upload: UploadSession: The upload session
+    :param db: Session: Pass the database session to the function
+    :return: None
+    """
+    db.delete(upload)
+    db.commit()
+
+
+async def discard_upload_session(upload: UploadSession, db: Session) -> None:
+    """
+    The discard_upload_session function marks an upload session for deletion without committing,
+    so it is removed in the same transaction as the image created from it.
+
+    :param upload: UploadSession: The upload session
+    :param db: Session: Pass the database session to the function
+    :return: None
+    """
+    db.delete(upload)
+
+
+async def pop_expired_upload_sessions(ttl: int, db: Session) -> List[str]:
+    """
+    The pop_expired_upload_sessions function deletes the upload sessions started more than ttl seconds ago.
+
+    :param ttl: int: Lifetime of an upload session in seconds
+    :param db: Session: Pass the database session to the function
+    :return: The upload ids of the deleted sessions, so their staged files can be removed
+    """
+    expired = db.query(UploadSession).filter(UploadSession.created_at < datetime.now() - timedelta(seconds=ttl)).all()
+    for upload in expired:
+        db.delete(upload)
+    db.commit()
+    return [upload.upload_id for upload in expired]
@@ -0,0 +1,41 @@
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from src.database.db import dialect_insert
+from src.models.version import CollectionVersion
+
+TAGS_COLLECTION = "tags"
+# Names of the collections bumped in the transaction, kept in Session.info for after_commit hooks (the response cache)
+CHANGED_COLLECTIONS = "collection_versions_changed"
+
+
+async def bump_collection_version(name: str, db: Session) -> None:
+    """
+    The bump_collection_version function increments the version counter of a collection,
+    so ETags of list responses built from it change. It runs in the transaction of the write
+    that changed the collection, the caller is responsible for committing. The name is kept in
+    Session.info under CHANGED_COLLECTIONS until the commit.
+
+    :param name: str: The name of the collection
+    :param db: Session: Pass the database session to the function
+    :return: None
+    """
+    stmt = (
+        dialect_insert(db, CollectionVersion)
+        .values(name=name, version=1)
+        .on_conflict_do_update(index_elements=["name"], set_={"version": CollectionVersion.version + 1})
+    )
+    db.execute(stmt)
+    db.info.setdefault(CHANGED_COLLECTIONS, set()).add(name)
+
+
+async def get_collection_version(name: str, db: Session) -> int:
+    """
+    The get_collection_version function returns the version counter of a collection.
+
+    :param name: str: The name of the collection
+    :param db: Session: Pass the database session to the function
+    :return: The version, 0 for a collection that was never written
+    """
+    version = db.execute(select(CollectionVersion.version).where(CollectionVersion.name == name)).scalar()
+    return version or 0
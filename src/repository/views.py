@@ -0,0 +1,65 @@
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import delete, exists, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from src.database.db import dialect_insert
+from src.models.image import Image
+from src.models.view import ImageViews, ViewFlush
+
+UPSERT_CHUNK_SIZE = 1000
+# Flushed batch ids are kept long enough to recognize any retried batch
+FLUSH_RETENTION = timedelta(days=1)
+
+
+async def apply_view_counts(batch_id: str, counts: Dict[int, int], db: Session) -> bool:
+    """
+    The apply_view_counts function adds a batch of view counts to image_views with chunked upserts and records
+    the batch id in the same transaction, so a batch that is retried after a crash is applied only once.
+    Counts of images deleted in the meantime are dropped. Commits the transaction.
+
+    :param batch_id: str: The id of the flushed batch
+    :param counts: Dict[int, int]: New views by image id
+    :param db: Session: Pass the database session to the function
+    :return: True if the batch was applied, False if it had been applied before
+    """
+    if db.get(ViewFlush, batch_id) is not None:
+        return False
+    existing = set(db.scalars(select(Image.id).where(Image.id.in_(counts))).all()) if counts else set()
+    rows = [{"image_id": image_id, "views": count} for image_id, count in counts.items() if image_id in existing]
+    for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+        stmt = dialect_insert(db, ImageViews).values(rows[start:start + UPSERT_CHUNK_SIZE])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["image_id"], set_={"views": ImageViews.views + stmt.excluded.views}
+        )
+        db.execute(stmt)
+    db.add(ViewFlush(batch_id=batch_id))
+    db.execute(delete(ViewFlush).where(ViewFlush.created_at < datetime.utcnow() - FLUSH_RETENTION))
+    try:
+        db.commit()
+    except IntegrityError:
+        # Another flusher applied the same batch concurrently
+        db.rollback()
+        return False
+    return True
+
+
+async def get_view_count(image_id: int, db: Session, batch_id: Optional[str] = None) -> Tuple[int, bool]:
+    """
+    The get_view_count function returns the flushed view count of an image and whether a flush batch was applied.
+    Both are read in one statement, so they describe the same state of the database.
+
+    :param image_id: int: The id of the image
+    :param db: Session: Pass the database session to the function
+    :param batch_id: Optional[str]: The id of a flush batch
+    :return: The number of views stored in the database and True if batch_id was applied
+    """
+    views, applied = db.execute(
+        select(
+            select(ImageViews.views).where(ImageViews.image_id == image_id).scalar_subquery(),
+            exists().where(ViewFlush.batch_id == batch_id),
+        )
+    ).one()
+    return views or 0, bool(applied) and batch_id is not None
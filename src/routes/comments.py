@@ -1,6 +1,6 @@
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Response
 from sqlalchemy.orm import Session
 from src.schemas.comment import CommentRequest, CommentResponse
 from src.database.db import get_db
@@ -10,19 +10,31 @@ from src.repository import images as repository_images
 
 from src.services.auth_service import auth_service
 from src.models.user import User, UserRole
-from src.services import roles
+from src.services import roles, trending
+from src.services.response_cache import IMAGE_COMMENTS_TAG, cache_response
+from src.utils.conditional import conditional_response, make_etag
+from src.utils.pagination import parse_cursor, set_next_cursor
+from src.utils.serialization import SerializedListRoute
 
-router = APIRouter(prefix='/comments', tags=["comments"])
+router = APIRouter(prefix='/comments', tags=["comments"], route_class=SerializedListRoute)
 
 @router.get("/all/", response_model = List[CommentResponse])
+@cache_response(tags=[IMAGE_COMMENTS_TAG])
 async def read_comments(
+    response: Response,
     image_id: int = 0, 
+    limit: int = 100,
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db)
     ):
     """
-    The read_comments function returns a list of comments for the image with the given ID.
+    The read_comments function returns a page of comments for the image with the given ID, oldest first.
+    When another page follows, the X-Next-Cursor response header holds its cursor.
     
+    :param response: Response: Set the X-Next-Cursor header
     :param image_id: int: Specify the image id for which we want to get comments
+    :param limit: int: Limit the number of comments returned
+    :param cursor: Optional[str]: The X-Next-Cursor value of the previous page
     :param db: Session: Pass the database session to the function
     :return: A list of comments
     """
@@ -31,19 +43,24 @@ async def read_comments(
     image = await repository_images.get_image(image_id, db)
     if not image:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image not found")
-    comments = await repository_comments.get_comments(image_id, db)
-    if not comments:
+    comments = await repository_comments.get_comments(image_id, db, limit=limit + 1, after_id=parse_cursor(cursor))
+    if not comments and cursor is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No comments have been found for this photo")
-    return comments
+    return set_next_cursor(response, comments, limit)
 
 @router.get("/get/{comment_id}/", response_model=CommentResponse)
 async def read_comment(
+    request: Request,
+    response: Response,
     comment_id: int = 0,
     db: Session = Depends(get_db)
     ):
     """
     The read_comment function returns a single comment from the database.
+    Conditional requests for an unchanged comment are answered with 304 Not Modified.
     
+    :param request: Request: Read the If-None-Match and If-Modified-Since headers
+    :param response: Response: Set the ETag and Last-Modified headers
     :param comment_id: int: Pass the comment id to the function
     :param db: Session: Pass the database session to the function
     :return: A comment object
@@ -53,6 +70,10 @@ async def read_comment(
     comment = await repository_comments.get_comment(comment_id, db)
     if not comment:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Comment not found')
+    etag = make_etag("comment", comment.id, comment.version, comment.updated_at)
+    not_modified = conditional_response(request, response, etag, comment.updated_at)
+    if not_modified is not None:
+        return not_modified
     return comment
     
 @router.post("/add_comments/", response_model=CommentResponse)
@@ -82,7 +103,9 @@ async def create_comment(
     image = await repository_images.get_image(image_id=image_id, db=db)
     if image is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image not found")
-    return await repository_comments.create_comment(body, current_user, image_id, db)
+    comment = await repository_comments.create_comment(body, current_user, image_id, db)
+    trending.record_comment(image_id)
+    return comment
 
 @router.put("/update/{comment_id}/", response_model=CommentResponse)
 async def update_comment(body: CommentRequest, 
@@ -1,38 +1,115 @@
-from fastapi import APIRouter, HTTPException, Depends, status, UploadFile, File, Query
+import asyncio
+import os
+from typing import List, Optional
+
+from fastapi import APIRouter, HTTPException, Depends, status, UploadFile, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import RedirectResponse
 from sqlalchemy.orm import Session
 
+from src.conf.config import settings
 from src.database.db import get_db
 from src.models.user import User
-from src.models.image import Tag
-from src.schemas.image import ImageCreate, ImageResponse, ImageUpdate, ImageURLResponse
+from src.schemas.image import (
+    ImageCardResponse,
+    ImageCreate,
+    ImageResponse,
+    ImageUpdate,
+    ImageURLResponse,
+    ImageDuplicateResponse,
+    ImageBatchResponse,
+    ImageViewsResponse,
+)
 from src.schemas.tag import TagResponse
 from src.repository import images as repository_images
+from src.repository import tags as repository_tags
+from src.repository import rating_stats as repository_rating_stats
+from src.repository.image_documents import get_image_documents
+from src.repository import storage_cleanup as repository_storage_cleanup
+from src.repository.storage_cleanup import lock_assets
 from src.utils.qr_code import create_qr_code_from_url
+from src.utils.conditional import conditional_response, is_conditional, make_etag
+from src.utils.pagination import NEXT_CURSOR_HEADER, parse_cursor, parse_score_cursor, set_next_cursor
+from src.utils.serialization import SerializedListRoute
+from src.utils.image_metadata import extract_upload_metadata
+from src.services import feed, timeline, trending
+from src.services.image_store import queue_orphaned_assets, restore_cleaned_assets, store_image
+from src.services.upload_validation import (
+    ValidatedBatchUpload,
+    check_storage_quota,
+    get_upload_body,
+    get_upload_file,
+    validate_batch_upload,
+)
 from src.utils.image_utils import (
+    IMMUTABLE_CACHE_CONTROL,
+    compute_file_hash,
+    get_asset_url,
+    get_cloudinary_public_id,
+    get_image_public_id,
+    is_content_addressed_url,
     post_cloudinary_image,
     get_cloudinary_image_transformation,
 )
 from src.services.auth_service import auth_service
+from src.services.response_cache import IMAGE_TAG, cache_response
+from src.services.view_counter import get_views, track_views
 import logging
 
 
-router = APIRouter(prefix="/images", tags=["images"])
+router = APIRouter(prefix="/images", tags=["images"], route_class=SerializedListRoute)
+
+# create_new reads its multipart body itself, so the form is documented explicitly
+IMAGE_UPLOAD_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {
+                        "tags": {"type": "array", "items": {"type": "string"}},
+                        "file": {"type": "string", "format": "binary"},
+                    },
+                    "required": ["file"],
+                }
+            }
+        },
+    }
+}
+
+
+def image_etag(image) -> str:
+    """
+    The image_etag function builds the ETag of an image response from the image's id, version and updated_at.
+
+    :param image: An Image or a row returned by get_image_validators
+    :return: The ETag header value
+    """
+    return make_etag("image", image.id, image.version, image.updated_at)
 
 
 @router.post(
-    "/create_new", response_model=ImageResponse, status_code=status.HTTP_201_CREATED
+    "/create_new",
+    response_model=ImageResponse,
+    status_code=status.HTTP_201_CREATED,
+    openapi_extra=IMAGE_UPLOAD_REQUEST_BODY,
 )
 async def create_image(
-    file: UploadFile = File(...),
-    body: ImageCreate = Depends(),
+    file: UploadFile = Depends(get_upload_file),
+    body: ImageCreate = Depends(get_upload_body),
     user: User = Depends(auth_service.get_current_user),
     db: Session = Depends(get_db),
 ):
     """
     Creates a new image for the user.
 
+    The request body is streamed through validate_image_upload: oversized bodies, uploads over the user's
+    storage quota, too many tags and files that are not images are rejected before or while the body is read.
     The function first checks if the number of tags in the request does not exceed the maximum limit (5).
-    It then uploads the provided image file to Cloudinary and creates a new image record in the database.
+    It then hashes the provided image file and uploads it to Cloudinary, unless identical bytes were
+    already uploaded, in which case the stored asset is reused. The dimensions, MIME type, size, dominant color
+    and blurhash of the file are extracted in the metadata worker pool. Finally it creates a new image record in the database.
 
     Args:
         file (UploadFile): The image file to be uploaded.
@@ -57,11 +134,11 @@ async def create_image(
         )
 
     try:
-        # Upload the image to Cloudinary
-        image_url = post_cloudinary_image(file, user)
-
-        # Create the image in the database
-        images = await repository_images.create_image(image_url, body, user, db)
+        # Skip the storage upload when identical bytes are already stored
+        content_hash = await run_in_threadpool(compute_file_hash, file.file)
+        images = await store_image(
+            file.file, content_hash, body, user, db, schema=ImageResponse
+        )
         if images is None:
             logging.error(f"Image creation failed for user {user.id}.")
             raise HTTPException(
@@ -70,11 +147,187 @@ async def create_image(
 
         return images
 
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Error in image creation for user {user.id}: {e}")
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@router.post("/batch", response_model=ImageBatchResponse)
+async def create_images_batch(
+    upload: ValidatedBatchUpload = Depends(validate_batch_upload),
+    user: User = Depends(auth_service.get_current_user),
+    db: Session = Depends(get_db),
+):
+    """
+    Creates many images for the user in one request.
+
+    Every file comes with its own content and its own comma separated tags (matched by position).
+    The body is streamed through the checks of the single upload: files that are not images or exceed
+    the maximum file size reject the batch before anything is stored.
+    Files are hashed, their metadata extracted in the metadata worker pool, and uploaded to Cloudinary
+    concurrently, bounded by the upload_concurrency setting;
+    bytes that are already stored (or repeated inside the batch) are uploaded only once.
+    Files that no longer fit into the user's storage quota are rejected, in the order of the request.
+    No lock is held meanwhile; the assets and the user's usage are then locked, the quota checked again
+    and all images and their tag links inserted in a single short transaction.
+
+    Args:
+        upload (ValidatedBatchUpload): The image files with the content and comma separated tags of every image.
+        user (User): The current authenticated user.
+        db (Session): Database session dependency.
+
+    Returns:
+        ImageBatchResponse: The result of every file, in the order of the request.
+
+    Raises:
+        HTTPException: If the batch is too large or the contents and tags do not match the files.
+    """
+    files, contents, tags = upload.files, upload.contents, upload.tags
+    if len(contents) != len(files) or (tags and len(tags) != len(files)):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Every file needs its own content and tags",
+        )
+
+    results = [
+        {"index": index, "filename": file.filename, "success": False}
+        for index, file in enumerate(files)
+    ]
+    bodies = {}
+    for index in range(len(files)):
+        tag_list = [tag.strip() for tag in tags[index].split(",") if tag.strip()] if tags else []
+        if len(tag_list) > 5:
+            results[index]["error"] = "Maximum number of tags is 5"
+            continue
+        bodies[index] = ImageCreate(content=contents[index], tags=tag_list)
+
+    hashes = await asyncio.gather(
+        *(run_in_threadpool(compute_file_hash, files[index].file) for index in bodies)
+    )
+    content_hashes = dict(zip(bodies, hashes))
+    sizes = {}
+    for index in content_hashes:
+        sizes[index] = files[index].file.seek(0, os.SEEK_END)
+        files[index].file.seek(0)
+
+    def admit(indexes: List[int], remaining: int) -> List[int]:
+        # Files are admitted in order while they fit into the quota
+        admitted = []
+        for index in indexes:
+            if sizes[index] > remaining:
+                results[index]["error"] = "Storage quota exceeded"
+            else:
+                admitted.append(index)
+                remaining -= sizes[index]
+        return admitted
+
+    # Files that cannot fit are not uploaded; the quota is checked again with the usage locked before the insert
+    admitted = admit(list(content_hashes), await check_storage_quota(user, 0, db))
+    content_hashes = {index: content_hashes[index] for index in admitted}
+    stored = await repository_images.get_images_by_hashes(list(set(content_hashes.values())), db)
+    reused = set(stored)
+    cleanup_pending = await repository_storage_cleanup.get_pending_cleanup_hashes(content_hashes.values(), db)
+    # No connection idles in a transaction during the extraction and the uploads
+    db.commit()
+
+    # Extract the metadata of every distinct content once, before the uploads read the same files
+    first_index = {}
+    for index, content_hash in content_hashes.items():
+        first_index.setdefault(content_hash, index)
+    extracted = await asyncio.gather(
+        *(extract_upload_metadata(files[index].file) for index in first_index.values())
+    )
+    # Files Pillow cannot read still count towards the storage quota
+    image_metadata = {
+        content_hash: {**(metadata or {}), "byte_size": sizes[index]}
+        for (content_hash, index), metadata in zip(first_index.items(), extracted)
+    }
+
+    # Upload every distinct content once, at most upload_concurrency at a time
+    to_upload = {}
+    for index, content_hash in content_hashes.items():
+        if content_hash not in stored:
+            to_upload.setdefault(content_hash, index)
+    semaphore = asyncio.Semaphore(settings.upload_concurrency)
+
+    async def upload(index: int):
+        async with semaphore:
+            return await run_in_threadpool(
+                post_cloudinary_image, files[index], content_hashes[index]
+            )
+
+    uploaded = await asyncio.gather(
+        *(upload(index) for index in to_upload.values()), return_exceptions=True
+    )
+    upload_errors = {}
+    for content_hash, image_url in zip(to_upload, uploaded):
+        if isinstance(image_url, Exception):
+            logging.error(f"Error in batch upload for user {user.id}: {image_url}")
+            upload_errors[content_hash] = str(image_url)
+        else:
+            stored[content_hash] = image_url
+
+    ready = []
+    for index, content_hash in content_hashes.items():
+        if content_hash in stored:
+            ready.append(index)
+        else:
+            results[index]["error"] = upload_errors[content_hash]
+
+    # Held until the images are committed, so the storage cleanup cannot delete the assets they link to
+    lock_assets([content_hashes[index] for index in ready], db)
+    usage = await repository_images.get_user_storage_usage(user, db, lock=True)
+    ready = admit(ready, settings.user_storage_quota - usage)
+    ready_hashes = {content_hashes[index] for index in ready}
+    orphans = {content_hash for content_hash in to_upload if content_hash in stored} - ready_hashes
+    stored.update(
+        await restore_cleaned_assets(
+            {
+                content_hash: files[first_index[content_hash]].file
+                for content_hash in ready_hashes
+                if content_hash in reused or content_hash in cleanup_pending
+            },
+            db,
+        )
+    )
+
+    if ready:
+        try:
+            images = await repository_images.create_images(
+                [
+                    (
+                        stored[content_hashes[index]],
+                        bodies[index],
+                        content_hashes[index],
+                        image_metadata[content_hashes[index]],
+                    )
+                    for index in ready
+                ],
+                user,
+                db,
+            )
+        except Exception as e:
+            db.rollback()
+            logging.error(f"Batch image creation failed for user {user.id}: {e}")
+            for index in ready:
+                results[index]["error"] = "Image not created"
+            orphans |= ready_hashes - reused
+        else:
+            feed.publish_images(images)
+            await timeline.fan_out_images(images, db)
+            for index, image in zip(ready, images):
+                results[index]["success"] = True
+                results[index]["image"] = ImageResponse.model_validate(
+                    image, from_attributes=True
+                )
+    if orphans:
+        await queue_orphaned_assets(orphans, db)
+
+    return {"results": results}
+
+
 @router.put("/{image_id}", response_model=ImageResponse)
 async def update_image(
     image_id,
@@ -96,7 +349,9 @@ async def update_image(
     :param : Get the image id
     :return: The updated image
     """
-    image = await repository_images.update_image(image_id, body, current_user, db)
+    image = await repository_images.update_image(
+        image_id, body, current_user, db, schema=ImageResponse
+    )
     if image is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Image not found"
@@ -128,56 +383,240 @@ async def delete_image(
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Image not found"
         )
+    feed.retract_image(image.id)
+    trending.retract_image(image.id)
     # current_user.uploaded_images -= 1
     return image
 
 
+@router.get("/duplicates", response_model=List[ImageDuplicateResponse])
+async def get_duplicate_images(
+    current_user: User = Depends(auth_service.get_current_user),
+    db: Session = Depends(get_db),
+):
+    """
+    The get_duplicate_images function returns a duplicate report for the current user.
+    Every entry groups the user's images that were uploaded with identical bytes.
+
+    :param current_user: User: Get the current user
+    :param db: Session: Get the database session
+    :return: A list of duplicate groups
+    """
+    return await repository_images.get_duplicate_report(current_user, db)
+
+
+@router.get("/feed", response_model=List[ImageCardResponse])
+async def get_feed(
+    response: Response,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(auth_service.get_current_user),
+    db: Session = Depends(get_db),
+):
+    """
+    The get_feed function returns the latest uploads across the site, newest first.
+    The feed keeps the newest settings.feed_size images; when the page is full, the X-Next-Cursor
+    response header holds the cursor of the next page.
+
+    :param response: Response: Set the X-Next-Cursor header
+    :param limit: int: Number of images per page
+    :param cursor: Optional[str]: The X-Next-Cursor value of the previous page
+    :param current_user: User: Get the current user
+    :param db: Session: Get the database session
+    :return: A list of images
+    """
+    images, next_cursor = await feed.get_feed(limit, parse_score_cursor(cursor), db)
+    if next_cursor is not None:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return images
+
+
+@router.get("/timeline", response_model=List[ImageCardResponse])
+async def get_timeline(
+    response: Response,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(auth_service.get_current_user),
+    db: Session = Depends(get_db),
+):
+    """
+    The get_timeline function returns the home timeline of the current user: the images of the users
+    they follow, newest first. When the page is full, the X-Next-Cursor response header holds the cursor
+    of the next page.
+
+    :param response: Response: Set the X-Next-Cursor header
+    :param limit: int: Number of images per page
+    :param cursor: Optional[str]: The X-Next-Cursor value of the previous page
+    :param current_user: User: Get the current user
+    :param db: Session: Get the database session
+    :return: A list of images
+    """
+    images, next_cursor = await timeline.get_timeline(current_user.id, limit, parse_cursor(cursor), db)
+    if next_cursor is not None:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return images
+
+
+@router.get("/trending", response_model=List[ImageCardResponse])
+async def get_trending(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    current_user: User = Depends(auth_service.get_current_user),
+    db: Session = Depends(get_db),
+):
+    """
+    The get_trending function returns the images with the most recent ratings and comments, where older
+    activity counts less with every settings.trending_half_life seconds. The ranking keeps the top
+    settings.trending_size images; it changes between requests, so pages are addressed by offset.
+
+    :param skip: int: Number of images skipped
+    :param limit: int: Number of images per page
+    :param current_user: User: Get the current user
+    :param db: Session: Get the database session
+    :return: A list of images
+    """
+    return await trending.get_trending(skip, limit, db)
+
+
+@router.get("/top_rated", response_model=List[ImageCardResponse])
+async def get_top_rated(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    current_user: User = Depends(auth_service.get_current_user),
+    db: Session = Depends(get_db),
+):
+    """
+    The get_top_rated function returns the rated images with the best average rating, best first.
+
+    :param skip: int: Number of images skipped
+    :param limit: int: Number of images per page
+    :param current_user: User: Get the current user
+    :param db: Session: Get the database session
+    :return: A list of images
+    """
+    image_ids = await repository_rating_stats.get_top_rated_ids(skip, limit, db)
+    return await get_image_documents(image_ids, db)
+
+
+@router.get("/assets/{content_hash}", response_class=RedirectResponse)
+async def get_asset(content_hash: str, db: Session = Depends(get_db)):
+    """
+    The get_asset function redirects to the stored asset with the given content hash.
+    Both urls are content-addressed, they point at the same bytes forever, so the redirect carries
+    Cache-Control: public, max-age=31536000, immutable and browsers and CDNs never ask again.
+
+    :param content_hash: str: SHA-256 of the image bytes
+    :param db: Session: Pass the database session to the function
+    :return: A permanent redirect to the asset
+    """
+    image = await repository_images.get_image_by_hash(content_hash, db)
+    # Images not migrated yet (see src/services/asset_migration.py) have no content-addressed asset
+    if image is None or not is_content_addressed_url(image.image_url, content_hash):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Image not found"
+        )
+    return RedirectResponse(
+        get_asset_url(content_hash),
+        status_code=status.HTTP_301_MOVED_PERMANENTLY,
+        headers={"Cache-Control": IMMUTABLE_CACHE_CONTROL},
+    )
+
+
 @router.get("/{image_id}", response_model=ImageResponse)
-async def get_image(image_id: str, db: Session = Depends(get_db)):
+@track_views()
+@cache_response(tags=[IMAGE_TAG])
+async def get_image(
+    image_id: str,
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_db),
+):
     """
     The get_image function returns an image object based on the image_id parameter.
     If no such image exists, it raises a 404 error.
+    The response carries an ETag and Last-Modified; conditional requests for an unchanged image
+    are answered with 304 after reading only its version, without loading the image and its tags.
 
     :param image_id: str: Get the image id from the url
+    :param request: Request: Read the If-None-Match and If-Modified-Since headers
+    :param response: Response: Set the ETag and Last-Modified headers
     :param db: Session: Pass the database session to the function
     :return: An image object
     """
-    image = await repository_images.get_image(image_id, db)
+    if is_conditional(request):
+        validators = await repository_images.get_image_validators(image_id, db)
+        if validators is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Image not found"
+            )
+        not_modified = conditional_response(
+            request, response, image_etag(validators), validators.updated_at
+        )
+        if not_modified is not None:
+            return not_modified
+    image = await repository_images.get_image(image_id, db, schema=ImageResponse)
     if image is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Image not found"
         )
+    conditional_response(request, response, image_etag(image), image.updated_at)
     return image
 
 
-@router.get("/", response_model=list())
+@router.get("/{image_id}/views", response_model=ImageViewsResponse)
+async def get_image_views(image_id: int, db: Session = Depends(get_db)):
+    """
+    The get_image_views function returns the number of views of an image, including the views
+    still waiting in Redis for the next flush, and the estimated number of unique viewers.
+
+    :param image_id: int: Get the image id from the url
+    :param db: Session: Pass the database session to the function
+    :return: The view counts of the image
+    """
+    if await repository_images.get_image_validators(image_id, db) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Image not found"
+        )
+    views, unique_viewers = await get_views(image_id, db)
+    return ImageViewsResponse(image_id=image_id, views=views, unique_viewers=unique_viewers)
+
+
+@router.get("/", response_model=List[ImageCardResponse])
 async def get_images(
-    skip: int = 0,
+    response: Response,
+    skip: int = Query(0, deprecated=True),
     limit: int = 100,
+    cursor: Optional[str] = None,
     current_user: User = Depends(auth_service.get_current_user),
     db: Session = Depends(get_db),
 ):
     """
-    The get_images function returns a list of images.
+    The get_images function returns a list of image cards, newest first.
+    The page of ids is read from the images table and the cards from their documents.
+    When another page follows, the X-Next-Cursor response header holds its cursor.
         ---
         get:
           summary: Get all images
           description: Returns a list of all the available images.
           tags: [images]
 
-    :param skip: int: Skip the first n images
+    :param response: Response: Set the X-Next-Cursor header
+    :param skip: int: Skip the first n images (deprecated, use cursor)
     :param limit: int: Limit the number of images returned
+    :param cursor: Optional[str]: The X-Next-Cursor value of the previous page
     :param current_user: User: Get the current user
     :param db: Session: Get the database session
-    :param : Skip the first n images
     :return: A list of images
     """
-    images = await repository_images.get_images(skip, limit, current_user, db)
+    image_ids = await repository_images.get_image_ids(
+        skip, limit + 1, current_user, db, after_id=parse_cursor(cursor)
+    )
+    images = await get_image_documents(image_ids, db)
     if images is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Images not found"
         )
-    return images
+    return set_next_cursor(response, images, limit)
 
 
 @router.patch(
@@ -201,7 +640,7 @@ async def add_tag(
     :return: The image object
     """
     image = await repository_images.get_image_user(
-        image_id=body.image_id, db=db, current_user=current_user
+        image_id=body.image_id, db=db, current_user=current_user, schema=ImageResponse
     )
     if not image:
         raise HTTPException(
@@ -214,20 +653,13 @@ async def add_tag(
             detail="Maximum 5 tags are allowed per image",
         )
 
-    tag = db.query(Tag).filter_by(name=body.tag).first()
-    if not tag:
-        tag = Tag(name=body.tag)
-        db.add(tag)
-        db.commit()
-
-    if tag not in image.tags:
-        image.tags.append(tag)
-        image_data = ImageUpdate(image_url=image.image_url, content=image.content)
-        await repository_images.update_image(
-            image.id, image_data=image_data, current_user=current_user, db=db
+    tags = await repository_tags.resolve_tags([body.tag], db)
+    if not tags:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Tag name is required"
         )
 
-    return image
+    return await repository_images.add_image_tags(image, tags, db)
 
 
 @router.post("/transform_image/", response_model=ImageURLResponse)
@@ -266,9 +698,17 @@ async def transform_image(
     :param : Determine the type of transformation to be applied on the image
     :return: A dictionary
     """
+    image = await repository_images.get_image_by_url(image_url, user, db)
+    # Urls of no stored image of the user keep addressing the legacy per-user asset
+    public_id = get_image_public_id(image) if image is not None else get_cloudinary_public_id(user)
     try:
         transformed_url = get_cloudinary_image_transformation(
-            user, transformation_type, width, height, effect, overlay_image_url
+            public_id,
+            transformation_type,
+            width,
+            height,
+            effect,
+            overlay_image_url,
         )
 
         qr_code = create_qr_code_from_url(transformed_url)
@@ -291,13 +731,19 @@ async def transform_image(
 @router.get("/transformed_image/{image_id}", response_model=ImageURLResponse)
 async def get_transform_image_url(
     image_id: str,
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
 ):
     """
     The get_transform_image_url function returns the transformed image URL and a QR code for that URL.
 
 
+    The ETag is derived from both URLs, so clients holding the current QR code get a 304 without it being drawn again.
+
     :param image_id: str: Get the image from the database
+    :param request: Request: Read the If-None-Match header
+    :param response: Response: Set the ETag header
     :param db: Session: Pass the database connection to the function
     :param current_user: User: Get the current user
     :param : Get the image id from the url and then pass it to the function
@@ -314,6 +760,11 @@ async def get_transform_image_url(
             detail="Image was not transformed, please transform first.",
         )
 
+    not_modified = conditional_response(
+        request, response, make_etag("transformed", image.image_url, image.image_transformed_url)
+    )
+    if not_modified is not None:
+        return not_modified
     qr_code = create_qr_code_from_url(image.image_transformed_url)
     return {
         "image_url": image.image_url,
@@ -1,5 +1,5 @@
-from typing import List, Union
-from fastapi import APIRouter, HTTPException, Depends, status
+from typing import List, Optional, Union
+from fastapi import APIRouter, HTTPException, Depends, status, Query, Response
 from sqlalchemy.orm import Session
 import cloudinary
 import cloudinary.uploader
@@ -10,9 +10,11 @@ from src.schemas.rating import RatingRequest, RatingResponse, ImageRatingsRespon
 from src.repository import images as repository_images
 from src.repository import ratings as repository_ratings
 from src.services.auth_service import auth_service
-from src.services import roles
+from src.services import roles, trending
+from src.utils.pagination import parse_cursor, set_next_cursor
+from src.utils.serialization import SerializedListRoute
 
-router = APIRouter(prefix="/rating", tags=["rating"])
+router = APIRouter(prefix="/rating", tags=["rating"], route_class=SerializedListRoute)
 
 @router.get("/photo/{image_id}/", response_model=List[ImageRatingsResponse], 
             dependencies=[Depends(roles.Roles(["admin", "moderator"]))])
@@ -49,18 +51,24 @@ async def get_by_photo_ratings(image_id: int, db: Session = Depends(get_db)):
 
 @router.get("/all", response_model=List[AllRatingResponse], 
             dependencies=[Depends(roles.Roles(["admin", "moderator"]))])
-async def get_ratings(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+async def get_ratings(response: Response, skip: int = Query(0, deprecated=True), limit: int = 100,
+                      cursor: Optional[str] = None, db: Session = Depends(get_db)):
     """
     The get_ratings function returns all ratings in the database.
-        The function takes no input and returns a list of rating objects.
+        The function returns a page of rating objects; when another page follows,
+        the X-Next-Cursor response header holds its cursor.
 
+    :param response: Response: Set the X-Next-Cursor header
+    :param skip: int: Skip the first n ratings (deprecated, use cursor)
+    :param limit: int: Limit the number of ratings returned
+    :param cursor: Optional[str]: The X-Next-Cursor value of the previous page
     :param db: Session: Pass the database session to the function
     :return: A list of ratings
     """
-    ratings = await repository_ratings.get_all_ratings(skip, limit, db)
-    if not ratings:
+    ratings = await repository_ratings.get_all_ratings(skip, limit + 1, db, after_id=parse_cursor(cursor))
+    if not ratings and cursor is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No ratings found")
-    return ratings
+    return set_next_cursor(response, ratings, limit)
 
 @router.get("/get/{rating_id}/", response_model=RatingResponse, 
             dependencies=[Depends(roles.Roles(["admin", "moderator"]))])
@@ -120,6 +128,6 @@ async def add_rating(body: RatingRequest, image_id: int, db: Session = Depends(g
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="You cannot rate your own image")
     if body.rating not in range(1, 6):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Rating must be between 1 and 5")
-    rating = repository_ratings.add_rating(body, image_id, current_user.id, db)
-    await repository_images.average_rating(image_id, db)
-    return await rating
\ No newline at end of file
+    rating = await repository_ratings.add_rating(body, image_id, current_user.id, db)
+    trending.record_rating(image_id)
+    return rating
\ No newline at end of file
@@ -9,9 +9,11 @@ from src.models.user import User
 from src.schemas.image import ImageSearch
 from src.schemas.user import UserSearchResponse
 from src.repository import search_filter as repository_search_filter
+from src.repository.tags import normalize_tag_names
 from src.services import roles
+from src.utils.serialization import SerializedListRoute
 
-router = APIRouter(prefix="/search_filter", tags=["search_filter"])
+router = APIRouter(prefix="/search_filter", tags=["search_filter"], route_class=SerializedListRoute)
 
 @router.get("/search/", response_model=List[ImageSearch])
 async def search_images(
@@ -21,13 +23,19 @@ async def search_images(
     max_rating: int = Query(5, description="Maximum rating"),
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
+    fuzzy: bool = Query(False, description="Match similar tags and keywords, ordered by similarity"),
+    tags: Optional[str] = Query(None, description="Comma separated tag names, combined according to mode"),
+    mode: str = Query("all", pattern="^(all|any|none)$", description="Images with all, any or none of the tags"),
     db: Session = Depends(get_db),
 ):
     """
     The search_images function searches for images based on the provided parameters.
         The tag parameter is used to search for images with a specific tag.
         The keyword parameter is used to search for images with a specific keyword in their description or title.
-        The min_rating and max_rating parameters are used to filter out any image that does not have a rating between these two values (inclusive). 
+        With fuzzy=true, misspelled tags and keywords and fragments of words match too, the most similar images first.
+        The tags parameter combines several tags: mode=all returns the images with every tag, mode=any the images
+        with at least one of them and mode=none the images with none of them.
+        The min_rating and max_rating parameters are used to filter out any image whose average rating is not between these two values (inclusive); unrated images count as 0. 
             If no value is provided, the default value of 0 will be assumed as the minimum rating, and 5 will be assumed as the maximum rating. 
     
     :param tag: Optional[str]: Specify that the tag parameter is optional
@@ -38,15 +46,21 @@ async def search_images(
     :param description: Provide a description for the endpoint in the openapi documentation
     :param start_date: Optional[str]: Filter the images based on the date they were uploaded
     :param end_date: Optional[str]: Specify the end date for the search
+    :param fuzzy: bool: Match by trigram similarity instead of exact tags and full-text search
+    :param tags: Optional[str]: Comma separated tag names
+    :param mode: str: How the tags are combined: all, any or none
     :param db: Session: Pass the database session to the function
     :param : Get the image id from the path
     :return: A list of images
     """
     # Perform the search based on the query and filter parameters
-    if tag is None and keyword is None:
-        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="At least one of tag or keyword must be provided")
+    tag_names = normalize_tag_names(tags.split(",")) if tags else []
+    if tag is None and keyword is None and not tag_names:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="At least one of tag, tags or keyword must be provided")
 
-    images = await repository_search_filter.get_images_by_search(db, tag, keyword, min_rating, max_rating, start_date, end_date)
+    images = await repository_search_filter.get_images_by_search(
+        db, tag, keyword, min_rating, max_rating, start_date, end_date, fuzzy, tag_names, mode
+    )
     
     if not images:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No images with rating found")
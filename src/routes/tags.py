@@ -1,16 +1,29 @@
-from typing import List
-from fastapi import APIRouter, HTTPException, Depends, status
+from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Depends, status, Query, Request, Response
 from sqlalchemy.orm import Session
 
 from src.database.db import get_db
 from src.repository import tags as repository_tags
+from src.repository import versions as repository_versions
 from src.schemas.tag import TagRequest, TagResponse, TagModel
+from src.services.response_cache import TAGS_TAG, cache_response
+from src.utils.conditional import conditional_response, make_etag
+from src.utils.pagination import parse_cursor, set_next_cursor
+from src.utils.serialization import SerializedListRoute, prefers_msgpack
 
-router = APIRouter(prefix='/tags', tags=["tags"])
+router = APIRouter(prefix='/tags', tags=["tags"], route_class=SerializedListRoute)
 
 
 @router.get("/all/", response_model=List[TagModel])
-async def read_tags(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+@cache_response(tags=[TAGS_TAG])
+async def read_tags(
+    request: Request,
+    response: Response,
+    skip: int = Query(0, deprecated=True),
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
     """
     The read_tags function returns a list of tags.
         ---
@@ -21,13 +34,27 @@ async def read_tags(skip: int = 0, limit: int = 100, db: Session = Depends(get_d
             &quot;200&quot;:
               description: A JSON array containing tag objects (see below).  Each object has an id and name field, as well as an optional color field if one was specified when creating the tag.  The response also includes a total_count field indicating how many total results there are for this query (which may be more than what is returned in this response).
     
-    :param skip: int: Skip a number of tags
+    The ETag of a page is derived from the version counter of the tags collection and the query,
+    so conditional requests for an unchanged page are answered with 304 without reading the tags.
+
+    :param request: Request: Read the If-None-Match and Accept headers
+    :param response: Response: Set the X-Next-Cursor and ETag headers
+    :param skip: int: Skip a number of tags (deprecated, use cursor)
     :param limit: int: Limit the number of tags returned
+    :param cursor: Optional[str]: The X-Next-Cursor value of the previous page
     :param db: Session: Get the database session
     :return: A list of tag objects
     """
-    tags = await repository_tags.get_tags(skip, limit, db)
-    return tags
+    after_id = parse_cursor(cursor)
+    version = await repository_versions.get_collection_version(repository_versions.TAGS_COLLECTION, db)
+    etag = make_etag(
+        "tags", version, skip, limit, after_id, prefers_msgpack(request.headers.get("accept", ""))
+    )
+    not_modified = conditional_response(request, response, etag)
+    if not_modified is not None:
+        return not_modified
+    tags = await repository_tags.get_tags(skip, limit + 1, db, after_id=after_id)
+    return set_next_cursor(response, tags, limit)
 
 
 @router.get("/get/{tag_id}/", response_model=TagModel)
@@ -59,6 +86,8 @@ async def create_tag(body: TagRequest, db: Session = Depends(get_db)):
     :return: A tag object
     """
     tag = await repository_tags.create_tag(body, db)
+    if tag is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Tag name is required")
     return tag
 
 
@@ -69,6 +98,7 @@ async def update_tag(body: TagRequest, tag_id: int, db: Session = Depends(get_db
         The function takes a TagRequest object as input, which contains the new values for the tag.
         It also takes an integer representing the id of the tag to be updated.
         If no such id exists, it raises an HTTPException with status code 404 and detail &quot;Tag not found&quot;.
+        The name is normalized like new tag names; renaming onto an existing tag is answered with 409.
     
     
     :param body: TagRequest: Get the body of the request
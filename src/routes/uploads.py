@@ -0,0 +1,251 @@
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response, status
+from sqlalchemy.orm import Session
+
+from src.conf.config import settings
+from src.database.db import get_db
+from src.models.user import User
+from src.repository import tags as repository_tags
+from src.repository import uploads as repository_uploads
+from src.schemas.image import ImageCreate, ImageResponse
+from src.schemas.upload import UploadCreate, UploadResponse
+from src.services import resumable_uploads
+from src.services.auth_service import auth_service
+from src.services.image_store import create_prepared_image, prepare_image
+from src.services.upload_validation import check_storage_quota, sniffed_stream
+from src.utils.serialization import MsgPackRoute
+import logging
+
+router = APIRouter(prefix="/images/uploads", tags=["uploads"], route_class=MsgPackRoute)
+
+UPLOAD_OFFSET_HEADER = "Upload-Offset"
+
+
+async def get_upload_or_404(upload_id: str, user: User, db: Session):
+    """
+    The get_upload_or_404 function returns an upload session of the user or raises a 404 error.
+
+    :param upload_id: str: The id of the upload session
+    :param user: User: The current user
+    :param db: Session: Pass the database session to the function
+    :return: The upload session
+    """
+    upload = await repository_uploads.get_upload_session(upload_id, user, db)
+    if upload is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload not found")
+    return upload
+
+
+async def lock_upload_or_409(upload, db: Session) -> None:
+    """
+    The lock_upload_or_409 function locks an upload session until the request commits, so no other request
+    writes its staged file meanwhile, or raises a 409 error if another request holds the lock.
+
+    :param upload: UploadSession: The upload session
+    :param db: Session: Pass the database session to the function
+    :return: None
+    """
+    if not await repository_uploads.lock_upload_session(upload, db):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Upload is being written by another request")
+
+
+def check_upload_offset(upload, upload_offset: int) -> None:
+    """
+    The check_upload_offset function raises a 409 error unless a chunk starts at the acknowledged offset of the upload.
+
+    :param upload: UploadSession: The upload session
+    :param upload_offset: int: The offset the chunk starts at
+    :return: None
+    """
+    if upload_offset != upload.offset:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Upload offset is {upload.offset}",
+            headers={UPLOAD_OFFSET_HEADER: str(upload.offset)},
+        )
+
+
+@router.post("", response_model=UploadResponse, status_code=status.HTTP_201_CREATED)
+async def create_upload(
+    body: UploadCreate,
+    response: Response,
+    user: User = Depends(auth_service.get_current_user),
+    db: Session = Depends(get_db),
+):
+    """
+    The create_upload function starts a resumable upload.
+    The client announces the file size and the image details, then sends the file in chunks with
+    PATCH requests and creates the image with the finalize request.
+
+    :param body: UploadCreate: The file name, size, content and tags of the image
+    :param response: Response: Set the Upload-Offset header
+    :param user: User: The current user
+    :param db: Session: Pass the database session to the function
+    :return: The upload session
+    """
+    tags = repository_tags.normalize_tag_names(
+        [tag for value in body.tags for tag in value.split(",")]
+    )
+    if len(tags) > 5:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Maximum number of tags is 5")
+    if body.size > settings.upload_max_size:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Maximum file size is {settings.upload_max_size} bytes",
+        )
+    await check_storage_quota(user, body.size, db)
+
+    for upload_id in await repository_uploads.pop_expired_upload_sessions(settings.upload_session_ttl, db):
+        resumable_uploads.discard_staging(upload_id)
+
+    upload = await repository_uploads.create_upload_session(body, tags, user, db)
+    await resumable_uploads.start_staging(upload.upload_id)
+    response.headers[UPLOAD_OFFSET_HEADER] = "0"
+    return upload
+
+
+@router.get("/{upload_id}", response_model=UploadResponse)
+async def get_upload(
+    upload_id: str,
+    response: Response,
+    user: User = Depends(auth_service.get_current_user),
+    db: Session = Depends(get_db),
+):
+    """
+    The get_upload function returns the acknowledged offset of an upload, so an interrupted client
+    knows where to resume.
+
+    :param upload_id: str: The id of the upload session
+    :param response: Response: Set the Upload-Offset header
+    :param user: User: The current user
+    :param db: Session: Pass the database session to the function
+    :return: The upload session
+    """
+    upload = await get_upload_or_404(upload_id, user, db)
+    response.headers[UPLOAD_OFFSET_HEADER] = str(upload.offset)
+    return upload
+
+
+@router.patch("/{upload_id}", response_model=UploadResponse)
+async def append_upload(
+    upload_id: str,
+    request: Request,
+    response: Response,
+    upload_offset: int = Header(..., alias=UPLOAD_OFFSET_HEADER),
+    user: User = Depends(auth_service.get_current_user),
+    db: Session = Depends(get_db),
+):
+    """
+    The append_upload function appends the request body to an upload.
+    The Upload-Offset header must equal the acknowledged offset; a chunk that was only partly received
+    is acknowledged up to the received bytes, and the client resumes from the returned offset.
+    The chunk is received into a temporary file first; the upload session is locked only to check the offset,
+    append the chunk to the staged file and advance the offset.
+
+    :param upload_id: str: The id of the upload session
+    :param request: Request: Stream the chunk from the request body
+    :param response: Response: Set the Upload-Offset header
+    :param upload_offset: int: The offset the chunk starts at
+    :param user: User: The current user
+    :param db: Session: Pass the database session to the function
+    :return: The upload session with its new offset
+    """
+    upload = await get_upload_or_404(upload_id, user, db)
+    check_upload_offset(upload, upload_offset)
+    size = upload.size
+    # No transaction stays open while the chunk is received
+    db.commit()
+    stream = request.stream()
+    if upload_offset == 0:
+        # The first chunk must start with the magic bytes of an image, checked before anything is staged
+        stream = sniffed_stream(stream)
+    try:
+        chunk, _ = await resumable_uploads.spool_chunk(stream, size - upload_offset)
+    except resumable_uploads.UploadOverflow:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Upload size is {size} bytes",
+        )
+    try:
+        async with resumable_uploads.upload_lock(upload_id):
+            # Locked only to check and advance the offset and to append the received chunk
+            upload = await get_upload_or_404(upload_id, user, db)
+            await lock_upload_or_409(upload, db)
+            check_upload_offset(upload, upload_offset)
+            new_offset, hasher = await resumable_uploads.append_chunk(upload_id, upload_offset, chunk)
+            if not await repository_uploads.advance_upload_offset(upload, upload_offset, new_offset, db):
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail=f"Upload offset is {upload.offset}",
+                    headers={UPLOAD_OFFSET_HEADER: str(upload.offset)},
+                )
+            resumable_uploads.remember_hasher(upload_id, new_offset, hasher)
+    finally:
+        chunk.close()
+    response.headers[UPLOAD_OFFSET_HEADER] = str(new_offset)
+    return upload
+
+
+@router.post("/{upload_id}/finalize", response_model=ImageResponse, status_code=status.HTTP_201_CREATED)
+async def finalize_upload(
+    upload_id: str,
+    user: User = Depends(auth_service.get_current_user),
+    db: Session = Depends(get_db),
+):
+    """
+    The finalize_upload function creates the image of a complete upload, the same way /images/create_new does,
+    and removes the upload session and its staged file.
+
+    :param upload_id: str: The id of the upload session
+    :param user: User: The current user
+    :param db: Session: Pass the database session to the function
+    :return: The new image
+    """
+    upload = await get_upload_or_404(upload_id, user, db)
+    async with resumable_uploads.upload_lock(upload_id):
+        await lock_upload_or_409(upload, db)
+        if upload.offset != upload.size:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Upload is incomplete: {upload.offset} of {upload.size} bytes received",
+                headers={UPLOAD_OFFSET_HEADER: str(upload.offset)},
+            )
+        hasher = await resumable_uploads.get_hasher(upload_id, upload.offset)
+        body = ImageCreate(content=upload.content, tags=[tag for tag in upload.tags.split(",") if tag])
+        try:
+            with open(resumable_uploads.get_staging_path(upload_id), "rb") as staged:
+                # Prepared without locks, which ends the transaction holding the lock of the session
+                prepared = await prepare_image(staged, hasher.hexdigest(), user, db)
+                upload = await get_upload_or_404(upload_id, user, db)
+                await lock_upload_or_409(upload, db)
+                # The session is deleted by the commit that creates the image,
+                # so a finalized upload cannot create a second image
+                await repository_uploads.discard_upload_session(upload, db)
+                image = await create_prepared_image(prepared, body, user, db, schema=ImageResponse)
+        except HTTPException:
+            db.rollback()
+            raise
+        except Exception as e:
+            db.rollback()
+            logging.error(f"Error in finalizing upload {upload_id} for user {user.id}: {e}")
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Image not created")
+    resumable_uploads.discard_staging(upload_id)
+    return image
+
+
+@router.delete("/{upload_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_upload(
+    upload_id: str,
+    user: User = Depends(auth_service.get_current_user),
+    db: Session = Depends(get_db),
+):
+    """
+    The delete_upload function aborts an upload and removes its staged file.
+
+    :param upload_id: str: The id of the upload session
+    :param user: User: The current user
+    :param db: Session: Pass the database session to the function
+    :return: None
+    """
+    upload = await get_upload_or_404(upload_id, user, db)
+    await repository_uploads.delete_upload_session(upload, db)
+    resumable_uploads.discard_staging(upload_id)
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, Depends, status, UploadFile, File
+from fastapi import APIRouter, HTTPException, Depends, status, UploadFile, File, Request, Response
 from fastapi.security import (
     OAuth2PasswordRequestForm,
     HTTPAuthorizationCredentials,
@@ -10,11 +10,22 @@ import cloudinary.uploader
 
 from src.database.db import get_db
 from src.models.user import User
-from src.schemas.user import UserDb, UserInfo, UserProfile, Username, UsernameResonpose, UserUpdateAvatar
+from src.schemas.user import (
+    FollowResponse,
+    UserDb,
+    UserInfo,
+    UserProfile,
+    Username,
+    UsernameResonpose,
+    UserUpdateAvatar,
+)
+from src.repository import follows as repository_follows
 from src.repository import users as repository_users
+from src.services import timeline
 from src.services.auth_service import auth_service
 from src.conf.config import settings
 from src.services import roles
+from src.utils.conditional import conditional_response, make_etag
 
 router = APIRouter(prefix="/users", tags=["users"])
 
@@ -86,11 +97,16 @@ async def update_avatar_user(
 @router.get(
     "/profile/{username}", response_model=UserProfile, status_code=status.HTTP_200_OK
 )
-async def get_user_profile(username: str, db: Session = Depends(get_db)):
+async def get_user_profile(
+    username: str, request: Request, response: Response, db: Session = Depends(get_db)
+):
     """
     The get_user_profile function returns the user profile of a given username.
+    The ETag is derived from the profile fields, a client holding the current profile gets a 304 without a body.
 
     :param username: str: Specify the username of the user whose profile we want to get
+    :param request: Request: Read the If-None-Match header
+    :param response: Response: Set the ETag header
     :param db: Session: Pass the database session to the function
     :return: A userprofile object
     """
@@ -109,6 +125,10 @@ async def get_user_profile(username: str, db: Session = Depends(get_db)):
         uploaded_images=uploaded_images_count,
         avatar=user.avatar,
     )
+    etag = make_etag("profile", *user_profile_response.model_dump().values())
+    not_modified = conditional_response(request, response, etag)
+    if not_modified is not None:
+        return not_modified
 
     return user_profile_response
 
@@ -165,4 +185,63 @@ async def ban_user(email: str, db: Session = Depends(get_db)):
             detail="Such user is not found",
         )
     user = await repository_users.to_ban_user(user, email, db)
-    return {"detail": "User was banned"}
\ No newline at end of file
+    return {"detail": "User was banned"}
+
+async def get_followed_or_404(username: str, current_user: User, db: Session) -> User:
+    """
+    The get_followed_or_404 function returns the user to follow or unfollow.
+
+    :param username: str: The username of the followed user
+    :param current_user: User: The user who follows
+    :param db: Session: Pass the database session to the function
+    :return: The followed user
+    :raises HTTPException: 404 if the user does not exist, 400 for the current user
+    """
+    followed = await repository_users.get_user_by_username(username, db)
+    if followed is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+    if followed.id == current_user.id:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="You cannot follow yourself")
+    return followed
+
+
+@router.post("/follow/{username}", response_model=FollowResponse)
+async def follow_user(
+    username: str,
+    current_user: User = Depends(auth_service.get_current_user),
+    db: Session = Depends(get_db),
+):
+    """
+    The follow_user function makes the current user follow another user.
+    The images of the followed user show up in the home timeline (GET /images/timeline).
+
+    :param username: str: The username of the user to follow
+    :param current_user: User: The user who follows
+    :param db: Session: Pass the database session to the function
+    :return: The followed username and their number of followers
+    """
+    followed = await get_followed_or_404(username, current_user, db)
+    if await repository_follows.follow_user(current_user, followed, db):
+        timeline.invalidate_timeline(current_user.id)
+    followers = await repository_follows.get_followers_count(followed.id, db)
+    return FollowResponse(username=followed.username, followers=followers)
+
+
+@router.delete("/follow/{username}", status_code=status.HTTP_204_NO_CONTENT)
+async def unfollow_user(
+    username: str,
+    current_user: User = Depends(auth_service.get_current_user),
+    db: Session = Depends(get_db),
+):
+    """
+    The unfollow_user function makes the current user stop following another user.
+
+    :param username: str: The username of the followed user
+    :param current_user: User: The user who follows
+    :param db: Session: Pass the database session to the function
+    :return: None
+    """
+    followed = await get_followed_or_404(username, current_user, db)
+    if not await repository_follows.unfollow_user(current_user, followed, db):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="You do not follow this user")
+    timeline.invalidate_timeline(current_user.id)
@@ -35,15 +35,54 @@ class ImageResponse(BaseModel):
     updated_at: Optional[datetime] = None
     user_id: int
     tags: List[TagRequest]
+    width: Optional[int] = None
+    height: Optional[int] = None
+    orientation: Optional[str] = None
+    mime_type: Optional[str] = None
+    byte_size: Optional[int] = None
+    dominant_color: Optional[str] = None
+    blurhash: Optional[str] = None
     Config: ClassVar[ConfigDict] = ConfigDict(from_attributes=True)
 
 
+class ImageCardResponse(ImageResponse):
+    content: str
+    username: str
+    average_rating: Optional[float] = None
+    ratings_count: int = 0
+    comments_count: int = 0
+
+
 class ImageURLResponse(BaseModel):
     image_url: str
     image_transformed_url: str
     qr_code: str
 
 
+class ImageBatchItemResponse(BaseModel):
+    index: int
+    filename: Optional[str] = None
+    success: bool
+    image: Optional[ImageResponse] = None
+    error: Optional[str] = None
+
+
+class ImageBatchResponse(BaseModel):
+    results: List[ImageBatchItemResponse]
+
+
+class ImageDuplicateResponse(BaseModel):
+    content_hash: str
+    count: int
+    image_ids: List[int]
+
+
+class ImageViewsResponse(BaseModel):
+    image_id: int
+    views: int
+    unique_viewers: Optional[int] = None
+
+
 class ImageSearch(BaseModel):
     id: int
     image_url: str
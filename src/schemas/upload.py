@@ -0,0 +1,18 @@
+from typing import ClassVar, List, Optional
+
+from pydantic import BaseModel, ConfigDict, Field
+
+
+class UploadCreate(BaseModel):
+    filename: Optional[str] = None
+    size: int = Field(gt=0)
+    content: str
+    tags: List[str] = []
+
+
+class UploadResponse(BaseModel):
+    upload_id: str
+    filename: Optional[str] = None
+    size: int
+    offset: int
+    Config: ClassVar[ConfigDict] = ConfigDict(from_attributes=True)
@@ -1,4 +1,4 @@
-from typing import Optional, List
+from typing import Optional, List, Tuple
 from datetime import datetime
 from pydantic import BaseModel, EmailStr, ConfigDict, Field
 from typing import ClassVar
@@ -54,6 +54,12 @@ class UserInfo(BaseModel):
     avatar: str
     role: str
     
+class FollowResponse(BaseModel):
+    username: str
+    followers: int
+    detail: str = "User followed"
+
+
 class UserUpdateAvatar(BaseModel):
     username: str
     avatar: str
@@ -72,6 +78,8 @@ class ChangePassword(BaseModel):
     
     
 class UserSearchResponse(BaseModel):
+    # username is read from Image.user, so the image query has to load that relationship
+    eager_load: ClassVar[Tuple[str, ...]] = ("user",)
     id: int
     image_url: str
     username: str
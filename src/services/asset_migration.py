@@ -0,0 +1,84 @@
+import argparse
+import hashlib
+import logging
+import urllib.request
+from io import BytesIO
+
+from sqlalchemy.orm import Session
+
+from src.database.db import SessionLocal
+from src.models.image import Image
+from src.repository.storage_cleanup import lock_assets
+from src.utils.image_utils import is_content_addressed_url, upload_cloudinary_asset
+
+
+def download_asset(url: str) -> bytes:
+    """
+    The download_asset function downloads the bytes served under an asset url.
+
+    :param url: str: The url of the asset
+    :return: The content of the asset
+    """
+    with urllib.request.urlopen(url, timeout=30) as response:
+        return response.read()
+
+
+def migrate_image_urls(db: Session, batch_size: int = 100, fetch=download_asset) -> int:
+    """
+    The migrate_image_urls function rewrites legacy image urls to content-addressed asset urls.
+    Images are walked in id order, batch_size rows at a time, and every batch is committed on its own,
+    so the migration can be stopped and restarted at any point. Identical bytes are uploaded only once.
+
+    :param db: Session: Pass the database session to the function
+    :param batch_size: int: Number of images loaded and committed at once
+    :param fetch: Callable that returns the bytes served under an image url
+    :return: The number of rewritten images
+    """
+    migrated = 0
+    uploaded = {}
+    last_id = 0
+    while True:
+        batch = (
+            db.query(Image)
+            .filter(Image.id > last_id)
+            .order_by(Image.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not batch:
+            break
+        for image in batch:
+            if is_content_addressed_url(image.image_url, image.content_hash):
+                continue
+            try:
+                data = fetch(image.image_url)
+            except Exception as e:
+                logging.error(f"Could not download image {image.id}: {e}")
+                continue
+            content_hash = hashlib.sha256(data).hexdigest()
+            # Held until the batch is committed, so the storage cleanup cannot delete the asset meanwhile
+            lock_assets([content_hash], db)
+            if content_hash not in uploaded:
+                uploaded[content_hash] = upload_cloudinary_asset(BytesIO(data), content_hash)
+            image.content_hash = content_hash
+            image.image_url = uploaded[content_hash]
+            migrated += 1
+        db.commit()
+        last_id = batch[-1].id
+        logging.info(f"Migrated {migrated} images, last image id {last_id}")
+    return migrated
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Rewrite legacy image urls to content-addressed asset urls."
+    )
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    session = SessionLocal()
+    try:
+        count = migrate_image_urls(session, batch_size=args.batch_size)
+        print(f"Migrated {count} images")
+    finally:
+        session.close()
@@ -0,0 +1,139 @@
+import logging
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from redis.exceptions import RedisError
+from sqlalchemy.orm import Session
+
+from src.conf.config import settings
+from src.database.cache import get_cache
+from src.models.image import Image
+from src.repository import images as repository_images
+from src.repository.image_documents import get_image_documents
+from src.schemas.image import ImageCardResponse
+from src.utils.pagination import encode_score_cursor
+
+FEED_KEY = "feed:recent"
+# Set once the feed was filled from the database; a missing marker (cold start, flushed Redis) triggers a rebuild
+FEED_READY_KEY = "feed:recent:ready"
+
+
+def _member(image_id: int) -> str:
+    # Zero padded, so images with equal scores are ordered by id
+    return f"{image_id:012d}"
+
+
+def _score(created_at: datetime) -> float:
+    return created_at.timestamp()
+
+
+def publish_images(images: List[Image]) -> None:
+    """
+    The publish_images function adds new images to the recent images feed and trims it to the newest
+    settings.feed_size entries. The feed is a cache: when Redis is unavailable the images are
+    only logged and show up after the next rebuild.
+
+    :param images: List[Image]: The newly created images
+    :return: None
+    """
+    entries = {_member(image.id): _score(image.created_at) for image in images if image.created_at is not None}
+    if not entries:
+        return
+    try:
+        pipe = get_cache().pipeline()
+        pipe.zadd(FEED_KEY, entries)
+        pipe.zremrangebyrank(FEED_KEY, 0, -settings.feed_size - 1)
+        pipe.execute()
+    except RedisError as e:
+        logging.warning(f"Could not add images to the feed: {e}")
+
+
+def retract_image(image_id: int) -> None:
+    """
+    The retract_image function removes a deleted image from the recent images feed.
+
+    :param image_id: int: The id of the deleted image
+    :return: None
+    """
+    try:
+        get_cache().zrem(FEED_KEY, _member(image_id))
+    except RedisError as e:
+        logging.warning(f"Could not remove image {image_id} from the feed: {e}")
+
+
+async def rebuild_feed(db: Session) -> int:
+    """
+    The rebuild_feed function fills the recent images feed with the newest images of the database.
+    Images published while the rebuild runs are kept, adding them twice is harmless.
+
+    :param db: Session: Pass the database session to the function
+    :return: The number of images in the rebuilt feed
+    """
+    keys = await repository_images.get_recent_image_keys(settings.feed_size, db)
+    pipe = get_cache().pipeline()
+    if keys:
+        pipe.zadd(FEED_KEY, {_member(image_id): _score(created_at) for image_id, created_at in keys})
+        pipe.zremrangebyrank(FEED_KEY, 0, -settings.feed_size - 1)
+    pipe.set(FEED_READY_KEY, 1)
+    pipe.execute()
+    return len(keys)
+
+
+async def _read_feed(limit: int, position: Optional[Tuple[float, int]], db: Session) -> List[Tuple[bytes, float]]:
+    cache = get_cache()
+    if not cache.exists(FEED_READY_KEY):
+        await rebuild_feed(db)
+
+    if position is None:
+        return cache.zrevrange(FEED_KEY, 0, limit - 1, withscores=True)
+    score, last_id = position
+    # Images sharing the score of the cursor are fetched as well and filtered by id
+    ties = cache.zcount(FEED_KEY, score, score)
+    entries = cache.zrevrangebyscore(FEED_KEY, score, "-inf", start=0, num=limit + ties, withscores=True)
+    return [(member, s) for member, s in entries if s < score or int(member) < last_id][:limit]
+
+
+async def get_feed(
+    limit: int,
+    position: Optional[Tuple[float, int]],
+    db: Session,
+) -> Tuple[List[ImageCardResponse], Optional[str]]:
+    """
+    The get_feed function returns a page of the newest images of the site.
+    The page is read from the sorted set of image ids scored by creation time and the image cards are read
+    from their documents with a single lookup. Pages are addressed by the score and id of the last image of the previous page,
+    so images published in the meantime do not shift the following pages. When Redis is unavailable the page
+    is read from the database in the same order, with the same cursors.
+
+    :param limit: int: Number of images per page
+    :param position: Optional[Tuple[float, int]]: Score and id of the last image of the previous page
+    :param db: Session: Pass the database session to the function
+    :return: The image cards of the page and the cursor of the next page (None on the last page)
+    """
+    cached = True
+    try:
+        entries = await _read_feed(limit, position, db)
+    except RedisError as e:
+        logging.warning(f"Could not read the feed, reading the database: {e}")
+        cached = False
+        before = None if position is None else (datetime.fromtimestamp(position[0]), position[1])
+        entries = [
+            (image_id, _score(created_at))
+            for image_id, created_at in await repository_images.get_recent_image_page(limit, before, db)
+        ]
+
+    image_ids = [int(member) for member, _ in entries]
+    images = await get_image_documents(image_ids, db)
+    if cached and len(images) < len(image_ids):
+        found = {image.id for image in images}
+        stale = [_member(image_id) for image_id in image_ids if image_id not in found]
+        try:
+            get_cache().zrem(FEED_KEY, *stale)
+        except RedisError as e:
+            logging.warning(f"Could not remove deleted images from the feed: {e}")
+
+    next_cursor = None
+    if len(entries) == limit:
+        member, score = entries[-1]
+        next_cursor = encode_score_cursor(score, int(member))
+    return images, next_cursor
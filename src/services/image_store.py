@@ -0,0 +1,184 @@
+import os
+from typing import Dict, Iterable, Optional, Type
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel
+from sqlalchemy.orm import Session
+
+from src.conf.config import settings
+from src.models.user import User
+from src.repository import images as repository_images
+from src.repository import storage_cleanup as repository_storage_cleanup
+from src.services import feed, timeline
+from src.schemas.image import ImageCreate
+from src.services.upload_validation import check_storage_quota
+from src.utils.image_metadata import extract_upload_metadata, get_stored_metadata
+from src.utils.image_utils import upload_cloudinary_asset
+
+
+class PreparedImage:
+    """The stored asset and the metadata of an upload, prepared by prepare_image before any lock is taken."""
+
+    def __init__(
+        self, file, content_hash: str, size: int, image_url: str, image_metadata: dict, uploaded: bool,
+        cleanup_pending: bool,
+    ):
+        self.file = file
+        self.content_hash = content_hash
+        self.size = size
+        self.image_url = image_url
+        self.image_metadata = image_metadata
+        # False when the asset of an image with identical bytes is reused
+        self.uploaded = uploaded
+        # Whether the storage cleanup had an entry for the asset before it was uploaded or reused
+        self.cleanup_pending = cleanup_pending
+
+
+async def prepare_image(file, content_hash: str, user: User, db: Session) -> PreparedImage:
+    """
+    The prepare_image function does the slow part of storing an upload, without holding a lock or a transaction:
+    identical bytes that are already stored reuse the stored asset and its metadata; otherwise the metadata
+    is extracted in the metadata worker pool and the file is uploaded to Cloudinary.
+    The quota is checked first so a file that cannot fit is not uploaded; create_prepared_image checks it again.
+    The transaction of the lookups is committed before the extraction and the upload, so the caller must not
+    have pending changes.
+
+    :param file: A binary file-like object with the image bytes
+    :param content_hash: str: SHA-256 of the file content
+    :param user: User: The owner of the new image
+    :param db: Session: Pass the database session to the function
+    :return: The prepared image
+    :raises HTTPException: 413 if the file does not fit into the user's storage quota
+    """
+    size = file.seek(0, os.SEEK_END)
+    file.seek(0)
+    await check_storage_quota(user, size, db)
+    duplicate = await repository_images.get_image_by_hash(content_hash, db)
+    image_metadata = get_stored_metadata(duplicate) if duplicate is not None else None
+    image_url = duplicate.image_url if duplicate is not None else None
+    cleanup_pending = bool(await repository_storage_cleanup.get_pending_cleanup_hashes([content_hash], db))
+    # No connection idles in a transaction during the extraction and the upload
+    db.commit()
+
+    if image_metadata is None:
+        image_metadata = await extract_upload_metadata(file)
+    # Files Pillow cannot read still count towards the storage quota
+    image_metadata = {**(image_metadata or {}), "byte_size": size}
+    uploaded = image_url is None
+    if uploaded:
+        image_url = await run_in_threadpool(upload_cloudinary_asset, file, content_hash)
+    return PreparedImage(file, content_hash, size, image_url, image_metadata, uploaded, cleanup_pending)
+
+
+async def restore_cleaned_assets(files: Dict[str, object], db: Session) -> Dict[str, str]:
+    """
+    The restore_cleaned_assets function uploads again the assets the storage cleanup may have deleted since they
+    were prepared: assets that were reused from an image or had a cleanup entry when they were prepared, and that
+    no image uses and no entry waits for anymore. The caller holds the locks of the assets (see lock_assets),
+    so no cleanup runs meanwhile; the uploads are idempotent and rarely needed.
+
+    :param files: Dict[str, object]: The binary file-like object of every such asset, by content hash
+    :param db: Session: Pass the database session to the function
+    :return: The new url of every uploaded asset, by content hash
+    """
+    kept = await repository_storage_cleanup.get_referenced_hashes(files, db)
+    kept |= await repository_storage_cleanup.get_pending_cleanup_hashes(files, db)
+    urls = {}
+    for content_hash, file in files.items():
+        if content_hash not in kept:
+            file.seek(0)
+            urls[content_hash] = await run_in_threadpool(upload_cloudinary_asset, file, content_hash)
+    return urls
+
+
+async def queue_orphaned_assets(content_hashes: Iterable[str], db: Session) -> None:
+    """
+    The queue_orphaned_assets function hands the assets uploaded for files that were not stored to the storage
+    cleanup and commits. The entries are due after settings.storage_cleanup_orphan_delay, so an upload of the
+    same bytes that is still being prepared has linked its image by then and keeps the asset.
+
+    :param content_hashes: Iterable[str]: SHA-256 digests of the orphaned assets
+    :param db: Session: Pass the database session to the function
+    :return: None
+    """
+    for content_hash in set(content_hashes):
+        await repository_storage_cleanup.enqueue_asset_cleanup(
+            content_hash, db, delay=settings.storage_cleanup_orphan_delay
+        )
+    db.commit()
+
+
+async def create_prepared_image(
+    prepared: PreparedImage,
+    body: ImageCreate,
+    user: User,
+    db: Session,
+    schema: Optional[Type[BaseModel]] = None,
+):
+    """
+    The create_prepared_image function creates the image of a prepared upload in a short transaction:
+    it takes the lock of the asset, so the storage cleanup cannot delete the asset the image links to,
+    checks the storage quota again with the user's usage locked, so concurrent uploads cannot exceed it together,
+    and commits the image. An asset uploaded for a file that no longer fits is handed to the storage cleanup.
+    The new image is published to the recent images feed and the home timelines of the followers.
+
+    :param prepared: PreparedImage: The upload returned by prepare_image
+    :param body: ImageCreate: The content and tags of the image
+    :param user: User: The owner of the new image
+    :param db: Session: Pass the database session to the function
+    :param schema: Optional[Type[BaseModel]]: The response model the image is serialized with
+    :return: The new image object
+    :raises HTTPException: 413 if the file does not fit into the user's storage quota
+    """
+    repository_storage_cleanup.lock_assets([prepared.content_hash], db)
+    try:
+        await check_storage_quota(user, prepared.size, db, lock=True)
+    except HTTPException:
+        db.rollback()
+        if prepared.uploaded:
+            await queue_orphaned_assets([prepared.content_hash], db)
+        raise
+    image_url = prepared.image_url
+    if not prepared.uploaded or prepared.cleanup_pending:
+        restored = await restore_cleaned_assets({prepared.content_hash: prepared.file}, db)
+        image_url = restored.get(prepared.content_hash, image_url)
+
+    image = await repository_images.create_image(
+        image_url,
+        body,
+        user,
+        db,
+        content_hash=prepared.content_hash,
+        schema=schema,
+        image_metadata=prepared.image_metadata,
+    )
+    feed.publish_images([image])
+    await timeline.fan_out_images([image], db)
+    return image
+
+
+async def store_image(
+    file,
+    content_hash: str,
+    body: ImageCreate,
+    user: User,
+    db: Session,
+    schema: Optional[Type[BaseModel]] = None,
+):
+    """
+    The store_image function stores an uploaded file as a new image of the user: the asset and the metadata
+    are prepared without locks (see prepare_image), then the image is created in a short transaction
+    (see create_prepared_image).
+
+    :param file: A binary file-like object with the image bytes
+    :param content_hash: str: SHA-256 of the file content
+    :param body: ImageCreate: The content and tags of the image
+    :param user: User: The owner of the new image
+    :param db: Session: Pass the database session to the function
+    :param schema: Optional[Type[BaseModel]]: The response model the image is serialized with
+    :return: The new image object
+    :raises HTTPException: 413 if the file does not fit into the user's storage quota
+    """
+    prepared = await prepare_image(file, content_hash, user, db)
+    return await create_prepared_image(prepared, body, user, db, schema=schema)
@@ -0,0 +1,42 @@
+import argparse
+import asyncio
+import logging
+
+from src.conf.config import settings
+from src.database.db import SessionLocal
+from src.repository.rating_stats import reconcile_rating_stats
+
+
+async def run_rating_reconciler(interval: int):
+    """
+    The run_rating_reconciler function repairs the drifted rating aggregates every interval seconds
+    until it is stopped.
+
+    :param interval: int: Pause between two passes in seconds
+    :return: None
+    """
+    while True:
+        session = SessionLocal()
+        try:
+            repaired = await reconcile_rating_stats(session)
+            if repaired:
+                logging.info(f"Repaired the rating aggregates of {repaired} images")
+        except Exception as e:
+            session.rollback()
+            logging.error(f"Rating aggregates reconciliation failed: {e}")
+        finally:
+            session.close()
+        await asyncio.sleep(interval)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Repair the rating aggregates that drifted from the ratings.")
+    parser.add_argument(
+        "--interval",
+        type=int,
+        default=settings.rating_reconcile_interval,
+        help="Pause between two passes in seconds",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_rating_reconciler(args.interval))
@@ -0,0 +1,261 @@
+import hashlib
+import logging
+import time
+from email.utils import parsedate_to_datetime
+from typing import List, Optional
+
+import msgpack
+from redis.exceptions import RedisError
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from starlette.background import BackgroundTask
+from starlette.requests import Request
+from starlette.responses import Response
+
+from src.conf.config import settings
+from src.database.cache import get_cache
+from src.models.comment import Comment
+from src.models.image import Image
+from src.repository.image_documents import CHANGED_IMAGES
+from src.repository.versions import CHANGED_COLLECTIONS, TAGS_COLLECTION
+from src.utils.conditional import is_not_modified
+from src.utils.serialization import prefers_msgpack
+
+ENTRY_PREFIX = "route:"
+GENERATION_PREFIX = "route-gen:"
+LOCK_PREFIX = "route-lock:"
+REVALIDATE_LOCK_SECONDS = 30
+CACHE_STATUS_HEADER = "X-Cache"
+# Tags invalidated once the session commits, kept in Session.info
+PENDING_TAGS = "response_cache_tags"
+CONDITIONAL_HEADERS = (b"if-none-match", b"if-modified-since")
+
+# Dependency tags, filled from the path and query parameters of the cached routes
+IMAGE_TAG = "image:{image_id}"
+IMAGE_COMMENTS_TAG = "comments:{image_id}"
+TAGS_TAG = "tags:*"
+
+
+def generation_key(tag: str) -> str:
+    return f"{GENERATION_PREFIX}{tag}"
+
+
+def invalidate_cache(*tags: str) -> None:
+    """
+    The invalidate_cache function drops the cached responses carrying any of the given tags.
+    Every tag has a generation counter that is part of the cache keys of its entries; incrementing it
+    makes the old entries unreachable (they expire on their own), so a reader that loaded the old data
+    before the write cannot store it under a key that is still read.
+
+    :param tags: str: The dependency tags, for example image:12 or tags:*
+    :return: None
+    """
+    if not tags:
+        return
+    # Generations must outlive every entry built from them, or a reset counter could reach an old entry
+    lifetime = 2 * (settings.response_cache_ttl + settings.response_cache_stale)
+    try:
+        pipe = get_cache().pipeline(transaction=False)
+        for tag in tags:
+            pipe.incr(generation_key(tag))
+            pipe.expire(generation_key(tag), lifetime)
+        pipe.execute()
+    except RedisError as e:
+        logging.warning(f"Response cache invalidation of {tags} failed: {e}")
+
+
+def invalidate_on_commit(db: Session, *tags: str) -> None:
+    """
+    The invalidate_on_commit function schedules cache invalidation for when the session commits.
+    Invalidating before the commit would let a concurrent reader cache the old rows under the new generation.
+    The tags of the repository writes are found by the session hooks below, this is for other dependencies.
+
+    :param db: Session: The session of the write
+    :param tags: str: The dependency tags changed by the write
+    :return: None
+    """
+    db.info.setdefault(PENDING_TAGS, set()).update(tags)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changed_comments(session: Session, flush_context):
+    tags = session.info.setdefault(PENDING_TAGS, set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Comment) and obj.image_id is not None:
+            tags.add(IMAGE_COMMENTS_TAG.format(image_id=obj.image_id))
+        elif isinstance(obj, Image) and obj in session.deleted:
+            # The comment list of a deleted image is gone with it
+            tags.add(IMAGE_COMMENTS_TAG.format(image_id=obj.id))
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session: Session):
+    # Changed images are the ones whose documents were rebuilt, bulk updates included (mark_image_documents)
+    tags = session.info.pop(PENDING_TAGS, set())
+    tags.update(IMAGE_TAG.format(image_id=image_id) for image_id in session.info.pop(CHANGED_IMAGES, ()))
+    if TAGS_COLLECTION in session.info.pop(CHANGED_COLLECTIONS, ()):
+        tags.add(TAGS_TAG)
+    if tags:
+        invalidate_cache(*sorted(tags))
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back(session: Session):
+    session.info.pop(PENDING_TAGS, None)
+    session.info.pop(CHANGED_COLLECTIONS, None)
+
+
+def _tag_value(value: str):
+    # Path and query values are strings; numeric ids are formatted like the ints the writes use (01 -> 1)
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+
+def _load_entry(raw: Optional[bytes]) -> Optional[dict]:
+    if raw is None:
+        return None
+    try:
+        entry = msgpack.unpackb(raw)
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(entry, dict) or not {"body", "headers", "fresh_until"} <= entry.keys():
+        return None
+    return entry
+
+
+def _revalidation_request(request: Request) -> Request:
+    scope = dict(request.scope)
+    scope["headers"] = [(name, value) for name, value in request.scope["headers"] if name not in CONDITIONAL_HEADERS]
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    return Request(scope, receive)
+
+
+class ResponseCachePolicy:
+    """
+    How the responses of one route are cached, see cache_response. The route class of the router
+    (MsgPackRoute and its subclasses) wraps the route handler with wrap.
+    """
+
+    def __init__(self, tags: List[str], ttl: int, stale: int):
+        self.tags = tags
+        self.ttl = ttl
+        self.stale = stale
+
+    def entry_tags(self, request: Request) -> Optional[List[str]]:
+        params = {name: _tag_value(value) for name, value in {**request.query_params, **request.path_params}.items()}
+        try:
+            return [tag.format(**params) for tag in self.tags]
+        except (KeyError, IndexError):
+            return None
+
+    def entry_key(self, request: Request, tags: List[str]) -> str:
+        generations = get_cache().mget([generation_key(tag) for tag in tags])
+        normalized = "&".join(f"{name}={value}" for name, value in sorted(request.query_params.multi_items()))
+        encoding = "msgpack" if prefers_msgpack(request.headers.get("accept", "")) else "json"
+        parts = [normalized, encoding] + [(generation or b"0").decode() for generation in generations]
+        digest = hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()
+        return f"{ENTRY_PREFIX}{request.url.path}:{digest}"
+
+    def store(self, key: str, response: Response) -> None:
+        if response.status_code != 200 or not hasattr(response, "body") or "set-cookie" in response.headers:
+            return
+        headers = [
+            [name, value] for name, value in response.raw_headers if name.lower() != CACHE_STATUS_HEADER.lower().encode()
+        ]
+        entry = {"body": response.body, "headers": headers, "fresh_until": time.time() + self.ttl}
+        try:
+            get_cache().set(key, msgpack.packb(entry), ex=self.ttl + self.stale)
+        except RedisError as e:
+            logging.warning(f"Response cache write of {key} failed: {e}")
+
+    def cached_response(self, request: Request, entry: dict, status: str) -> Response:
+        headers = [(bytes(name), bytes(value)) for name, value in entry["headers"]]
+        validators = {name.lower(): value.decode("latin-1") for name, value in headers}
+        etag = validators.get(b"etag")
+        if etag is not None:
+            last_modified = validators.get(b"last-modified")
+            if is_not_modified(request, etag, last_modified and parsedate_to_datetime(last_modified)):
+                response = Response(status_code=304)
+                response.raw_headers = [
+                    (name, value) for name, value in headers
+                    if name.lower() in (b"etag", b"last-modified", b"cache-control", b"vary")
+                ]
+                response.headers[CACHE_STATUS_HEADER] = status
+                return response
+        response = Response(content=entry["body"])
+        response.raw_headers = headers
+        response.headers[CACHE_STATUS_HEADER] = status
+        return response
+
+    async def revalidate(self, handler, request: Request, key: str) -> None:
+        try:
+            response = await handler(_revalidation_request(request))
+        except Exception as e:
+            logging.warning(f"Response cache revalidation of {key} failed: {e}")
+            return
+        self.store(key, response)
+
+    def wrap(self, handler):
+        async def cached_handler(request: Request) -> Response:
+            tags = self.entry_tags(request) if request.method == "GET" else None
+            if tags is None:
+                return await handler(request)
+            try:
+                key = self.entry_key(request, tags)
+                entry = _load_entry(get_cache().get(key))
+                fresh = entry is not None and entry["fresh_until"] >= time.time()
+                # A stale entry is served right away, one request refreshes it after its response is sent
+                revalidate = (
+                    entry is not None
+                    and not fresh
+                    and get_cache().set(LOCK_PREFIX + key, 1, nx=True, ex=REVALIDATE_LOCK_SECONDS)
+                )
+            except RedisError as e:
+                logging.warning(f"Response cache read failed: {e}")
+                return await handler(request)
+            if entry is not None:
+                response = self.cached_response(request, entry, "HIT" if fresh else "STALE")
+                if revalidate:
+                    response.background = BackgroundTask(self.revalidate, handler, request, key)
+                return response
+            response = await handler(request)
+            self.store(key, response)
+            response.headers[CACHE_STATUS_HEADER] = "MISS"
+            return response
+
+        return cached_handler
+
+
+def cache_response(tags: List[str], ttl: Optional[int] = None, stale: Optional[int] = None):
+    """
+    The cache_response decorator caches the serialized responses of a GET route in Redis.
+    Entries are keyed by the path, the sorted query parameters, the negotiated encoding and the generations
+    of their dependency tags. Tags are format strings filled from the path and query parameters,
+    for example "image:{image_id}", numeric values normalized to ints; committed writes invalidate them
+    through the session hooks above. Requests missing a parameter used by a tag are passed through uncached.
+    An entry is fresh for ttl seconds and served stale for stale more seconds while a single request
+    revalidates it in the background, so readers never wait for the database on an expired entry.
+    The cached handler runs before the dependencies, only use it on routes whose response does not
+    depend on the current user.
+
+    :param tags: List[str]: Dependency tags of the responses
+    :param ttl: Optional[int]: Seconds an entry is fresh, response_cache_ttl by default
+    :param stale: Optional[int]: Seconds an expired entry is still served, response_cache_stale by default
+    :return: The decorator
+    """
+    policy = ResponseCachePolicy(
+        tags,
+        settings.response_cache_ttl if ttl is None else ttl,
+        settings.response_cache_stale if stale is None else stale,
+    )
+
+    def decorator(endpoint):
+        endpoint.__dict__.setdefault("handler_wrappers", []).append(policy)
+        return endpoint
+
+    return decorator
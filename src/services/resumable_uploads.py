@@ -0,0 +1,213 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+import time
+from typing import IO, AsyncIterator, Dict, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from starlette.requests import ClientDisconnect
+
+from src.conf.config import settings
+from src.utils.image_utils import HASH_CHUNK_SIZE
+
+# Running SHA-256 of every upload handled by this process, keyed by upload id, with the offset it covers.
+# Hash objects cannot be persisted, so a process that has not seen the previous chunks rebuilds the
+# state from the staged file.
+_hashers: Dict[str, Tuple[int, "hashlib._Hash"]] = {}
+_locks: Dict[str, asyncio.Lock] = {}
+# When this process last handled every upload, to drop the state of the ones that expired
+_last_used: Dict[str, float] = {}
+
+
+class UploadOverflow(Exception):
+    """Raised when a chunk would grow the upload past its announced size."""
+
+
+def get_staging_path(upload_id: str) -> str:
+    """
+    The get_staging_path function returns the path of the staging file of an upload.
+
+    :param upload_id: str: The id of the upload session
+    :return: The path of the staging file
+    """
+    return os.path.join(settings.upload_staging_dir, f"{upload_id}.part")
+
+
+def _rebuild_hasher(upload_id: str, offset: int):
+    hasher = hashlib.sha256()
+    remaining = offset
+    if remaining:
+        with open(get_staging_path(upload_id), "rb") as staged:
+            while remaining:
+                chunk = staged.read(min(HASH_CHUNK_SIZE, remaining))
+                if not chunk:
+                    raise ValueError("Staged upload is shorter than its acknowledged offset")
+                hasher.update(chunk)
+                remaining -= len(chunk)
+    return hasher
+
+
+async def get_hasher(upload_id: str, offset: int):
+    """
+    The get_hasher function returns a copy of the running hash of the first offset bytes of an upload.
+
+    :param upload_id: str: The id of the upload session
+    :param offset: int: The acknowledged offset of the upload
+    :return: A hashlib sha256 object
+    """
+    cached = _hashers.get(upload_id)
+    if cached is not None and cached[0] == offset:
+        return cached[1].copy()
+    return await run_in_threadpool(_rebuild_hasher, upload_id, offset)
+
+
+def _open_at(path: str, offset: int):
+    staged = open(path, "r+b")
+    staged.seek(offset)
+    # Drop bytes of an earlier attempt that were received but never acknowledged
+    staged.truncate()
+    return staged
+
+
+async def start_staging(upload_id: str) -> None:
+    """
+    The start_staging function creates the empty staging file of a new upload.
+
+    :param upload_id: str: The id of the upload session
+    :return: None
+    """
+    os.makedirs(settings.upload_staging_dir, exist_ok=True)
+    open(get_staging_path(upload_id), "wb").close()
+    _hashers[upload_id] = (0, hashlib.sha256())
+    _last_used[upload_id] = time.monotonic()
+
+
+def _spool_file():
+    os.makedirs(settings.upload_staging_dir, exist_ok=True)
+    return tempfile.TemporaryFile(dir=settings.upload_staging_dir)
+
+
+async def spool_chunk(stream: AsyncIterator[bytes], limit: int) -> Tuple[IO[bytes], int]:
+    """
+    The spool_chunk function receives a request body stream into a temporary file, before the upload session
+    is locked, so a slow client does not hold the lock or a database transaction while it sends the chunk.
+    When the client disconnects, the bytes received so far are kept, so they can be acknowledged
+    and the client resumes after them.
+
+    :param stream: AsyncIterator[bytes]: The request body
+    :param limit: int: The number of bytes the upload still expects
+    :return: The temporary file, rewound, and the number of bytes in it; the caller closes the file
+    :raises UploadOverflow: If the chunk is longer than limit
+    """
+    spooled = await run_in_threadpool(_spool_file)
+    length = 0
+    try:
+        async for piece in stream:
+            if not piece:
+                continue
+            if length + len(piece) > limit:
+                raise UploadOverflow()
+            await run_in_threadpool(spooled.write, piece)
+            length += len(piece)
+    except ClientDisconnect:
+        pass
+    except BaseException:
+        await run_in_threadpool(spooled.close)
+        raise
+    await run_in_threadpool(spooled.seek, 0)
+    return spooled, length
+
+
+def _copy_chunk(path: str, offset: int, chunk: IO[bytes], hasher) -> int:
+    position = offset
+    with _open_at(path, offset) as staged:
+        while True:
+            piece = chunk.read(HASH_CHUNK_SIZE)
+            if not piece:
+                break
+            staged.write(piece)
+            hasher.update(piece)
+            position += len(piece)
+    return position
+
+
+async def append_chunk(upload_id: str, offset: int, chunk: IO[bytes]) -> Tuple[int, "hashlib._Hash"]:
+    """
+    The append_chunk function writes a chunk received by spool_chunk to the staging file, starting at offset,
+    and feeds it to the running hash. The caller holds the lock of the upload session.
+
+    :param upload_id: str: The id of the upload session
+    :param offset: int: The acknowledged offset the chunk starts at
+    :param chunk: IO[bytes]: The spooled chunk, rewound
+    :return: The offset after the chunk and the running hash covering it
+    """
+    hasher = await get_hasher(upload_id, offset)
+    position = await run_in_threadpool(_copy_chunk, get_staging_path(upload_id), offset, chunk, hasher)
+    return position, hasher
+
+
+def _evict_idle() -> None:
+    # Uploads finished by another worker or abandoned never reach discard_staging in this process.
+    # An upload idle for longer than the lifetime of its session has expired.
+    deadline = time.monotonic() - settings.upload_session_ttl
+    for upload_id in [upload_id for upload_id, used in _last_used.items() if used < deadline]:
+        lock = _locks.get(upload_id)
+        if lock is not None and lock.locked():
+            continue
+        forget_upload(upload_id)
+
+
+def upload_lock(upload_id: str) -> asyncio.Lock:
+    """
+    The upload_lock function returns the lock serializing the requests of one upload in this process,
+    so they wait for each other instead of failing on the row lock of the upload session
+    (see lock_upload_session), which serializes the requests handled by different workers.
+    The state this process keeps for uploads that stayed idle longer than settings.upload_session_ttl is dropped.
+
+    :param upload_id: str: The id of the upload session
+    :return: An asyncio lock
+    """
+    _evict_idle()
+    _last_used[upload_id] = time.monotonic()
+    return _locks.setdefault(upload_id, asyncio.Lock())
+
+
+def forget_upload(upload_id: str) -> None:
+    """
+    The forget_upload function drops the lock and running hash this process keeps for an upload.
+    They are rebuilt if the upload is used again.
+
+    :param upload_id: str: The id of the upload session
+    :return: None
+    """
+    _hashers.pop(upload_id, None)
+    _locks.pop(upload_id, None)
+    _last_used.pop(upload_id, None)
+
+
+def remember_hasher(upload_id: str, offset: int, hasher) -> None:
+    """
+    The remember_hasher function keeps the running hash of an acknowledged offset for the next chunk.
+
+    :param upload_id: str: The id of the upload session
+    :param offset: int: The acknowledged offset
+    :param hasher: The hashlib sha256 object covering the first offset bytes
+    :return: None
+    """
+    _hashers[upload_id] = (offset, hasher)
+    _last_used[upload_id] = time.monotonic()
+
+
+def discard_staging(upload_id: str) -> None:
+    """
+    The discard_staging function removes the staging file and running hash of an upload.
+
+    :param upload_id: str: The id of the upload session
+    :return: None
+    """
+    forget_upload(upload_id)
+    try:
+        os.remove(get_staging_path(upload_id))
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,526 @@
+import argparse
+import array
+import asyncio
+import bisect
+import heapq
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, Optional
+
+import msgpack
+import snowballstemmer
+from sqlalchemy import event, inspect, insert
+from sqlalchemy.orm import Session
+
+from src.conf.config import settings
+from src.database.db import SessionLocal, database_now
+from src.models.image import Image
+from src.models.outbox import SearchIndexChange
+from src.repository import images as repository_images
+from src.repository import search_index as repository_search_index
+from src.utils.full_text import STOP_WORDS, parse_websearch
+
+# Set in Session.info when the session recorded content changes, so this worker syncs right after the commit
+PENDING_CHANGES = "search_index_changes"
+REBUILD_BATCH_SIZE = 1000
+SYNC_BATCH_SIZE = 1000
+# A change id missing when a greater one is read belongs to a transaction that is still open or was rolled back;
+# it is looked up again on every sync during this many seconds
+GAP_TIMEOUT = 60
+# Posting lists are sorted arrays of signed 64 bit image ids
+TYPECODE = "q"
+EMPTY = array.array(TYPECODE)
+# Words as the full-text parsers of PostgreSQL and SQLite split them: runs of letters and digits
+TOKEN_PATTERN = re.compile(r"[^\W_]+")
+# The stemmer of the full-text search of every database: the english configuration of PostgreSQL uses the
+# Snowball english stemmer, the porter tokenizer of SQLite FTS5 the original Porter stemmer
+STEMMERS = {"postgresql": "english", "sqlite": "porter"}
+
+_index: Optional["InvertedIndex"] = None
+_last_sync = 0.0
+_changed = False
+
+
+@lru_cache(maxsize=None)
+def _stemmer(language: str):
+    return snowballstemmer.stemmer(language)
+
+
+def _fold(word: str) -> str:
+    # The unicode61 tokenizer of FTS5 removes diacritics
+    return "".join(char for char in unicodedata.normalize("NFKD", word) if not unicodedata.combining(char))
+
+
+def stem_words(text: str, language: str) -> List[str]:
+    """
+    The stem_words function returns the stems of the words of a text, without the stop words, as the full-text
+    search of the database with this stemmer indexes them.
+
+    :param text: str: The text
+    :param language: str: The stemmer, a value of STEMMERS
+    :return: The stems, in the order of the words
+    """
+    words = [word for word in TOKEN_PATTERN.findall(text.lower()) if word not in STOP_WORDS]
+    if language == "porter":
+        words = [_fold(word) for word in words]
+    return _stemmer(language).stemWords(words)
+
+
+def intersect(first: array.array, second: array.array) -> array.array:
+    """
+    The intersect function returns the ids found in both sorted posting lists. Every id of the shorter
+    list is looked up in the longer one by binary search, starting where the previous lookup ended.
+
+    :param first: array: A sorted posting list
+    :param second: array: A sorted posting list
+    :return: The sorted common ids
+    """
+    if len(first) > len(second):
+        first, second = second, first
+    result = array.array(TYPECODE)
+    position = 0
+    for image_id in first:
+        position = bisect.bisect_left(second, image_id, position)
+        if position == len(second):
+            break
+        if second[position] == image_id:
+            result.append(image_id)
+    return result
+
+
+def union(lists: Iterable[array.array]) -> array.array:
+    """
+    The union function merges sorted posting lists into one sorted list without duplicates.
+
+    :param lists: Iterable[array]: Sorted posting lists
+    :return: The sorted ids found in any of the lists
+    """
+    result = array.array(TYPECODE)
+    for image_id in heapq.merge(*lists):
+        if not result or result[-1] != image_id:
+            result.append(image_id)
+    return result
+
+
+def difference(first: array.array, second: array.array) -> array.array:
+    """
+    The difference function returns the ids of a sorted posting list that are missing from another one.
+
+    :param first: array: A sorted posting list
+    :param second: array: The sorted posting list of the ids removed
+    :return: The sorted remaining ids
+    """
+    result = array.array(TYPECODE)
+    position = 0
+    for image_id in first:
+        position = bisect.bisect_left(second, image_id, position)
+        if position == len(second) or second[position] != image_id:
+            result.append(image_id)
+    return result
+
+
+class InvertedIndex:
+    """
+    An inverted index of the words of Image.content: every stem maps to the sorted array of the ids
+    of the images containing it. The stems of every image are kept too, to update and remove images.
+    Words are stemmed and stop words dropped as the full-text search of the database does, so a search
+    returns at least every image the database matches (see get_images_by_search).
+    position is the id of the last change of the search_index_changes table applied to the index, gaps
+    maps the smaller ids not seen yet to the time they are given up, and synced_at is the time of the
+    database when the index was last synced.
+    """
+
+    def __init__(self, language: str = "english"):
+        self.language = language
+        self.postings: Dict[str, array.array] = {}
+        self.documents: Dict[int, FrozenSet[str]] = {}
+        self.position = 0
+        self.gaps: Dict[int, float] = {}
+        self.synced_at: Optional[datetime] = None
+        self.lock = threading.RLock()
+
+    def set(self, image_id: int, content: str) -> None:
+        with self.lock:
+            tokens = frozenset(stem_words(content, self.language))
+            previous = self.documents.get(image_id, frozenset())
+            for token in previous - tokens:
+                self._remove_posting(token, image_id)
+            for token in tokens - previous:
+                self._add_posting(token, image_id)
+            self.documents[image_id] = tokens
+
+    def remove(self, image_id: int) -> None:
+        with self.lock:
+            for token in self.documents.pop(image_id, frozenset()):
+                self._remove_posting(token, image_id)
+
+    def _add_posting(self, token: str, image_id: int) -> None:
+        postings = self.postings.get(token)
+        if postings is None:
+            self.postings[token] = array.array(TYPECODE, [image_id])
+            return
+        # New images have the greatest ids, so this is usually an append
+        position = bisect.bisect_left(postings, image_id)
+        if position == len(postings) or postings[position] != image_id:
+            postings.insert(position, image_id)
+
+    def _remove_posting(self, token: str, image_id: int) -> None:
+        postings = self.postings.get(token)
+        if postings is None:
+            return
+        position = bisect.bisect_left(postings, image_id)
+        if position < len(postings) and postings[position] == image_id:
+            del postings[position]
+        if not postings:
+            del self.postings[token]
+
+    def _lookup(self, term: str) -> array.array:
+        # The words of a phrase must all be present; their order is left to the database
+        lists = [self.postings.get(token, EMPTY) for token in set(stem_words(term, self.language))]
+        if not lists:
+            return EMPTY
+        lists.sort(key=len)
+        result = lists[0]
+        for postings in lists[1:]:
+            result = intersect(result, postings)
+        return result
+
+    def search(self, query: str) -> array.array:
+        """
+        The search method returns the ids of the images that may match a search in the syntax of
+        websearch_to_tsquery (words, "phrases", OR, -word): every image the full-text search of the database
+        matches, and images containing the words of a phrase in another order or the words of an excluded phrase.
+
+        :param query: str: The search typed by the user
+        :return: The sorted ids of the candidate images
+        """
+        groups, excluded = parse_websearch(query)
+        with self.lock:
+            matches = [union(self._lookup(term) for term in group) for group in groups]
+            if matches:
+                matches.sort(key=len)
+                result = matches[0]
+                for postings in matches[1:]:
+                    result = intersect(result, postings)
+            elif excluded:
+                result = array.array(TYPECODE, sorted(self.documents))
+            else:
+                return array.array(TYPECODE)
+            # Only single words are excluded here, an image with the words of a phrase may lack the phrase
+            words = [stems for stems in (stem_words(term, self.language) for term in excluded) if len(stems) == 1]
+            if words:
+                result = difference(result, union(self.postings.get(stem, EMPTY) for stem, in words))
+            # A copy, the posting lists keep changing after the lock is released
+            return array.array(TYPECODE, result)
+
+    def dump(self) -> bytes:
+        """
+        The dump method serializes the posting lists and the sync state of the index.
+
+        :return: The snapshot bytes
+        """
+        with self.lock:
+            return msgpack.packb(
+                {
+                    "language": self.language,
+                    "position": self.position,
+                    "gaps": sorted(self.gaps),
+                    "synced_at": self.synced_at.isoformat() if self.synced_at else None,
+                    "postings": {token: postings.tobytes() for token, postings in self.postings.items()},
+                }
+            )
+
+    @classmethod
+    def load(cls, data: bytes) -> "InvertedIndex":
+        """
+        The load method restores an index from a snapshot created by dump.
+        The missing changes are looked up again during GAP_TIMEOUT seconds.
+
+        :param data: bytes: The snapshot bytes
+        :return: The index
+        """
+        payload = msgpack.unpackb(data)
+        index = cls(payload["language"])
+        index.position = payload["position"]
+        deadline = time.monotonic() + GAP_TIMEOUT
+        index.gaps = {change_id: deadline for change_id in payload["gaps"]}
+        if payload["synced_at"]:
+            index.synced_at = datetime.fromisoformat(payload["synced_at"])
+        documents: Dict[int, set] = {}
+        for token, raw in payload["postings"].items():
+            postings = array.array(TYPECODE)
+            postings.frombytes(raw)
+            index.postings[token] = postings
+            for image_id in postings:
+                documents.setdefault(image_id, set()).add(token)
+        index.documents = {image_id: frozenset(tokens) for image_id, tokens in documents.items()}
+        return index
+
+
+def get_search_index() -> Optional[InvertedIndex]:
+    """
+    The get_search_index function returns the index of this process, None until load_search_index ran.
+
+    :return: The index or None
+    """
+    return _index
+
+
+def _language(db: Session) -> str:
+    return STEMMERS.get(db.get_bind().dialect.name, "english")
+
+
+def _is_stale(index: InvertedIndex, now: datetime) -> bool:
+    # Older changes may already be deleted by prune_search_index_changes
+    return index.synced_at is None or index.synced_at < now - timedelta(seconds=settings.search_index_retention)
+
+
+def apply_changes(index: InvertedIndex, changes, deadline: float) -> None:
+    """
+    The apply_changes function applies rows of the search_index_changes table to an index, in id order.
+    The ids skipped before a newer change are recorded as gaps until deadline.
+
+    :param index: InvertedIndex: The index
+    :param changes: The (id, image id, content) rows
+    :param deadline: float: time.monotonic() value until which the skipped ids are looked up
+    :return: None
+    """
+    for change_id, image_id, content in changes:
+        if change_id > index.position:
+            for missing in range(index.position + 1, change_id):
+                index.gaps[missing] = deadline
+            index.position = change_id
+        else:
+            index.gaps.pop(change_id, None)
+        if content is None:
+            index.remove(image_id)
+        else:
+            index.set(image_id, content)
+
+
+async def sync_search_index(db: Session, force: bool = False) -> None:
+    """
+    The sync_search_index function applies the content changes committed since the last sync, by this
+    worker or another one. It reads the changes at most every settings.search_index_sync_interval seconds,
+    unless forced or this worker committed changes meanwhile. An index whose following changes may be
+    deleted already is loaded again.
+
+    :param db: Session: Pass the database session to the function
+    :param force: bool: Read the changes now
+    :return: None
+    """
+    global _last_sync, _changed
+    if _index is None:
+        return
+    now = time.monotonic()
+    if not force and not _changed and now - _last_sync < settings.search_index_sync_interval:
+        return
+    _last_sync, _changed = now, False
+    synced_at = database_now(db)
+    if _is_stale(_index, synced_at):
+        logging.warning("The search index missed changes that are deleted already, loading it again")
+        await load_search_index(db)
+        return
+    deadline = now + GAP_TIMEOUT
+    if _index.gaps:
+        apply_changes(_index, await repository_search_index.get_search_index_changes_by_id(_index.gaps, db), deadline)
+        for change_id, expiry in list(_index.gaps.items()):
+            if expiry < now:
+                del _index.gaps[change_id]
+    while True:
+        changes = await repository_search_index.get_search_index_changes(_index.position, SYNC_BATCH_SIZE, db)
+        apply_changes(_index, changes, deadline)
+        if len(changes) < SYNC_BATCH_SIZE:
+            break
+    _index.synced_at = synced_at
+
+
+async def search_ids(query: str, db: Session) -> Optional[List[int]]:
+    """
+    The search_ids function returns the candidates of a keyword search from the in-process index:
+    a superset of the images the full-text search of the database matches.
+
+    :param query: str: The search typed by the user
+    :param db: Session: Pass the database session to the function
+    :return: The sorted ids of the candidate images, or None when the index is not loaded or disabled
+    """
+    if _index is None or not settings.search_index_enabled:
+        return None
+    await sync_search_index(db)
+    return _index.search(query).tolist()
+
+
+async def rebuild_search_index(db: Session) -> InvertedIndex:
+    """
+    The rebuild_search_index function builds an index from the images of the database, batch by batch.
+    Its position is taken before the first batch is read, so changes committed during the rebuild are applied
+    again on the next sync, which is harmless. Recent ids that are missing may belong to transactions still
+    open, they are recorded as gaps.
+
+    :param db: Session: Pass the database session to the function
+    :return: The index
+    """
+    index = InvertedIndex(_language(db))
+    index.synced_at = database_now(db)
+    index.position = await repository_search_index.get_last_search_index_change_id(db)
+    recent = max(index.position - REBUILD_BATCH_SIZE, 0)
+    committed = set(await repository_search_index.get_search_index_change_ids(recent, db))
+    deadline = time.monotonic() + GAP_TIMEOUT
+    index.gaps = {
+        change_id: deadline for change_id in range(recent + 1, index.position + 1) if change_id not in committed
+    }
+    after_id = 0
+    while True:
+        rows = await repository_images.get_image_contents(after_id, REBUILD_BATCH_SIZE, db)
+        for image_id, content in rows:
+            index.set(image_id, content)
+        if len(rows) < REBUILD_BATCH_SIZE:
+            return index
+        after_id = rows[-1][0]
+
+
+async def prune_search_index_changes(db: Session) -> int:
+    """
+    The prune_search_index_changes function deletes the content changes older than
+    settings.search_index_retention seconds. Indexes not synced for that long are loaded again.
+
+    :param db: Session: Pass the database session to the function
+    :return: The number of deleted changes
+    """
+    before = database_now(db) - timedelta(seconds=settings.search_index_retention)
+    return await repository_search_index.delete_search_index_changes(before, db)
+
+
+def save_snapshot(index: InvertedIndex, path: Optional[str] = None) -> None:
+    """
+    The save_snapshot function writes an index to the snapshot file shared by the workers.
+    The file is replaced atomically, so workers never read a half written snapshot.
+
+    :param index: InvertedIndex: The index
+    :param path: Optional[str]: The snapshot file, settings.search_index_path by default
+    :return: None
+    """
+    path = path or settings.search_index_path
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as file:
+        file.write(index.dump())
+    os.replace(temporary, path)
+
+
+async def load_search_index(db: Session) -> InvertedIndex:
+    """
+    The load_search_index function loads the index of this process from the snapshot file and applies the
+    changes committed since. Without a usable snapshot, or with one for another database or older than the
+    changes kept, the index is rebuilt from the database and written as the new snapshot.
+
+    :param db: Session: Pass the database session to the function
+    :return: The loaded index
+    """
+    global _index
+    index = None
+    try:
+        with open(settings.search_index_path, "rb") as file:
+            index = InvertedIndex.load(file.read())
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logging.warning(f"Could not read the search index snapshot: {e}")
+    if index is None or index.language != _language(db) or _is_stale(index, database_now(db)):
+        index = await rebuild_search_index(db)
+        try:
+            save_snapshot(index)
+        except OSError as e:
+            logging.warning(f"Could not write the search index snapshot: {e}")
+    _index = index
+    await sync_search_index(db, force=True)
+    return index
+
+
+async def start_search_index() -> None:
+    """
+    The start_search_index function loads the index when the application starts. Until it is loaded, or if
+    loading fails, keyword searches run in the database only.
+
+    :return: None
+    """
+    if not settings.search_index_enabled:
+        return
+    db = SessionLocal()
+    try:
+        index = await load_search_index(db)
+        logging.info(f"Search index loaded, {len(index.documents)} images")
+    except Exception as e:
+        logging.error(f"Could not load the search index: {e}")
+    finally:
+        db.close()
+
+
+def stop_search_index() -> None:
+    """
+    The stop_search_index function writes the index of this process as the snapshot, so the next start
+    only applies the changes made since.
+
+    :return: None
+    """
+    if _index is None:
+        return
+    try:
+        save_snapshot(_index)
+    except OSError as e:
+        logging.warning(f"Could not write the search index snapshot: {e}")
+
+
+@event.listens_for(Session, "after_flush")
+def _record_content_changes(session: Session, flush_context):
+    changes = []
+    for obj in session.new:
+        if isinstance(obj, Image):
+            changes.append({"image_id": obj.id, "content": obj.content})
+    for obj in session.dirty:
+        if isinstance(obj, Image) and inspect(obj).attrs.content.history.has_changes():
+            changes.append({"image_id": obj.id, "content": obj.content})
+    for obj in session.deleted:
+        if isinstance(obj, Image):
+            changes.append({"image_id": obj.id, "content": None})
+    if not changes:
+        return
+    # Written in the transaction of the images, so the changes are recorded exactly when they are committed
+    session.connection().execute(insert(SearchIndexChange.__table__), changes)
+    session.info[PENDING_CHANGES] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _sync_after_commit(session: Session):
+    global _changed
+    if session.info.pop(PENDING_CHANGES, False):
+        _changed = True
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_content_changes(session: Session):
+    session.info.pop(PENDING_CHANGES, None)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Rebuild the search index snapshot from the database and delete the content changes "
+        "older than the retention. Run it periodically, at least once per retention period."
+    )
+    parser.add_argument("--path", default=settings.search_index_path, help="The snapshot file to write")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    session = SessionLocal()
+    try:
+        rebuilt = asyncio.run(rebuild_search_index(session))
+        save_snapshot(rebuilt, args.path)
+        logging.info(f"Search index snapshot written, {len(rebuilt.documents)} images")
+        pruned = asyncio.run(prune_search_index_changes(session))
+        logging.info(f"Deleted {pruned} search index changes")
+    finally:
+        session.close()
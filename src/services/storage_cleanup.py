@@ -0,0 +1,129 @@
+import argparse
+import asyncio
+import logging
+from typing import Callable, Dict, Optional
+
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from src.conf.config import settings
+from src.database.db import SessionLocal
+from src.repository import storage_cleanup as repository_storage_cleanup
+from src.utils.image_utils import delete_cloudinary_asset
+
+
+async def _destroy(public_id: str, destroy: Callable[[str], None], semaphore: asyncio.Semaphore) -> Optional[str]:
+    """
+    The _destroy function deletes one asset in the thread pool while holding the semaphore.
+
+    :param public_id: str: Public id of the asset
+    :param destroy: Callable that deletes an asset by public id
+    :param semaphore: asyncio.Semaphore: Bounds the number of concurrent deletions
+    :return: None on success or the error message
+    """
+    async with semaphore:
+        try:
+            await run_in_threadpool(destroy, public_id)
+        except Exception as e:
+            return str(e) or e.__class__.__name__
+    return None
+
+
+async def drain_storage_cleanup(
+    db: Session,
+    batch_size: int = settings.storage_cleanup_batch_size,
+    concurrency: int = settings.storage_cleanup_concurrency,
+    destroy: Callable[[str], None] = delete_cloudinary_asset,
+) -> int:
+    """
+    The drain_storage_cleanup function processes the storage cleanup outbox until no entry is due.
+    Entries are claimed batch_size at a time and every batch is committed on its own. Assets that an image
+    still uses (identical bytes were uploaded again) are kept; the others are deleted with at most
+    concurrency requests in flight. The assets stay locked against uploads of the same bytes until the batch
+    is committed (see lock_assets). Failed deletions are retried later with an exponential backoff;
+    deletions are idempotent, so an entry processed twice after a crash does no harm.
+
+    :param db: Session: Pass the database session to the function
+    :param batch_size: int: Number of entries claimed and committed at once
+    :param concurrency: int: Maximum number of concurrent deletions
+    :param destroy: Callable that deletes an asset by public id
+    :return: The number of deleted assets
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    deleted = 0
+    while True:
+        batch = await repository_storage_cleanup.claim_storage_cleanups(
+            batch_size, settings.storage_cleanup_max_attempts, db
+        )
+        if not batch:
+            break
+        # Uploads of the same bytes wait until the assets are deleted and the batch is committed
+        repository_storage_cleanup.lock_assets([entry.content_hash for entry in batch if entry.content_hash], db)
+        pending: Dict[str, list] = {}
+        for entry in batch:
+            if entry.content_hash and await repository_storage_cleanup.is_asset_referenced(entry.content_hash, db):
+                await repository_storage_cleanup.complete_storage_cleanup(entry.public_id, db)
+            else:
+                pending.setdefault(entry.public_id, []).append(entry)
+
+        errors = await asyncio.gather(*(_destroy(public_id, destroy, semaphore) for public_id in pending))
+        for (public_id, entries), error in zip(pending.items(), errors):
+            if error is None:
+                await repository_storage_cleanup.complete_storage_cleanup(public_id, db)
+                deleted += 1
+            else:
+                for entry in entries:
+                    await repository_storage_cleanup.retry_storage_cleanup(
+                        entry, error, settings.storage_cleanup_backoff, db
+                    )
+                logging.warning(f"Could not delete asset {public_id}: {error}")
+        db.commit()
+        logging.info(f"Processed {len(batch)} storage cleanup entries, deleted {deleted} assets")
+        if len(batch) < batch_size:
+            break
+    return deleted
+
+
+async def run_storage_cleanup_worker(interval: int, batch_size: int, concurrency: int):
+    """
+    The run_storage_cleanup_worker function drains the outbox every interval seconds until it is stopped.
+
+    :param interval: int: Pause between two drains in seconds
+    :param batch_size: int: Number of entries claimed and committed at once
+    :param concurrency: int: Maximum number of concurrent deletions
+    :return: None
+    """
+    while True:
+        session = SessionLocal()
+        try:
+            await drain_storage_cleanup(session, batch_size=batch_size, concurrency=concurrency)
+        except Exception as e:
+            session.rollback()
+            logging.error(f"Storage cleanup failed: {e}")
+        finally:
+            session.close()
+        await asyncio.sleep(interval)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Delete the stored assets of deleted images recorded in the storage cleanup outbox."
+    )
+    parser.add_argument("--batch-size", type=int, default=settings.storage_cleanup_batch_size)
+    parser.add_argument("--concurrency", type=int, default=settings.storage_cleanup_concurrency)
+    parser.add_argument(
+        "--interval", type=int, default=0, help="Keep running and drain the outbox every INTERVAL seconds"
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if args.interval:
+        asyncio.run(run_storage_cleanup_worker(args.interval, args.batch_size, args.concurrency))
+    else:
+        session = SessionLocal()
+        try:
+            count = asyncio.run(
+                drain_storage_cleanup(session, batch_size=args.batch_size, concurrency=args.concurrency)
+            )
+            print(f"Deleted {count} assets")
+        finally:
+            session.close()
@@ -0,0 +1,235 @@
+import logging
+import re
+import uuid
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from redis.exceptions import RedisError
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+
+from src.conf.config import settings
+from src.database.cache import get_cache
+from src.models.image import Image, Tag, image_m2m_tags
+
+TAG_BITMAP_PREFIX = "tag-bitmap:"
+# Bit image_id is set for every existing image; the other bitmaps are masked with it
+ALL_IMAGES_KEY = "tag-bitmap:all"
+# Set once the bitmaps were filled from the database; a missing marker triggers a rebuild
+BITMAPS_READY_KEY = "tag-bitmap:ready"
+# Bit changes and dropped tags waiting for the commit of the session, kept in Session.info
+PENDING_BITS = "tag_bitmaps_bits"
+PENDING_DROPS = "tag_bitmaps_drops"
+REBUILD_CHUNK_SIZE = 10000
+# Rebuilds write here and rename the bitmaps in at the end; leftovers of a crashed rebuild expire
+BUILD_PREFIX = "tag-bitmap-build:"
+BUILD_TTL = 60 * 60
+NONZERO_BYTE = re.compile(rb"[^\x00]")
+
+
+def tag_key(tag_id: int) -> str:
+    return f"{TAG_BITMAP_PREFIX}{tag_id}"
+
+
+def is_bitmap_key(key: bytes) -> bool:
+    name = key.decode()
+    return name == ALL_IMAGES_KEY or (name.startswith(TAG_BITMAP_PREFIX) and name[len(TAG_BITMAP_PREFIX):].isdigit())
+
+
+def bitmap_ids(data: bytes) -> List[int]:
+    """
+    The bitmap_ids function returns the positions of the set bits of a Redis bitmap.
+    Redis numbers the bits of every byte from the most significant one. Empty bytes are skipped by a regular
+    expression, so the cost follows the number of set bits rather than the length of the bitmap.
+
+    :param data: bytes: The bitmap
+    :return: The sorted positions
+    """
+    ids = []
+    for match in NONZERO_BYTE.finditer(data):
+        index, byte = match.start(), data[match.start()]
+        while byte:
+            high = byte.bit_length() - 1
+            ids.append(index * 8 + 7 - high)
+            byte ^= 1 << high
+    return ids
+
+
+def mark_tag_links(db: Session, links: Iterable[Tuple[int, int]]) -> None:
+    """
+    The mark_tag_links function schedules the bitmap bits of image-tag links inserted without the ORM
+    (bulk statements) for when the session commits. Links changed through Image.tags are picked up on flush.
+
+    :param db: Session: The session of the write
+    :param links: Iterable[Tuple[int, int]]: (image_id, tag_id) pairs
+    :return: None
+    """
+    bits = db.info.setdefault(PENDING_BITS, {})
+    for image_id, tag_id in links:
+        bits[(tag_key(tag_id), image_id)] = 1
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_tag_changes(session: Session, flush_context):
+    bits: Dict[Tuple[str, int], int] = session.info.setdefault(PENDING_BITS, {})
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Image):
+            if obj in session.new:
+                bits[(ALL_IMAGES_KEY, obj.id)] = 1
+            history = inspect(obj).attrs.tags.history
+            for tag in history.added or ():
+                bits[(tag_key(tag.id), obj.id)] = 1
+            for tag in history.deleted or ():
+                bits[(tag_key(tag.id), obj.id)] = 0
+    for obj in session.deleted:
+        if isinstance(obj, Image):
+            bits[(ALL_IMAGES_KEY, obj.id)] = 0
+            # Bits of tags that are not loaded stay set, the mask hides them
+            for tag in obj.__dict__.get("tags", ()):
+                bits[(tag_key(tag.id), obj.id)] = 0
+        elif isinstance(obj, Tag):
+            session.info.setdefault(PENDING_DROPS, set()).add(obj.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_tag_changes(session: Session):
+    bits = session.info.pop(PENDING_BITS, None)
+    drops: Set[int] = session.info.pop(PENDING_DROPS, set())
+    if not bits and not drops:
+        return
+    dropped = {tag_key(tag_id) for tag_id in drops}
+    try:
+        pipe = get_cache().pipeline(transaction=False)
+        for (key, image_id), value in (bits or {}).items():
+            if key not in dropped:
+                pipe.setbit(key, image_id, value)
+        if dropped:
+            pipe.delete(*dropped)
+        pipe.execute()
+    except RedisError as e:
+        logging.warning(f"Could not update the tag bitmaps: {e}")
+        # Bitmaps missing a change must not be read, the next search rebuilds them
+        try:
+            get_cache().delete(BITMAPS_READY_KEY)
+        except RedisError as e:
+            logging.warning(f"Could not mark the tag bitmaps for a rebuild: {e}")
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_tag_changes(session: Session):
+    session.info.pop(PENDING_BITS, None)
+    session.info.pop(PENDING_DROPS, None)
+
+
+async def rebuild_tag_bitmaps(db: Session) -> int:
+    """
+    The rebuild_tag_bitmaps function fills the bitmaps of all tags and of all images from the database,
+    for example after Redis was flushed. The bitmaps are written under temporary keys and renamed over
+    the live ones in one transaction, which also drops the bitmaps of tags without links, so searches
+    running meanwhile keep reading complete bitmaps and their result keys are left alone.
+
+    :param db: Session: Pass the database session to the function
+    :return: The number of image-tag links written
+    """
+    cache = get_cache()
+    build_prefix = f"{BUILD_PREFIX}{uuid.uuid4().hex}:"
+    built: Set[str] = set()
+    pipe = cache.pipeline(transaction=False)
+    commands = 0
+
+    def set_bit(key: str, image_id: int):
+        nonlocal commands
+        pipe.setbit(build_prefix + key, image_id, 1)
+        if key not in built:
+            built.add(key)
+            pipe.expire(build_prefix + key, BUILD_TTL)
+        commands += 1
+        if commands % REBUILD_CHUNK_SIZE == 0:
+            pipe.execute()
+
+    for image_id in db.scalars(select(Image.id)):
+        set_bit(ALL_IMAGES_KEY, image_id)
+    links = 0
+    for image_id, tag_id in db.execute(select(image_m2m_tags.c.image_id, image_m2m_tags.c.tag_id)):
+        set_bit(tag_key(tag_id), image_id)
+        links += 1
+    pipe.execute()
+
+    stale = [
+        key for key in cache.scan_iter(match=f"{TAG_BITMAP_PREFIX}*")
+        if is_bitmap_key(key) and key.decode() not in built
+    ]
+    with cache.pipeline() as swap:
+        for key in built:
+            swap.rename(build_prefix + key, key)
+            swap.persist(key)
+        if stale:
+            swap.delete(*stale)
+        swap.set(BITMAPS_READY_KEY, 1)
+        swap.execute()
+    return links
+
+
+async def get_tag_ids(names: Iterable[str], db: Session) -> Dict[str, int]:
+    """
+    The get_tag_ids function looks up the ids of tags by name.
+
+    :param names: Iterable[str]: The tag names
+    :param db: Session: Pass the database session to the function
+    :return: The ids of the tags that exist, by name
+    """
+    names = list(names)
+    if not names:
+        return {}
+    return dict(db.execute(select(Tag.name, Tag.id).where(Tag.name.in_(names))).all())
+
+
+async def get_tagged_image_ids(names: List[str], mode: str, db: Session) -> Optional[List[int]]:
+    """
+    The get_tagged_image_ids function combines the bitmaps of several tags in Redis with BITOP:
+    mode "all" returns the images having every tag, "any" the images having at least one of them and
+    "none" the images having none of them. The result is masked with the bitmap of existing images,
+    so the cost is a few bitwise operations over the bitmaps instead of a join per tag.
+    The ids are only read when there are at most settings.tag_bitmap_max_ids of them (counted with BITCOUNT);
+    for larger results, as "none" usually is, and when Redis fails, None tells the caller to filter
+    the tags in the database instead.
+
+    :param names: List[str]: The tag names
+    :param mode: str: One of "all", "any" and "none"
+    :param db: Session: Pass the database session to the function
+    :return: The sorted ids of the matching images, or None
+    """
+    tag_ids = await get_tag_ids(names, db)
+    if mode == "all" and len(tag_ids) < len(set(names)):
+        return []
+    if not tag_ids and mode != "none":
+        return []
+    keys = [tag_key(tag_id) for tag_id in tag_ids.values()]
+    cache = get_cache()
+    result = f"{TAG_BITMAP_PREFIX}result:{uuid.uuid4().hex}"
+    try:
+        if not cache.exists(BITMAPS_READY_KEY):
+            await rebuild_tag_bitmaps(db)
+        if not keys:
+            result = ALL_IMAGES_KEY
+        else:
+            pipe = cache.pipeline()
+            pipe.bitop("AND" if mode == "all" else "OR", result, *keys)
+            pipe.bitop("AND", result, result, ALL_IMAGES_KEY)
+            if mode == "none":
+                # XOR with the mask leaves the existing images without any of the tags,
+                # unlike NOT it also covers ids beyond the end of the tag bitmaps
+                pipe.bitop("XOR", result, result, ALL_IMAGES_KEY)
+            pipe.expire(result, BUILD_TTL)
+            pipe.execute()
+        if cache.bitcount(result) > settings.tag_bitmap_max_ids:
+            return None
+        return bitmap_ids(cache.getrange(result, 0, -1))
+    except RedisError as e:
+        logging.warning(f"Could not combine the tag bitmaps of {names}: {e}")
+        return None
+    finally:
+        if keys:
+            try:
+                cache.delete(result)
+            except RedisError:
+                pass
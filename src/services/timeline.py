@@ -0,0 +1,166 @@
+import logging
+from typing import List, Optional, Tuple
+
+from redis.exceptions import RedisError
+from sqlalchemy.orm import Session
+
+from src.conf.config import settings
+from src.database.cache import get_cache
+from src.models.image import Image
+from src.repository import follows as repository_follows
+from src.repository import images as repository_images
+from src.repository.image_documents import get_image_documents
+from src.schemas.image import ImageCardResponse
+from src.utils.pagination import encode_cursor
+
+# Fan-out writes are sent to Redis in pipelines of this many timelines
+FANOUT_CHUNK_SIZE = 1000
+# Owners whose images were not fanned out while they had too many followers; see fan_out_images
+SKIPPED_OWNERS_KEY = "timeline:skipped-owners"
+
+
+def timeline_key(user_id: int) -> str:
+    return f"timeline:{user_id}"
+
+
+async def fan_out_images(images: List[Image], db: Session) -> None:
+    """
+    The fan_out_images function pushes new image ids onto the home timelines of the followers of their owners.
+    Owners with more than settings.timeline_fanout_limit followers are skipped: their images are merged
+    into the timelines when they are read, and they are recorded in SKIPPED_OWNERS_KEY. Once such an owner
+    is back under the limit, their images are still merged on read until their next image drops the timelines
+    of their followers, which are then rebuilt with the skipped images.
+    Only timelines that are cached receive the ids (LPUSHX), missing ones are rebuilt from the database
+    on the next read anyway. Every timeline is trimmed to settings.timeline_size ids.
+
+    :param images: List[Image]: The newly created images, all of the same owner
+    :param db: Session: Pass the database session to the function
+    :return: None
+    """
+    if not images:
+        return
+    owner_id = images[0].user_id
+    try:
+        cache = get_cache()
+        if await repository_follows.get_followers_count(owner_id, db) > settings.timeline_fanout_limit:
+            cache.sadd(SKIPPED_OWNERS_KEY, owner_id)
+            return
+        follower_ids = await repository_follows.get_follower_ids(owner_id, db)
+        rebuild = cache.sismember(SKIPPED_OWNERS_KEY, owner_id)
+        image_ids = sorted(image.id for image in images)
+        for start in range(0, len(follower_ids), FANOUT_CHUNK_SIZE):
+            pipe = cache.pipeline(transaction=False)
+            for follower_id in follower_ids[start:start + FANOUT_CHUNK_SIZE]:
+                if rebuild:
+                    pipe.delete(timeline_key(follower_id))
+                else:
+                    pipe.lpushx(timeline_key(follower_id), *image_ids)
+                    pipe.ltrim(timeline_key(follower_id), 0, settings.timeline_size - 1)
+            pipe.execute()
+        if rebuild:
+            # Only once every timeline was dropped, the rebuilt ones hold the skipped images
+            cache.srem(SKIPPED_OWNERS_KEY, owner_id)
+    except RedisError as e:
+        logging.warning(f"Could not fan out images of user {owner_id}: {e}")
+
+
+def invalidate_timeline(user_id: int) -> None:
+    """
+    The invalidate_timeline function drops the cached home timeline of a user, for example after
+    they followed or unfollowed someone, so it is rebuilt on the next read.
+
+    :param user_id: int: The id of the timeline owner
+    :return: None
+    """
+    try:
+        get_cache().delete(timeline_key(user_id))
+    except RedisError as e:
+        logging.warning(f"Could not invalidate the timeline of user {user_id}: {e}")
+
+
+async def rebuild_timeline(user_id: int, fanned_out_ids: List[int], db: Session) -> List[int]:
+    """
+    The rebuild_timeline function fills the cached home timeline of a user with the newest images of the
+    followed users whose images are fanned out on write.
+
+    :param user_id: int: The id of the timeline owner
+    :param fanned_out_ids: List[int]: The followed users whose images are fanned out on write
+    :param db: Session: Pass the database session to the function
+    :return: The cached image ids, newest first
+    """
+    image_ids = await repository_images.get_recent_image_ids_by_users(fanned_out_ids, settings.timeline_size, db)
+    if image_ids:
+        get_cache().rpush(timeline_key(user_id), *image_ids)
+    return image_ids
+
+
+async def get_timeline(
+    user_id: int,
+    limit: int,
+    after_id: Optional[int],
+    db: Session,
+) -> Tuple[List[ImageCardResponse], Optional[str]]:
+    """
+    The get_timeline function returns a page of the home timeline of a user: the images of the users they follow,
+    newest first. Ids fanned out on write are read from the cached Redis list; the images of followed accounts
+    with too many followers to fan out, or whose skipped images are not fanned out yet (see fan_out_images),
+    are read with one query and merged in. The image cards of the page are read from their documents with
+    a single lookup. Timelines reach back settings.timeline_size images. When Redis is unavailable the page
+    is read from the database.
+
+    :param user_id: int: The id of the timeline owner
+    :param limit: int: Number of images per page
+    :param after_id: Optional[int]: Id of the last image of the previous page
+    :param db: Session: Pass the database session to the function
+    :return: The image cards of the page and the cursor of the next page (None on the last page)
+    """
+    followed = await repository_follows.get_followed_users(user_id, db)
+    try:
+        return await _read_timeline(user_id, followed, limit, after_id, db)
+    except RedisError as e:
+        logging.warning(f"Could not read the timeline of user {user_id}, reading the database: {e}")
+    followed_ids = [followed_id for followed_id, _ in followed]
+    image_ids = await repository_images.get_recent_image_ids_by_users(followed_ids, limit, db, after_id=after_id)
+    images = await get_image_documents(image_ids, db)
+    next_cursor = encode_cursor(image_ids[-1]) if len(image_ids) == limit else None
+    return images, next_cursor
+
+
+async def _read_timeline(
+    user_id: int,
+    followed: List[Tuple[int, int]],
+    limit: int,
+    after_id: Optional[int],
+    db: Session,
+) -> Tuple[List[ImageCardResponse], Optional[str]]:
+    cache = get_cache()
+    over_limit = {followed_id for followed_id, count in followed if count > settings.timeline_fanout_limit}
+    if len(over_limit) < len(followed):
+        # Owners back under the limit whose skipped images are not in the cached timelines yet
+        under_limit = [followed_id for followed_id, _ in followed if followed_id not in over_limit]
+        skipped = cache.smismember(SKIPPED_OWNERS_KEY, under_limit)
+        over_limit.update(followed_id for followed_id, flag in zip(under_limit, skipped) if flag)
+    fanned_out = [followed_id for followed_id, _ in followed if followed_id not in over_limit]
+    merged_on_read = sorted(over_limit)
+
+    cached = [int(image_id) for image_id in cache.lrange(timeline_key(user_id), 0, -1)]
+    if not cached and fanned_out:
+        cached = await rebuild_timeline(user_id, fanned_out, db)
+    merged = await repository_images.get_recent_image_ids_by_users(merged_on_read, limit, db, after_id=after_id)
+    if len(cached) >= settings.timeline_size:
+        # The timeline reaches back as far as its cached window, for every source
+        merged = [image_id for image_id in merged if image_id >= cached[-1]]
+
+    candidates = {image_id for image_id in cached if after_id is None or image_id < after_id}
+    candidates.update(merged)
+    image_ids = sorted(candidates, reverse=True)[:limit]
+
+    images = await get_image_documents(image_ids, db)
+    if len(images) < len(image_ids):
+        found = {image.id for image in images}
+        for image_id in image_ids:
+            if image_id not in found:
+                cache.lrem(timeline_key(user_id), 0, image_id)
+
+    next_cursor = encode_cursor(image_ids[-1]) if len(image_ids) == limit else None
+    return images, next_cursor
@@ -0,0 +1,231 @@
+import argparse
+import asyncio
+import logging
+import math
+import time
+from datetime import timedelta
+from typing import Dict, List, Optional
+
+from redis.exceptions import RedisError
+from sqlalchemy.orm import Session
+
+from src.conf.config import settings
+from src.database.cache import get_cache
+from src.database.db import database_now
+from src.repository import comments as repository_comments
+from src.repository import ratings as repository_ratings
+from src.repository.image_documents import get_image_documents
+from src.schemas.image import ImageCardResponse
+
+TRENDING_KEY = "trending:images"
+# Hash holding the time (unix seconds) the scores are stored relative to; decay_trending moves it forward
+TRENDING_META_KEY = "trending:meta"
+EPOCH_FIELD = "epoch"
+# Set once the ranking was filled from the database; a missing marker triggers a rebuild
+TRENDING_READY_KEY = "trending:images:ready"
+
+RATING_WEIGHT = 1.0
+COMMENT_WEIGHT = 2.0
+# Images whose decayed score dropped below this are removed by decay_trending
+MIN_SCORE = 0.01
+# Activity older than this many half-lives is below MIN_SCORE and skipped by rebuild_trending
+REBUILD_HALF_LIVES = 8
+
+
+def _decay_rate() -> float:
+    return math.log(2) / settings.trending_half_life
+
+
+def _get_epoch(cache) -> float:
+    pipe = cache.pipeline(transaction=False)
+    pipe.hsetnx(TRENDING_META_KEY, EPOCH_FIELD, time.time())
+    pipe.hget(TRENDING_META_KEY, EPOCH_FIELD)
+    return float(pipe.execute()[-1])
+
+
+def record_activity(image_id: int, weight: float) -> None:
+    """
+    The record_activity function adds an activity on an image to the trending ranking with a single ZINCRBY.
+    Instead of decaying every score as time passes, new activity is weighted up by exp(rate * (now - epoch)):
+    the ranking of the sorted set is the ranking by exponentially decayed score, and only the periodic
+    decay_trending pass rewrites the stored scores.
+    The ranking is a cache: when Redis is unavailable the activity is only logged.
+
+    :param image_id: int: The id of the image
+    :param weight: float: The weight of the activity at the time it happens
+    :return: None
+    """
+    try:
+        cache = get_cache()
+        increment = weight * math.exp(_decay_rate() * (time.time() - _get_epoch(cache)))
+        cache.zincrby(TRENDING_KEY, increment, image_id)
+    except RedisError as e:
+        logging.warning(f"Could not add activity of image {image_id} to the trending ranking: {e}")
+
+
+def record_rating(image_id: int) -> None:
+    """
+    The record_rating function adds a new rating of an image to the trending ranking.
+
+    :param image_id: int: The id of the rated image
+    :return: None
+    """
+    record_activity(image_id, RATING_WEIGHT)
+
+
+def record_comment(image_id: int) -> None:
+    """
+    The record_comment function adds a new comment on an image to the trending ranking.
+
+    :param image_id: int: The id of the commented image
+    :return: None
+    """
+    record_activity(image_id, COMMENT_WEIGHT)
+
+
+def retract_image(image_id: int) -> None:
+    """
+    The retract_image function removes a deleted image from the trending ranking.
+
+    :param image_id: int: The id of the deleted image
+    :return: None
+    """
+    try:
+        get_cache().zrem(TRENDING_KEY, image_id)
+    except RedisError as e:
+        logging.warning(f"Could not remove image {image_id} from the trending ranking: {e}")
+
+
+def decay_trending(now: Optional[float] = None) -> int:
+    """
+    The decay_trending function rescales the stored scores to the current time, so they stay decayed scores
+    and the weights of new activity stay small, then drops images below MIN_SCORE and trims the ranking
+    to settings.trending_size images. Rescaling all scores by the same factor keeps their order.
+    The rescale and the new epoch are written in one transaction; activity recorded with the old epoch
+    while the pass runs is overweighted by at most the decay of one interval.
+
+    :param now: Optional[float]: The new epoch in unix seconds, the current time by default
+    :return: The number of images left in the ranking
+    """
+    cache = get_cache()
+    now = time.time() if now is None else now
+    factor = math.exp(-_decay_rate() * (now - _get_epoch(cache)))
+    pipe = cache.pipeline()
+    pipe.zunionstore(TRENDING_KEY, {TRENDING_KEY: factor})
+    pipe.zremrangebyscore(TRENDING_KEY, "-inf", f"({MIN_SCORE}")
+    pipe.zremrangebyrank(TRENDING_KEY, 0, -settings.trending_size - 1)
+    pipe.hset(TRENDING_META_KEY, EPOCH_FIELD, now)
+    pipe.zcard(TRENDING_KEY)
+    return pipe.execute()[-1]
+
+
+async def score_trending(db: Session) -> Dict[int, float]:
+    """
+    The score_trending function computes the decayed activity scores of the images from the ratings and comments
+    of the last REBUILD_HALF_LIVES half-lives. Their ages are measured with the clock of the database,
+    which set their creation times.
+
+    :param db: Session: Pass the database session to the function
+    :return: The scores at the current time by image id, without the ones below MIN_SCORE
+    """
+    now = database_now(db)
+    since = now - timedelta(seconds=settings.trending_half_life * REBUILD_HALF_LIVES)
+    rate = _decay_rate()
+    scores = {}
+    for weight, times in (
+        (RATING_WEIGHT, await repository_ratings.get_rating_times(since, db)),
+        (COMMENT_WEIGHT, await repository_comments.get_comment_times(since, db)),
+    ):
+        for image_id, created_at in times:
+            age = max((now - created_at).total_seconds(), 0)
+            scores[image_id] = scores.get(image_id, 0) + weight * math.exp(-rate * age)
+    return {image_id: score for image_id, score in scores.items() if score >= MIN_SCORE}
+
+
+async def rank_trending(skip: int, limit: int, db: Session) -> List[int]:
+    """
+    The rank_trending function ranks the images by score_trending, for when the ranking cannot be read from Redis.
+
+    :param skip: int: Number of images skipped
+    :param limit: int: Number of images returned
+    :param db: Session: Pass the database session to the function
+    :return: The ids of the images, highest score first
+    """
+    scores = await score_trending(db)
+    ranking = sorted(scores, key=lambda image_id: (scores[image_id], image_id), reverse=True)
+    return ranking[:settings.trending_size][skip:skip + limit]
+
+
+async def rebuild_trending(db: Session) -> int:
+    """
+    The rebuild_trending function fills the trending ranking with score_trending, for example after Redis was flushed.
+    The scores hold at the current time, which becomes the epoch of the ranking.
+
+    :param db: Session: Pass the database session to the function
+    :return: The number of images in the rebuilt ranking
+    """
+    scores = await score_trending(db)
+    pipe = get_cache().pipeline()
+    pipe.delete(TRENDING_KEY)
+    if scores:
+        pipe.zadd(TRENDING_KEY, scores)
+        pipe.zremrangebyrank(TRENDING_KEY, 0, -settings.trending_size - 1)
+    pipe.hset(TRENDING_META_KEY, EPOCH_FIELD, time.time())
+    pipe.set(TRENDING_READY_KEY, 1)
+    pipe.execute()
+    return min(len(scores), settings.trending_size)
+
+
+async def get_trending(skip: int, limit: int, db: Session) -> List[ImageCardResponse]:
+    """
+    The get_trending function returns a page of the images with the highest decayed activity score.
+    The page is read from the sorted set and the image cards from their documents with a single lookup.
+    When Redis is unavailable the images are ranked from the database instead (see rank_trending).
+
+    :param skip: int: Number of images skipped
+    :param limit: int: Number of images per page
+    :param db: Session: Pass the database session to the function
+    :return: The image cards of the page
+    """
+    try:
+        cache = get_cache()
+        if not cache.exists(TRENDING_READY_KEY):
+            await rebuild_trending(db)
+        image_ids = [int(member) for member in cache.zrevrange(TRENDING_KEY, skip, skip + limit - 1)]
+    except RedisError as e:
+        logging.warning(f"Could not read the trending ranking, ranking the database: {e}")
+        return await get_image_documents(await rank_trending(skip, limit, db), db)
+    images = await get_image_documents(image_ids, db)
+    if len(images) < len(image_ids):
+        found = {image.id for image in images}
+        try:
+            cache.zrem(TRENDING_KEY, *[image_id for image_id in image_ids if image_id not in found])
+        except RedisError as e:
+            logging.warning(f"Could not remove deleted images from the trending ranking: {e}")
+    return images
+
+
+async def run_trending_decay(interval: int):
+    """
+    The run_trending_decay function runs decay_trending every interval seconds until it is stopped.
+
+    :param interval: int: Pause between two passes in seconds
+    :return: None
+    """
+    while True:
+        try:
+            size = decay_trending()
+            logging.info(f"Trending ranking rescaled, {size} images")
+        except RedisError as e:
+            logging.error(f"Trending decay failed: {e}")
+        await asyncio.sleep(interval)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Periodically rescale and trim the trending images ranking.")
+    parser.add_argument(
+        "--interval", type=int, default=settings.trending_decay_interval, help="Pause between two passes in seconds"
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_trending_decay(args.interval))
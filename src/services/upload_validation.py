@@ -0,0 +1,443 @@
+from tempfile import SpooledTemporaryFile
+from typing import AsyncIterator, List, Optional, Tuple, Union
+
+from fastapi import Depends, HTTPException, Query, Request, UploadFile, status
+from multipart.exceptions import MultipartParseError
+from multipart.multipart import MultipartParser, parse_options_header
+from sqlalchemy.orm import Session
+from starlette.datastructures import FormData, Headers, UploadFile as StarletteUploadFile
+
+from src.conf.config import settings
+from src.database.db import get_db
+from src.models.user import User
+from src.repository import images as repository_images
+from src.schemas.image import ImageCreate
+from src.services.auth_service import auth_service
+
+# Room for the multipart boundaries, part headers and the tags field around the file itself
+MULTIPART_OVERHEAD = 64 * 1024
+MAX_TAGS = 5
+SNIFF_SIZE = 12
+
+IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"BM", "image/bmp"),
+    (b"II*\x00", "image/tiff"),
+    (b"MM\x00*", "image/tiff"),
+)
+ISO_BRANDS = {b"heic": "image/heic", b"heix": "image/heic", b"mif1": "image/heif", b"avif": "image/avif"}
+
+
+class UploadRejected(Exception):
+    """Raised while the request body is streamed, to stop reading it."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    """
+    The sniff_image_type function recognizes an image format from the first bytes of a file.
+
+    :param head: bytes: At least the first 12 bytes of the file (fewer only if the file is shorter)
+    :return: The MIME type of the image or None if the bytes are not a supported image
+    """
+    for signature, mime_type in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return mime_type
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[4:8] == b"ftyp":
+        return ISO_BRANDS.get(head[8:12])
+    return None
+
+
+def count_tags(values: List[str]) -> int:
+    """
+    The count_tags function counts the distinct non-empty tags of comma separated tag values.
+
+    :param values: List[str]: The submitted tag values
+    :return: The number of tags
+    """
+    return len({tag.strip() for value in values for tag in value.split(",") if tag.strip()})
+
+
+async def check_storage_quota(user: User, size: int, db: Session, lock: bool = False) -> int:
+    """
+    The check_storage_quota function rejects an upload of size bytes that would not fit into the user's
+    storage quota and returns how many bytes the user may still upload.
+    Early checks of an announced size run without the lock; the check made right before an image is inserted
+    takes it and keeps it until the insert is committed, so concurrent uploads cannot exceed the quota together.
+
+    :param user: User: The uploading user
+    :param size: int: The size of the upload
+    :param db: Session: Pass the database session to the function
+    :param lock: bool: Lock the user's usage until the transaction ends
+    :return: The remaining quota in bytes
+    :raises HTTPException: 413 if the upload does not fit
+    """
+    usage = await repository_images.get_user_storage_usage(user, db, lock=lock)
+    remaining = settings.user_storage_quota - usage
+    if size > remaining:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail="Storage quota exceeded",
+        )
+    return remaining
+
+
+async def sniffed_stream(stream: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """
+    The sniffed_stream function passes a file body stream through after checking its first bytes are an image.
+    Nothing is yielded before the check, so a rejected stream writes nothing.
+
+    :param stream: AsyncIterator[bytes]: The body stream, starting at the first byte of the file
+    :return: The same stream
+    :raises HTTPException: 415 if the file is not a supported image
+    """
+    head = b""
+    async for piece in stream:
+        if head is None:
+            yield piece
+            continue
+        head += piece
+        if len(head) < SNIFF_SIZE:
+            continue
+        if sniff_image_type(head) is None:
+            raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="Unsupported file type")
+        yield head
+        head = None
+    if head:
+        if sniff_image_type(head) is None:
+            raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="Unsupported file type")
+        yield head
+
+
+class ImageUploadParser:
+    """
+    A multipart parser for image uploads that validates the body while it is streamed:
+    the tags are checked as soon as their field ends, the file type from the first bytes of every
+    file and the file size on every chunk, so invalid uploads stop being read right away.
+    It drives the python-multipart parser through its callbacks and spools the files like Starlette's form parser.
+    Batch uploads allow several files and do not count the tags fields together, every one belongs to its own file.
+    """
+
+    max_spool_size = 1024 * 1024
+
+    def __init__(
+        self,
+        headers,
+        stream: AsyncIterator[bytes],
+        max_file_size: int,
+        max_files: int = 1,
+        max_fields: int = MAX_TAGS + 1,
+        check_tags: bool = True,
+    ):
+        self.headers = headers
+        self.stream = stream
+        self.max_upload_size = max_file_size
+        self.max_files = max_files
+        self.max_fields = max_fields
+        self.check_tags = check_tags
+        self.items: List[Tuple[str, Union[str, StarletteUploadFile]]] = []
+        self._charset = "utf-8"
+        self._files = 0
+        self._fields = 0
+        self._file_size = 0
+        self._head = b""
+        self._pending_writes: List[Tuple[StarletteUploadFile, bytes]] = []
+        self._spooled: List[SpooledTemporaryFile] = []
+        self._header_field = b""
+        self._header_value = b""
+        self._part_headers: List[Tuple[bytes, bytes]] = []
+        self._part_name = ""
+        self._part_file: Optional[StarletteUploadFile] = None
+        self._part_data = b""
+
+    def _decode(self, value: bytes) -> str:
+        try:
+            return value.decode(self._charset)
+        except (UnicodeDecodeError, LookupError):
+            return value.decode("latin-1")
+
+    def on_part_begin(self) -> None:
+        self._part_headers = []
+        self._part_name = ""
+        self._part_file = None
+        self._part_data = b""
+
+    def on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def on_header_end(self) -> None:
+        self._part_headers.append((self._header_field.lower(), self._header_value))
+        self._header_field = b""
+        self._header_value = b""
+
+    def on_headers_finished(self) -> None:
+        disposition = dict(self._part_headers).get(b"content-disposition", b"")
+        _, options = parse_options_header(disposition)
+        if b"name" not in options:
+            raise UploadRejected(
+                status.HTTP_400_BAD_REQUEST, 'The Content-Disposition header field "name" must be provided.'
+            )
+        self._part_name = self._decode(options[b"name"])
+        if b"filename" in options:
+            self._files += 1
+            if self._files > self.max_files:
+                raise UploadRejected(
+                    status.HTTP_400_BAD_REQUEST, f"Too many files. Maximum number of files is {self.max_files}."
+                )
+            self._file_size = 0
+            self._head = b""
+            spooled = SpooledTemporaryFile(max_size=self.max_spool_size)
+            self._spooled.append(spooled)
+            self._part_file = StarletteUploadFile(
+                file=spooled,
+                size=0,
+                filename=self._decode(options[b"filename"]),
+                headers=Headers(raw=self._part_headers),
+            )
+        else:
+            self._fields += 1
+            if self._fields > self.max_fields:
+                raise UploadRejected(
+                    status.HTTP_400_BAD_REQUEST, f"Too many fields. Maximum number of fields is {self.max_fields}."
+                )
+
+    def on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._part_file is None:
+            self._part_data += data[start:end]
+            if len(self._part_data) > MULTIPART_OVERHEAD:
+                raise UploadRejected(status.HTTP_400_BAD_REQUEST, "Form field is too large")
+            return
+        self._file_size += end - start
+        if self._file_size > self.max_upload_size:
+            raise UploadRejected(status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, "File is too large")
+        if self._head is not None:
+            self._head += data[start:end]
+            if len(self._head) >= SNIFF_SIZE:
+                self._check_head()
+        self._pending_writes.append((self._part_file, data[start:end]))
+
+    def on_part_end(self) -> None:
+        if self._part_file is not None:
+            if self._head is not None:
+                self._check_head()
+            self.items.append((self._part_name, self._part_file))
+            return
+        self.items.append((self._part_name, self._decode(self._part_data)))
+        if self.check_tags and self._part_name == "tags":
+            tags = [value for name, value in self.items if name == "tags"]
+            if count_tags(tags) > MAX_TAGS:
+                raise UploadRejected(status.HTTP_400_BAD_REQUEST, "Maximum number of tags is 5")
+
+    def _check_head(self) -> None:
+        if sniff_image_type(self._head) is None:
+            raise UploadRejected(status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, "Unsupported file type")
+        self._head = None
+
+    async def _write_pending(self) -> None:
+        # UploadFile.write runs in a thread once the file rolled over to disk, so it is awaited outside the callbacks
+        for file, data in self._pending_writes:
+            await file.write(data)
+        self._pending_writes.clear()
+
+    async def parse(self) -> FormData:
+        """
+        The parse function reads the body and returns its fields and files, rewound to the start.
+
+        :return: The form data
+        :raises UploadRejected: If the body is malformed or fails a check
+        """
+        _, params = parse_options_header(self.headers["Content-Type"])
+        charset = params.get(b"charset", b"utf-8")
+        self._charset = charset.decode("latin-1") if isinstance(charset, bytes) else charset
+        if b"boundary" not in params:
+            raise UploadRejected(status.HTTP_400_BAD_REQUEST, "Missing boundary in multipart.")
+        parser = MultipartParser(
+            params[b"boundary"],
+            {
+                "on_part_begin": self.on_part_begin,
+                "on_part_data": self.on_part_data,
+                "on_part_end": self.on_part_end,
+                "on_header_field": self.on_header_field,
+                "on_header_value": self.on_header_value,
+                "on_header_end": self.on_header_end,
+                "on_headers_finished": self.on_headers_finished,
+            },
+        )
+        try:
+            async for chunk in self.stream:
+                parser.write(chunk)
+                await self._write_pending()
+            parser.finalize()
+            await self._write_pending()
+        except (UploadRejected, MultipartParseError) as e:
+            for spooled in self._spooled:
+                spooled.close()
+            if isinstance(e, MultipartParseError):
+                raise UploadRejected(status.HTTP_400_BAD_REQUEST, "Malformed multipart body")
+            raise
+        for _, value in self.items:
+            if isinstance(value, StarletteUploadFile):
+                await value.seek(0)
+        return FormData(self.items)
+
+
+def check_content_length(request: Request, ceiling: int) -> Optional[int]:
+    """
+    The check_content_length function rejects a request whose Content-Length exceeds the ceiling
+    before a single body byte is read.
+
+    :param request: Request: The upload request
+    :param ceiling: int: The largest accepted body in bytes
+    :return: The Content-Length or None if the request does not announce it
+    :raises HTTPException: 400 if the header is malformed, 413 if the body is too large
+    """
+    content_length = request.headers.get("content-length")
+    if content_length is None:
+        return None
+    if not content_length.isdigit():
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid Content-Length")
+    if int(content_length) > ceiling:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Maximum file size is {settings.upload_max_size} bytes",
+        )
+    return int(content_length)
+
+
+async def parse_upload(request: Request, parser: ImageUploadParser) -> FormData:
+    """
+    The parse_upload function streams a multipart upload through the validating parser.
+
+    :param request: Request: The upload request
+    :param parser: ImageUploadParser: The parser reading the request body
+    :return: The form data
+    :raises HTTPException: If the body is not multipart or fails a check of the parser
+    """
+    if not request.headers.get("content-type", "").startswith("multipart/form-data"):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Expected a multipart/form-data body")
+    try:
+        return await parser.parse()
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+
+class ValidatedImageUpload:
+    """The file and image details of an upload that passed validate_image_upload."""
+
+    def __init__(self, file: UploadFile, body: ImageCreate):
+        self.file = file
+        self.body = body
+
+
+async def validate_image_upload(
+    request: Request,
+    content: str = Query(...),
+    tags: List[str] = Query([]),
+    user: User = Depends(auth_service.get_current_user),
+    db: Session = Depends(get_db),
+) -> ValidatedImageUpload:
+    """
+    The validate_image_upload dependency reads a multipart image upload (a file field and optional tags fields)
+    after validating everything that can be known before the body arrives.
+    Requests whose Content-Length exceeds the upload ceiling or the user's remaining quota, and requests with
+    too many tags in the query, are rejected before a single body byte is read. The body is then streamed:
+    the tags field, the file type and the file size are checked as the bytes arrive.
+
+    :param request: Request: Stream the body from the request
+    :param content: str: The description of the image
+    :param tags: List[str]: Comma separated tags, may also be sent as form fields
+    :param user: User: The current user
+    :param db: Session: Pass the database session to the function
+    :return: The uploaded file and the image details
+    """
+    if count_tags(tags) > MAX_TAGS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Maximum number of tags is 5")
+
+    content_length = check_content_length(request, settings.upload_max_size + MULTIPART_OVERHEAD)
+    announced = max(content_length - MULTIPART_OVERHEAD, 0) if content_length else 0
+    remaining = await check_storage_quota(user, announced, db)
+
+    form = await parse_upload(
+        request, ImageUploadParser(request.headers, request.stream(), min(settings.upload_max_size, remaining))
+    )
+    file = form.get("file")
+    if not isinstance(file, StarletteUploadFile):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="File is required")
+    tag_values = tags + [value for value in form.getlist("tags") if isinstance(value, str)]
+    # Same shape as the form field: one comma separated string
+    body = ImageCreate(content=content, tags=[",".join(tag_values)])
+    return ValidatedImageUpload(file, body)
+
+
+def get_upload_file(upload: ValidatedImageUpload = Depends(validate_image_upload)) -> UploadFile:
+    """
+    The get_upload_file dependency returns the file of a validated image upload.
+
+    :param upload: ValidatedImageUpload: The validated upload
+    :return: The uploaded file
+    """
+    return upload.file
+
+
+def get_upload_body(upload: ValidatedImageUpload = Depends(validate_image_upload)) -> ImageCreate:
+    """
+    The get_upload_body dependency returns the image details of a validated image upload.
+
+    :param upload: ValidatedImageUpload: The validated upload
+    :return: The image details
+    """
+    return upload.body
+
+
+class ValidatedBatchUpload:
+    """The files, contents and tags of a batch upload that passed validate_batch_upload."""
+
+    def __init__(self, files: List[UploadFile], contents: List[str], tags: List[str]):
+        self.files = files
+        self.contents = contents
+        self.tags = tags
+
+
+async def validate_batch_upload(
+    request: Request,
+    user: User = Depends(auth_service.get_current_user),
+) -> ValidatedBatchUpload:
+    """
+    The validate_batch_upload dependency reads a multipart batch upload (files fields with their contents and
+    tags fields) through the same streaming checks as validate_image_upload: the Content-Length ceiling before
+    the body is read, then the type and size of every file and the number of files while the bytes arrive.
+    The tags of every file are checked by the route, which reports them per file.
+
+    :param request: Request: Stream the body from the request
+    :param user: User: The current user, authenticated before the body is read
+    :return: The uploaded files with their contents and tags
+    """
+    max_files = settings.batch_upload_max_files
+    check_content_length(request, max_files * (settings.upload_max_size + MULTIPART_OVERHEAD))
+    parser = ImageUploadParser(
+        request.headers,
+        request.stream(),
+        settings.upload_max_size,
+        max_files=max_files,
+        max_fields=2 * max_files,
+        check_tags=False,
+    )
+    form = await parse_upload(request, parser)
+    files = [value for value in form.getlist("files") if isinstance(value, StarletteUploadFile)]
+    if not files:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="File is required")
+    contents = [value for value in form.getlist("contents") if isinstance(value, str)]
+    tags = [value for value in form.getlist("tags") if isinstance(value, str)]
+    return ValidatedBatchUpload(files, contents, tags)
@@ -0,0 +1,216 @@
+import argparse
+import asyncio
+import logging
+import uuid
+from typing import Optional, Tuple
+
+from redis.exceptions import RedisError, WatchError
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from starlette.requests import Request
+from starlette.responses import Response
+
+from src.conf.config import settings
+from src.database.cache import get_cache
+from src.database.db import SessionLocal
+from src.models.image import Image
+from src.repository import views as repository_views
+
+VIEWS_PENDING_KEY = "views:pending"
+# The batch being written to the database; it survives a crashed flush and is retried first
+VIEWS_FLUSHING_KEY = "views:flushing"
+BATCH_FIELD = "batch"
+# Ids of the deleted images whose unique viewer estimates are dropped after the commit, kept in Session.info
+DELETED_IMAGES = "view_counter_deleted_images"
+
+
+def unique_viewers_key(image_id: int) -> str:
+    return f"views:unique:{image_id}"
+
+
+def record_view(image_id: int, viewer: str) -> None:
+    """
+    The record_view function counts a view of an image in Redis. The count is added to the database
+    later by flush_view_counts, so popular images never turn their rows into write hot spots.
+    With settings.view_unique_viewers the viewer is also added to a HyperLogLog of the image, which expires
+    settings.view_unique_ttl seconds after the last view and is deleted with the image.
+
+    :param image_id: int: The id of the viewed image
+    :param viewer: str: Identifies the viewer for the unique viewer estimate
+    :return: None
+    """
+    try:
+        pipe = get_cache().pipeline(transaction=False)
+        pipe.hincrby(VIEWS_PENDING_KEY, image_id, 1)
+        if settings.view_unique_viewers:
+            pipe.pfadd(unique_viewers_key(image_id), viewer)
+            pipe.expire(unique_viewers_key(image_id), settings.view_unique_ttl)
+        pipe.execute()
+    except RedisError as e:
+        logging.warning(f"Could not count a view of image {image_id}: {e}")
+
+
+class ViewTracker:
+    """Counts a view for every successful response of a route, see track_views."""
+
+    def __init__(self, param: str):
+        self.param = param
+
+    def wrap(self, handler):
+        async def tracked_handler(request: Request) -> Response:
+            response = await handler(request)
+            image_id = str(request.path_params.get(self.param, ""))
+            if response.status_code in (200, 304) and image_id.isdigit():
+                record_view(int(image_id), request.client.host if request.client else "unknown")
+            return response
+
+        return tracked_handler
+
+
+def track_views(param: str = "image_id"):
+    """
+    The track_views decorator counts a view of the image named by a path parameter whenever the route
+    answers with 200 or 304. It wraps the route handler outside of cache_response, so views answered
+    from the response cache are counted too.
+
+    :param param: str: The path parameter holding the image id
+    :return: The decorator
+    """
+    tracker = ViewTracker(param)
+
+    def decorator(endpoint):
+        endpoint.__dict__.setdefault("handler_wrappers", []).append(tracker)
+        return endpoint
+
+    return decorator
+
+
+def _release_batch(cache, batch_id: str) -> None:
+    # Only the batch this flusher applied is deleted, another flusher may already have started the next one
+    with cache.pipeline() as pipe:
+        try:
+            pipe.watch(VIEWS_FLUSHING_KEY)
+            if pipe.hget(VIEWS_FLUSHING_KEY, BATCH_FIELD) == batch_id.encode():
+                pipe.multi()
+                pipe.delete(VIEWS_FLUSHING_KEY)
+                pipe.execute()
+        except WatchError:
+            pass
+
+
+async def _flush_batch(db: Session) -> int:
+    cache = get_cache()
+    cache.hsetnx(VIEWS_FLUSHING_KEY, BATCH_FIELD, uuid.uuid4().hex)
+    entries = cache.hgetall(VIEWS_FLUSHING_KEY)
+    batch_id = entries.pop(BATCH_FIELD.encode(), None)
+    if batch_id is None:
+        # Another flusher finished the batch meanwhile
+        return 0
+    batch_id = batch_id.decode()
+    counts = {int(image_id): int(count) for image_id, count in entries.items()}
+    applied = await repository_views.apply_view_counts(batch_id, counts, db)
+    _release_batch(cache, batch_id)
+    return sum(counts.values()) if applied else 0
+
+
+async def flush_view_counts(db: Session) -> int:
+    """
+    The flush_view_counts function moves the counted views from Redis to the database.
+    The pending counters are renamed to a flushing hash in one atomic step (new views start a new hash),
+    the batch gets an id, and the counts are upserted together with that id. The hash is only deleted after
+    the commit, and only while it still holds that batch id: a flush that crashes leaves the batch in Redis,
+    the next flush retries it, and the recorded batch id keeps it from being counted twice.
+
+    :param db: Session: Pass the database session to the function
+    :return: The number of views added to the database
+    """
+    cache = get_cache()
+    flushed = 0
+    if cache.exists(VIEWS_FLUSHING_KEY):
+        flushed += await _flush_batch(db)
+    if cache.exists(VIEWS_PENDING_KEY) and cache.renamenx(VIEWS_PENDING_KEY, VIEWS_FLUSHING_KEY):
+        flushed += await _flush_batch(db)
+    return flushed
+
+
+async def get_views(image_id: int, db: Session) -> Tuple[int, Optional[int]]:
+    """
+    The get_views function returns the view count of an image, including the views not flushed yet,
+    and the estimated number of unique viewers. The flushing batch is only added while its id is not
+    recorded in the database, a committed batch is already in the stored count.
+
+    :param image_id: int: The id of the image
+    :param db: Session: Pass the database session to the function
+    :return: The views and the unique viewers (None when unique viewers are not tracked)
+    """
+    pending = flushing = 0
+    batch_id = unique = None
+    try:
+        # One transaction, so the hashes are read between two steps of a flush
+        pipe = get_cache().pipeline()
+        pipe.hget(VIEWS_PENDING_KEY, image_id)
+        pipe.hget(VIEWS_FLUSHING_KEY, image_id)
+        pipe.hget(VIEWS_FLUSHING_KEY, BATCH_FIELD)
+        pipe.pfcount(unique_viewers_key(image_id))
+        pending, flushing, batch_id, unique = pipe.execute()
+    except RedisError as e:
+        logging.warning(f"Could not read the pending views of image {image_id}: {e}")
+    # Read after Redis: a batch committed meanwhile is both in the stored count and recorded
+    views, applied = await repository_views.get_view_count(image_id, db, batch_id.decode() if batch_id else None)
+    views += int(pending or 0) + (0 if applied else int(flushing or 0))
+    return views, unique if settings.view_unique_viewers else None
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_deleted_images(session: Session, flush_context):
+    deleted = [obj.id for obj in session.deleted if isinstance(obj, Image)]
+    if deleted:
+        session.info.setdefault(DELETED_IMAGES, set()).update(deleted)
+
+
+@event.listens_for(Session, "after_commit")
+def _drop_unique_viewers(session: Session):
+    image_ids = session.info.pop(DELETED_IMAGES, None)
+    if not image_ids:
+        return
+    try:
+        get_cache().delete(*(unique_viewers_key(image_id) for image_id in image_ids))
+    except RedisError as e:
+        # The estimates still expire after settings.view_unique_ttl seconds
+        logging.warning(f"Could not delete the unique viewers of images {sorted(image_ids)}: {e}")
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_deleted_images(session: Session):
+    session.info.pop(DELETED_IMAGES, None)
+
+
+async def run_view_flusher(interval: int):
+    """
+    The run_view_flusher function flushes the view counters every interval seconds until it is stopped.
+
+    :param interval: int: Pause between two flushes in seconds
+    :return: None
+    """
+    while True:
+        session = SessionLocal()
+        try:
+            flushed = await flush_view_counts(session)
+            if flushed:
+                logging.info(f"Flushed {flushed} image views")
+        except Exception as e:
+            session.rollback()
+            logging.error(f"View flush failed: {e}")
+        finally:
+            session.close()
+        await asyncio.sleep(interval)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Flush the image view counters from Redis to the database.")
+    parser.add_argument(
+        "--interval", type=int, default=settings.view_flush_interval, help="Pause between two flushes in seconds"
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_view_flusher(args.interval))
@@ -0,0 +1,99 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Request, Response, status
+
+
+def make_etag(*parts) -> str:
+    """
+    The make_etag function builds a weak ETag from the values a representation depends on,
+    for example the id, version and updated_at of an entity or the version counter of a collection.
+
+    :param parts: The values the representation depends on
+    :return: The ETag header value
+    """
+    digest = hashlib.sha1(":".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+    return f'W/"{digest[:24]}"'
+
+
+def _as_utc(value: datetime) -> datetime:
+    # Timestamps are stored naive in UTC
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).replace(microsecond=0)
+
+
+def is_conditional(request: Request) -> bool:
+    """
+    The is_conditional function tells whether a request carries If-None-Match or If-Modified-Since.
+
+    :param request: Request: The incoming request
+    :return: True for a conditional request
+    """
+    return "if-none-match" in request.headers or "if-modified-since" in request.headers
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime] = None) -> bool:
+    """
+    The is_not_modified function evaluates If-None-Match and If-Modified-Since against the current
+    validators of a resource. As in RFC 7232, If-Modified-Since is ignored when If-None-Match is present
+    and ETags are compared weakly.
+
+    :param request: Request: The incoming request
+    :param etag: str: The current ETag
+    :param last_modified: Optional[datetime]: The time of the last change
+    :return: True if the client's copy is still current
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        candidates = {candidate.strip().removeprefix("W/") for candidate in if_none_match.split(",")}
+        return "*" in candidates or etag.removeprefix("W/") in candidates
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is None or last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    return _as_utc(last_modified) <= since
+
+
+def set_validators(response: Response, etag: str, last_modified: Optional[datetime] = None) -> None:
+    """
+    The set_validators function adds the ETag and Last-Modified headers to a response. Cache-Control: no-cache
+    lets clients keep the body but makes them revalidate it on every use.
+
+    :param response: Response: The outgoing response
+    :param etag: str: The current ETag
+    :param last_modified: Optional[datetime]: The time of the last change
+    :return: None
+    """
+    response.headers["ETag"] = etag
+    if last_modified is not None:
+        response.headers["Last-Modified"] = format_datetime(_as_utc(last_modified), usegmt=True)
+    response.headers["Cache-Control"] = "no-cache"
+
+
+def conditional_response(
+    request: Request, response: Response, etag: str, last_modified: Optional[datetime] = None
+) -> Optional[Response]:
+    """
+    The conditional_response function sets the validators on the response and answers a conditional
+    request whose copy is still current with 304 Not Modified.
+
+    :param request: Request: The incoming request
+    :param response: Response: The injected response the full body would be sent with
+    :param etag: str: The current ETag
+    :param last_modified: Optional[datetime]: The time of the last change
+    :return: A 304 response to return from the route, or None if the full body has to be sent
+    """
+    set_validators(response, etag, last_modified)
+    if not is_not_modified(request, etag, last_modified):
+        return None
+    not_modified = Response(status_code=status.HTTP_304_NOT_MODIFIED)
+    set_validators(not_modified, etag, last_modified)
+    return not_modified
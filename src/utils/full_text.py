@@ -0,0 +1,78 @@
+import re
+from typing import List, Optional, Tuple
+
+# A quoted phrase (optionally negated) or a bare word, as in PostgreSQL's websearch_to_tsquery
+TOKEN_PATTERN = re.compile(r'(-?)"([^"]*)"?|(\S+)')
+WORD_PATTERN = re.compile(r"\w+")
+# Stop words of PostgreSQL's english text search configuration (tsearch_data/english.stop). websearch_to_tsquery
+# drops them, so a term made of stop words only must not constrain the SQLite matches either.
+STOP_WORDS = frozenset(
+    "i me my myself we our ours ourselves you your yours yourself yourselves he him his himself she her hers "
+    "herself it its itself they them their theirs themselves what which who whom this that these those am is are "
+    "was were be been being have has had having do does did doing a an the and but if or because as until while "
+    "of at by for with about against between into through during before after above below to from up down in out "
+    "on off over under again further then once here there when where why how all any both each few more most "
+    "other some such no nor not only own same so than too very s t can will just don should now".split()
+)
+
+
+def _fts5_phrase(text: str) -> str:
+    return '"' + text.replace('"', '""') + '"'
+
+
+def is_stop_term(term: str) -> bool:
+    """
+    The is_stop_term function tells whether a search term would be dropped by PostgreSQL's websearch_to_tsquery
+    with the english configuration: it has no letter or digit, or all its words are stop words.
+
+    :param term: str: A word or a quoted phrase
+    :return: True if the term does not constrain the matches
+    """
+    return all(word in STOP_WORDS for word in WORD_PATTERN.findall(term.lower()))
+
+
+def parse_websearch(query: str) -> Tuple[List[List[str]], List[str]]:
+    """
+    The parse_websearch function splits a search in the syntax of PostgreSQL's websearch_to_tsquery
+    (words, "quoted phrases", OR between alternatives and -word to exclude) into its terms.
+    Terms without a letter or digit and terms made of stop words only are dropped, as PostgreSQL does.
+
+    :param query: str: The search typed by the user
+    :return: The groups of alternatives a match must contain one term of each, and the excluded terms
+    """
+    groups: List[List[str]] = []
+    excluded: List[str] = []
+    alternative = False
+    for match in TOKEN_PATTERN.finditer(query):
+        negated, phrase, word = match.groups()
+        if word is not None:
+            if word.lower() == "or":
+                alternative = bool(groups)
+                continue
+            negated = word.startswith("-")
+            phrase = word.lstrip("-")
+        if is_stop_term(phrase):
+            continue
+        if negated:
+            excluded.append(phrase)
+        elif alternative:
+            groups[-1].append(phrase)
+        else:
+            groups.append([phrase])
+        alternative = False
+    return groups, excluded
+
+
+def websearch_to_fts5(query: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    The websearch_to_fts5 function translates a search in the syntax of websearch_to_tsquery into SQLite FTS5 queries.
+    Every term is quoted, so FTS5 operators typed by users are searched as text. Alternatives joined by OR
+    bind tighter than the implicit AND, like in websearch_to_tsquery.
+
+    :param query: str: The search typed by the user
+    :return: The FTS5 query the matches must satisfy and the FTS5 query they must not match (either may be None)
+    """
+    groups, excluded = parse_websearch(query)
+    groups = [[_fts5_phrase(phrase) for phrase in group] for group in groups]
+    required = " AND ".join(group[0] if len(group) == 1 else f"({' OR '.join(group)})" for group in groups)
+    return required or None, " OR ".join(_fts5_phrase(phrase) for phrase in excluded) or None
@@ -0,0 +1,260 @@
+import asyncio
+import io
+import logging
+import math
+import multiprocessing
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple, Union
+
+from PIL import Image as PILImage, ImageOps
+
+from src.conf.config import settings
+
+BLURHASH_COMPONENTS = (4, 3)
+BLURHASH_SIZE = 32
+DOMINANT_COLOR_SIZE = 64
+DOMINANT_COLOR_PALETTE = 5
+# EXIF orientations 5 to 8 rotate the image by 90 degrees, so width and height are swapped when displayed
+EXIF_ORIENTATION_TAG = 0x0112
+ROTATED_ORIENTATIONS = {5, 6, 7, 8}
+
+BASE83_CHARACTERS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~"
+
+METADATA_FIELDS = ("width", "height", "orientation", "mime_type", "byte_size", "dominant_color", "blurhash")
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _encode_base83(value: int, length: int) -> str:
+    """
+    The _encode_base83 function encodes an integer with the base 83 alphabet of the blurhash format.
+
+    :param value: int: The value to encode
+    :param length: int: Number of characters of the result
+    :return: The encoded string
+    """
+    result = ""
+    for i in range(1, length + 1):
+        digit = (value // 83 ** (length - i)) % 83
+        result += BASE83_CHARACTERS[digit]
+    return result
+
+
+def _srgb_to_linear(value: int) -> float:
+    v = value / 255
+    return v / 12.92 if v <= 0.04045 else ((v + 0.055) / 1.055) ** 2.4
+
+
+def _linear_to_srgb(value: float) -> int:
+    v = max(0.0, min(1.0, value))
+    if v <= 0.0031308:
+        return int(v * 12.92 * 255 + 0.5)
+    return int((1.055 * v ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def _sign_pow(value: float, exponent: float) -> float:
+    return math.copysign(abs(value) ** exponent, value)
+
+
+def encode_blurhash(image: PILImage.Image, components: Tuple[int, int] = BLURHASH_COMPONENTS) -> str:
+    """
+    The encode_blurhash function encodes a small RGB image into a blurhash string (https://blurha.sh).
+    Clients decode it into a blurred placeholder of the image without downloading the image itself.
+    The image should already be downscaled, the encoder visits every pixel once per component.
+
+    :param image: PIL.Image: A small RGB image
+    :param components: Tuple[int, int]: Number of horizontal and vertical components (1 to 9)
+    :return: The blurhash string
+    """
+    components_x, components_y = components
+    width, height = image.size
+    pixels = [tuple(_srgb_to_linear(channel) for channel in pixel) for pixel in image.getdata()]
+    cos_x = [[math.cos(math.pi * i * x / width) for x in range(width)] for i in range(components_x)]
+    cos_y = [[math.cos(math.pi * j * y / height) for y in range(height)] for j in range(components_y)]
+
+    factors: List[Tuple[float, float, float]] = []
+    for j in range(components_y):
+        for i in range(components_x):
+            normalisation = 1 if i == 0 and j == 0 else 2
+            r = g = b = 0.0
+            for y in range(height):
+                row = y * width
+                basis_y = cos_y[j][y]
+                for x in range(width):
+                    basis = cos_x[i][x] * basis_y
+                    pixel = pixels[row + x]
+                    r += basis * pixel[0]
+                    g += basis * pixel[1]
+                    b += basis * pixel[2]
+            scale = normalisation / (width * height)
+            factors.append((r * scale, g * scale, b * scale))
+
+    dc, ac = factors[0], factors[1:]
+    blurhash = _encode_base83((components_x - 1) + (components_y - 1) * 9, 1)
+    if ac:
+        actual_max = max(abs(channel) for factor in ac for channel in factor)
+        quantised_max = max(0, min(82, int(math.floor(actual_max * 166 - 0.5))))
+        max_value = (quantised_max + 1) / 166
+        blurhash += _encode_base83(quantised_max, 1)
+    else:
+        max_value = 1
+        blurhash += _encode_base83(0, 1)
+
+    blurhash += _encode_base83(
+        (_linear_to_srgb(dc[0]) << 16) + (_linear_to_srgb(dc[1]) << 8) + _linear_to_srgb(dc[2]), 4
+    )
+
+    def quantise(value: float) -> int:
+        return max(0, min(18, int(math.floor(_sign_pow(value / max_value, 0.5) * 9 + 9.5))))
+
+    for r, g, b in ac:
+        blurhash += _encode_base83(quantise(r) * 19 * 19 + quantise(g) * 19 + quantise(b), 2)
+    return blurhash
+
+
+def dominant_color(image: PILImage.Image) -> str:
+    """
+    The dominant_color function returns the most common color of a small palette quantized from the image.
+
+    :param image: PIL.Image: A small RGB image
+    :return: The color as a #rrggbb string
+    """
+    quantized = image.quantize(colors=DOMINANT_COLOR_PALETTE)
+    _, index = max(quantized.getcolors())
+    palette = quantized.getpalette()
+    r, g, b = palette[index * 3:index * 3 + 3]
+    return f"#{r:02x}{g:02x}{b:02x}"
+
+
+def extract_image_metadata(source: Union[str, bytes]) -> dict:
+    """
+    The extract_image_metadata function reads the display dimensions, orientation, MIME type, byte size,
+    dominant color and blurhash of an encoded image.
+    Only the header is parsed for the dimensions; the pixels are decoded at a reduced scale where the
+    format allows it (JPEG), so the cost barely depends on the size of the original.
+
+    :param source: Union[str, bytes]: The path of a file holding the encoded image, or the encoded image
+    :return: A dict with the metadata columns of Image
+    :raises PIL.UnidentifiedImageError: If the data is not an image Pillow can read
+    """
+    if isinstance(source, bytes):
+        byte_size, source = len(source), io.BytesIO(source)
+    else:
+        byte_size = os.path.getsize(source)
+    with PILImage.open(source) as image:
+        width, height = image.size
+        exif_orientation = image.getexif().get(EXIF_ORIENTATION_TAG, 1)
+        if exif_orientation in ROTATED_ORIENTATIONS:
+            width, height = height, width
+        mime_type = image.get_format_mimetype()
+
+        image.draft("RGB", (DOMINANT_COLOR_SIZE, DOMINANT_COLOR_SIZE))
+        small = ImageOps.exif_transpose(image).convert("RGB")
+        small.thumbnail((DOMINANT_COLOR_SIZE, DOMINANT_COLOR_SIZE))
+        color = dominant_color(small)
+        small.thumbnail((BLURHASH_SIZE, BLURHASH_SIZE))
+        blurhash = encode_blurhash(small)
+
+    if width > height:
+        orientation = "landscape"
+    elif width < height:
+        orientation = "portrait"
+    else:
+        orientation = "square"
+    return {
+        "width": width,
+        "height": height,
+        "orientation": orientation,
+        "mime_type": mime_type,
+        "byte_size": byte_size,
+        "dominant_color": color,
+        "blurhash": blurhash,
+    }
+
+
+def get_stored_metadata(image) -> Optional[dict]:
+    """
+    The get_stored_metadata function returns the metadata already stored on an image row, so uploads of
+    identical bytes can reuse it instead of decoding the image again.
+
+    :param image: Image: A stored image
+    :return: A dict with the metadata columns of Image or None if it was never extracted
+    """
+    if image.width is None:
+        return None
+    return {field: getattr(image, field) for field in METADATA_FIELDS}
+
+
+def get_metadata_pool() -> ProcessPoolExecutor:
+    """
+    The get_metadata_pool function returns the process pool the metadata extraction runs in,
+    creating it on first use. Decoding and hashing pixels is CPU bound and would otherwise hold
+    the event loop or the GIL of the API process.
+
+    :return: The process pool
+    """
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=settings.metadata_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool
+
+
+def shutdown_metadata_pool():
+    """
+    The shutdown_metadata_pool function stops the worker processes of the metadata pool, if it was started.
+
+    :return: None
+    """
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=True)
+        _pool = None
+
+
+def spool_upload(file) -> str:
+    """
+    The spool_upload function copies a file-like object to a named temporary file in chunks and rewinds it,
+    so it can still be uploaded. Worker processes of the metadata pool open the copy by its path instead of
+    receiving the whole upload pickled through a pipe.
+
+    :param file: A binary file-like object
+    :return: The path of the copy, deleted by the caller
+    """
+    file.seek(0)
+    with tempfile.NamedTemporaryFile(prefix="snapshare-upload-", delete=False) as spooled:
+        try:
+            shutil.copyfileobj(file, spooled)
+        except BaseException:
+            spooled.close()
+            os.unlink(spooled.name)
+            raise
+    file.seek(0)
+    return spooled.name
+
+
+async def extract_upload_metadata(file) -> Optional[dict]:
+    """
+    The extract_upload_metadata function extracts the metadata of an uploaded file in the metadata pool,
+    from a temporary copy of the file (see spool_upload).
+    Files that cannot be read as an image are logged and get no metadata.
+
+    :param file: A binary file-like object holding the upload
+    :return: A dict with the metadata columns of Image or None
+    """
+    loop = asyncio.get_running_loop()
+    path = None
+    try:
+        path = await loop.run_in_executor(None, spool_upload, file)
+        return await loop.run_in_executor(get_metadata_pool(), extract_image_metadata, path)
+    except Exception as e:
+        logging.warning(f"Image metadata extraction failed: {e}")
+        return None
+    finally:
+        if path is not None:
+            os.unlink(path)
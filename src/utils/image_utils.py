@@ -1,8 +1,11 @@
+import hashlib
+
 import cloudinary
 import cloudinary.uploader
 
 from fastapi import UploadFile
 from src.conf.config import settings
+from src.models.image import Image
 from src.models.user import User
 from urllib.parse import urlparse, parse_qs
 
@@ -13,6 +16,11 @@ cloudinary.config(
     secure=True,
 )
 
+HASH_CHUNK_SIZE = 1024 * 1024
+ASSET_FOLDER = "SnapShare-API"
+# Content-addressed urls never change what they point at
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
 
 def extract_id_from_url(url):
     """
@@ -30,43 +38,137 @@ def extract_id_from_url(url):
     return query_params.get("v", [None])[0]
 
 
+def compute_file_hash(file) -> str:
+    """
+    The compute_file_hash function streams a file object in fixed-size chunks and returns its SHA-256 digest.
+    The file is rewound before and after hashing, so it can be uploaded right away without reopening it.
+
+    :param file: A binary file-like object (for example UploadFile.file)
+    :return: The hex encoded SHA-256 digest of the file content
+    """
+    sha256 = hashlib.sha256()
+    file.seek(0)
+    for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b""):
+        sha256.update(chunk)
+    file.seek(0)
+    return sha256.hexdigest()
+
+
 def get_cloudinary_public_id(user: User):
     """
-    The get_cloudinary_public_id function takes a user object and returns the public id of that user's profile picture.
-    The public id is used to identify the image in Cloudinary, which is where we store our images.
+    The get_cloudinary_public_id function takes a user object and returns the legacy public id of that user's uploads.
+    Every upload of a user used to share this public id, so each upload overwrote the previous asset.
+    It is only kept to address images uploaded before content-addressed ids were introduced.
 
     :param user: User: Specify the type of parameter that is being passed in
     :return: A string in the format of snapshare-api/usernameid
     """
-    return f"SnapShare-API/{user.username}{user.id}"
+    return f"{ASSET_FOLDER}/{user.username}{user.id}"
 
 
-def post_cloudinary_image(file: UploadFile, user: User):
+def get_content_public_id(content_hash: str):
     """
-    The post_cloudinary_image function takes a file and user as arguments.
-    It then calls the get_cloudinary_public_id function to generate a public id for the image.
-    The post_cloudinary_image function then uploads the image to Cloudinary using that public id, overwriting any existing images with that same public id.
-    Finally, it returns an url for accessing this uploaded image.
+    The get_content_public_id function returns the content-addressed public id of an asset.
+    The id is derived from the SHA-256 of the uploaded bytes, so an asset is never overwritten
+    and every url built from it (including transformed derivatives) is immutable and can be cached for a year.
 
-    :param file: UploadFile: Get the file from the request
-    :param user: User: Get the user's id
+    :param content_hash: str: SHA-256 of the uploaded bytes
+    :return: A string in the format of snapshare-api/content_hash
+    """
+    return f"{ASSET_FOLDER}/{content_hash}"
+
+
+def get_image_public_id(image: Image):
+    """
+    The get_image_public_id function returns the public id of the asset stored for an image.
+    Images without a content hash still point at the legacy per-user public id.
+
+    :param image: Image: The image whose asset id is needed
+    :return: The Cloudinary public id of the image
+    """
+    if image.content_hash:
+        return get_content_public_id(image.content_hash)
+    return get_cloudinary_public_id(image.user)
+
+
+def is_content_addressed_url(image_url: str, content_hash: str):
+    """
+    The is_content_addressed_url function checks whether an image url already points at the content-addressed asset.
+
+    :param image_url: str: The stored image url
+    :param content_hash: str: SHA-256 of the image bytes
+    :return: True if the url is built from the content-addressed public id
+    """
+    return bool(content_hash) and f"/{get_content_public_id(content_hash)}" in image_url
+
+
+def get_asset_url(content_hash: str):
+    """
+    The get_asset_url function returns the delivery url of the content-addressed asset of an image,
+    in the format returned by upload_cloudinary_asset (without the version, which the public id makes redundant).
+
+    :param content_hash: str: SHA-256 of the image bytes
     :return: A url to the image
     """
-    public_id = get_cloudinary_public_id(user)
-    r = cloudinary.uploader.upload(file.file, public_id=public_id, owerwrite=True)
+    return cloudinary.CloudinaryImage(get_content_public_id(content_hash)).build_url(
+        width=250, height=250, crop="fill"
+    )
+
+
+def upload_cloudinary_asset(file, content_hash: str):
+    """
+    The upload_cloudinary_asset function uploads a binary file object under its content-addressed public id.
+    Existing assets are never overwritten: uploading bytes that are already stored returns the stored asset.
+
+    :param file: A binary file-like object with the image bytes
+    :param content_hash: str: SHA-256 of the file content
+    :return: A url to the image
+    """
+    public_id = get_content_public_id(content_hash)
+    r = cloudinary.uploader.upload(
+        file, public_id=public_id, overwrite=False, unique_filename=False
+    )
     return cloudinary.CloudinaryImage(public_id).build_url(
         width=250, height=250, crop="fill", version=r.get("version")
     )
 
 
+def delete_cloudinary_asset(public_id: str):
+    """
+    The delete_cloudinary_asset function deletes an uploaded asset together with its derived transformations
+    and invalidates the cached copies on the CDN. Deleting an asset that is already gone succeeds,
+    so the call can be retried safely.
+
+    :param public_id: str: Public id of the asset
+    :return: None
+    :raises RuntimeError: If Cloudinary did not delete the asset
+    """
+    r = cloudinary.uploader.destroy(public_id, invalidate=True)
+    if r.get("result") not in ("ok", "not found"):
+        raise RuntimeError(f"Could not delete asset {public_id}: {r.get('result')}")
+
+
+def post_cloudinary_image(file: UploadFile, content_hash: str):
+    """
+    The post_cloudinary_image function takes an uploaded file and the SHA-256 of its content as arguments.
+    It uploads the image to Cloudinary under a content-addressed public id and returns an url for accessing it.
+
+    :param file: UploadFile: Get the file from the request
+    :param content_hash: str: SHA-256 of the file content
+    :return: A url to the image
+    """
+    return upload_cloudinary_asset(file.file, content_hash)
+
+
 def get_cloudinary_image_transformation(
-    user: User, transformation_type, width, height, effect, overlay_image_url
+    public_id: str, transformation_type, width, height, effect, overlay_image_url
 ):
     """
-    The get_cloudinary_image_transformation function takes in a user, transformation_type, width, height, effect and overlay_image_url.
+    The get_cloudinary_image_transformation function takes in a public id, transformation_type, width, height, effect and overlay_image_url.
     It then returns the cloudinary image url with the specified transformation applied to it.
+    The derived url is unique per source asset and transformation.
 
-    :param user: User: Get the user object
+    :param public_id: str: Public id of the source asset
     :param transformation_type: Determine which transformation function to use
     :param width: Specify the width of the image
     :param height: Set the height of the image
@@ -93,6 +195,6 @@ def get_cloudinary_image_transformation(
         )
     else:
         raise KeyError
-    return cloudinary.CloudinaryImage(get_cloudinary_public_id(user)).build_url(
+    return cloudinary.CloudinaryImage(public_id).build_url(
         transformation=transformation
     )
@@ -0,0 +1,123 @@
+import base64
+import binascii
+import json
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException, Response, status
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def _pack(payload: dict) -> str:
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _unpack(cursor: str) -> dict:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(payload, dict) or not isinstance(payload.get("id"), int):
+        raise ValueError("Invalid cursor")
+    return payload
+
+
+def encode_cursor(last_id: int) -> str:
+    """
+    The encode_cursor function packs the id of the last returned row into an opaque, url safe cursor.
+
+    :param last_id: int: The id of the last row of the page
+    :return: The cursor string
+    """
+    return _pack({"id": last_id})
+
+
+def decode_cursor(cursor: str) -> int:
+    """
+    The decode_cursor function unpacks a cursor created by encode_cursor.
+
+    :param cursor: str: The cursor received from the client
+    :return: The id of the last row of the previous page
+    :raises ValueError: If the cursor is malformed
+    """
+    return _unpack(cursor)["id"]
+
+
+def encode_score_cursor(score: float, last_id: int) -> str:
+    """
+    The encode_score_cursor function packs the position of the last returned entry of a list ordered by
+    a score (for example a Redis sorted set) into an opaque cursor. The id breaks ties between equal scores.
+
+    :param score: float: The score of the last entry of the page
+    :param last_id: int: The id of the last entry of the page
+    :return: The cursor string
+    """
+    return _pack({"id": last_id, "score": score})
+
+
+def decode_score_cursor(cursor: str) -> Tuple[float, int]:
+    """
+    The decode_score_cursor function unpacks a cursor created by encode_score_cursor.
+
+    :param cursor: str: The cursor received from the client
+    :return: The score and the id of the last entry of the previous page
+    :raises ValueError: If the cursor is malformed
+    """
+    payload = _unpack(cursor)
+    score = payload.get("score")
+    if not isinstance(score, (int, float)) or isinstance(score, bool):
+        raise ValueError("Invalid cursor")
+    return float(score), payload["id"]
+
+
+def parse_cursor(cursor: Optional[str]) -> Optional[int]:
+    """
+    The parse_cursor function decodes the optional cursor query parameter of a list endpoint.
+
+    :param cursor: Optional[str]: The cursor received from the client
+    :return: The id of the last row of the previous page, or None for the first page
+    :raises HTTPException: 400 if the cursor is malformed
+    """
+    if cursor is None:
+        return None
+    try:
+        return decode_cursor(cursor)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+def parse_score_cursor(cursor: Optional[str]) -> Optional[Tuple[float, int]]:
+    """
+    The parse_score_cursor function decodes the optional cursor query parameter of a score ordered list.
+
+    :param cursor: Optional[str]: The cursor received from the client
+    :return: The score and id of the last entry of the previous page, or None for the first page
+    :raises HTTPException: 400 if the cursor is malformed
+    """
+    if cursor is None:
+        return None
+    try:
+        return decode_score_cursor(cursor)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+def set_next_cursor(response: Response, items: List, limit: int) -> List:
+    """
+    The set_next_cursor function trims a page read with limit + 1 rows to limit rows and, when the extra row
+    shows that another page follows, adds the X-Next-Cursor header, so clients can request the following page
+    with ?cursor=... instead of a growing ?skip=... The last page never carries a cursor,
+    so clients do not follow it to an empty page.
+
+    :param response: Response: The outgoing response
+    :param items: List: The rows of the current page and at most one more, in keyset order
+    :param limit: int: The page size
+    :return: The rows of the page
+    """
+    if len(items) <= limit:
+        return items
+    items = items[:limit]
+    if items:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(items[-1].id)
+    return items
@@ -0,0 +1,212 @@
+import functools
+import inspect
+from contextvars import ContextVar
+from datetime import date, datetime, timezone
+from typing import Any, Dict, List, Optional, Type, get_args, get_origin
+
+import msgpack
+from fastapi import HTTPException, Request, Response, status
+from fastapi.routing import APIRoute
+from pydantic import BaseModel, TypeAdapter
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+MSGPACK_MEDIA_TYPES = (MSGPACK_MEDIA_TYPE, "application/x-msgpack")
+
+_list_adapters: Dict[Type[BaseModel], TypeAdapter] = {}
+# The Accept header of the request being handled by a MsgPackRoute
+_accept: ContextVar[str] = ContextVar("accept", default="")
+
+
+def list_adapter(schema: Type[BaseModel]) -> TypeAdapter:
+    """
+    The list_adapter function returns the TypeAdapter of List[schema], building it on first use.
+    Building an adapter compiles its validator and serializer, so it is done once per schema.
+
+    :param schema: Type[BaseModel]: The schema of the list items
+    :return: The TypeAdapter of a list of schema
+    """
+    adapter = _list_adapters.get(schema)
+    if adapter is None:
+        adapter = _list_adapters[schema] = TypeAdapter(List[schema])
+    return adapter
+
+
+def dump_list(schema: Type[BaseModel], items: List[Any]) -> bytes:
+    """
+    The dump_list function validates ORM objects (or dicts) against a schema and encodes them
+    straight to JSON bytes in pydantic-core, without building intermediate Python dicts.
+
+    :param schema: Type[BaseModel]: The schema of the list items
+    :param items: List[Any]: The objects to serialize
+    :return: The JSON document
+    """
+    adapter = list_adapter(schema)
+    return adapter.dump_json(adapter.validate_python(items, from_attributes=True))
+
+
+def _pack_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        # Naive datetimes are stored in UTC
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return msgpack.Timestamp.from_datetime(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__} to MessagePack")
+
+
+def pack_list(schema: Type[BaseModel], items: List[Any]) -> bytes:
+    """
+    The pack_list function validates ORM objects (or dicts) against a schema and encodes them as MessagePack.
+    Nested models become maps and datetimes use the MessagePack timestamp extension type, which clients
+    decode into native date objects.
+
+    :param schema: Type[BaseModel]: The schema of the list items
+    :param items: List[Any]: The objects to serialize
+    :return: The MessagePack document
+    """
+    adapter = list_adapter(schema)
+    return msgpack.packb(
+        adapter.dump_python(adapter.validate_python(items, from_attributes=True)), default=_pack_default
+    )
+
+
+def unpack(data: bytes) -> Any:
+    """
+    The unpack function decodes a MessagePack document; timestamps become timezone aware datetimes.
+
+    :param data: bytes: The MessagePack document
+    :return: The decoded value
+    :raises ValueError: If the data is not valid MessagePack
+    """
+    try:
+        return msgpack.unpackb(data, timestamp=3)
+    except (msgpack.ExtraData, msgpack.FormatError, msgpack.StackError, ValueError) as e:
+        raise ValueError("Invalid MessagePack body") from e
+
+
+def prefers_msgpack(accept: str) -> bool:
+    """
+    The prefers_msgpack function tells whether an Accept header asks for MessagePack rather than JSON.
+    Media types are weighed by their q parameter; on a tie the one listed first wins.
+
+    :param accept: str: The Accept header
+    :return: True if MessagePack should be sent
+    """
+    best_type, best_q = None, 0.0
+    for item in accept.split(","):
+        media_type, *params = [part.strip() for part in item.split(";")]
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if media_type.lower() in MSGPACK_MEDIA_TYPES + (JSON_MEDIA_TYPE, "*/*", "application/*") and q > best_q:
+            best_type, best_q = media_type.lower(), q
+    return best_type in MSGPACK_MEDIA_TYPES
+
+
+def list_item_schema(response_model: Any) -> Optional[Type[BaseModel]]:
+    """
+    The list_item_schema function returns the item schema of a List[Schema] response model.
+
+    :param response_model: Any: The response model of a route
+    :return: The item schema or None if the response model is not a list of a pydantic model
+    """
+    if get_origin(response_model) not in (list, List):
+        return None
+    args = get_args(response_model)
+    if len(args) == 1 and inspect.isclass(args[0]) and issubclass(args[0], BaseModel):
+        return args[0]
+    return None
+
+
+def _serialize_list(endpoint, schema: Type[BaseModel], status_code: Optional[int]):
+    @functools.wraps(endpoint)
+    async def serialize(**kwargs):
+        items = await endpoint(**kwargs)
+        if isinstance(items, Response):
+            # A 304 answers for whichever encoding the client negotiated
+            items.headers["Vary"] = "Accept"
+            return items
+        if prefers_msgpack(_accept.get()):
+            response = Response(pack_list(schema, items), status_code=status_code or 200, media_type=MSGPACK_MEDIA_TYPE)
+        else:
+            response = Response(dump_list(schema, items), status_code=status_code or 200, media_type=JSON_MEDIA_TYPE)
+        response.headers["Vary"] = "Accept"
+        # Headers and status code set on the injected Response parameter, as FastAPI would merge them
+        for value in kwargs.values():
+            if isinstance(value, Response):
+                response.headers.raw.extend(value.headers.raw)
+                if value.status_code:
+                    response.status_code = value.status_code
+        return response
+
+    return serialize
+
+
+class MsgPackRequest(Request):
+    """A request whose MessagePack body is handed to FastAPI as if it had been sent as JSON."""
+
+    async def json(self) -> Any:
+        if not hasattr(self, "_json"):
+            self._json = unpack(await self.body())
+        return self._json
+
+
+class MsgPackRoute(APIRoute):
+    """
+    A route class that accepts request bodies sent as Content-Type: application/msgpack
+    and remembers the Accept header of the request for the response encoding.
+    """
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def negotiate(request: Request) -> Response:
+            if request.headers.get("content-type", "").split(";")[0].strip().lower() in MSGPACK_MEDIA_TYPES:
+                scope = dict(request.scope)
+                scope["headers"] = [
+                    (name, value) for name, value in request.scope["headers"] if name != b"content-type"
+                ] + [(b"content-type", JSON_MEDIA_TYPE.encode())]
+                request = MsgPackRequest(scope, request.receive)
+                try:
+                    await request.json()
+                except ValueError as e:
+                    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+            token = _accept.set(request.headers.get("accept", ""))
+            try:
+                return await handler(request)
+            finally:
+                _accept.reset(token)
+
+        # Handler wrappers attached by route decorators such as cache_response (src/services/response_cache.py)
+        # run before the dependencies, the one attached last is outermost
+        route_handler = negotiate
+        for wrapper in getattr(self.endpoint, "handler_wrappers", ()):
+            route_handler = wrapper.wrap(route_handler)
+        return route_handler
+
+
+class SerializedListRoute(MsgPackRoute):
+    """
+    A route class for routers with list endpoints. Routes declared with response_model=List[Schema]
+    serialize their result with the precompiled TypeAdapter of the schema straight to JSON bytes,
+    instead of validating into models, dumping them to dicts and encoding those again.
+    Clients sending Accept: application/msgpack get the list as MessagePack.
+    The endpoint functions themselves are unchanged and still return the list.
+    """
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        schema = list_item_schema(kwargs.get("response_model"))
+        if schema is not None and inspect.iscoroutinefunction(endpoint):
+            list_adapter(schema)
+            endpoint = _serialize_list(endpoint, schema, kwargs.get("status_code"))
+            responses = dict(kwargs.get("responses") or {})
+            status_code = kwargs.get("status_code") or 200
+            responses[status_code] = {**responses.get(status_code, {}), "content": {MSGPACK_MEDIA_TYPE: {}}}
+            kwargs["responses"] = responses
+        super().__init__(path, endpoint, **kwargs)
@@ -0,0 +1,66 @@
+import re
+from typing import List, Optional
+
+# Words are runs of letters and digits, like the words pg_trgm extracts
+WORD_PATTERN = re.compile(r"[^\W_]+")
+
+
+def trigrams(text: str) -> List[str]:
+    """
+    The trigrams function returns the trigrams of a text the way pg_trgm builds them: every lowercased word
+    is padded with two spaces in front and one behind and cut into overlapping three letter pieces.
+
+    :param text: str: The text
+    :return: The trigrams in the order of the text, repeated ones included
+    """
+    result = []
+    for word in WORD_PATTERN.findall(text.lower()):
+        padded = f"  {word} "
+        result.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+def similarity(a: Optional[str], b: Optional[str]) -> Optional[float]:
+    """
+    The similarity function is pg_trgm's similarity(): the share of trigrams the two texts have in common.
+
+    :param a: Optional[str]: The first text
+    :param b: Optional[str]: The second text
+    :return: A number from 0 (no trigram in common) to 1 (same trigrams), None if a text is None
+    """
+    if a is None or b is None:
+        return None
+    first, second = set(trigrams(a)), set(trigrams(b))
+    if not first or not second:
+        return 0.0
+    common = len(first & second)
+    return common / (len(first) + len(second) - common)
+
+
+def word_similarity(a: Optional[str], b: Optional[str]) -> Optional[float]:
+    """
+    The word_similarity function is pg_trgm's word_similarity(): the greatest similarity between the trigrams
+    of a and any continuous extent of the trigrams of b. It is high when a is close to a word or a word
+    prefix of b, so it suits misspelled and partial search terms.
+
+    :param a: Optional[str]: The search term
+    :param b: Optional[str]: The searched text
+    :return: A number from 0 to 1, None if a text is None
+    """
+    if a is None or b is None:
+        return None
+    wanted = set(trigrams(a))
+    ordered = trigrams(b)
+    best = 0.0
+    for start in range(len(ordered)):
+        # The best extents start and end with a wanted trigram
+        if ordered[start] not in wanted:
+            continue
+        extent, common = set(), 0
+        for trigram in ordered[start:]:
+            if trigram not in extent:
+                extent.add(trigram)
+                if trigram in wanted:
+                    common += 1
+                    best = max(best, common / (len(wanted) + len(extent) - common))
+    return best
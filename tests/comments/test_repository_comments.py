@@ -30,12 +30,12 @@ class TestUpdateComment(unittest.IsolatedAsyncioTestCase):
     async def test_get_comments(self):
         image_id = 2
         expected_comments = [MagicMock(), MagicMock()]
-        self.db.query().filter().limit().all.return_value = expected_comments
+        self.db.query().filter().order_by().limit().all.return_value = expected_comments
 
         result = await get_comments(image_id, self.db)
 
         self.assertEqual(result, expected_comments)
-        self.db.query().filter().limit().all.assert_called_once_with()
+        self.db.query().filter().order_by().limit().all.assert_called_once_with()
 
     # Додайте цей метод в тестовий клас TestUpdateComment
     async def test_create_comment(self):
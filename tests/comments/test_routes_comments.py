@@ -1,10 +1,12 @@
 import unittest
+from datetime import datetime
 from unittest.mock import patch, AsyncMock, MagicMock, ANY
 from fastapi.testclient import TestClient
-from fastapi import HTTPException, status
+from fastapi import HTTPException, Response, status
 
 from src.models.user import User
 from src.schemas.comment import CommentRequest
+from src.utils.pagination import NEXT_CURSOR_HEADER, encode_cursor
 from main import app
 import unittest
 from unittest.mock import MagicMock
@@ -23,12 +25,12 @@ class TestCommentsRoutes(unittest.IsolatedAsyncioTestCase):
     async def test_read_comment(self, mock_get_comment):
         # Arrange
         mock_db = MagicMock()
-        mock_comment = MagicMock()
+        mock_comment = MagicMock(id=1, version=1, updated_at=datetime(2023, 10, 1, 12, 0))
         mock_get_comment.return_value = mock_comment
         comment_id = 1
 
         # Act
-        result = await read_comment(comment_id, mock_db)
+        result = await read_comment(MagicMock(headers={}), MagicMock(headers={}), comment_id, mock_db)
 
         # Assert
         self.assertEqual(result, mock_comment)
@@ -46,12 +48,37 @@ class TestCommentsRoutes(unittest.IsolatedAsyncioTestCase):
         image_id = 1
 
         # Act
-        result = await read_comments(image_id, mock_db)
+        result = await read_comments(MagicMock(headers={}), image_id, 100, None, mock_db)
 
         # Assert
         self.assertEqual(result, mock_comments)
         mock_get_image.assert_called_with(image_id, mock_db)
-        mock_get_comments.assert_called_with(image_id, mock_db)
+        mock_get_comments.assert_called_with(image_id, mock_db, limit=101, after_id=None)
+
+    @patch('src.repository.comments.get_comments')
+    @patch('src.repository.images.get_image')
+    async def test_read_comments_pages_to_the_end(self, mock_get_image, mock_get_comments):
+        comments = [MagicMock(id=comment_id) for comment_id in range(1, 5)]
+        mock_get_comments.side_effect = lambda image_id, db, limit, after_id: [
+            comment for comment in comments if after_id is None or comment.id > after_id
+        ][:limit]
+
+        seen, cursor = [], None
+        while True:
+            response = Response()
+            page = await read_comments(response, 1, 2, cursor, MagicMock())
+            seen += page
+            cursor = response.headers.get(NEXT_CURSOR_HEADER)
+            if cursor is None:
+                break
+
+        # Four comments are two full pages, and the second one carries no cursor
+        self.assertEqual(seen, comments)
+        self.assertEqual(mock_get_comments.call_count, 2)
+
+        mock_get_comments.side_effect = None
+        mock_get_comments.return_value = []
+        self.assertEqual(await read_comments(Response(), 1, 2, encode_cursor(4), MagicMock()), [])
     
     
     @patch('src.repository.comments.create_comment')
@@ -0,0 +1,15 @@
+import os
+
+import fakeredis
+import pytest
+
+# Image relationships raise instead of lazy loading, so every repository call has to declare its loads
+os.environ.setdefault("RELATIONSHIP_LAZY", "raise")
+
+
+@pytest.fixture(autouse=True)
+def cache(monkeypatch):
+    # Feeds, timelines and counters live in the Redis cache; every test gets an empty in-memory one
+    fake = fakeredis.FakeStrictRedis()
+    monkeypatch.setattr("src.database.cache.redis_cache", fake)
+    return fake
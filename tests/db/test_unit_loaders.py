@@ -0,0 +1,71 @@
+import unittest
+
+from sqlalchemy import create_engine, event, inspect
+from sqlalchemy.orm import sessionmaker
+
+from src.database.loaders import loader_options, relationship_names
+from src.models.base import Base
+from src.models.image import Image, Tag
+from src.models.rating import Rating
+from src.models.user import User
+from src.repository.images import get_images
+from src.repository.search_filter import get_images_by_user
+from src.schemas.image import ImageResponse
+from src.schemas.user import UserSearchResponse
+
+
+class TestLoaderOptions(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.engine = create_engine("sqlite:///:memory:")
+        Base.metadata.create_all(bind=self.engine)
+        self.db = sessionmaker(bind=self.engine)()
+        self.user = User(
+            username="test_user",
+            email="test@example.com",
+            password="test_password",
+            avatar="test_avatar",
+            role="admin",
+        )
+        tags = [Tag(name=f"tag{i}") for i in range(3)]
+        self.db.add(self.user)
+        self.db.commit()
+        for i in range(20):
+            image = Image(image_url=f"http://stored.com/{i}.jpg", content="content", user_id=self.user.id)
+            image.tags = tags[: i % 3 + 1]
+            self.db.add(image)
+        self.db.commit()
+        self.db.add(Rating(user_id=self.user.id, image_id=1, rating_score=4))
+        self.db.commit()
+        user_id = self.user.id
+        self.db.expunge_all()
+        self.user = self.db.get(User, user_id)
+
+        self.statements = []
+        event.listen(self.engine, "before_cursor_execute", self._count)
+
+    def tearDown(self):
+        event.remove(self.engine, "before_cursor_execute", self._count)
+        self.db.close()
+
+    def _count(self, conn, cursor, statement, *args):
+        self.statements.append(statement)
+
+    def test_relationship_names(self):
+        self.assertEqual(relationship_names(inspect(Image), ImageResponse), ["tags"])
+        self.assertEqual(relationship_names(inspect(Image), UserSearchResponse), ["user"])
+        self.assertEqual(loader_options(Image, None), [])
+
+    async def test_page_serializes_in_fixed_queries(self):
+        images = await get_images(0, 100, self.user, self.db, schema=ImageResponse)
+        self.statements.clear()
+
+        page = [ImageResponse.model_validate(image, from_attributes=True) for image in images]
+
+        self.assertEqual(len(page), 20)
+        self.assertEqual(self.statements, [])
+
+    async def test_images_by_user_loads_owner(self):
+        result = await get_images_by_user(self.db, self.user.id, min_rating=0, max_rating=5)
+
+        self.assertEqual(len(result), 20)
+        self.assertEqual({item.username for item in result}, {"test_user"})
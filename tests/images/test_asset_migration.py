@@ -0,0 +1,70 @@
+import hashlib
+import unittest
+from unittest.mock import patch
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.models.base import Base
+from src.models.image import Image
+from src.models.user import User
+from src.services.asset_migration import migrate_image_urls
+
+
+class TestMigrateImageUrls(unittest.TestCase):
+    def setUp(self):
+        engine = create_engine("sqlite:///:memory:")
+        Base.metadata.create_all(bind=engine)
+        self.db = sessionmaker(bind=engine)()
+        user = User(
+            username="test_user",
+            email="test@example.com",
+            password="test_password",
+            avatar="test_avatar",
+        )
+        self.db.add(user)
+        self.db.commit()
+        self.migrated_hash = hashlib.sha256(b"migrated").hexdigest()
+        self.db.add_all(
+            [
+                Image(image_url="http://legacy.com/1", content="one", user_id=user.id),
+                Image(image_url="http://legacy.com/2", content="two", user_id=user.id),
+                Image(
+                    image_url=f"http://cdn.com/SnapShare-API/{self.migrated_hash}",
+                    content="three",
+                    content_hash=self.migrated_hash,
+                    user_id=user.id,
+                ),
+            ]
+        )
+        self.db.commit()
+
+    def tearDown(self):
+        self.db.close()
+
+    @patch("src.services.asset_migration.upload_cloudinary_asset")
+    def test_migrate_image_urls(self, mock_upload):
+        mock_upload.side_effect = lambda file, content_hash: (
+            f"http://cdn.com/SnapShare-API/{content_hash}"
+        )
+        fetched = []
+
+        def fetch(url):
+            fetched.append(url)
+            return b"same bytes"
+
+        migrated = migrate_image_urls(self.db, batch_size=2, fetch=fetch)
+
+        content_hash = hashlib.sha256(b"same bytes").hexdigest()
+        self.assertEqual(migrated, 2)
+        self.assertEqual(fetched, ["http://legacy.com/1", "http://legacy.com/2"])
+        # Identical bytes are uploaded once
+        mock_upload.assert_called_once()
+        images = self.db.query(Image).order_by(Image.id).all()
+        self.assertEqual(images[0].content_hash, content_hash)
+        self.assertEqual(images[1].image_url, f"http://cdn.com/SnapShare-API/{content_hash}")
+        self.assertEqual(images[2].content_hash, self.migrated_hash)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -69,8 +69,7 @@ def create_random_images_for_user(db, user, tags, min_images=3, max_images=3):
             content="Random content" + random_string(4),
             user_id=user.id,
         )
-        # Assign one or two random tags
-        for _ in range(random.randint(1, 2)):
-            image.tags.append(random.choice(tags))
+        # Assign one or two distinct random tags
+        image.tags.extend(random.sample(tags, random.randint(1, 2)))
         db.add(image)
     db.commit()
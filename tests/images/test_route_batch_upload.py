@@ -0,0 +1,142 @@
+from unittest.mock import patch
+
+PNG = b"\x89PNG\r\n\x1a\n"
+
+
+def login(client, user):
+    login_response = client.post(
+        "/api/auth/login",
+        data={"username": user["email"], "password": user["password"]},
+    )
+    assert login_response.status_code == 200, login_response.text
+    return login_response.json()["access_token"]
+
+
+@patch("src.routes.images.post_cloudinary_image")
+def test_create_images_batch(mock_post_image, client, user, mock_redis):
+    mock_post_image.side_effect = lambda file, content_hash: (
+        f"https://example.com/SnapShare-API/{content_hash}"
+    )
+    user_token = login(client, user)
+
+    response = client.post(
+        "/api/images/batch",
+        files=[
+            ("files", ("first.jpg", PNG + b"first bytes", "image/jpeg")),
+            ("files", ("second.jpg", PNG + b"second bytes", "image/jpeg")),
+            ("files", ("copy.jpg", PNG + b"first bytes", "image/jpeg")),
+            ("files", ("tags.jpg", PNG + b"tags bytes", "image/jpeg")),
+        ],
+        data={
+            "contents": ["first", "second", "copy", "too many tags"],
+            "tags": ["batchtag,newbatchtag", "batchtag", "", "a,b,c,d,e,f"],
+        },
+        headers={"Authorization": f"Bearer {user_token}"},
+    )
+
+    assert response.status_code == 200, response.text
+    results = response.json()["results"]
+    assert [result["success"] for result in results] == [True, True, True, False]
+    assert results[3]["error"] == "Maximum number of tags is 5"
+    # Identical bytes inside one batch are uploaded once
+    assert mock_post_image.call_count == 2
+    assert results[0]["image"]["image_url"] == results[2]["image"]["image_url"]
+    assert results[0]["image"]["byte_size"] == len(PNG + b"first bytes")
+    assert {tag["name"] for tag in results[0]["image"]["tags"]} == {
+        "batchtag",
+        "newbatchtag",
+    }
+    assert [tag["name"] for tag in results[1]["image"]["tags"]] == ["batchtag"]
+
+
+@patch("src.routes.images.post_cloudinary_image")
+def test_create_images_batch_upload_error(mock_post_image, client, user, mock_redis):
+    mock_post_image.side_effect = Exception("Upload failed")
+    user_token = login(client, user)
+
+    response = client.post(
+        "/api/images/batch",
+        files=[("files", ("broken.jpg", PNG + b"broken bytes", "image/jpeg"))],
+        data={"contents": ["broken"]},
+        headers={"Authorization": f"Bearer {user_token}"},
+    )
+
+    assert response.status_code == 200, response.text
+    result = response.json()["results"][0]
+    assert result["success"] is False
+    assert result["error"] == "Upload failed"
+
+
+def test_create_images_batch_mismatched_contents(client, user, mock_redis):
+    user_token = login(client, user)
+
+    response = client.post(
+        "/api/images/batch",
+        files=[("files", ("one.jpg", PNG + b"one", "image/jpeg"))],
+        data={"contents": ["one", "two"]},
+        headers={"Authorization": f"Bearer {user_token}"},
+    )
+
+    assert response.status_code == 400, response.text
+
+
+@patch("src.routes.images.post_cloudinary_image")
+@patch("src.repository.images.get_user_storage_usage")
+def test_create_images_batch_over_quota(mock_usage, mock_post_image, client, user, mock_redis, monkeypatch):
+    mock_post_image.side_effect = lambda file, content_hash: (
+        f"https://example.com/SnapShare-API/{content_hash}"
+    )
+    mock_usage.return_value = 0
+    monkeypatch.setattr("src.conf.config.settings.user_storage_quota", 20)
+    user_token = login(client, user)
+
+    response = client.post(
+        "/api/images/batch",
+        files=[
+            ("files", ("fits.jpg", PNG + b"quota fits", "image/jpeg")),
+            ("files", ("over.jpg", PNG + b"quota exceeded", "image/jpeg")),
+        ],
+        data={"contents": ["fits", "over"]},
+        headers={"Authorization": f"Bearer {user_token}"},
+    )
+
+    assert response.status_code == 200, response.text
+    results = response.json()["results"]
+    assert [result["success"] for result in results] == [True, False]
+    assert results[1]["error"] == "Storage quota exceeded"
+    mock_post_image.assert_called_once()
+
+
+@patch("src.routes.images.post_cloudinary_image")
+def test_create_images_batch_rejects_invalid_files(mock_post_image, client, user, mock_redis, monkeypatch):
+    user_token = login(client, user)
+
+    response = client.post(
+        "/api/images/batch",
+        files=[
+            ("files", ("image.png", PNG + b"image", "image/png")),
+            ("files", ("script.png", b"#!/bin/sh\necho hi\n", "image/png")),
+        ],
+        data={"contents": ["image", "script"]},
+        headers={"Authorization": f"Bearer {user_token}"},
+    )
+    assert response.status_code == 415, response.text
+
+    monkeypatch.setattr("src.conf.config.settings.upload_max_size", 16)
+    response = client.post(
+        "/api/images/batch",
+        files=[("files", ("large.png", PNG + b"x" * 16, "image/png"))],
+        data={"contents": ["large"]},
+        headers={"Authorization": f"Bearer {user_token}"},
+    )
+    assert response.status_code == 413, response.text
+
+    monkeypatch.setattr("src.conf.config.settings.batch_upload_max_files", 1)
+    response = client.post(
+        "/api/images/batch",
+        files=[("files", ("one.png", PNG + b"one", "image/png")), ("files", ("two.png", PNG + b"two", "image/png"))],
+        data={"contents": ["one", "two"]},
+        headers={"Authorization": f"Bearer {user_token}"},
+    )
+    assert response.status_code == 400, response.text
+    mock_post_image.assert_not_called()
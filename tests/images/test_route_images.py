@@ -2,10 +2,15 @@ import sys
 import os
 import unittest
 import asyncio
-from unittest.mock import patch, MagicMock, Mock
+import hashlib
+from io import BytesIO
+from unittest.mock import patch, AsyncMock, MagicMock, Mock
 from fastapi import UploadFile, HTTPException
 from src.routes.images import create_image
 from src.models.image import Image
+from src.models.rating import Rating
+from src.models.user import User
+from PIL import Image as PILImage
 
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
@@ -19,13 +24,17 @@ class TestCreateImage(unittest.TestCase):
         # Mocking file upload
         mock_file = MagicMock(spec=UploadFile)
         mock_file.filename = "test_image.jpg"
-        mock_file.file = MagicMock()
+        mock_file.file = BytesIO(b"test image bytes")
 
         # Mocking user and database session
         mock_user = MagicMock()
         mock_user.username = "testuser"
         mock_user.id = "123"
         mock_db = MagicMock()
+        # The owner has no followers, the new image is fanned out to no timeline
+        mock_db.query.return_value.filter.return_value.scalar.return_value = 0
+        # No image with the same content hash exists yet
+        mock_db.query.return_value.filter.return_value.first.return_value = None
 
         # Mocking Cloudinary upload and URL generation
         mock_upload.return_value = {"public_id": "test_public_id", "version": "123456"}
@@ -46,10 +55,75 @@ class TestCreateImage(unittest.TestCase):
 
         # Assertions
         self.assertIsInstance(response, Image)  # Assuming Image is the expected type
+        public_id = f"SnapShare-API/{response.content_hash}"
         mock_upload.assert_called_once_with(
-            mock_file.file, public_id="SnapShare-API/testuser123", owerwrite=True
+            mock_file.file, public_id=public_id, overwrite=False, unique_filename=False
+        )
+        mock_cloudinary_image.assert_called_once_with(public_id)
+
+    @patch("cloudinary.uploader.upload")
+    def test_create_image_duplicate_reuses_asset(self, mock_upload):
+        mock_file = MagicMock(spec=UploadFile)
+        mock_file.filename = "test_image.jpg"
+        mock_file.file = BytesIO(b"test image bytes")
+
+        mock_user = MagicMock()
+        mock_user.username = "testuser"
+        mock_user.id = 123
+        mock_db = MagicMock()
+        # The owner has no followers, the new image is fanned out to no timeline
+        mock_db.query.return_value.filter.return_value.scalar.return_value = 0
+        existing_image = Image(id=1, image_url="http://stored.com/image.jpg")
+        mock_db.query.return_value.filter.return_value.first.return_value = (
+            existing_image
         )
-        mock_cloudinary_image.assert_called_once_with("SnapShare-API/testuser123")
+
+        body = MagicMock()
+        body.tags = ["tag1"]
+        body.model_dump.return_value = {"content": "Duplicate", "tags": ["tag1"]}
+
+        # The stored image still uses the asset, so it is not uploaded again
+        referenced = {hashlib.sha256(b"test image bytes").hexdigest()}
+        with patch("src.repository.storage_cleanup.get_referenced_hashes", AsyncMock(return_value=referenced)):
+            response = asyncio.run(
+                create_image(file=mock_file, body=body, user=mock_user, db=mock_db)
+            )
+
+        mock_upload.assert_not_called()
+        self.assertEqual(response.image_url, existing_image.image_url)
+        self.assertEqual(len(response.content_hash), 64)
+
+    @patch("cloudinary.uploader.upload")
+    @patch("cloudinary.CloudinaryImage")
+    def test_create_image_stores_metadata(self, mock_cloudinary_image, mock_upload):
+        buffer = BytesIO()
+        PILImage.new("RGB", (30, 60), (0, 0, 255)).save(buffer, format="PNG")
+        mock_file = MagicMock(spec=UploadFile)
+        mock_file.filename = "test_image.png"
+        mock_file.file = BytesIO(buffer.getvalue())
+
+        mock_user = MagicMock()
+        mock_user.id = 123
+        mock_db = MagicMock()
+        # The owner has no followers, the new image is fanned out to no timeline
+        mock_db.query.return_value.filter.return_value.scalar.return_value = 0
+        mock_db.query.return_value.filter.return_value.first.return_value = None
+        mock_upload.return_value = {"public_id": "test_public_id", "version": "123456"}
+        mock_cloudinary_image.return_value.build_url.return_value = "http://mocked_url.com"
+
+        body = MagicMock()
+        body.tags = ["tag1"]
+        body.model_dump.return_value = {"content": "Metadata", "tags": ["tag1"]}
+
+        response = asyncio.run(
+            create_image(file=mock_file, body=body, user=mock_user, db=mock_db)
+        )
+
+        self.assertEqual((response.width, response.height), (30, 60))
+        self.assertEqual(response.orientation, "portrait")
+        self.assertEqual(response.mime_type, "image/png")
+        self.assertEqual(response.dominant_color, "#0000ff")
+        self.assertTrue(response.blurhash)
 
     @patch("tests.images.conftest.cloudinary.config")
     @patch("cloudinary.uploader.upload")
@@ -91,7 +165,7 @@ def test_update_image(client, user, monkeypatch, mock_redis):
 
     # Prepare the image update data
     image_data = {
-        "image_url": "https://example.com/sunset_beach.jpg",
+        "image_url": "https://example.com/waifu.jpg",
         "content": "Beautiful sunset at the beach",
         "tags": [1, 2],
     }
@@ -288,6 +362,49 @@ def test_get_images(client, user, monkeypatch, mock_redis):
     # Add more assertions as needed, based on your application's logic and requirements
 
 
+def test_get_feed(client, user, mock_redis, cache):
+    login_response = client.post(
+        "/api/auth/login",
+        data={"username": user["email"], "password": user["password"]},
+    )
+    assert login_response.status_code == 200, login_response.text
+    user_token = login_response.json()["access_token"]
+
+    response = client.get(
+        "/api/images/feed",
+        params={"limit": 1},
+        headers={"Authorization": f"Bearer {user_token}"},
+    )
+
+    assert response.status_code == 200, response.text
+    assert len(response.json()) == 1
+    assert cache.zcard("feed:recent") > 1
+    next_page = client.get(
+        "/api/images/feed",
+        params={"limit": 1, "cursor": response.headers["X-Next-Cursor"]},
+        headers={"Authorization": f"Bearer {user_token}"},
+    )
+    assert next_page.status_code == 200, next_page.text
+    assert next_page.json()[0]["id"] < response.json()[0]["id"]
+
+
+def test_follow_and_timeline(client, user, mock_redis):
+    login_response = client.post(
+        "/api/auth/login",
+        data={"username": user["email"], "password": user["password"]},
+    )
+    assert login_response.status_code == 200, login_response.text
+    headers = {"Authorization": f"Bearer {login_response.json()['access_token']}"}
+
+    assert client.post(f"/api/users/follow/{user['username']}", headers=headers).status_code == 400
+    assert client.post("/api/users/follow/nobody_here", headers=headers).status_code == 404
+    assert client.delete("/api/users/follow/nobody_here", headers=headers).status_code == 404
+
+    response = client.get("/api/images/timeline", headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.json() == []
+
+
 @patch("src.repository.images.get_image")
 def test_get_transform_image_url(mock_get_image, client):
     # Mocking a transformed image
@@ -364,3 +481,113 @@ def test_delete_image(client, user, monkeypatch, mock_redis):
     assert (
         response.status_code == 204
     ), response.text  # Adjust the status code as per your API design
+
+
+def test_get_image_conditional(client, user, mock_redis):
+    login_response = client.post(
+        "/api/auth/login",
+        data={"username": user["email"], "password": user["password"]},
+    )
+    assert login_response.status_code == 200, login_response.text
+    headers = {"Authorization": f"Bearer {login_response.json()['access_token']}"}
+    image_id = client.get("/api/images/", params={"limit": 1}, headers=headers).json()[0]["id"]
+
+    response = client.get(f"/api/images/{image_id}")
+    assert response.status_code == 200, response.text
+    etag = response.headers["ETag"]
+
+    not_modified = client.get(f"/api/images/{image_id}", headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+    assert not_modified.headers["ETag"] == etag
+    since = client.get(
+        f"/api/images/{image_id}", headers={"If-Modified-Since": response.headers["Last-Modified"]}
+    )
+    assert since.status_code == 304
+    changed = client.get(f"/api/images/{image_id}", headers={"If-None-Match": 'W/"outdated"'})
+    assert changed.status_code == 200
+    assert changed.json() == response.json()
+    assert client.get("/api/images/999999", headers={"If-None-Match": etag}).status_code == 404
+
+
+def test_get_image_views(client, user, mock_redis):
+    login_response = client.post(
+        "/api/auth/login",
+        data={"username": user["email"], "password": user["password"]},
+    )
+    assert login_response.status_code == 200, login_response.text
+    headers = {"Authorization": f"Bearer {login_response.json()['access_token']}"}
+    image_id = client.get("/api/images/", params={"limit": 1}, headers=headers).json()[0]["id"]
+    before = client.get(f"/api/images/{image_id}/views").json()["views"]
+
+    etag = client.get(f"/api/images/{image_id}").headers["ETag"]
+    assert client.get(f"/api/images/{image_id}", headers={"If-None-Match": etag}).status_code == 304
+    client.get("/api/images/999999")
+
+    response = client.get(f"/api/images/{image_id}/views")
+    assert response.status_code == 200, response.text
+    assert response.json()["views"] == before + 2
+    assert response.json()["unique_viewers"] == 1
+    assert client.get("/api/images/999999/views").status_code == 404
+
+
+def test_get_trending(client, user, mock_redis):
+    login_response = client.post(
+        "/api/auth/login",
+        data={"username": user["email"], "password": user["password"]},
+    )
+    assert login_response.status_code == 200, login_response.text
+    headers = {"Authorization": f"Bearer {login_response.json()['access_token']}"}
+    image_id = client.get("/api/images/", params={"limit": 1}, headers=headers).json()[0]["id"]
+    response = client.post(f"/api/comments/add_comments/?image_id={image_id}", json={"content": "trending"}, headers=headers)
+    assert response.status_code == 200, response.text
+
+    response = client.get("/api/images/trending", params={"limit": 5}, headers=headers)
+    assert response.status_code == 200, response.text
+    assert image_id in [card["id"] for card in response.json()]
+
+
+def test_get_top_rated(client, session, user, mock_redis):
+    login_response = client.post(
+        "/api/auth/login",
+        data={"username": user["email"], "password": user["password"]},
+    )
+    assert login_response.status_code == 200, login_response.text
+    headers = {"Authorization": f"Bearer {login_response.json()['access_token']}"}
+    image_id = client.get("/api/images/", params={"limit": 1}, headers=headers).json()[0]["id"]
+    owner_id = session.query(Image.user_id).filter(Image.id == image_id).scalar()
+    session.add(Rating(user_id=owner_id, image_id=image_id, rating_score=5))
+    session.commit()
+
+    response = client.get("/api/images/top_rated", params={"limit": 5}, headers=headers)
+    assert response.status_code == 200, response.text
+    card = next(card for card in response.json() if card["id"] == image_id)
+    assert card["average_rating"] is not None
+
+
+def test_content_addressed_asset(client, session, user, mock_redis):
+    content_hash = "c" * 64
+    image_url = f"https://res.cloudinary.com/demo/image/upload/v1/SnapShare-API/{content_hash}"
+    owner_id = session.query(User.id).filter(User.email == user["email"]).scalar()
+    session.add(Image(image_url=image_url, content="Stored", user_id=owner_id, content_hash=content_hash))
+    session.commit()
+    login_response = client.post(
+        "/api/auth/login",
+        data={"username": user["email"], "password": user["password"]},
+    )
+    assert login_response.status_code == 200, login_response.text
+    headers = {"Authorization": f"Bearer {login_response.json()['access_token']}"}
+
+    response = client.post(
+        "/api/images/transform_image/",
+        params={"image_url": image_url, "transformation_type": "resize", "width": 100, "height": 100},
+        headers=headers,
+    )
+    assert response.status_code == 200, response.text
+    assert f"SnapShare-API/{content_hash}" in response.json()["image_transformed_url"]
+
+    response = client.get(f"/api/images/assets/{content_hash}", follow_redirects=False)
+    assert response.status_code == 301
+    assert response.headers["Cache-Control"] == "public, max-age=31536000, immutable"
+    assert f"SnapShare-API/{content_hash}" in response.headers["Location"]
+    assert client.get(f"/api/images/assets/{'d' * 64}", follow_redirects=False).status_code == 404
@@ -0,0 +1,142 @@
+import hashlib
+from datetime import datetime
+from unittest.mock import patch
+
+from src.conf.config import settings
+from src.models.outbox import StorageCleanup
+from src.services.upload_validation import MULTIPART_OVERHEAD, count_tags, sniff_image_type
+from tests.images.test_route_batch_upload import login
+
+PNG_BYTES = b"\x89PNG\r\n\x1a\n" + b"\x00" * 32
+
+
+def test_sniff_image_type():
+    assert sniff_image_type(b"\xff\xd8\xff\xe0\x00\x10JFIF\x00") == "image/jpeg"
+    assert sniff_image_type(PNG_BYTES[:12]) == "image/png"
+    assert sniff_image_type(b"GIF89a\x01\x00\x01\x00\x00\x00") == "image/gif"
+    assert sniff_image_type(b"RIFF\x00\x00\x00\x00WEBP") == "image/webp"
+    assert sniff_image_type(b"\x00\x00\x00\x18ftypavif") == "image/avif"
+    assert sniff_image_type(b"\x00\x00\x00\x18ftypisom") is None
+    assert sniff_image_type(b"%PDF-1.7\n%\xe2\xe3") is None
+    assert sniff_image_type(b"") is None
+
+
+def test_count_tags():
+    assert count_tags(["a,b", " b ,c", ""]) == 3
+    assert count_tags([]) == 0
+
+
+def post_image(client, token, files, params=None, data=None, headers=None):
+    return client.post(
+        "/api/images/create_new",
+        params={"content": "validated", **(params or {})},
+        files=files,
+        data=data,
+        headers={"Authorization": f"Bearer {token}", **(headers or {})},
+    )
+
+
+@patch("src.services.image_store.upload_cloudinary_asset")
+def test_create_image_streamed(mock_upload, client, user, mock_redis):
+    mock_upload.side_effect = lambda file, content_hash: (
+        f"https://example.com/SnapShare-API/{content_hash}"
+    )
+    token = login(client, user)
+
+    response = post_image(
+        client, token, {"file": ("image.png", PNG_BYTES, "image/png")}, data={"tags": "valid,streamed"}
+    )
+
+    assert response.status_code == 201, response.text
+    assert {tag["name"] for tag in response.json()["tags"]} == {"valid", "streamed"}
+    # The zero padded PNG cannot be decoded, its size is recorded all the same
+    assert response.json()["byte_size"] == len(PNG_BYTES)
+    assert response.json()["width"] is None
+    mock_upload.assert_called_once()
+
+
+@patch("src.services.image_store.upload_cloudinary_asset")
+def test_create_image_rejected_early(mock_upload, client, user, mock_redis, monkeypatch):
+    token = login(client, user)
+
+    response = post_image(client, token, {"file": ("script.png", b"#!/bin/sh\necho hi\n", "image/png")})
+    assert response.status_code == 415
+
+    response = post_image(
+        client,
+        token,
+        {"file": ("image.png", PNG_BYTES, "image/png")},
+        params={"tags": "a,b,c,d,e,f"},
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Maximum number of tags is 5"
+
+    response = post_image(
+        client,
+        token,
+        {"file": ("image.png", PNG_BYTES, "image/png")},
+        data={"tags": ["a,b,c", "d,e,f"]},
+    )
+    assert response.status_code == 400
+
+    response = post_image(
+        client,
+        token,
+        {"file": ("image.png", PNG_BYTES, "image/png")},
+        headers={"Content-Length": str(settings.upload_max_size + MULTIPART_OVERHEAD + 1)},
+    )
+    assert response.status_code == 413
+
+    monkeypatch.setattr(settings, "upload_max_size", 16)
+    response = post_image(client, token, {"file": ("image.png", PNG_BYTES, "image/png")})
+    assert response.status_code == 413
+
+    monkeypatch.setattr(settings, "upload_max_size", 1024)
+    monkeypatch.setattr(settings, "user_storage_quota", 16)
+    response = post_image(client, token, {"file": ("image.png", PNG_BYTES, "image/png")})
+    assert response.status_code == 413
+    mock_upload.assert_not_called()
+
+
+@patch("src.services.image_store.upload_cloudinary_asset")
+@patch("src.repository.images.get_user_storage_usage")
+def test_create_image_quota_checked_at_insert(
+    mock_usage, mock_upload, client, session, user, mock_redis, monkeypatch
+):
+    mock_upload.side_effect = lambda file, content_hash: (
+        f"https://example.com/SnapShare-API/{content_hash}"
+    )
+    monkeypatch.setattr(settings, "user_storage_quota", 1024)
+    # A concurrent upload committed while the file was uploaded
+    mock_usage.side_effect = lambda user, db, lock=False: 1000 if lock else 0
+    token = login(client, user)
+    data = PNG_BYTES + b"quota"
+
+    response = post_image(client, token, {"file": ("image.png", data, "image/png")})
+
+    assert response.status_code == 413
+    assert response.json()["detail"] == "Storage quota exceeded"
+    # The asset uploaded before the recheck is handed to the storage cleanup
+    mock_upload.assert_called_once()
+    orphan = session.query(StorageCleanup).filter_by(content_hash=hashlib.sha256(data).hexdigest()).one()
+    assert orphan.available_at > datetime.now()
+
+
+def test_create_image_malformed_body(client, user, mock_redis):
+    token = login(client, user)
+
+    response = post_image(
+        client,
+        token,
+        {"file": ("image.png", PNG_BYTES, "image/png"), "other": ("other.png", PNG_BYTES, "image/png")},
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Too many files. Maximum number of files is 1."
+
+    response = client.post(
+        "/api/images/create_new",
+        params={"content": "validated"},
+        content=b"not a multipart body",
+        headers={"Authorization": f"Bearer {token}", "Content-Type": "multipart/form-data; boundary=xyz"},
+    )
+    assert response.status_code == 400
@@ -0,0 +1,164 @@
+import hashlib
+import os
+import time
+from unittest.mock import patch
+
+import pytest
+
+from src.conf.config import settings
+from src.services import resumable_uploads
+from tests.images.test_route_batch_upload import login
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+@pytest.fixture()
+def staging_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "upload_staging_dir", str(tmp_path))
+    return tmp_path
+
+
+def start_upload(client, token, data, **body):
+    response = client.post(
+        "/api/images/uploads",
+        json={"filename": "large.jpg", "size": len(data), "content": "chunked", **body},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 201, response.text
+    return response.json()["upload_id"]
+
+
+def append(client, token, upload_id, offset, chunk):
+    return client.patch(
+        f"/api/images/uploads/{upload_id}",
+        content=chunk,
+        headers={
+            "Authorization": f"Bearer {token}",
+            "Upload-Offset": str(offset),
+            "Content-Type": "application/offset+octet-stream",
+        },
+    )
+
+
+@patch("src.services.image_store.upload_cloudinary_asset")
+def test_resumable_upload(mock_upload, client, user, mock_redis, staging_dir):
+    mock_upload.side_effect = lambda file, content_hash: (
+        f"https://example.com/SnapShare-API/{content_hash}"
+    )
+    token = login(client, user)
+    data = PNG_SIGNATURE + os.urandom(3000)
+    upload_id = start_upload(client, token, data, tags=["chunked,resumed"])
+
+    response = append(client, token, upload_id, 0, data[:1000])
+    assert response.status_code == 200, response.text
+    assert response.headers["Upload-Offset"] == "1000"
+
+    # A retried chunk at a stale offset is rejected with the acknowledged offset
+    response = append(client, token, upload_id, 0, data[:1000])
+    assert response.status_code == 409
+    assert response.headers["Upload-Offset"] == "1000"
+
+    # Another process resumes from the staged bytes
+    resumable_uploads._hashers.clear()
+    response = client.get(
+        f"/api/images/uploads/{upload_id}", headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.json()["offset"] == 1000
+    assert append(client, token, upload_id, 1000, data[1000:]).status_code == 200
+
+    response = client.post(
+        f"/api/images/uploads/{upload_id}/finalize",
+        headers={"Authorization": f"Bearer {token}"},
+    )
+
+    assert response.status_code == 201, response.text
+    content_hash = hashlib.sha256(data).hexdigest()
+    assert response.json()["image_url"].endswith(content_hash)
+    assert {tag["name"] for tag in response.json()["tags"]} == {"chunked", "resumed"}
+    mock_upload.assert_called_once()
+    assert os.listdir(staging_dir) == []
+
+
+def test_upload_locked_by_another_worker(client, user, mock_redis, staging_dir):
+    token = login(client, user)
+    data = PNG_SIGNATURE + b"0123456789"
+    upload_id = start_upload(client, token, data)
+    assert append(client, token, upload_id, 0, data[:10]).status_code == 200
+
+    # A request of another worker holds the row lock of the session: nothing is written to the staged file
+    with patch("src.repository.uploads.lock_upload_session", return_value=False):
+        response = append(client, token, upload_id, 10, data[10:])
+    assert response.status_code == 409
+    assert (staging_dir / f"{upload_id}.part").read_bytes() == data[:10]
+    assert append(client, token, upload_id, 10, data[10:]).status_code == 200
+
+
+def test_upload_overflow_and_incomplete(client, user, mock_redis, staging_dir):
+    token = login(client, user)
+    data = PNG_SIGNATURE + b"0123456789"
+    upload_id = start_upload(client, token, data)
+
+    assert append(client, token, upload_id, 0, data + b"extra").status_code == 413
+    assert append(client, token, upload_id, 0, data[:12]).status_code == 200
+
+    response = client.post(
+        f"/api/images/uploads/{upload_id}/finalize",
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 409
+    assert response.headers["Upload-Offset"] == "12"
+
+    response = client.delete(
+        f"/api/images/uploads/{upload_id}", headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 204
+    assert os.listdir(staging_dir) == []
+
+
+def test_create_upload_too_large(client, user, mock_redis, staging_dir):
+    token = login(client, user)
+    response = client.post(
+        "/api/images/uploads",
+        json={"size": settings.upload_max_size + 1, "content": "too large"},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 413
+
+
+def test_upload_rejects_non_image_first_chunk(client, user, mock_redis, staging_dir):
+    token = login(client, user)
+    data = b"#!/bin/sh\necho not an image\n"
+    upload_id = start_upload(client, token, data)
+
+    response = append(client, token, upload_id, 0, data)
+    assert response.status_code == 415
+    response = client.get(
+        f"/api/images/uploads/{upload_id}", headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.json()["offset"] == 0
+
+
+def test_create_upload_over_quota(client, user, mock_redis, staging_dir, monkeypatch):
+    monkeypatch.setattr(settings, "user_storage_quota", 100)
+    token = login(client, user)
+    response = client.post(
+        "/api/images/uploads",
+        json={"size": 101, "content": "over quota"},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 413
+    assert response.json()["detail"] == "Storage quota exceeded"
+
+
+def test_idle_upload_state_is_evicted(staging_dir):
+    resumable_uploads.remember_hasher("idle", 10, hashlib.sha256())
+    resumable_uploads.upload_lock("idle")
+    resumable_uploads._last_used["idle"] = time.monotonic() - settings.upload_session_ttl - 1
+
+    resumable_uploads.upload_lock("active")
+
+    assert "idle" not in resumable_uploads._hashers
+    assert "idle" not in resumable_uploads._locks
+    assert "active" in resumable_uploads._locks
+    resumable_uploads.discard_staging("active")
+    assert "active" not in resumable_uploads._locks
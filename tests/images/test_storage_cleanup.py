@@ -0,0 +1,150 @@
+import hashlib
+import unittest
+from io import BytesIO
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.models.base import Base
+from src.models.image import Image
+from src.models.outbox import StorageCleanup
+from src.models.user import User
+from src.repository.images import delete_image
+from src.repository.storage_cleanup import enqueue_asset_cleanup, lock_assets
+from src.services.image_store import restore_cleaned_assets
+from src.services.storage_cleanup import drain_storage_cleanup
+from src.utils.image_utils import get_content_public_id
+
+
+class TestStorageCleanup(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        engine = create_engine("sqlite:///:memory:")
+        Base.metadata.create_all(bind=engine)
+        self.db = sessionmaker(bind=engine)()
+        self.user = User(
+            username="test_user",
+            email="test@example.com",
+            password="test_password",
+            avatar="test_avatar",
+            role="admin",
+        )
+        self.db.add(self.user)
+        self.db.commit()
+        self.unique_hash = hashlib.sha256(b"unique").hexdigest()
+        self.shared_hash = hashlib.sha256(b"shared").hexdigest()
+        self.images = [
+            Image(image_url="http://cdn.com/unique", content="unique", content_hash=self.unique_hash),
+            Image(image_url="http://cdn.com/shared", content="shared", content_hash=self.shared_hash),
+            Image(image_url="http://cdn.com/shared", content="copy", content_hash=self.shared_hash),
+            Image(image_url="http://legacy.com/1", content="legacy"),
+        ]
+        for image in self.images:
+            image.user_id = self.user.id
+        self.db.add_all(self.images)
+        self.db.commit()
+
+    def tearDown(self):
+        self.db.close()
+
+    async def test_delete_writes_outbox_entry(self):
+        await delete_image(self.images[0].id, self.user, self.db)
+        await delete_image(self.images[3].id, self.user, self.db)
+
+        entries = self.db.query(StorageCleanup).all()
+        self.assertEqual([entry.public_id for entry in entries], [get_content_public_id(self.unique_hash)])
+
+    async def test_drain_deletes_unreferenced_assets(self):
+        for image in self.images:
+            await delete_image(image.id, self.user, self.db)
+        destroyed = []
+
+        deleted = await drain_storage_cleanup(self.db, batch_size=1, destroy=destroyed.append)
+
+        self.assertEqual(deleted, 2)
+        self.assertEqual(
+            sorted(destroyed),
+            sorted([get_content_public_id(self.unique_hash), get_content_public_id(self.shared_hash)]),
+        )
+        self.assertEqual(self.db.query(StorageCleanup).count(), 0)
+
+    async def test_drain_keeps_referenced_asset(self):
+        await delete_image(self.images[1].id, self.user, self.db)
+        destroyed = []
+
+        deleted = await drain_storage_cleanup(self.db, destroy=destroyed.append)
+
+        self.assertEqual(deleted, 0)
+        self.assertEqual(destroyed, [])
+        self.assertEqual(self.db.query(StorageCleanup).count(), 0)
+
+    async def test_failed_delete_is_retried_later(self):
+        await delete_image(self.images[0].id, self.user, self.db)
+
+        def fail(public_id):
+            raise RuntimeError("timeout")
+
+        deleted = await drain_storage_cleanup(self.db, destroy=fail)
+
+        entry = self.db.query(StorageCleanup).one()
+        self.assertEqual(deleted, 0)
+        self.assertEqual(entry.attempts, 1)
+        self.assertEqual(entry.last_error, "timeout")
+        self.assertGreater(entry.available_at, datetime.now())
+        # Not due yet, so the next drain leaves it alone
+        destroyed = []
+        self.assertEqual(await drain_storage_cleanup(self.db, destroy=destroyed.append), 0)
+        self.assertEqual(destroyed, [])
+
+    async def test_drain_locks_assets_before_checking_them(self):
+        await delete_image(self.images[0].id, self.user, self.db)
+        calls = []
+
+        with patch(
+            "src.repository.storage_cleanup.lock_assets",
+            side_effect=lambda content_hashes, db: calls.append(("lock", list(content_hashes))),
+        ), patch(
+            "src.repository.storage_cleanup.is_asset_referenced",
+            new=AsyncMock(side_effect=lambda content_hash, db: calls.append(("check", content_hash))),
+        ):
+            await drain_storage_cleanup(self.db, destroy=lambda public_id: calls.append(("destroy", public_id)))
+
+        self.assertEqual(
+            calls,
+            [
+                ("lock", [self.unique_hash]),
+                ("check", self.unique_hash),
+                ("destroy", get_content_public_id(self.unique_hash)),
+            ],
+        )
+
+    def test_lock_assets_takes_advisory_locks_in_order(self):
+        db = MagicMock()
+        db.get_bind.return_value.dialect.name = "postgresql"
+
+        lock_assets([self.unique_hash, self.shared_hash, self.unique_hash], db)
+
+        keys = [call.args[0].compile().params for call in db.execute.call_args_list]
+        expected = sorted([self.unique_hash, self.shared_hash])
+        self.assertEqual([list(params.values()) for params in keys], [[int(h[:15], 16)] for h in expected])
+        self.assertIn("pg_advisory_xact_lock", str(db.execute.call_args.args[0]))
+        # Other databases have no advisory locks
+        lock_assets([self.unique_hash], self.db)
+
+    async def test_restore_cleaned_assets(self):
+        gone_hash = hashlib.sha256(b"gone").hexdigest()
+        queued_hash = hashlib.sha256(b"queued").hexdigest()
+        await enqueue_asset_cleanup(queued_hash, self.db)
+        self.db.commit()
+        files = {self.shared_hash: BytesIO(b"shared"), gone_hash: BytesIO(b"gone"), queued_hash: BytesIO(b"queued")}
+
+        with patch(
+            "src.services.image_store.upload_cloudinary_asset",
+            side_effect=lambda file, content_hash: f"http://cdn.com/{file.read().decode()}",
+        ) as mock_upload:
+            restored = await restore_cleaned_assets(files, self.db)
+
+        # Only the asset no image uses and no cleanup entry waits for may have been deleted
+        self.assertEqual(restored, {gone_hash: "http://cdn.com/gone"})
+        mock_upload.assert_called_once()
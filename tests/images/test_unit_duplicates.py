@@ -0,0 +1,65 @@
+import unittest
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.models.base import Base
+from src.models.image import Image
+from src.models.user import User
+from src.repository.images import get_image_by_hash, get_duplicate_report
+
+
+class TestDuplicateImages(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        engine = create_engine("sqlite:///:memory:")
+        Base.metadata.create_all(bind=engine)
+        self.db = sessionmaker(bind=engine)()
+
+        self.user = User(
+            username="test_user",
+            email="test@example.com",
+            password="test_password",
+            avatar="test_avatar",
+        )
+        other_user = User(
+            username="other_user",
+            email="other@example.com",
+            password="test_password",
+            avatar="test_avatar",
+        )
+        self.db.add_all([self.user, other_user])
+        self.db.commit()
+        for user, content_hash in [
+            (self.user, "a" * 64),
+            (self.user, "a" * 64),
+            (self.user, "b" * 64),
+            (other_user, "a" * 64),
+        ]:
+            self.db.add(
+                Image(
+                    image_url=f"http://stored.com/{content_hash[0]}.jpg",
+                    content="content",
+                    content_hash=content_hash,
+                    user_id=user.id,
+                )
+            )
+        self.db.commit()
+
+    def tearDown(self):
+        self.db.close()
+
+    async def test_get_image_by_hash(self):
+        image = await get_image_by_hash("b" * 64, self.db)
+        self.assertEqual(image.image_url, "http://stored.com/b.jpg")
+        self.assertIsNone(await get_image_by_hash("c" * 64, self.db))
+
+    async def test_get_duplicate_report(self):
+        report = await get_duplicate_report(self.user, self.db)
+        self.assertEqual(len(report), 1)
+        self.assertEqual(report[0]["content_hash"], "a" * 64)
+        self.assertEqual(report[0]["count"], 2)
+        self.assertEqual(report[0]["image_ids"], [1, 2])
+
+
+if __name__ == "__main__":
+    unittest.main()
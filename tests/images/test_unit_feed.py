@@ -0,0 +1,88 @@
+import unittest
+from datetime import datetime, timedelta
+
+from redis.exceptions import ConnectionError as RedisConnectionError
+from unittest.mock import patch
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.conf.config import settings
+from src.database import cache
+from src.models.base import Base
+from src.models.image import Image
+from src.models.user import User
+from src.services import feed
+from src.utils.pagination import decode_score_cursor
+
+
+class TestFeed(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        engine = create_engine("sqlite:///:memory:")
+        Base.metadata.create_all(bind=engine)
+        self.db = sessionmaker(bind=engine)()
+        # The in-memory Redis of the autouse cache fixture
+        self.redis = cache.redis_cache
+
+        user = User(username="test_user", email="test@example.com", password="test_password", avatar="avatar")
+        self.db.add(user)
+        self.db.commit()
+        start = datetime(2026, 1, 1)
+        # Pairs of images share a creation time, so pages have to break ties by id
+        self.images = [
+            Image(
+                image_url=f"http://stored.com/{i}.jpg",
+                content="content",
+                user_id=user.id,
+                created_at=start + timedelta(seconds=i // 2),
+            )
+            for i in range(7)
+        ]
+        self.db.add_all(self.images)
+        self.db.commit()
+
+    def tearDown(self):
+        self.db.close()
+
+    async def walk(self, limit):
+        seen, position = [], None
+        while True:
+            page, cursor = await feed.get_feed(limit, position, self.db)
+            seen.extend(image.id for image in page)
+            if cursor is None:
+                return seen
+            position = decode_score_cursor(cursor)
+
+    async def test_cold_start_rebuild_and_pages(self):
+        self.assertEqual(await self.walk(3), [7, 6, 5, 4, 3, 2, 1])
+        self.assertTrue(self.redis.exists(feed.FEED_READY_KEY))
+
+    async def test_publish_and_retract(self):
+        await feed.rebuild_feed(self.db)
+        image = Image(image_url="http://stored.com/new.jpg", content="new", user_id=1, created_at=datetime(2026, 2, 1))
+        self.db.add(image)
+        self.db.commit()
+        feed.publish_images([image])
+        feed.retract_image(3)
+
+        self.assertEqual(await self.walk(2), [8, 7, 6, 5, 4, 2, 1])
+
+    async def test_feed_is_capped_and_skips_deleted_rows(self):
+        with patch.object(settings, "feed_size", 4):
+            await feed.rebuild_feed(self.db)
+            self.db.delete(self.images[6])
+            self.db.commit()
+
+            page, cursor = await feed.get_feed(10, None, self.db)
+
+        self.assertEqual([image.id for image in page], [6, 5, 4])
+        self.assertIsNone(cursor)
+        self.assertEqual(self.redis.zcard(feed.FEED_KEY), 3)
+
+    async def test_database_fallback_when_redis_fails(self):
+        first_page, cursor = await feed.get_feed(3, None, self.db)
+        with patch.object(self.redis, "exists", side_effect=RedisConnectionError("down")):
+            # A cursor of the cached feed continues in the database
+            page, _ = await feed.get_feed(3, decode_score_cursor(cursor), self.db)
+            self.assertEqual([image.id for image in first_page + page], [7, 6, 5, 4, 3, 2])
+            self.assertEqual(await self.walk(3), [7, 6, 5, 4, 3, 2, 1])
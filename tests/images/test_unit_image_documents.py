@@ -0,0 +1,94 @@
+import unittest
+
+from sqlalchemy import create_engine, delete, event, select
+from sqlalchemy.orm import sessionmaker
+
+from src.models.base import Base
+from src.models.comment import Comment
+from src.models.document import ImageDocument
+from src.models.image import Image, Tag
+from src.models.rating import Rating
+from src.models.user import User
+from src.repository.image_documents import get_image_documents, rebuild_image_documents
+from src.repository.tags import update_tag
+from src.schemas.tag import TagRequest
+
+
+class TestImageDocuments(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.engine = create_engine("sqlite:///:memory:")
+        Base.metadata.create_all(bind=self.engine)
+        self.db = sessionmaker(bind=self.engine)()
+        self.user = User(username="owner", email="owner@example.com", password="pwd", avatar="avatar")
+        self.db.add(self.user)
+        self.db.commit()
+        self.tag = Tag(name="sea")
+        self.images = [
+            Image(image_url=f"http://stored.com/{i}.jpg", content=f"content {i}", user_id=self.user.id, tags=[self.tag])
+            for i in range(3)
+        ]
+        self.db.add_all(self.images)
+        self.db.commit()
+
+    def tearDown(self):
+        self.db.close()
+
+    def document(self, image_id):
+        return self.db.scalar(select(ImageDocument.document).where(ImageDocument.image_id == image_id))
+
+    async def test_documents_follow_writes(self):
+        image_id = self.images[0].id
+        self.assertEqual(self.document(image_id)["tags"], [{"name": "sea"}])
+        self.assertEqual(self.document(image_id)["username"], "owner")
+
+        self.db.add_all(
+            [
+                Rating(user_id=self.user.id, image_id=image_id, rating_score=4),
+                Rating(user_id=self.user.id, image_id=image_id, rating_score=5),
+                Comment(content="nice", user_id=self.user.id, image_id=image_id),
+            ]
+        )
+        self.db.commit()
+        document = self.document(image_id)
+        self.assertEqual((document["average_rating"], document["ratings_count"]), (4.5, 2))
+        self.assertEqual(document["comments_count"], 1)
+
+        self.user.username = "renamed"
+        self.db.commit()
+        await update_tag(self.tag.id, TagRequest(name="ocean"), self.db)
+        document = self.document(self.images[2].id)
+        self.assertEqual(document["username"], "renamed")
+        self.assertEqual(document["tags"], [{"name": "ocean"}])
+
+        deleted_id = self.images[1].id
+        self.db.delete(self.images[1])
+        self.db.commit()
+        self.assertIsNone(self.document(deleted_id))
+
+    async def test_page_is_one_lookup(self):
+        ids = [image.id for image in reversed(self.images)]
+        statements = []
+        event.listen(self.engine, "before_cursor_execute", lambda conn, cursor, statement, *args: statements.append(statement))
+
+        cards = await get_image_documents(ids, self.db)
+
+        self.assertEqual([card.id for card in cards], ids)
+        self.assertEqual(cards[0].content, "content 2")
+        self.assertEqual(len(statements), 1)
+        # Ids of deleted images are skipped
+        self.assertEqual([card.id for card in await get_image_documents([999] + ids, self.db)], ids)
+
+    async def test_missing_documents_are_built_on_read(self):
+        self.db.execute(delete(ImageDocument))
+        self.db.commit()
+
+        cards = await get_image_documents([self.images[0].id], self.db)
+
+        self.assertEqual(cards[0].tags[0].name, "sea")
+        # Reads do not write, the document is stored by the next change or by rebuild_image_documents
+        self.db.rollback()
+        self.assertIsNone(self.document(self.images[0].id))
+        self.db.execute(delete(ImageDocument))
+        self.db.commit()
+        self.assertEqual(await rebuild_image_documents(self.db, batch_size=2), 3)
+        self.assertEqual(len(self.db.scalars(select(ImageDocument)).all()), 3)
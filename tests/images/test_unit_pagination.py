@@ -0,0 +1,80 @@
+import unittest
+
+from fastapi import HTTPException, Response
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.models.base import Base
+from src.models.image import Image
+from src.models.user import User, UserRole
+from src.repository.images import get_images
+from src.utils.pagination import (
+    NEXT_CURSOR_HEADER,
+    encode_cursor,
+    decode_cursor,
+    parse_cursor,
+    set_next_cursor,
+)
+
+
+class TestCursor(unittest.TestCase):
+    def test_round_trip(self):
+        self.assertEqual(decode_cursor(encode_cursor(12345)), 12345)
+
+    def test_invalid_cursor(self):
+        for cursor in ["not-a-cursor", encode_cursor("1"), "e30"]:
+            with self.assertRaises(ValueError):
+                decode_cursor(cursor)
+        with self.assertRaises(HTTPException) as context:
+            parse_cursor("not-a-cursor")
+        self.assertEqual(context.exception.status_code, 400)
+        self.assertIsNone(parse_cursor(None))
+
+    def test_set_next_cursor(self):
+        response = Response()
+        items = [Image(id=5), Image(id=3)]
+        self.assertEqual(set_next_cursor(response, items, 2), items)
+        self.assertNotIn(NEXT_CURSOR_HEADER, response.headers)
+
+        self.assertEqual(set_next_cursor(response, items, 1), items[:1])
+        self.assertEqual(decode_cursor(response.headers[NEXT_CURSOR_HEADER]), 5)
+
+
+class TestKeysetImages(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        engine = create_engine("sqlite:///:memory:")
+        Base.metadata.create_all(bind=engine)
+        self.db = sessionmaker(bind=engine)()
+        self.user = User(
+            username="test_user",
+            email="test@example.com",
+            password="test_password",
+            avatar="test_avatar",
+            role=UserRole.User,
+        )
+        self.db.add(self.user)
+        self.db.commit()
+        self.db.add_all(
+            Image(image_url=f"http://stored.com/{i}.jpg", content="content", user_id=self.user.id)
+            for i in range(7)
+        )
+        self.db.commit()
+
+    def tearDown(self):
+        self.db.close()
+
+    async def test_walk_pages_with_cursor(self):
+        seen = []
+        after_id = None
+        while True:
+            page = await get_images(0, 4, self.user, self.db, after_id=after_id)
+            response = Response()
+            page = set_next_cursor(response, page, 3)
+            seen.extend(image.id for image in page)
+            if NEXT_CURSOR_HEADER not in response.headers:
+                break
+            after_id = decode_cursor(response.headers[NEXT_CURSOR_HEADER])
+
+        self.assertEqual(seen, sorted(seen, reverse=True))
+        self.assertEqual(len(seen), 7)
+        self.assertEqual(len(set(seen)), 7)
@@ -82,7 +82,7 @@ class Testimages(unittest.IsolatedAsyncioTestCase):
             image_url="http://testurl.com/image.jpg", content="Updated Description"
         )
         # Mock the query to return None for first()
-        self.session.query().filter().first.return_value = None
+        self.session.query().options().filter().first.return_value = None
 
         # Call the function under test
         result = await update_image(
@@ -189,7 +189,7 @@ class Testimages(unittest.IsolatedAsyncioTestCase):
             image_url="http://testurl.com/image.jpg",
             content="Test Description",
         )
-        self.session.query().filter().first.return_value = image
+        self.session.query().options().filter().first.return_value = image
         result = await get_image(image_id=1, db=self.session)
         self.assertEqual(result, image)
 
@@ -212,7 +212,7 @@ class Testimages(unittest.IsolatedAsyncioTestCase):
             )
         ]
         # Correctly mock the query chain
-        self.session.query().filter().offset().limit().all.return_value = images
+        self.session.query().options().filter().order_by().offset().limit().all.return_value = images
 
         # Call the function under test
         result = await get_images(
@@ -242,7 +242,7 @@ class Testimages(unittest.IsolatedAsyncioTestCase):
         current_user.id = 1  # Set this to the id of the user who owns the mock image
 
         # Mock the database query
-        db.query.return_value.filter.return_value.first.return_value = mock_image
+        db.query.return_value.options.return_value.filter.return_value.first.return_value = mock_image
 
         # Test Execution
         result = await get_image_user(image_id, db, current_user)
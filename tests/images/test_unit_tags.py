@@ -7,14 +7,19 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")
 
 import unittest
 import datetime
-from unittest.mock import MagicMock, AsyncMock
+from unittest.mock import MagicMock, AsyncMock, patch
 
 from fastapi import HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, sessionmaker
 
+from src.database.loaders import refresh_loaded
 from src.repository import images as repository_images
+from src.schemas.image import ImageResponse
 from src.schemas.tag import TagResponse
+from src.models.base import Base
 from src.models.image import Image, Tag
+from src.models.user import User
 from src.routes.images import add_tag
 
 
@@ -25,33 +30,49 @@ class TestTag(unittest.IsolatedAsyncioTestCase):
         self.image_id = 123
         self.tag_name = "Nature"
 
-    async def test_succes_added_tag(self):
-        mock_image = Image(
+        engine = create_engine("sqlite:///:memory:")
+        Base.metadata.create_all(bind=engine)
+        self.db = sessionmaker(bind=engine)()
+        user = User(
+            username="test_user",
+            email="test@example.com",
+            password="test_password",
+            avatar="test_avatar",
+        )
+        self.db.add(user)
+        self.db.commit()
+        self.image = Image(
             id=self.image_id,
             image_url="https://example.com/sunset_beach.jpg",
-            tags=[],
             content="Test content",
+            user_id=user.id,
         )
-        repository_images.get_image_user = AsyncMock(return_value=mock_image)
+        self.db.add(self.image)
+        self.db.commit()
+        # Loaded the way get_image_user(..., schema=ImageResponse) returns it
+        refresh_loaded(self.db, self.image, ImageResponse)
 
-        self.session.query().filter_by().first = MagicMock(return_value=None)
-
-        repository_images.update_image = AsyncMock()
+    def tearDown(self):
+        self.db.close()
 
+    async def test_succes_added_tag(self):
         tag_response = TagResponse(id=1, tag=self.tag_name, image_id=self.image_id)
 
-        updated_image = await add_tag(
-            body=tag_response, db=self.session, current_user=self.current_user
-        )
+        with patch.object(
+            repository_images, "get_image_user", AsyncMock(return_value=self.image)
+        ):
+            updated_image = await add_tag(
+                body=tag_response, db=self.db, current_user=self.current_user
+            )
 
         self.assertIn(self.tag_name, [tag.name for tag in updated_image.tags])
         self.assertEqual(len(updated_image.tags), 1)
-        repository_images.update_image.assert_called_once()
 
     async def test_add_tag_image_not_found(self):
-        repository_images.get_image_user = AsyncMock(return_value=None)
         tag_response = TagResponse(id=1, tag=self.tag_name, image_id=self.image_id)
-        with self.assertRaises(HTTPException):
+        with patch.object(
+            repository_images, "get_image_user", AsyncMock(return_value=None)
+        ), self.assertRaises(HTTPException):
             await add_tag(
                 body=tag_response, db=self.session, current_user=self.current_user
             )
@@ -69,28 +90,34 @@ class TestTag(unittest.IsolatedAsyncioTestCase):
             ],
             content="Test content",
         )
-        repository_images.get_image_user = AsyncMock(return_value=mock_image)
         tag_response = TagResponse(id=1, tag=self.tag_name, image_id=self.image_id)
-        with self.assertRaises(HTTPException):
+        with patch.object(
+            repository_images, "get_image_user", AsyncMock(return_value=mock_image)
+        ), self.assertRaises(HTTPException):
             await add_tag(
                 body=tag_response, db=self.session, current_user=self.current_user
             )
 
     async def test_add_tag_existing_tag(self):
         existing_tag = Tag(name=self.tag_name)
-        mock_image = Image(
-            id=self.image_id,
-            image_url="https://example.com/sunset_beach.jpg",
-            tags=[],
-            content="Test content",
-        )
-        repository_images.get_image_user = AsyncMock(return_value=mock_image)
-        self.session.query().filter_by().first = MagicMock(return_value=existing_tag)
-        tag_response = TagResponse(id=1, tag=self.tag_name, image_id=self.image_id)
-        updated_image = await add_tag(
-            body=tag_response, db=self.session, current_user=self.current_user
-        )
-        self.assertIn(existing_tag, updated_image.tags)
+        self.db.add(existing_tag)
+        self.db.commit()
+        refresh_loaded(self.db, self.image, ImageResponse)
+        tag_response = TagResponse(id=1, tag=f" {self.tag_name} ", image_id=self.image_id)
+
+        with patch.object(
+            repository_images, "get_image_user", AsyncMock(return_value=self.image)
+        ):
+            updated_image = await add_tag(
+                body=tag_response, db=self.db, current_user=self.current_user
+            )
+            # Adding the same tag twice keeps a single link
+            updated_image = await add_tag(
+                body=tag_response, db=self.db, current_user=self.current_user
+            )
+
+        self.assertEqual([tag.id for tag in updated_image.tags], [existing_tag.id])
+        self.assertEqual(self.db.query(Tag).count(), 1)
 
 
 if __name__ == "__main__":
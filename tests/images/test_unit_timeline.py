@@ -0,0 +1,119 @@
+import unittest
+from unittest.mock import patch
+
+from redis.exceptions import ConnectionError as RedisConnectionError
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.conf.config import settings
+from src.database import cache
+from src.models.base import Base
+from src.models.image import Image
+from src.models.user import User
+from src.repository import follows as repository_follows
+from src.services import timeline
+from src.utils.pagination import decode_cursor
+
+
+class TestTimeline(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        engine = create_engine("sqlite:///:memory:")
+        Base.metadata.create_all(bind=engine)
+        self.db = sessionmaker(bind=engine)()
+        # The in-memory Redis of the autouse cache fixture
+        self.redis = cache.redis_cache
+
+        self.reader, self.friend, self.star, self.stranger = [
+            User(username=name, email=f"{name}@example.com", password="password", avatar="avatar")
+            for name in ("reader", "friend", "star", "stranger")
+        ]
+        self.db.add_all([self.reader, self.friend, self.star, self.stranger])
+        self.db.commit()
+
+    def tearDown(self):
+        self.db.close()
+
+    def add_image(self, owner):
+        image = Image(image_url="http://stored.com/image.jpg", content="content", user_id=owner.id)
+        self.db.add(image)
+        self.db.commit()
+        return image
+
+    async def walk(self, limit):
+        seen, after_id = [], None
+        while True:
+            page, cursor = await timeline.get_timeline(self.reader.id, limit, after_id, self.db)
+            seen.extend(image.id for image in page)
+            if cursor is None:
+                return seen
+            after_id = decode_cursor(cursor)
+
+    async def test_follow_counts(self):
+        self.assertTrue(await repository_follows.follow_user(self.reader, self.friend, self.db))
+        self.assertFalse(await repository_follows.follow_user(self.reader, self.friend, self.db))
+        self.assertEqual(await repository_follows.get_followers_count(self.friend.id, self.db), 1)
+        self.assertTrue(await repository_follows.unfollow_user(self.reader, self.friend, self.db))
+        self.assertFalse(await repository_follows.unfollow_user(self.reader, self.friend, self.db))
+        self.assertEqual(await repository_follows.get_followers_count(self.friend.id, self.db), 0)
+
+    async def test_hybrid_fan_out(self):
+        await repository_follows.follow_user(self.reader, self.friend, self.db)
+        await repository_follows.follow_user(self.reader, self.star, self.db)
+        await repository_follows.follow_user(self.stranger, self.star, self.db)
+        old_friend, _, old_star = self.add_image(self.friend), self.add_image(self.stranger), self.add_image(self.star)
+        key = timeline.timeline_key(self.reader.id)
+
+        # The star has more followers than the limit: fanned out on read, the friend on write
+        with patch.object(settings, "timeline_fanout_limit", 1):
+            self.assertEqual(await self.walk(2), [old_star.id, old_friend.id])
+            self.assertEqual(self.redis.lrange(key, 0, -1), [str(old_friend.id).encode()])
+
+            new_friend, new_star = self.add_image(self.friend), self.add_image(self.star)
+            await timeline.fan_out_images([new_star], self.db)
+            await timeline.fan_out_images([new_friend], self.db)
+            self.assertEqual(self.redis.lrange(key, 0, -1), [str(new_friend.id).encode(), str(old_friend.id).encode()])
+
+            self.db.delete(old_friend)
+            self.db.commit()
+            self.assertEqual(await self.walk(3), [new_star.id, new_friend.id, old_star.id])
+            self.assertEqual(self.redis.llen(key), 1)
+
+    async def test_timeline_is_capped(self):
+        await repository_follows.follow_user(self.reader, self.friend, self.db)
+        images = [self.add_image(self.friend) for _ in range(5)]
+
+        with patch.object(settings, "timeline_size", 3):
+            await timeline.get_timeline(self.reader.id, 10, None, self.db)
+            await timeline.fan_out_images([self.add_image(self.friend)], self.db)
+
+            self.assertEqual(self.redis.llen(timeline.timeline_key(self.reader.id)), 3)
+            self.assertEqual(len(await self.walk(10)), 3)
+        self.assertNotIn(images[0].id, await self.walk(10))
+
+    async def test_images_skipped_above_the_limit_are_kept(self):
+        await repository_follows.follow_user(self.reader, self.star, self.db)
+        await repository_follows.follow_user(self.stranger, self.star, self.db)
+        first = self.add_image(self.star)
+        await timeline.get_timeline(self.reader.id, 10, None, self.db)
+
+        with patch.object(settings, "timeline_fanout_limit", 1):
+            skipped = self.add_image(self.star)
+            await timeline.fan_out_images([skipped], self.db)
+        # Back under the limit, the skipped image is merged on read until the next image rebuilds the timelines
+        await repository_follows.unfollow_user(self.stranger, self.star, self.db)
+        self.assertEqual(await self.walk(10), [skipped.id, first.id])
+
+        latest = self.add_image(self.star)
+        await timeline.fan_out_images([latest], self.db)
+        self.assertFalse(self.redis.exists(timeline.timeline_key(self.reader.id)))
+        self.assertEqual(await self.walk(10), [latest.id, skipped.id, first.id])
+        self.assertEqual(self.redis.llen(timeline.timeline_key(self.reader.id)), 3)
+        self.assertFalse(self.redis.sismember(timeline.SKIPPED_OWNERS_KEY, self.star.id))
+
+    async def test_database_fallback_when_redis_fails(self):
+        await repository_follows.follow_user(self.reader, self.friend, self.db)
+        await repository_follows.follow_user(self.reader, self.star, self.db)
+        images = [self.add_image(owner) for owner in (self.friend, self.stranger, self.star, self.friend)]
+
+        with patch.object(self.redis, "lrange", side_effect=RedisConnectionError("down")):
+            self.assertEqual(await self.walk(2), [images[3].id, images[2].id, images[0].id])
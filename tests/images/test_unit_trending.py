@@ -0,0 +1,89 @@
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from redis.exceptions import ConnectionError as RedisConnectionError
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.database.cache import get_cache
+from src.models.base import Base
+from src.models.comment import Comment
+from src.models.image import Image
+from src.models.rating import Rating
+from src.models.user import User
+from src.services import trending
+
+HALF_LIFE = 3600
+
+
+class TestTrending(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.engine = create_engine("sqlite:///:memory:")
+        Base.metadata.create_all(bind=self.engine)
+        self.db = sessionmaker(bind=self.engine)()
+        self.user = User(username="owner", email="owner@example.com", password="pwd", avatar="avatar")
+        self.db.add(self.user)
+        self.db.commit()
+        self.images = [Image(image_url=f"http://stored.com/{i}.jpg", content="content", user_id=self.user.id) for i in range(3)]
+        self.db.add_all(self.images)
+        self.db.commit()
+        self.settings = patch.object(trending.settings, "trending_half_life", HALF_LIFE)
+        self.settings.start()
+
+    def tearDown(self):
+        self.settings.stop()
+        self.db.close()
+
+    def ranking(self):
+        return [int(member) for member in get_cache().zrevrange(trending.TRENDING_KEY, 0, -1)]
+
+    async def test_recent_activity_outranks_older_activity(self):
+        old, new, _ = (image.id for image in self.images)
+        with patch("src.services.trending.time.time", return_value=1_000_000):
+            trending.record_comment(old)
+            trending.record_rating(old)
+        with patch("src.services.trending.time.time", return_value=1_000_000 + 2 * HALF_LIFE):
+            trending.record_comment(new)
+            self.assertEqual(self.ranking(), [new, old])
+            self.assertEqual(trending.decay_trending(), 2)
+        scores = dict(get_cache().zrange(trending.TRENDING_KEY, 0, -1, withscores=True))
+        self.assertAlmostEqual(scores[str(new).encode()], 2.0)
+        self.assertAlmostEqual(scores[str(old).encode()], 3.0 / 4)
+
+        with patch("src.services.trending.time.time", return_value=1_000_000 + 12 * HALF_LIFE):
+            self.assertEqual(trending.decay_trending(), 0)
+
+    async def test_trending_page_is_rebuilt_from_the_database(self):
+        first, second, third = (image.id for image in self.images)
+        now = datetime.utcnow()
+        self.db.add_all(
+            [
+                Rating(user_id=self.user.id, image_id=first, rating_score=5, created_at=now - timedelta(hours=3)),
+                Comment(content="nice", user_id=self.user.id, image_id=second, created_at=now),
+                Comment(content="old", user_id=self.user.id, image_id=third, created_at=now - timedelta(days=2)),
+            ]
+        )
+        self.db.commit()
+
+        cards = await trending.get_trending(0, 10, self.db)
+
+        self.assertEqual([card.id for card in cards], [second, first])
+        self.assertEqual([card.id for card in await trending.get_trending(1, 10, self.db)], [first])
+        trending.retract_image(second)
+        self.assertEqual(self.ranking(), [first])
+
+    async def test_database_ranking_when_redis_fails(self):
+        first, second, third = (image.id for image in self.images)
+        now = datetime.utcnow()
+        self.db.add_all(
+            [
+                Rating(user_id=self.user.id, image_id=first, rating_score=5, created_at=now - timedelta(hours=3)),
+                Comment(content="nice", user_id=self.user.id, image_id=second, created_at=now),
+            ]
+        )
+        self.db.commit()
+
+        with patch.object(get_cache(), "exists", side_effect=RedisConnectionError("down")):
+            self.assertEqual([card.id for card in await trending.get_trending(0, 10, self.db)], [second, first])
+            self.assertEqual([card.id for card in await trending.get_trending(1, 1, self.db)], [first])
@@ -0,0 +1,97 @@
+import unittest
+from unittest.mock import patch
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+from src.database.cache import get_cache
+from src.models.base import Base
+from src.models.image import Image
+from src.models.rating import Rating  # noqa: F401 - configures the Image mapper
+from src.models.user import User
+from src.models.view import ImageViews, ViewFlush
+from src.services.view_counter import (
+    BATCH_FIELD,
+    VIEWS_FLUSHING_KEY,
+    VIEWS_PENDING_KEY,
+    _release_batch,
+    flush_view_counts,
+    get_views,
+    record_view,
+    unique_viewers_key,
+)
+
+
+class TestViewCounter(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.engine = create_engine("sqlite:///:memory:")
+        Base.metadata.create_all(bind=self.engine)
+        self.db = sessionmaker(bind=self.engine)()
+        user = User(username="owner", email="owner@example.com", password="pwd", avatar="avatar")
+        self.db.add(user)
+        self.db.commit()
+        self.images = [Image(image_url=f"http://stored.com/{i}.jpg", content="content", user_id=user.id) for i in range(2)]
+        self.db.add_all(self.images)
+        self.db.commit()
+
+    def tearDown(self):
+        self.db.close()
+
+    def stored_views(self, image_id):
+        return self.db.scalar(select(ImageViews.views).where(ImageViews.image_id == image_id))
+
+    async def test_views_are_flushed_in_batches(self):
+        first, second = (image.id for image in self.images)
+        for viewer in ("1.1.1.1", "1.1.1.1", "2.2.2.2"):
+            record_view(first, viewer)
+        record_view(second, "1.1.1.1")
+        record_view(999, "1.1.1.1")
+
+        self.assertEqual(await get_views(first, self.db), (3, 2))
+        self.assertEqual(await flush_view_counts(self.db), 5)
+        self.assertEqual((self.stored_views(first), self.stored_views(second)), (3, 1))
+        self.assertFalse(get_cache().exists(VIEWS_PENDING_KEY, VIEWS_FLUSHING_KEY))
+
+        record_view(first, "3.3.3.3")
+        await flush_view_counts(self.db)
+        self.assertEqual(self.stored_views(first), 4)
+        self.assertEqual(await get_views(first, self.db), (4, 3))
+        self.assertEqual(await flush_view_counts(self.db), 0)
+
+    async def test_crashed_flush_is_retried_once(self):
+        image_id = self.images[0].id
+        record_view(image_id, "1.1.1.1")
+        with patch("src.services.view_counter._release_batch", side_effect=ConnectionError("lost")):
+            with self.assertRaises(ConnectionError):
+                await flush_view_counts(self.db)
+        # The batch was committed but is still in Redis; new views wait in a fresh pending hash
+        self.assertEqual(self.stored_views(image_id), 1)
+        record_view(image_id, "1.1.1.1")
+        self.assertEqual(await get_views(image_id, self.db), (2, 1))
+
+        self.assertEqual(await flush_view_counts(self.db), 1)
+        self.assertEqual(self.stored_views(image_id), 2)
+        self.assertEqual(len(self.db.scalars(select(ViewFlush)).all()), 2)
+
+    async def test_flusher_keeps_the_batch_of_another_flusher(self):
+        image_id = self.images[0].id
+        record_view(image_id, "1.1.1.1")
+        await flush_view_counts(self.db)
+        record_view(image_id, "1.1.1.1")
+        # A slow flusher finishing the first batch after the second one started must not delete it
+        get_cache().rename(VIEWS_PENDING_KEY, VIEWS_FLUSHING_KEY)
+        get_cache().hset(VIEWS_FLUSHING_KEY, BATCH_FIELD, "second")
+        _release_batch(get_cache(), "first")
+        self.assertEqual(await flush_view_counts(self.db), 1)
+        self.assertEqual(self.stored_views(image_id), 2)
+
+    async def test_unique_viewers_expire_and_are_deleted_with_the_image(self):
+        first, second = (image.id for image in self.images)
+        record_view(first, "1.1.1.1")
+        record_view(second, "1.1.1.1")
+        self.assertGreater(get_cache().ttl(unique_viewers_key(first)), 0)
+
+        self.db.delete(self.images[0])
+        self.db.commit()
+        self.assertFalse(get_cache().exists(unique_viewers_key(first)))
+        self.assertTrue(get_cache().exists(unique_viewers_key(second)))
@@ -16,6 +16,20 @@ class TestCreateQRCodeFromURL(unittest.TestCase):
         self.assertTrue(re.match(base64_pattern, result))
 
 
+class TestComputeFileHash(unittest.TestCase):
+    def test_hash_and_rewind(self):
+        """Test the digest matches hashlib and the file is rewound for the upload."""
+        import hashlib
+        from io import BytesIO
+
+        data = b"x" * (HASH_CHUNK_SIZE + 10)
+        file = BytesIO(data)
+        file.seek(5)
+        result = compute_file_hash(file)
+        self.assertEqual(result, hashlib.sha256(data).hexdigest())
+        self.assertEqual(file.tell(), 0)
+
+
 class TestExtractIDFromURL(unittest.TestCase):
     def test_valid_url(self):
         """Test if the correct ID is extracted from a valid URL."""
@@ -55,6 +69,24 @@ class TestGetCloudinaryPublicID(unittest.TestCase):
         result = get_cloudinary_public_id(user)
         self.assertEqual(result, expected_public_id)
 
+    def test_content_public_id(self):
+        """Test the content-addressed public id is derived from the hash only."""
+        self.assertEqual(get_content_public_id("abc"), "SnapShare-API/abc")
+
+    def test_image_public_id(self):
+        """Test images fall back to the legacy id until they have a content hash."""
+        user = MockUser(username="testuser", id=123)
+        legacy_image = MagicMock(content_hash=None, user=user)
+        image = MagicMock(content_hash="abc", user=user)
+        self.assertEqual(get_image_public_id(legacy_image), "SnapShare-API/testuser123")
+        self.assertEqual(get_image_public_id(image), "SnapShare-API/abc")
+
+    def test_is_content_addressed_url(self):
+        url = "https://res.cloudinary.com/demo/image/upload/v1/SnapShare-API/abc"
+        self.assertTrue(is_content_addressed_url(url, "abc"))
+        self.assertFalse(is_content_addressed_url(url, "abd"))
+        self.assertFalse(is_content_addressed_url(url, None))
+
 
 class MockFile:
     def __init__(self):
@@ -65,23 +97,27 @@ class TestPostCloudinaryImage(unittest.TestCase):
     @patch("cloudinary.uploader.upload")
     @patch("cloudinary.CloudinaryImage.build_url")
     def test_valid_file_and_user(self, mock_build_url, mock_upload):
-        """Test with valid file and user objects."""
-        mock_user = MockUser(username="testuser", id=123)
+        """Test with valid file and content hash."""
         mock_file = MockFile()
         mock_upload.return_value = {"version": "12345"}
         mock_build_url.return_value = "http://mocked.url/image"
 
-        result = post_cloudinary_image(mock_file, mock_user)
+        result = post_cloudinary_image(mock_file, "abc")
         self.assertEqual(result, "http://mocked.url/image")
+        mock_upload.assert_called_once_with(
+            mock_file.file,
+            public_id="SnapShare-API/abc",
+            overwrite=False,
+            unique_filename=False,
+        )
 
     @patch("cloudinary.uploader.upload", side_effect=Exception("Mocked upload error"))
     def test_error_handling(self, mock_upload):
         """Test error handling when Cloudinary API returns an error."""
-        mock_user = MockUser(username="testuser", id=123)
         mock_file = MockFile()
 
         with self.assertRaises(Exception):
-            post_cloudinary_image(mock_file, mock_user)
+            post_cloudinary_image(mock_file, "abc")
 
 
 class TestGetCloudinaryImageTransformation(unittest.TestCase):
@@ -89,27 +125,24 @@ class TestGetCloudinaryImageTransformation(unittest.TestCase):
     def test_valid_inputs(self, mock_build_url):
         """Test with all valid arguments."""
         mock_build_url.return_value = "http://mocked.url/transformed_image"
-        user = MockUser(username="testuser", id=123)
         result = get_cloudinary_image_transformation(
-            user, "resize", 100, 100, None, None
+            "SnapShare-API/abc", "resize", 100, 100, None, None
         )
         self.assertEqual(result, "http://mocked.url/transformed_image")
 
     def test_invalid_transformation_type(self):
         """Test the function's behavior with an unknown transformation type."""
-        user = MockUser(username="testuser", id=123)
         with self.assertRaises(KeyError):
             get_cloudinary_image_transformation(
-                user, "unknown_type", 100, 100, None, None
+                "SnapShare-API/abc", "unknown_type", 100, 100, None, None
             )
 
     @patch("cloudinary.CloudinaryImage.build_url")
     def test_incomplete_parameters(self, mock_build_url):
         """Test with missing or None parameters."""
         mock_build_url.return_value = "http://mocked.url/transformed_image"
-        user = MockUser(username="testuser", id=123)
         result = get_cloudinary_image_transformation(
-            user, "resize", None, None, None, None
+            "SnapShare-API/abc", "resize", None, None, None, None
         )
         self.assertEqual(result, "http://mocked.url/transformed_image")
 
@@ -0,0 +1,88 @@
+import asyncio
+import os
+import unittest
+from io import BytesIO
+
+from PIL import Image as PILImage
+
+from src.models.image import Image
+from src.utils.image_metadata import (
+    BASE83_CHARACTERS,
+    encode_blurhash,
+    extract_image_metadata,
+    extract_upload_metadata,
+    get_stored_metadata,
+    spool_upload,
+)
+
+
+def encoded_image(size, color, format="PNG", exif_orientation=None) -> bytes:
+    buffer = BytesIO()
+    image = PILImage.new("RGB", size, color)
+    if exif_orientation is not None:
+        exif = PILImage.Exif()
+        exif[0x0112] = exif_orientation
+        image.save(buffer, format=format, exif=exif)
+    else:
+        image.save(buffer, format=format)
+    return buffer.getvalue()
+
+
+def decode_base83(value: str) -> int:
+    result = 0
+    for character in value:
+        result = result * 83 + BASE83_CHARACTERS.index(character)
+    return result
+
+
+class TestImageMetadata(unittest.TestCase):
+    def test_extract_image_metadata(self):
+        data = encoded_image((40, 20), (255, 0, 0))
+
+        metadata = extract_image_metadata(data)
+
+        self.assertEqual(metadata["width"], 40)
+        self.assertEqual(metadata["height"], 20)
+        self.assertEqual(metadata["orientation"], "landscape")
+        self.assertEqual(metadata["mime_type"], "image/png")
+        self.assertEqual(metadata["byte_size"], len(data))
+        self.assertEqual(metadata["dominant_color"], "#ff0000")
+
+    def test_exif_rotation_swaps_dimensions(self):
+        data = encoded_image((40, 20), (0, 0, 255), format="JPEG", exif_orientation=6)
+
+        metadata = extract_image_metadata(data)
+
+        self.assertEqual((metadata["width"], metadata["height"]), (20, 40))
+        self.assertEqual(metadata["orientation"], "portrait")
+        self.assertEqual(metadata["mime_type"], "image/jpeg")
+
+    def test_encode_blurhash_of_flat_image(self):
+        blurhash = encode_blurhash(PILImage.new("RGB", (8, 8), (255, 0, 0)))
+
+        # 4x3 components: size flag, max AC, 4 characters of DC and 2 per AC component
+        self.assertEqual(len(blurhash), 1 + 1 + 4 + 2 * 11)
+        self.assertEqual(blurhash[0], BASE83_CHARACTERS[3 + 2 * 9])
+        self.assertEqual(decode_base83(blurhash[2:6]), 0xFF0000)
+
+    def test_get_stored_metadata(self):
+        self.assertIsNone(get_stored_metadata(Image()))
+        image = Image(width=10, height=5, orientation="landscape", byte_size=100)
+        self.assertEqual(get_stored_metadata(image)["byte_size"], 100)
+
+    def test_extract_upload_metadata(self):
+        metadata = asyncio.run(extract_upload_metadata(BytesIO(encoded_image((8, 8), (0, 255, 0)))))
+        self.assertEqual(metadata["orientation"], "square")
+        self.assertIsNone(asyncio.run(extract_upload_metadata(BytesIO(b"not an image"))))
+
+    def test_spool_upload(self):
+        data = encoded_image((8, 8), (0, 255, 0))
+        upload = BytesIO(data)
+        upload.seek(3)
+
+        path = spool_upload(upload)
+        try:
+            self.assertEqual(upload.tell(), 0)
+            self.assertEqual(extract_image_metadata(path)["byte_size"], len(data))
+        finally:
+            os.unlink(path)
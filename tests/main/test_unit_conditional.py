@@ -0,0 +1,62 @@
+import unittest
+from datetime import datetime, timezone
+
+from fastapi import Response
+from starlette.requests import Request
+
+from src.utils.conditional import conditional_response, is_not_modified, make_etag
+
+LAST_MODIFIED = datetime(2023, 10, 1, 12, 0, 30, 250000)
+
+
+def make_request(**headers) -> Request:
+    raw = [(name.replace("_", "-").lower().encode(), value.encode()) for name, value in headers.items()]
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": raw})
+
+
+class TestConditional(unittest.TestCase):
+    def test_make_etag(self):
+        self.assertEqual(make_etag("image", 1, 2), make_etag("image", 1, 2))
+        self.assertNotEqual(make_etag("image", 1, 2), make_etag("image", 1, 3))
+        self.assertTrue(make_etag("image", 1).startswith('W/"'))
+
+    def test_if_none_match(self):
+        etag = make_etag("image", 1, 1)
+        self.assertTrue(is_not_modified(make_request(if_none_match=etag), etag))
+        self.assertTrue(is_not_modified(make_request(if_none_match=f'"other", {etag[2:]}'), etag))
+        self.assertTrue(is_not_modified(make_request(if_none_match="*"), etag))
+        self.assertFalse(is_not_modified(make_request(if_none_match='W/"other"'), etag))
+        self.assertFalse(is_not_modified(make_request(), etag, LAST_MODIFIED))
+
+    def test_if_modified_since(self):
+        etag = make_etag("image", 1, 1)
+        self.assertTrue(
+            is_not_modified(make_request(if_modified_since="Sun, 01 Oct 2023 12:00:30 GMT"), etag, LAST_MODIFIED)
+        )
+        self.assertFalse(
+            is_not_modified(make_request(if_modified_since="Sun, 01 Oct 2023 12:00:29 GMT"), etag, LAST_MODIFIED)
+        )
+        self.assertFalse(is_not_modified(make_request(if_modified_since="yesterday"), etag, LAST_MODIFIED))
+        self.assertFalse(is_not_modified(make_request(if_modified_since="Sun, 01 Oct 2023 12:00:30 GMT"), etag))
+        # If-None-Match takes precedence
+        self.assertFalse(
+            is_not_modified(
+                make_request(if_none_match='W/"other"', if_modified_since="Sun, 01 Oct 2023 12:00:30 GMT"),
+                etag,
+                LAST_MODIFIED,
+            )
+        )
+
+    def test_conditional_response(self):
+        etag = make_etag("comment", 1, 1)
+        response = Response()
+        self.assertIsNone(conditional_response(make_request(), response, etag, LAST_MODIFIED))
+        self.assertEqual(response.headers["ETag"], etag)
+        self.assertEqual(response.headers["Last-Modified"], "Sun, 01 Oct 2023 12:00:30 GMT")
+
+        not_modified = conditional_response(
+            make_request(if_none_match=etag), Response(), etag, LAST_MODIFIED.replace(tzinfo=timezone.utc)
+        )
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.headers["ETag"], etag)
+        self.assertEqual(not_modified.body, b"")
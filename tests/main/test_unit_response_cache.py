@@ -0,0 +1,135 @@
+from fastapi import APIRouter, FastAPI, Response
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.models.base import Base
+from src.models.comment import Comment
+from src.models.image import Image
+from src.models.user import User
+from src.services.response_cache import cache_response, generation_key, invalidate_cache, invalidate_on_commit
+from src.utils.conditional import make_etag
+from src.utils.serialization import MsgPackRoute
+
+
+def make_client(ttl=30):
+    calls = []
+    router = APIRouter(route_class=MsgPackRoute)
+
+    @router.get("/items/{item_id}")
+    @cache_response(tags=["item:{item_id}", "color:{color}"], ttl=ttl, stale=60)
+    async def read_item(item_id: int, response: Response, color: str = "red"):
+        calls.append(item_id)
+        response.headers["ETag"] = make_etag("item", item_id, len(calls))
+        return {"id": item_id, "color": color, "calls": len(calls)}
+
+    app = FastAPI()
+    app.include_router(router)
+    return TestClient(app), calls
+
+
+def test_miss_then_hit(cache):
+    client, calls = make_client()
+
+    first = client.get("/items/1?color=blue&x=1")
+    second = client.get("/items/1?x=1&color=blue")
+
+    assert first.headers["X-Cache"] == "MISS"
+    assert second.headers["X-Cache"] == "HIT"
+    assert second.json() == first.json()
+    assert second.headers["ETag"] == first.headers["ETag"]
+    assert calls == [1]
+    assert client.get("/items/2?color=blue").headers["X-Cache"] == "MISS"
+    # Requests that cannot fill every tag are not cached
+    assert "X-Cache" not in client.get("/items/1").headers
+
+
+def test_invalidate_by_tag(cache):
+    client, calls = make_client()
+    client.get("/items/1?color=red")
+
+    invalidate_cache("item:2")
+    assert client.get("/items/1?color=red").headers["X-Cache"] == "HIT"
+    invalidate_cache("color:red")
+    response = client.get("/items/1?color=red")
+
+    assert response.headers["X-Cache"] == "MISS"
+    assert response.json()["calls"] == 2
+
+
+def test_invalidate_on_commit(cache):
+    client, calls = make_client()
+    db = sessionmaker(bind=create_engine("sqlite:///:memory:"))()
+    client.get("/items/1?color=red")
+
+    invalidate_on_commit(db, "item:1")
+    db.rollback()
+    assert client.get("/items/1?color=red").headers["X-Cache"] == "HIT"
+
+    invalidate_on_commit(db, "item:1")
+    assert client.get("/items/1?color=red").headers["X-Cache"] == "HIT"
+    db.commit()
+    assert client.get("/items/1?color=red").headers["X-Cache"] == "MISS"
+    db.close()
+
+
+def test_numeric_tags_are_normalized(cache):
+    client, calls = make_client()
+    client.get("/items/01?color=red")
+
+    invalidate_cache("item:1")
+
+    assert client.get("/items/01?color=red").headers["X-Cache"] == "MISS"
+
+
+def test_committed_writes_invalidate_their_tags(cache):
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    user = User(username="owner", email="owner@example.com", password="password", avatar="avatar")
+    image = Image(image_url="http://example.com/1.jpg", content="content", user=user)
+    db.add(image)
+    db.commit()
+    cache.flushall()
+
+    image.content = "changed"
+    db.add(Comment(content="comment", user_id=user.id, image_id=image.id))
+    db.flush()
+    db.rollback()
+    assert cache.keys("route-gen:*") == []
+
+    image.content = "changed"
+    db.add(Comment(content="comment", user_id=user.id, image_id=image.id))
+    db.commit()
+    assert cache.get(generation_key(f"image:{image.id}")) == b"1"
+    assert cache.get(generation_key(f"comments:{image.id}")) == b"1"
+    db.close()
+
+
+def test_stale_while_revalidate(cache):
+    client, calls = make_client(ttl=0)
+    client.get("/items/1?color=red")
+
+    stale = client.get("/items/1?color=red")
+    # The stale body is served, the refresh ran after the response
+    assert stale.headers["X-Cache"] == "STALE"
+    assert stale.json()["calls"] == 1
+    assert len(calls) == 2
+
+    # Only one request revalidates while the lock is held
+    again = client.get("/items/1?color=red")
+    assert again.headers["X-Cache"] == "STALE"
+    assert again.json()["calls"] == 2
+    assert len(calls) == 2
+
+
+def test_conditional_hit(cache):
+    client, calls = make_client()
+    etag = client.get("/items/1?color=red").headers["ETag"]
+
+    response = client.get("/items/1?color=red", headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert response.content == b""
+    assert calls == [1]
@@ -0,0 +1,112 @@
+import json
+import unittest
+from datetime import datetime, timezone
+from typing import List
+
+import msgpack
+
+from fastapi import APIRouter, FastAPI, Response
+from fastapi.testclient import TestClient
+
+from src.models.image import Image, Tag
+from src.models.rating import Rating  # noqa: F401  registers the mapper used by Image.ratings
+from src.schemas.image import ImageResponse
+from src.schemas.tag import TagModel, TagRequest
+from src.utils.serialization import (
+    MsgPackRoute,
+    SerializedListRoute,
+    dump_list,
+    list_adapter,
+    list_item_schema,
+    pack_list,
+    prefers_msgpack,
+    unpack,
+)
+
+
+class TestSerialization(unittest.TestCase):
+    def test_list_item_schema(self):
+        self.assertIs(list_item_schema(List[ImageResponse]), ImageResponse)
+        self.assertIsNone(list_item_schema(ImageResponse))
+        self.assertIsNone(list_item_schema(List[int]))
+        self.assertIsNone(list_item_schema(None))
+        self.assertIs(list_adapter(ImageResponse), list_adapter(ImageResponse))
+
+    def test_dump_list_from_orm(self):
+        image = Image(id=1, image_url="http://stored.com/1.jpg", content="secret", user_id=2)
+        image.tags = [Tag(id=3, name="tag")]
+
+        data = json.loads(dump_list(ImageResponse, [image]))
+
+        self.assertEqual(data[0]["tags"], [{"name": "tag"}])
+        # Only the declared fields are written
+        self.assertNotIn("content", data[0])
+
+    def test_route_serializes_list_and_keeps_headers(self):
+        router = APIRouter(route_class=SerializedListRoute)
+
+        @router.get("/tags", response_model=List[TagModel], status_code=201)
+        async def read_tags(response: Response):
+            response.headers["X-Next-Cursor"] = "next"
+            return [Tag(id=1, name="first"), {"id": 2, "name": "second"}]
+
+        app = FastAPI()
+        app.include_router(router)
+        response = TestClient(app).get("/tags")
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.headers["X-Next-Cursor"], "next")
+        self.assertEqual(response.json(), [{"id": 1, "name": "first"}, {"id": 2, "name": "second"}])
+        self.assertIn("TagModel", json.dumps(app.openapi()))
+
+    def test_prefers_msgpack(self):
+        self.assertTrue(prefers_msgpack("application/msgpack"))
+        self.assertTrue(prefers_msgpack("application/x-msgpack, application/json"))
+        self.assertTrue(prefers_msgpack("application/json;q=0.5, application/msgpack"))
+        self.assertFalse(prefers_msgpack("application/json, application/msgpack"))
+        self.assertFalse(prefers_msgpack("application/msgpack;q=0, */*"))
+        self.assertFalse(prefers_msgpack(""))
+
+    def test_pack_list_round_trip(self):
+        created_at = datetime(2026, 10, 19, 12, 30, 15, 250000)
+        image = Image(id=1, image_url="http://stored.com/1.jpg", user_id=2, created_at=created_at)
+        image.tags = [Tag(id=3, name="tag")]
+
+        data = unpack(pack_list(ImageResponse, [image]))
+
+        self.assertEqual(data[0]["created_at"], created_at.replace(tzinfo=timezone.utc))
+        self.assertEqual(data[0]["tags"], [{"name": "tag"}])
+        with self.assertRaises(ValueError):
+            unpack(b"\xc1")
+
+    def test_msgpack_negotiation_and_body(self):
+        router = APIRouter(route_class=SerializedListRoute)
+        created = []
+
+        @router.get("/tags", response_model=List[TagModel])
+        async def read_tags():
+            return [Tag(id=1, name="first")]
+
+        @router.post("/tags", response_model=TagModel)
+        async def create_tag(body: TagRequest):
+            created.append(body.name)
+            return {"id": 2, "name": body.name}
+
+        app = FastAPI()
+        app.include_router(router)
+        client = TestClient(app)
+
+        response = client.get("/tags", headers={"Accept": "application/msgpack"})
+        self.assertEqual(response.headers["content-type"], "application/msgpack")
+        self.assertEqual(response.headers["vary"], "Accept")
+        self.assertEqual(msgpack.unpackb(response.content), [{"id": 1, "name": "first"}])
+        self.assertEqual(client.get("/tags").json(), [{"id": 1, "name": "first"}])
+
+        response = client.post(
+            "/tags", content=msgpack.packb({"name": "packed"}), headers={"Content-Type": "application/msgpack"}
+        )
+        self.assertEqual(response.status_code, 200, response.text)
+        self.assertEqual(created, ["packed"])
+        response = client.post("/tags", content=b"\xc1", headers={"Content-Type": "application/msgpack"})
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(issubclass(SerializedListRoute, MsgPackRoute))
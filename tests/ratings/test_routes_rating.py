@@ -1,11 +1,12 @@
 import unittest
 from unittest.mock import patch, AsyncMock, MagicMock, ANY
 from fastapi.testclient import TestClient
-from fastapi import HTTPException, status
+from fastapi import HTTPException, Response, status
 
 from src.models.rating import Rating
 from src.models.user import User
 from src.schemas.rating import RatingRequest
+from src.utils.pagination import NEXT_CURSOR_HEADER, encode_cursor
 from main import app
 import unittest
 from unittest.mock import MagicMock
@@ -162,10 +163,10 @@ class TestRatingsRoutes(unittest.IsolatedAsyncioTestCase):
         mock_ratings = [MagicMock(spec=Rating), MagicMock(spec=Rating)]
         mock_get_all_ratings.return_value = mock_ratings
 
-        result = await get_ratings(skip, limit, mock_db)
+        result = await get_ratings(MagicMock(headers={}), skip, limit, None, mock_db)
 
         self.assertEqual(len(result), len(mock_ratings))
-        mock_get_all_ratings.assert_called_with(skip, limit, mock_db)
+        mock_get_all_ratings.assert_called_with(skip, limit + 1, mock_db, after_id=None)
 
     @patch('src.repository.ratings.get_all_ratings')
     async def test_get_all_ratings_no_ratings_found(self, mock_get_all_ratings):
@@ -175,7 +176,17 @@ class TestRatingsRoutes(unittest.IsolatedAsyncioTestCase):
         mock_get_all_ratings.return_value = []
 
         with self.assertRaises(HTTPException) as context:
-            await get_ratings(skip, limit, mock_db)
+            await get_ratings(MagicMock(headers={}), skip, limit, None, mock_db)
 
         self.assertEqual(context.exception.status_code, status.HTTP_404_NOT_FOUND)
-        self.assertEqual(context.exception.detail, "No ratings found")
\ No newline at end of file
+        self.assertEqual(context.exception.detail, "No ratings found")
+
+    @patch('src.repository.ratings.get_all_ratings')
+    async def test_get_all_ratings_last_page(self, mock_get_all_ratings):
+        mock_get_all_ratings.return_value = []
+        response = Response()
+
+        result = await get_ratings(response, 0, 2, encode_cursor(2), MagicMock())
+
+        self.assertEqual(result, [])
+        self.assertNotIn(NEXT_CURSOR_HEADER, response.headers)
@@ -0,0 +1,117 @@
+import unittest
+
+from sqlalchemy import create_engine, delete, text, update
+from sqlalchemy.orm import sessionmaker
+
+from src.models.base import Base
+from src.models.document import ImageDocument
+from src.models.image import Image
+from src.models.rating import ImageRatingStats, Rating
+from src.models.user import User
+from src.repository.image_documents import get_image_documents
+from src.repository.images import average_rating
+from src.repository.rating_stats import get_rating_stats, get_top_rated_ids, reconcile_rating_stats
+
+
+class TestRatingStats(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        engine = create_engine("sqlite:///:memory:")
+        Base.metadata.create_all(bind=engine)
+        self.db = sessionmaker(bind=engine)()
+        self.user = User(username="owner", email="owner@example.com", password="pwd", avatar="avatar")
+        self.db.add(self.user)
+        self.db.commit()
+        self.images = [
+            Image(image_url=f"http://stored.com/{i}.jpg", content="content", user_id=self.user.id) for i in range(3)
+        ]
+        self.db.add_all(self.images)
+        self.db.commit()
+        self.ids = [image.id for image in self.images]
+
+    def tearDown(self):
+        self.db.close()
+
+    def rate(self, image_id, *scores):
+        self.db.add_all([Rating(user_id=self.user.id, image_id=image_id, rating_score=score) for score in scores])
+        self.db.commit()
+
+    def stats(self, image_id):
+        self.db.expire_all()
+        stats = self.db.get(ImageRatingStats, image_id)
+        if stats is None:
+            return None
+        return (
+            stats.rating_sum, stats.rating_count,
+            [stats.score_1, stats.score_2, stats.score_3, stats.score_4, stats.score_5], stats.rating_average,
+        )
+
+    async def test_triggers_maintain_aggregates(self):
+        first = self.ids[0]
+        self.assertIsNone(self.stats(first))
+        self.rate(first, 5, 4, 4)
+        self.assertEqual(self.stats(first), (13, 3, [0, 0, 0, 2, 1], 13 / 3))
+
+        self.db.execute(update(Rating).where(Rating.rating_score == 5).values(rating_score=1))
+        self.db.commit()
+        self.assertEqual(self.stats(first), (9, 3, [1, 0, 0, 2, 0], 3.0))
+
+        rating = self.db.query(Rating).filter(Rating.rating_score == 1).first()
+        self.db.delete(rating)
+        self.db.commit()
+        self.assertEqual(self.stats(first), (8, 2, [0, 0, 0, 2, 0], 4.0))
+        self.assertEqual(await average_rating(first, self.db), 4.0)
+
+        self.db.execute(delete(Rating))
+        self.db.commit()
+        self.assertEqual(self.stats(first), (0, 0, [0, 0, 0, 0, 0], None))
+        self.assertEqual(await average_rating(first, self.db), 0)
+
+    async def test_deleting_image_drops_aggregates(self):
+        first = self.ids[0]
+        self.rate(first, 3)
+        self.db.execute(delete(Rating))
+        self.db.execute(delete(Image).where(Image.id == first))
+        self.db.commit()
+        self.assertIsNone(await get_rating_stats(first, self.db))
+
+    async def test_top_rated(self):
+        first, second, third = self.ids
+        self.rate(first, 3, 4)
+        self.rate(second, 5)
+        self.rate(third, 4, 3)
+        self.assertEqual(await get_top_rated_ids(0, 10, self.db), [second, third, first])
+        self.assertEqual(await get_top_rated_ids(1, 1, self.db), [third])
+
+    async def test_image_documents_read_aggregates(self):
+        first = self.ids[0]
+        self.rate(first, 5, 4)
+        cards = await get_image_documents([first], self.db)
+        self.assertEqual((cards[0].average_rating, cards[0].ratings_count), (4.5, 2))
+
+    async def test_reconcile_repairs_drift(self):
+        first, second, third = self.ids
+        self.rate(first, 5, 4)
+        self.rate(second, 2)
+        await get_image_documents([first], self.db)
+        # Simulate writes that bypassed the triggers
+        self.db.execute(text("DROP TRIGGER ratings_stats_insert"))
+        self.rate(first, 3)
+        self.rate(third, 1)
+        self.db.execute(update(ImageRatingStats).where(ImageRatingStats.image_id == second).values(rating_count=7))
+        self.db.add(ImageRatingStats(image_id=999, rating_sum=5, rating_count=1))
+        self.db.commit()
+
+        repaired = await reconcile_rating_stats(self.db, batch_size=2)
+
+        self.assertEqual(repaired, 4)
+        self.assertEqual(self.stats(first), (12, 3, [0, 0, 1, 1, 1], 4.0))
+        self.assertEqual(self.stats(second), (2, 1, [0, 1, 0, 0, 0], 2.0))
+        self.assertEqual(self.stats(third), (1, 1, [1, 0, 0, 0, 0], 1.0))
+        self.assertIsNone(self.stats(999))
+        document = self.db.get(ImageDocument, first).document
+        self.assertEqual((document["average_rating"], document["ratings_count"]), (4.0, 3))
+        self.assertEqual(await reconcile_rating_stats(self.db), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.models.base import Base
+from src.models.image import Image, Tag
+from src.models.rating import Rating  # noqa: F401 - configures the Image mapper
+from src.models.user import User
+from src.repository.search_filter import get_images_by_search
+from src.utils.full_text import websearch_to_fts5
+
+
+class TestWebsearchToFts5(unittest.TestCase):
+    def test_translation(self):
+        self.assertEqual(websearch_to_fts5("sunset sea"), ('"sunset" AND "sea"', None))
+        self.assertEqual(websearch_to_fts5('"black cat" or dog -bird'), ('("black cat" OR "dog")', '"bird"'))
+        self.assertEqual(websearch_to_fts5("or sea OR"), ('"sea"', None))
+        self.assertEqual(websearch_to_fts5('NEAR(a b) "un"closed'), ('"NEAR(a" AND "b)" AND "un" AND "closed"', None))
+        self.assertEqual(websearch_to_fts5("-cat"), (None, '"cat"'))
+        self.assertEqual(websearch_to_fts5("!!! -"), (None, None))
+        self.assertEqual(websearch_to_fts5('The cat "in the" -a "cat in the garden"'), ('"cat" AND "cat in the garden"', None))
+
+
+class TestFullTextSearch(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        engine = create_engine("sqlite:///:memory:")
+        Base.metadata.create_all(bind=engine)
+        self.db = sessionmaker(bind=engine)()
+        user = User(username="owner", email="owner@example.com", password="pwd", avatar="avatar")
+        self.db.add(user)
+        self.db.commit()
+        contents = ["A sunset over the sea", "Sunsets, sunsets and more sunsets", "A cat in the garden", "Sea cat"]
+        self.images = [Image(image_url=f"http://stored.com/{i}.jpg", content=content, user_id=user.id) for i, content in enumerate(contents)]
+        self.db.add_all(self.images)
+        self.db.commit()
+
+    def tearDown(self):
+        self.db.close()
+
+    async def search(self, keyword):
+        images = await get_images_by_search(self.db, None, keyword, None, None, None, None)
+        return [image.id for image in images]
+
+    async def test_matches_are_ranked(self):
+        sunset, sunsets, cat, sea_cat = (image.id for image in self.images)
+        self.assertEqual(await self.search("sunset"), [sunsets, sunset])
+        self.assertEqual(await self.search("sea -cat"), [sunset])
+        self.assertCountEqual(await self.search('"sea cat" or garden'), [cat, sea_cat])
+        self.assertEqual(await self.search("-sunset"), [cat, sea_cat])
+        # "and" and "not" are stop words, dropped by PostgreSQL's english configuration
+        self.assertCountEqual(await self.search("cat AND NOT"), [cat, sea_cat])
+        self.assertEqual(await self.search("the -over"), [])
+
+    async def test_index_follows_changes(self):
+        self.images[2].content = "A dog in the garden"
+        self.db.delete(self.images[3])
+        self.db.commit()
+        self.assertEqual(await self.search("cat"), [])
+        self.assertEqual(await self.search("dogs"), [self.images[2].id])
+
+
+class TestFuzzySearch(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        engine = create_engine("sqlite:///:memory:")
+        Base.metadata.create_all(bind=engine)
+        self.db = sessionmaker(bind=engine)()
+        user = User(username="owner", email="owner@example.com", password="pwd", avatar="avatar")
+        self.db.add(user)
+        self.db.commit()
+        landscape, portrait = Tag(name="landscape"), Tag(name="portrait")
+        self.images = [
+            Image(image_url="http://stored.com/0.jpg", content="A sunset over the sea", user_id=user.id, tags=[landscape]),
+            Image(image_url="http://stored.com/1.jpg", content="Sunny mountains", user_id=user.id, tags=[landscape]),
+            Image(image_url="http://stored.com/2.jpg", content="A 100%_real cat", user_id=user.id, tags=[portrait]),
+        ]
+        self.db.add_all(self.images)
+        self.db.commit()
+
+    def tearDown(self):
+        self.db.close()
+
+    async def search(self, tag=None, keyword=None):
+        images = await get_images_by_search(self.db, tag, keyword, None, None, None, None, fuzzy=True)
+        return [image.id for image in images]
+
+    async def test_misspellings_and_fragments_match(self):
+        sunset, sunny, cat = (image.id for image in self.images)
+        self.assertEqual(await self.search(keyword="sunet"), [sunset, sunny])
+        self.assertEqual(await self.search(keyword="ountai"), [sunny])
+        self.assertEqual(await self.search(keyword="0%_r"), [cat])
+        self.assertEqual(await self.search(keyword="%"), [cat])
+        self.assertEqual(await self.search(tag="landscap", keyword="sunny"), [sunny, sunset])
+        self.assertEqual(await self.search(tag="portriat"), [cat])
+        self.assertEqual(await get_images_by_search(self.db, None, "sunet", None, None, None, None), [])
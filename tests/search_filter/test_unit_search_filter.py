@@ -1,7 +1,6 @@
 import unittest
-from unittest.mock import patch, MagicMock
 from datetime import datetime
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 from src.models.base import Base
 from src.models.image import Image, Tag
@@ -69,35 +68,72 @@ class TestSearchFilter(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(len(result), 1)
         self.assertEqual(result[0].tags[0].name, tag)
         self.assertEqual(result[0].content, keyword)
-        self.assertGreaterEqual(result[0].ratings[0].rating_score, min_rating)
-        self.assertLessEqual(result[0].ratings[0].rating_score, max_rating)
+        ratings = self.db.query(Rating).filter(Rating.image_id == result[0].id).all()
+        self.assertGreaterEqual(ratings[0].rating_score, min_rating)
+        self.assertLessEqual(ratings[0].rating_score, max_rating)
 
 
     def tearDown(self):
         self.db.close()
 
-class TestGetImagesByUser(unittest.TestCase):
-    @patch('src.repository.search_filter.get_rating_score')
-    @patch('sqlalchemy.orm.Session')
-    async def test_get_images_by_user(self, mock_session, mock_get_rating_score):
-        user_id = 1
-        mock_images = [MagicMock(spec=Image), MagicMock(spec=Image)]
-        mock_session.query.return_value.filter.return_value = mock_session.query.return_value
-        mock_session.query.return_value.join.return_value = mock_session.query.return_value
-        mock_session.query.return_value.group_by.return_value = mock_session.query.return_value
-        mock_session.query.return_value.having.return_value = mock_session.query.return_value
-        mock_session.query.return_value.all.return_value = mock_images
-        mock_get_rating_score.return_value = 4.5
-
-        result = await get_images_by_user(mock_session, user_id)
-
-        self.assertEqual(len(result), len(mock_images))
-        for image_response in result:
-            self.assertEqual(image_response.user_id, user_id)
-            self.assertEqual(image_response.average_rating, mock_get_rating_score.return_value)
-
-        mock_session.query.assert_called_with(Image)
-        mock_session.query.return_value.filter.assert_called_with(Image.user_id == user_id)
-    
+class TestAverageRating(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        engine = create_engine('sqlite:///:memory:')
+        Base.metadata.create_all(bind=engine)
+        self.db = sessionmaker(bind=engine)()
+        self.user = User(username="owner", email="owner@example.com", password="password", avatar="avatar")
+        voters = [User(username=f"voter{i}", email=f"voter{i}@example.com", password="password", avatar="avatar")
+                  for i in range(2)]
+        # Averages 3.0 (ratings 1 and 5), 4.5 (ratings 4 and 5) and no rating
+        self.images = [Image(image_url=f"url{i}", content="content", user=self.user) for i in range(3)]
+        ratings = [
+            Rating(user=voters[0], image=self.images[0], rating_score=1),
+            Rating(user=voters[1], image=self.images[0], rating_score=5),
+            Rating(user=voters[0], image=self.images[1], rating_score=4),
+            Rating(user=voters[1], image=self.images[1], rating_score=5),
+        ]
+        self.db.add_all([self.user, *voters, *self.images, *ratings])
+        self.db.commit()
+
+    def tearDown(self):
+        self.db.close()
+
+    async def search_ids(self, min_rating, max_rating):
+        result = await get_images_by_search(self.db, None, None, min_rating, max_rating, None, None)
+        return [image.id for image in result]
+
+    async def test_search_filters_on_average(self):
+        rated_low, rated_high, unrated = [image.id for image in self.images]
+        # A single rating of 5 no longer lets an image with an average of 3 through
+        self.assertEqual(await self.search_ids(4, 5), [rated_high])
+        self.assertEqual(await self.search_ids(1, 3), [rated_low])
+        self.assertEqual(await self.search_ids(0, 3), [rated_low, unrated])
+        self.assertEqual(await self.search_ids(0, 5), [rated_low, rated_high, unrated])
+        self.assertEqual(await self.search_ids(None, None), [rated_low, rated_high, unrated])
+
+    async def test_get_images_by_user(self):
+        result = await get_images_by_user(self.db, self.user.id)
+
+        self.assertEqual([item.average_rating for item in result], [3.0, 4.5, None])
+        self.assertEqual({item.username for item in result}, {"owner"})
+        self.assertEqual({item.user_id for item in result}, {self.user.id})
+
+        result = await get_images_by_user(self.db, self.user.id, min_rating=4, max_rating=5)
+        self.assertEqual([item.id for item in result], [self.images[1].id])
+
+    async def test_get_images_by_user_runs_one_statement(self):
+        user_id = self.user.id
+        statements = []
+        engine = self.db.get_bind()
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(engine, "before_cursor_execute", listener)
+        try:
+            await get_images_by_user(self.db, user_id)
+        finally:
+            event.remove(engine, "before_cursor_execute", listener)
+        self.assertEqual(len(statements), 1)
+        self.assertIn("image_rating_stats", statements[0])
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,169 @@
+import array
+import os
+from datetime import datetime
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.models.base import Base
+from src.models.image import Image
+from src.models.outbox import SearchIndexChange
+from src.models.rating import Rating  # noqa: F401 - configures the Image mapper
+from src.models.user import User
+from src.repository.search_filter import filter_by_content, get_images_by_search
+from src.services import search_index
+from src.services.search_index import InvertedIndex, apply_changes, difference, intersect, union
+
+
+def postings(*ids):
+    return array.array("q", ids)
+
+
+class TestPostingLists(unittest.TestCase):
+    def test_operations(self):
+        self.assertEqual(intersect(postings(1, 3, 5, 7), postings(3, 4, 7, 9, 11)), postings(3, 7))
+        self.assertEqual(union([postings(1, 5), postings(2, 5, 8), postings()]), postings(1, 2, 5, 8))
+        self.assertEqual(difference(postings(1, 2, 5, 8), postings(2, 8, 9)), postings(1, 5))
+
+
+class TestInvertedIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = InvertedIndex("english")
+        self.index.set(1, "A sunset over the sea")
+        self.index.set(2, "Sunny mountains, no sea")
+        self.index.set(3, "A black cat")
+
+    def search(self, query):
+        return self.index.search(query).tolist()
+
+    def test_search(self):
+        self.assertEqual(self.search("sea"), [1, 2])
+        self.assertEqual(self.search("sea -sunny"), [1])
+        self.assertEqual(self.search("cat or mountains"), [2, 3])
+        self.assertEqual(self.search('"black cat" sea'), [])
+        self.assertEqual(self.search("-sea"), [3])
+        self.assertEqual(self.search("!!!"), [])
+
+    def test_words_are_stemmed_like_the_database(self):
+        self.assertEqual(self.search("cats"), [3])
+        self.assertEqual(self.search("the seas"), [1, 2])
+        self.assertEqual(self.search("sun"), [])
+        # Candidates are a superset: the order of a phrase and excluded phrases are left to the database
+        self.assertEqual(self.search('"cat black"'), [3])
+        self.assertEqual(self.search('-"black cat"'), [1, 2, 3])
+
+    def test_updates_and_snapshot(self):
+        self.index.set(1, "A sunrise")
+        self.index.remove(3)
+        self.assertEqual(self.search("sea"), [2])
+        self.assertEqual(self.search("cat"), [])
+        self.assertNotIn("cat", self.index.postings)
+
+        self.index.position = 42
+        self.index.gaps = {40: 0.0}
+        self.index.synced_at = datetime(2026, 10, 19, 12, 30)
+        loaded = InvertedIndex.load(self.index.dump())
+        self.assertEqual((loaded.language, loaded.position, loaded.synced_at), ("english", 42, self.index.synced_at))
+        self.assertEqual(list(loaded.gaps), [40])
+        self.assertEqual(loaded.documents, self.index.documents)
+        self.assertEqual(loaded.search("sunrises"), postings(1))
+
+    def test_changes_committed_out_of_order_are_applied(self):
+        apply_changes(self.index, [(2, 3, "A white cat"), (5, 4, "A grey cat")], deadline=10.0)
+        self.assertEqual((self.index.position, self.index.gaps), (5, {1: 10.0, 3: 10.0, 4: 10.0}))
+        apply_changes(self.index, [(4, 1, None)], deadline=20.0)
+        self.assertEqual((self.index.position, sorted(self.index.gaps)), (5, [1, 3]))
+        self.assertEqual(self.search("cat"), [3, 4])
+        self.assertEqual(self.search("sunset"), [])
+
+
+class TestSearchIndexService(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        engine = create_engine("sqlite:///:memory:")
+        Base.metadata.create_all(bind=engine)
+        self.db = sessionmaker(bind=engine)()
+        self.user = User(username="owner", email="owner@example.com", password="pwd", avatar="avatar")
+        self.db.add(self.user)
+        self.db.commit()
+        self.images = [
+            Image(image_url=f"http://stored.com/{i}.jpg", content=content, user_id=self.user.id)
+            for i, content in enumerate(["A sunset over the sea", "A black cat"])
+        ]
+        self.db.add_all(self.images)
+        self.db.commit()
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "index.msgpack")
+        self.settings = patch.object(search_index.settings, "search_index_path", self.path)
+        self.settings.start()
+
+    def tearDown(self):
+        search_index._index = None
+        self.settings.stop()
+        self.directory.cleanup()
+        self.db.close()
+
+    def add_image(self, content):
+        image = Image(image_url=f"http://stored.com/{content}.jpg", content=content, user_id=self.user.id)
+        self.db.add(image)
+        self.db.commit()
+        return image.id
+
+    async def search(self, keyword):
+        images = await get_images_by_search(self.db, None, keyword, None, None, None, None)
+        return [image.id for image in images]
+
+    async def test_index_is_loaded_and_follows_commits(self):
+        sunset, cat = (image.id for image in self.images)
+        index = await search_index.load_search_index(self.db)
+        self.assertTrue(os.path.exists(self.path))
+        self.assertEqual(await search_index.search_ids("sea", self.db), [sunset])
+
+        self.images[1].content = "A black cat by the sea"
+        self.db.add(Image(image_url="http://stored.com/2.jpg", content="Sea shells", user_id=self.user.id))
+        self.db.delete(self.images[0])
+        self.db.commit()
+        self.assertEqual(await search_index.search_ids("sea", self.db), [cat, cat + 1])
+
+        # Another worker starts from the snapshot and catches up with the recorded changes
+        search_index._index = None
+        await search_index.load_search_index(self.db)
+        self.assertIsNot(search_index.get_search_index(), index)
+        self.assertEqual(await search_index.search_ids("sea", self.db), [cat, cat + 1])
+
+        self.assertEqual(await self.search("sea -shells"), [cat])
+        with patch("src.repository.search_filter.filter_by_content") as filter_by_content:
+            self.assertEqual(await self.search("dog"), [])
+        filter_by_content.assert_not_called()
+
+    async def test_results_match_the_database_search(self):
+        self.add_image("Seas and seas and seas")
+        self.add_image("A cat watching the sea")
+        self.add_image("Mountains")
+        queries = ["sea", "seas", "the sea -cat", "cat OR mountain", '"black cat"', "-sea", "sunsets over seas"]
+        expected = [await self.search(query) for query in queries]
+        self.assertEqual(expected[0], expected[1])
+        # bm25 ranks the image repeating the word first
+        self.assertEqual(expected[0][0], self.images[-1].id + 1)
+
+        await search_index.load_search_index(self.db)
+        with patch("src.repository.search_filter.filter_by_content", wraps=filter_by_content) as spy:
+            self.assertEqual([await self.search(query) for query in queries], expected)
+        self.assertIn("images.id IN", str(spy.call_args_list[0].args[0]))
+        with patch.object(search_index.settings, "search_index_max_candidates", 1):
+            self.assertEqual([await self.search(query) for query in queries], expected)
+
+    async def test_index_missing_deleted_changes_is_loaded_again(self):
+        await search_index.load_search_index(self.db)
+        shells = self.add_image("Sea shells")
+        # The changes are deleted once older than the retention, before this worker synced them
+        self.db.query(SearchIndexChange).update({SearchIndexChange.created_at: datetime(2000, 1, 1)})
+        self.db.commit()
+        self.assertEqual(await search_index.prune_search_index_changes(self.db), 3)
+        os.remove(self.path)
+        search_index.get_search_index().synced_at = datetime(2000, 1, 1)
+
+        self.assertEqual(await search_index.search_ids("shell", self.db), [shells])
+        self.assertTrue(os.path.exists(self.path))
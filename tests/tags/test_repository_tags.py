@@ -1,10 +1,19 @@
 import unittest
 import asyncio
+from fastapi import HTTPException
 from sqlalchemy.orm import Session
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
-from src.repository.tags import get_tags, get_tag, create_tag, update_tag, remove_tag
+from src.repository.tags import (
+    get_tags,
+    get_tag,
+    create_tag,
+    update_tag,
+    remove_tag,
+    normalize_tag_names,
+    resolve_tags,
+)
 from src.models.image import Tag
 from src.schemas.tag import TagRequest
 
@@ -61,6 +70,23 @@ class TestRepositoryTags(unittest.IsolatedAsyncioTestCase):
         # Перевірте результат тесту
         self.assertEqual(result.name, "tag2")
 
+    async def test_update_tag_normalizes_and_rejects_duplicates(self):
+        tag = Tag(name="tag1")
+        other = Tag(name="sunny day")
+        self.db.add_all([tag, other])
+        self.db.commit()
+
+        result = await update_tag(tag.id, TagRequest(name="  tag2 "), self.db)
+        self.assertEqual(result.name, "tag2")
+
+        with self.assertRaises(HTTPException) as context:
+            await update_tag(tag.id, TagRequest(name="sunny   day"), self.db)
+        self.assertEqual(context.exception.status_code, 409)
+
+        with self.assertRaises(HTTPException) as context:
+            await update_tag(tag.id, TagRequest(name="   "), self.db)
+        self.assertEqual(context.exception.status_code, 400)
+
     async def test_remove_tag(self):
         # Створіть дані для тестування
         tag = Tag(name="tag1")
@@ -73,5 +99,31 @@ class TestRepositoryTags(unittest.IsolatedAsyncioTestCase):
         # Перевірте результат тесту
         self.assertEqual(result.name, "tag1")
 
+    async def test_normalize_tag_names(self):
+        result = normalize_tag_names(["  sea ", "sunny  day", "", "sea", "   "])
+
+        self.assertEqual(result, ["sea", "sunny day"])
+
+    async def test_resolve_tags_mixed_known_and_new(self):
+        known = Tag(name="known")
+        self.db.add(known)
+        self.db.commit()
+
+        result = await resolve_tags(["new", " known", "new"], self.db)
+        self.db.commit()
+
+        self.assertEqual([tag.name for tag in result], ["new", "known"])
+        self.assertEqual(result[1].id, known.id)
+        self.assertEqual(self.db.query(Tag).count(), 2)
+
+    async def test_create_tag_existing(self):
+        tag = Tag(name="tag1")
+        self.db.add(tag)
+        self.db.commit()
+
+        result = await create_tag(TagRequest(name="tag1 "), self.db)
+
+        self.assertEqual(result.id, tag.id)
+
 if __name__ == '__main__':
     unittest.main()
@@ -18,18 +18,35 @@ from src.routes.tags import (
 )
 
 class TestTagsRoutes(unittest.IsolatedAsyncioTestCase):
+    @patch('src.repository.versions.get_collection_version', new_callable=AsyncMock, return_value=3)
     @patch('src.repository.tags.get_tags')
-    async def test_read_tags(self, mock_get_tags):
+    async def test_read_tags(self, mock_get_tags, mock_get_version):
         mock_db = MagicMock()
         mock_tags = [MagicMock(), MagicMock()]
         mock_get_tags.return_value = mock_tags
         skip = 0
         limit = 10
 
-        result = await read_tags(skip, limit, mock_db)
+        result = await read_tags(MagicMock(headers={}), MagicMock(headers={}), skip, limit, None, mock_db)
 
         self.assertEqual(result, mock_tags)
-        mock_get_tags.assert_called_with(skip, limit, mock_db)
+        mock_get_tags.assert_called_with(skip, limit + 1, mock_db, after_id=None)
+
+    @patch('src.repository.versions.get_collection_version', new_callable=AsyncMock, return_value=3)
+    @patch('src.repository.tags.get_tags')
+    async def test_read_tags_not_modified(self, mock_get_tags, mock_get_version):
+        response = MagicMock(headers={})
+        await read_tags(MagicMock(headers={}), response, 0, 10, None, MagicMock())
+        request = MagicMock(headers={"if-none-match": response.headers["ETag"]})
+
+        result = await read_tags(request, MagicMock(headers={}), 0, 10, None, MagicMock())
+
+        self.assertEqual(result.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(mock_get_tags.call_count, 1)
+
+        mock_get_version.return_value = 4
+        result = await read_tags(request, MagicMock(headers={}), 0, 10, None, MagicMock())
+        self.assertEqual(result, mock_get_tags.return_value)
 
     @patch('src.repository.tags.get_tag')
     async def test_read_tag(self, mock_get_tag):
@@ -0,0 +1,123 @@
+import unittest
+from unittest.mock import patch
+
+from redis.exceptions import ConnectionError as RedisConnectionError
+from sqlalchemy import create_engine
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload, sessionmaker
+
+from src.database.cache import get_cache
+from src.models.base import Base
+from src.models.image import Image, Tag
+from src.models.rating import Rating  # noqa: F401 - configures the Image mapper
+from src.models.user import User
+from src.repository.search_filter import get_images_by_search
+from src.repository.tags import link_image_tags, remove_tag
+from src.services.tag_bitmaps import (
+    BITMAPS_READY_KEY,
+    TAG_BITMAP_PREFIX,
+    bitmap_ids,
+    get_tagged_image_ids,
+    rebuild_tag_bitmaps,
+    tag_key,
+)
+
+
+class TestTagBitmaps(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        engine = create_engine("sqlite:///:memory:")
+        Base.metadata.create_all(bind=engine)
+        self.db = sessionmaker(bind=engine)()
+        self.user = User(username="owner", email="owner@example.com", password="pwd", avatar="avatar")
+        self.db.add(self.user)
+        self.db.commit()
+        self.sea, self.sky, self.cat = Tag(name="sea"), Tag(name="sky"), Tag(name="cat")
+        tag_sets = [[self.sea, self.sky], [self.sea], [self.cat], []]
+        self.images = [
+            Image(image_url=f"http://stored.com/{i}.jpg", content="content", user_id=self.user.id, tags=tags)
+            for i, tags in enumerate(tag_sets)
+        ]
+        self.db.add_all(self.images)
+        self.db.commit()
+        self.ids = [image.id for image in self.images]
+
+    def tearDown(self):
+        self.db.close()
+
+    async def tagged(self, names, mode):
+        return await get_tagged_image_ids(names, mode, self.db)
+
+    def test_bitmap_ids(self):
+        self.assertEqual(bitmap_ids(b"\x80\x05"), [0, 13, 15])
+
+    async def test_modes(self):
+        first, second, third, fourth = self.ids
+        self.assertEqual(await self.tagged(["sea", "sky"], "all"), [first])
+        self.assertEqual(await self.tagged(["sky", "cat"], "any"), [first, third])
+        self.assertEqual(await self.tagged(["sea", "cat"], "none"), [fourth])
+        self.assertEqual(await self.tagged(["sea", "missing"], "all"), [])
+        self.assertEqual(await self.tagged(["sea", "missing"], "any"), [first, second])
+        self.assertEqual(await self.tagged(["missing"], "none"), self.ids)
+
+    async def test_bitmaps_follow_writes(self):
+        first, second, third, fourth = self.ids
+        await self.tagged(["sea"], "all")
+        await link_image_tags([(fourth, self.cat.id)], self.db)
+        self.db.commit()
+        second_image = self.db.scalar(select(Image).where(Image.id == second).options(selectinload(Image.tags)))
+        second_image.tags.remove(self.sea)
+        self.db.delete(self.images[0])
+        self.db.commit()
+        self.assertEqual(await self.tagged(["cat"], "all"), [third, fourth])
+        self.assertEqual(await self.tagged(["sea"], "any"), [])
+        self.assertEqual(await self.tagged(["cat"], "none"), [second])
+
+        await remove_tag(self.cat.id, self.db)
+        self.assertEqual(await self.tagged(["cat"], "none"), [second, third, fourth])
+
+        # A flushed cache is rebuilt from the database
+        get_cache().flushall()
+        self.assertEqual(await self.tagged(["sky"], "none"), [second, third, fourth])
+        self.assertTrue(get_cache().exists(BITMAPS_READY_KEY))
+
+    async def test_search_combines_tags_with_other_filters(self):
+        images = await get_images_by_search(self.db, None, "content", None, None, None, None, tags=["sea"], mode="any")
+        self.assertEqual([image.id for image in images], self.ids[:2])
+
+    async def test_large_results_are_filtered_by_the_database(self):
+        first, second, third, fourth = self.ids
+        with patch("src.services.tag_bitmaps.settings.tag_bitmap_max_ids", 1):
+            self.assertIsNone(await self.tagged(["sea"], "none"))
+            self.assertEqual(await self.tagged(["sky"], "any"), [first])
+            for names, mode, expected in (
+                (["sea", "sky"], "all", [first]),
+                (["sky", "cat"], "any", [first, third]),
+                (["sky", "cat"], "none", [second, fourth]),
+            ):
+                images = await get_images_by_search(self.db, None, None, None, None, None, None, tags=names, mode=mode)
+                self.assertEqual([image.id for image in images], expected)
+        self.assertEqual(get_cache().keys(f"{TAG_BITMAP_PREFIX}result:*"), [])
+
+    async def test_rebuild_swaps_the_bitmaps_in(self):
+        await rebuild_tag_bitmaps(self.db)
+        running = f"{TAG_BITMAP_PREFIX}result:running"
+        get_cache().set(running, b"\xff")
+        get_cache().setbit(tag_key(999), 1, 1)
+
+        self.assertEqual(await rebuild_tag_bitmaps(self.db), 4)
+
+        self.assertTrue(get_cache().exists(running))
+        self.assertFalse(get_cache().exists(tag_key(999)))
+        self.assertEqual(get_cache().ttl(tag_key(self.sea.id)), -1)
+        self.assertEqual(get_cache().keys("tag-bitmap-build:*"), [])
+        self.assertEqual(await self.tagged(["sea"], "all"), self.ids[:2])
+
+    async def test_failed_update_triggers_a_rebuild(self):
+        await self.tagged(["sea"], "all")
+        with patch("src.services.tag_bitmaps.get_cache") as get_cache_mock:
+            get_cache_mock.return_value.pipeline.side_effect = RedisConnectionError("lost")
+            get_cache_mock.return_value.delete.side_effect = get_cache().delete
+            await link_image_tags([(self.ids[3], self.sea.id)], self.db)
+            self.db.commit()
+        self.assertFalse(get_cache().exists(BITMAPS_READY_KEY))
+        self.assertEqual(await self.tagged(["sea"], "all"), [self.ids[0], self.ids[1], self.ids[3]])
@@ -0,0 +1,55 @@
+import unittest
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.models.base import Base
+from src.models.image import Image
+from src.models.rating import Rating  # noqa: F401
+from src.models.user import User
+from src.repository.images import add_image_tags, get_image_validators
+from src.repository.tags import resolve_tags, update_tag
+from src.repository.versions import TAGS_COLLECTION, get_collection_version
+from src.schemas.tag import TagRequest
+
+
+class TestVersions(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        engine = create_engine("sqlite:///:memory:")
+        Base.metadata.create_all(bind=engine)
+        self.db = sessionmaker(bind=engine)()
+        user = User(username="test_user", email="test@example.com", password="pwd", avatar="avatar")
+        self.db.add(user)
+        self.db.commit()
+        self.image = Image(image_url="http://stored.com/1.jpg", content="content", user_id=user.id)
+        self.db.add(self.image)
+        self.db.commit()
+
+    def tearDown(self):
+        self.db.close()
+
+    async def version(self) -> int:
+        return (await get_image_validators(self.image.id, self.db)).version
+
+    async def test_update_bumps_version(self):
+        self.assertEqual(await self.version(), 1)
+        self.image.content = "changed"
+        self.db.commit()
+        self.assertEqual(await self.version(), 2)
+        self.assertIsNone(await get_image_validators(999, self.db))
+
+    async def test_tag_changes_bump_versions(self):
+        self.assertEqual(await get_collection_version(TAGS_COLLECTION, self.db), 0)
+        tags = await resolve_tags(["sea", "sky"], self.db)
+        await add_image_tags(self.image, tags, self.db)
+        self.assertEqual(await get_collection_version(TAGS_COLLECTION, self.db), 1)
+        self.assertEqual(await self.version(), 2)
+
+        # Existing tags leave the collection unchanged
+        await resolve_tags(["sea"], self.db)
+        self.db.commit()
+        self.assertEqual(await get_collection_version(TAGS_COLLECTION, self.db), 1)
+
+        await update_tag(tags[0].id, TagRequest(name="ocean"), self.db)
+        self.assertEqual(await get_collection_version(TAGS_COLLECTION, self.db), 2)
+        self.assertEqual(await self.version(), 3)